@@ -0,0 +1,96 @@
+"""Shared helpers for the pie benchmarks."""
+import os
+import re
+import subprocess
+import sys
+
+PIE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STREAM_DIR = os.path.join(PIE_DIR, "stream")
+PI_GUARD_DIR = os.path.join(PIE_DIR, "pi-guard")
+
+AUD_PATTERN = re.compile(rb"\x00\x00\x01\x09")
+
+
+def use_source_dir(path):
+    """Make a service directory importable (they are deployed as plain script folders)."""
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def generate_h264(path, seconds=10, fps=30, size="1280x720", gop=30, extra_filters=""):
+    """Encode a synthetic Annex B H.264 test source with access unit delimiters."""
+    video_filter = f"testsrc2=size={size}:rate={fps}"
+    if extra_filters:
+        video_filter += f",{extra_filters}"
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", video_filter,
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+        "-pix_fmt", "yuv420p", "-g", str(gop), "-b:v", "1M",
+        "-bsf:v", "h264_metadata=aud=insert",
+        "-f", "h264", path
+    ], check=True)
+    return path
+
+
+def split_access_units(data):
+    """Split an Annex B byte stream on access unit delimiters."""
+    starts = []
+    for match in AUD_PATTERN.finditer(data):
+        start = match.start()
+        if start > 0 and data[start - 1] == 0:
+            start -= 1  # four byte start code
+        starts.append(start)
+    starts.append(len(data))
+    return [data[a:b] for a, b in zip(starts, starts[1:])]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def read_peak_rss_kb(pid):
+    """Peak resident set size of a running process in kB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def process_cpu_seconds(pid):
+    """User plus system CPU time of a running process in seconds (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def process_tree(pid):
+    """A process and all its descendants' pids (Linux only)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat:
+                    parent = int(stat.read().rsplit(")", 1)[1].split()[1])
+            except OSError:
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
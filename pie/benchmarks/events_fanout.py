@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events fan-out benchmark for pi-guard's GET /events.
+Runs pi-guard's routes under uvicorn in a child process with MetricsService
+sampling a stand-in Sense HAT and publishing a window every --interval
+seconds, and connects --subscribers clients to /events?types=metrics over
+loopback:
+
+  fast      read everything as it arrives
+  slow      read 1 KB per second, far below the event rate
+  stalled   connect, then never read
+
+Reports, for fast clients, delivery latency (window end to receipt, p50/p99/
+max) and windows missed; for slow clients, how stale the newest window they
+receive is; the server's resident memory every second of the run; and the
+number of events coalesced for slow and stalled clients. Memory should stay
+flat because each client holds at most one pending event per type. The
+server holds a slow client's events back while more than EVENTS_SEND_AHEAD
+bytes wait unsent on its connection, with the kernel's own buffer sizes, so
+what a slow client receives stays recent; the run fails (exit 1) if the
+newest window in any read by a slow client in the second half of the run
+was more than --max-stale seconds old. Also times one publish to 1, 10 and
+100 in-process subscriptions.
+
+Usage: python3 events_fanout.py [--subscribers 100] [--slow 5] [--stalled 5] [--seconds 20] [--interval 0.02]
+                                [--max-stale 8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import types
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+from metrics_sampling import CHANNELS, FakeSenseHat
+
+# The real module only imports on a Pi; the metrics service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+
+
+def serve(port):
+    """The server side, run in the child process; settings come from its environment."""
+    use_source_dir(PI_GUARD_DIR)
+    import uvicorn
+    from fastapi import FastAPI
+
+    from api.routes import router
+    from modules.camera.service import CameraService
+    from modules.events.service import EventsService
+    from modules.metrics.service import MetricsService
+    from modules.motion.service import MotionService
+    from modules.mqtt.service import MqttService
+    from modules.streaming.service import StreamingService
+
+    app = FastAPI()
+    app.include_router(router)
+    camera, streaming, mqtt = CameraService(), StreamingService(), MqttService()
+    metrics = MetricsService(mqtt)  # Never connected: windows go to history and events only
+    events = EventsService(camera, streaming, mqtt, metrics, MotionService(camera, mqtt))
+
+    @app.on_event("startup")
+    async def start():
+        app.state.metrics_service = metrics
+        app.state.events_service = events
+        metrics.start()
+        events.start()
+
+    uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")).run()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def subscribe(port, mode, until, result):
+    """One client; appends (receipt time, window time) per window to result["windows"]."""
+    sock = socket.socket()
+    if mode != "fast":
+        # The kernel's smallest receive buffer, so what the client holds itself adds little to the staleness
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+    sock.setblocking(False)
+    loop = asyncio.get_running_loop()
+    await loop.sock_connect(sock, ("127.0.0.1", port))
+    # Raw socket reads: a StreamReader would keep draining the socket into its own buffer
+    await loop.sock_sendall(sock, b"GET /events?types=metrics HTTP/1.1\r\nHost: pi-guard\r\n"
+                                  b"Accept: text/event-stream\r\n\r\n")
+    buffer = b""
+    try:
+        while time.monotonic() < until:
+            if mode == "stalled":
+                await asyncio.sleep(until - time.monotonic())
+                break
+            if mode == "slow":
+                await asyncio.sleep(1)
+            try:
+                data = await asyncio.wait_for(loop.sock_recv(sock, 1024 if mode == "slow" else 65536),
+                                              max(0.01, until - time.monotonic()))
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+            received = time.time()
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.startswith(b"data: "):
+                    result["windows"].append((received, json.loads(line[6:])["time"]))
+    finally:
+        sock.close()
+
+
+async def run_clients(port, args):
+    until = time.monotonic() + args.seconds
+    fast = args.subscribers - args.slow - args.stalled
+    results = [{"mode": mode, "windows": []} for mode in ["fast"] * fast + ["slow"] * args.slow + ["stalled"] * args.stalled]
+    await asyncio.gather(*(subscribe(port, result["mode"], until, result) for result in results))
+    return results
+
+
+def publish_cost(subscribers, events=2000):
+    """Microseconds per EventsService.publish() with that many in-process subscriptions."""
+    use_source_dir(PI_GUARD_DIR)
+    from modules.events.service import EventsService, Subscription
+
+    async def measure():
+        service = EventsService(None, None, None, None, None)
+        service._running = True
+        service.clients = {Subscription(["metrics"]) for _ in range(subscribers)}
+        window = {"time": 0.0, "min": {f"f{i}": 1.0 for i in range(10)}, "max": {f"f{i}": 2.0 for i in range(10)}}
+        started = time.perf_counter()
+        for n in range(events):
+            window["time"] = n
+            service.publish("metrics", window)
+        return (time.perf_counter() - started) / events * 1e6
+
+    return asyncio.run(measure())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--slow", type=int, default=5)
+    parser.add_argument("--stalled", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=0.02, help="METRICS_PUBLISH_INTERVAL")
+    parser.add_argument("--max-stale", type=float, default=8, help="oldest window a slow client may receive, seconds")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    port = free_port()
+    # Every channel sampled fast enough that no window is empty; no spool, broker or long history
+    rates = ",".join(f"{name}={2 / args.interval:g}" for name in CHANNELS)
+    env = dict(os.environ, METRICS_PUBLISH_INTERVAL=str(args.interval), METRICS_SAMPLE_RATES=rates,
+               METRICS_SPOOL_PATH="", METRICS_HISTORY_HOURS="1", MQTT_BROKER="127.0.0.1", MQTT_PORT="1",
+               EVENTS_MAX_CLIENTS=str(args.subscribers), LOG_LEVEL="WARNING")
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], env=env)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        time.sleep(args.interval * 3)  # First windows out, so every client starts from a current state
+
+        memory = []
+
+        async def run():
+            async def sample():
+                while True:
+                    memory.append(rss_kb(server.pid))
+                    await asyncio.sleep(1)
+            sampler = asyncio.create_task(sample())
+            results = await run_clients(port, args)
+            sampler.cancel()
+            return results
+
+        started = time.time()
+        results = asyncio.run(run())
+        import urllib.request
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as response:
+            health = json.loads(response.read())
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            exposition = response.read().decode()
+    finally:
+        server.terminate()
+        server.wait()
+
+    expected = args.seconds / args.interval
+    fast = [result for result in results if result["mode"] == "fast"]
+    latencies = [(received - sent) * 1000 for result in fast for received, sent in result["windows"]]
+    counts = [len({sent for _, sent in result["windows"]}) for result in fast]
+    print(f"{args.subscribers} subscribers ({len(fast)} fast, {args.slow} slow, {args.stalled} stalled), "
+          f"a window every {args.interval:g} s for {args.seconds:g} s (~{expected:.0f} windows)")
+    print(f"fast: latency p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms, "
+          f"max {max(latencies, default=float('nan')):.1f} ms; windows per client {min(counts, default=0)}..{max(counts, default=0)}")
+    slow = [result for result in results if result["mode"] == "slow"]
+    stale = 0.0
+    if slow:
+        # The first half is left out: a slow client starts by working through its first read's backlog
+        half = started + args.seconds / 2
+        newest_per_read = {}
+        for result in slow:
+            for received, sent in result["windows"]:
+                if received >= half:
+                    newest_per_read[received] = max(sent, newest_per_read.get(received, sent))
+        stale = max((received - sent for received, sent in newest_per_read.items()), default=float("inf"))
+        newest = [(received - sent) for result in slow for received, sent in result["windows"][-1:]]
+        received = [len(result["windows"]) for result in slow]
+        print(f"slow: {min(received)}..{max(received)} windows received, newest one at the end "
+              f"{min(newest, default=float('nan')):.1f}..{max(newest, default=float('nan')):.1f} s old, "
+              f"at most {stale:.1f} s old in the second half (limit {args.max_stale:g} s)")
+    coalesced = next((line.split()[-1] for line in exposition.splitlines()
+                      if line.startswith("pi_guard_events_coalesced_total")), "0")
+    print(f"events: {health['events']['events']} broadcast, {coalesced} coalesced for slow and stalled clients; "
+          f"{health['events']['clients']} clients still registered after disconnecting")
+    if memory:
+        settled = memory[min(2, len(memory) - 1):]
+        print(f"server RSS (MB, per second): {' '.join(f'{kb / 1024:.0f}' for kb in memory)}")
+        print(f"  after 2 s: {settled[0] / 1024:.1f} -> {settled[-1] / 1024:.1f} MB "
+              f"({(settled[-1] - settled[0]) / 1024:+.1f} MB)")
+    for subscribers in (1, 10, 100):
+        print(f"publish to {subscribers:3} in-process subscriptions: {publish_cost(subscribers):.1f} us")
+    if stale > args.max_stale:
+        print(f"FAIL: slow clients received windows up to {stale:.1f} s old, over {args.max_stale:g} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Resource governor simulation for pi-guard's GovernorService.
+Writes a fake sysfs/procfs tree (thermal zone, firmware get_throttled,
+/proc/stat) in a temporary directory and plays synthetic load traces
+through it on a simulated clock, one governor check per --interval:
+
+  summer    the SoC warms from 60 to 83°C over ten minutes, throttling and
+            slowing the encoder past 80°C, holds, then cools back to 60°C:
+            the governor should step up to "video" and back to "normal"
+  spike     a one-check CPU spike to 100% every two minutes: no step
+  flap      the temperature swings between 66 and 77°C every 30 seconds:
+            steps up while it is hot, never back down while it swings
+  encoder   the encoder runs at 0.9x real time for two minutes on a cool,
+            idle Pi, then recovers
+  sparse    the summer trace on a tree without get_throttled or /proc/stat
+            (the temperature alone drives it)
+
+For each trace it checks that levels change one step at a time, that a
+step up comes only after --raise-after seconds of pressure and a step down
+only after --lower-after seconds recovered, and the highest and final
+level. The summer trace is then run through GovernorService itself, with
+stand-ins for the streaming, metrics and motion services recording how its
+levers are pulled: each in order on the way up, in reverse on the way down,
+after restoring the full video quality a previous run left lowered.
+Last, the cost of one check (reading the tree and updating the policy).
+
+Exits 1 if a check fails.
+
+Usage: python3 governor_sim.py [--interval 5] [--raise-after 10] [--lower-after 60] [--verbose]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+
+CORES = 4
+HZ = 100  # jiffies per second per core in /proc/stat
+
+
+class FakeSysfs:
+    """The files the governor reads, under a root directory, written from simulated readings."""
+
+    def __init__(self, root, throttle=True, proc_stat=True):
+        self.root = root
+        self.throttle = throttle
+        self.proc_stat = proc_stat
+        self.busy = 0
+        self.idle = 0
+        for path in ("sys/class/thermal/thermal_zone0", "sys/devices/platform/soc/soc:firmware", "proc"):
+            os.makedirs(os.path.join(root, path), exist_ok=True)
+
+    def _write(self, path, text):
+        with open(os.path.join(self.root, path), "w") as file:
+            file.write(text)
+
+    def set(self, temperature, throttled, cpu, seconds):
+        """Readings for the next check; cpu is the busy share over the seconds since the last."""
+        self._write("sys/class/thermal/thermal_zone0/temp", f"{round(temperature * 1000)}\n")
+        if self.throttle:
+            self._write("sys/devices/platform/soc/soc:firmware/get_throttled", f"{throttled:#x}\n")
+        if self.proc_stat:
+            jiffies = round(seconds * HZ * CORES)
+            self.busy += round(jiffies * cpu)
+            self.idle += jiffies - round(jiffies * cpu)
+            user, system = self.busy * 3 // 4, self.busy - self.busy * 3 // 4
+            self._write("proc/stat", f"cpu  {user} 0 {system} {self.idle} 0 0 0 0 0 0\ncpu0 0 0 0 0 0 0 0 0 0 0\n")
+
+
+# Each trace is a function of seconds since the start giving (°C, get_throttled flags, CPU busy, encoder speed)
+
+def summer(t):
+    if t < 600:
+        temperature = 60 + 23 * t / 600
+    elif t < 1500:
+        temperature = 83
+    elif t < 2100:
+        temperature = 83 - 23 * (t - 1500) / 600
+    else:
+        temperature = 60
+    throttled = 0xE if temperature >= 82 else 0x8 if temperature >= 80 else 0
+    return temperature, throttled, 0.6, 0.9 if temperature >= 80 else 1.0
+
+
+def spike(t):
+    return 55, 0, 1.0 if t % 120 == 60 else 0.4, 1.0
+
+
+def flap(t):
+    return (77 if t % 60 < 30 else 66), 0, 0.5, 1.0
+
+
+def encoder(t):
+    return 55, 0, 0.5, 0.9 if 60 <= t < 180 else 1.0
+
+
+# name, trace, seconds, (highest level, final level), sysfs options
+TRACES = [
+    ("summer", summer, 3600, (3, 0), {}),
+    ("spike", spike, 1200, (0, 0), {}),
+    ("flap", flap, 1200, (3, 3), {}),
+    ("encoder", encoder, 600, (3, 0), {}),
+    ("sparse", summer, 3600, (3, 0), {"throttle": False, "proc_stat": False}),
+]
+
+
+def simulate(trace, seconds, interval, root, sysfs_options, policy_options):
+    """Run the probe and policy over a trace; returns the (time, level, state) of every check."""
+    from modules.governor.policy import DegradationPolicy
+    from modules.governor.signals import SysfsProbe
+
+    fake = FakeSysfs(root, **sysfs_options)
+    probe = SysfsProbe(root)
+    policy = DegradationPolicy(**policy_options)
+    fake.set(60, 0, 0, 0)  # Primes /proc/stat
+    probe.cpu()
+    steps = []
+    for tick in range(int(seconds / interval) + 1):
+        t = tick * interval
+        temperature, throttled, cpu, speed = trace(t)
+        fake.set(temperature, throttled, cpu, interval)
+        policy.update(probe.read(speed), t)
+        steps.append((t, policy.level, policy.state))
+    return steps
+
+
+def check_steps(name, steps, expected, raise_after, lower_after):
+    """Failures of the hysteresis rules in one trace's checks."""
+    failures = []
+    last_change = None
+    pressure_since = recovered_since = None
+    previous = 0
+    for t, level, state in steps:
+        if state == "pressure":
+            pressure_since = t if pressure_since is None else pressure_since
+        else:
+            pressure_since = None
+        if state == "recovered":
+            recovered_since = t if recovered_since is None else recovered_since
+        else:
+            recovered_since = None
+        if level != previous:
+            if abs(level - previous) != 1:
+                failures.append(f"{name}: level {previous} -> {level} at {t}s skips a level")
+            dwell = raise_after if level > previous else lower_after
+            since = pressure_since if level > previous else recovered_since
+            if since is None or t - since < dwell or (last_change is not None and t - last_change < dwell):
+                failures.append(f"{name}: level {previous} -> {level} at {t}s before {dwell:g}s of "
+                                f"{'pressure' if level > previous else 'recovery'}")
+            last_change = t
+            # The dwell starts again after a step
+            pressure_since = t if level > previous else None
+            recovered_since = t if level < previous else None
+        previous = level
+    highest, final = max(level for _, level, _ in steps), steps[-1][1]
+    if (highest, final) != expected:
+        failures.append(f"{name}: highest/final level {highest}/{final}, expected {expected[0]}/{expected[1]}")
+    return failures
+
+
+class StandInStreaming:
+    def __init__(self, calls, trace):
+        self.calls = calls
+        self.trace = trace
+        self.t = 0
+        self.quality = {"framerate": 30, "bitrate": 1000000}
+
+    async def get_status(self):
+        return {"status": "running", "encoder": {"speed": self.trace(self.t)[3]}, "quality": dict(self.quality)}
+
+    async def set_quality(self, framerate=None, bitrate=None):
+        self.calls.append(("video", framerate, bitrate))
+        self.quality = {"framerate": framerate or 30, "bitrate": bitrate or 1000000}
+        return dict(self.quality)
+
+
+class StandInSampler:
+    rate_scale = 1.0
+
+
+class StandInMetrics:
+    def __init__(self, calls):
+        self.calls = calls
+        self.sampler = StandInSampler()
+
+    def set_sampling_scale(self, scale):
+        self.calls.append(("sampling", scale))
+        self.sampler.rate_scale = scale
+
+
+class StandInMotion:
+    def __init__(self, calls):
+        self.calls = calls
+        self.max_rate = None
+
+    def set_analysis_rate(self, rate):
+        self.calls.append(("analysis", rate))
+        self.max_rate = rate
+
+
+async def run_service(root, seconds, interval):
+    """The summer trace through GovernorService; returns the lever calls and the final status."""
+    from modules.governor.service import GovernorService
+
+    fake = FakeSysfs(root)
+    calls = []
+    streaming = StandInStreaming(calls, summer)
+    streaming.quality = {"framerate": 15, "bitrate": 600000}  # Left lowered by a pi-guard that restarted at "video"
+    service = GovernorService(streaming, StandInMetrics(calls), StandInMotion(calls))
+    fake.set(60, 0, 0, 0)
+    service.probe.cpu()
+    for tick in range(int(seconds / interval) + 1):
+        t = streaming.t = tick * interval
+        temperature, throttled, cpu, _ = summer(t)
+        fake.set(temperature, throttled, cpu, interval)
+        await service.tick(t)
+    return calls, await service.get_status()
+
+
+def check_levers(calls, settings):
+    expected = [
+        ("video", None, None),  # The first check restores the configured quality, whatever it was
+        ("analysis", settings.GOVERNOR_ANALYSIS_FPS),
+        ("sampling", settings.GOVERNOR_SAMPLING_SCALE),
+        ("video", settings.GOVERNOR_VIDEO_FRAMERATE, settings.GOVERNOR_VIDEO_BITRATE),
+        ("video", None, None),
+        ("sampling", 1.0),
+        ("analysis", None),
+    ]
+    if calls != expected:
+        return [f"service: levers pulled {calls}, expected {expected}"]
+    return []
+
+
+def time_check(root, count):
+    """Seconds per check: reading the fake tree and updating the policy."""
+    from modules.governor.policy import DegradationPolicy
+    from modules.governor.signals import SysfsProbe
+
+    fake = FakeSysfs(root)
+    fake.set(70, 0, 0.5, 5)
+    probe = SysfsProbe(root)
+    policy = DegradationPolicy()
+    durations = []
+    for i in range(count):
+        started = time.perf_counter()
+        policy.update(probe.read(1.0), i * 5)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=5, help="seconds between governor checks")
+    parser.add_argument("--raise-after", type=float, default=10, help="seconds of pressure per step up")
+    parser.add_argument("--lower-after", type=float, default=60, help="seconds recovered per step down")
+    parser.add_argument("--checks", type=int, default=2000, help="checks to time")
+    parser.add_argument("--verbose", action="store_true", help="print every level change")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="governor-sim-") as work:
+        return run(args, work)
+
+
+def run(args, work):
+    # The service reads its settings at import
+    os.environ.update({
+        "GOVERNOR_SYSFS_ROOT": os.path.join(work, "service"),
+        "GOVERNOR_RAISE_AFTER": str(args.raise_after),
+        "GOVERNOR_LOWER_AFTER": str(args.lower_after),
+    })
+    use_source_dir(PI_GUARD_DIR)
+    from config import settings
+    if not args.verbose:
+        logging.getLogger("modules.governor").setLevel(logging.ERROR)
+
+    policy_options = {"raise_after": args.raise_after, "lower_after": args.lower_after}
+    failures = []
+    print(f"{'trace':8} {'checks':>6} {'changes':>7} {'highest':>7} {'final':>5}  time at each level (s)")
+    for name, trace, seconds, expected, sysfs_options in TRACES:
+        steps = simulate(trace, seconds, args.interval, os.path.join(work, name), sysfs_options, policy_options)
+        failures += check_steps(name, steps, expected, args.raise_after, args.lower_after)
+        changes = [(t, level) for (t, level, _), (_, previous, _) in zip(steps[1:], steps) if level != previous]
+        dwell = [0.0] * 4
+        for t, level, _ in steps:
+            dwell[level] += args.interval
+        print(f"{name:8} {len(steps):6d} {len(changes):7d} {max(s[1] for s in steps):7d} {steps[-1][1]:5d}  "
+              + " ".join(f"{spent:6.0f}" for spent in dwell))
+        if args.verbose:
+            for t, level in changes:
+                print(f"  {t:7.0f}s  -> level {level}  ({trace(t)[0]:.1f}°C)")
+
+    calls, status = asyncio.run(run_service(os.path.join(work, "service"), 3600, args.interval))
+    failures += check_levers(calls, settings)
+    print(f"service: {len(calls)} lever calls, {status['level_changes']} level changes, "
+          f"ends at {status['level_name']} ({status['lever_errors']} lever errors)")
+    if args.verbose:
+        for call in calls:
+            print(f"  {call}")
+
+    durations = time_check(os.path.join(work, "timing"), args.checks)
+    print(f"check: p50 {percentile(durations, 50) * 1e6:.0f} us, p99 {percentile(durations, 99) * 1e6:.0f} us "
+          f"({args.checks} checks)")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("FAIL" if failures else "OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
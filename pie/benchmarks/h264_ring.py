@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+H.264 access unit parser and GOP ring benchmark.
+Reports parse throughput in MB/s and memory allocated per frame while the
+stream is split into access units and appended to the ring, with and without
+concurrent consumers (one of them stalled). First checks that the parser
+finds the same access units however the stream is split into reads,
+including reads ending inside the first NAL header; exits 1 if not.
+
+Usage: python3 h264_ring.py [--source file.h264] [--megabytes 200]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from common import STREAM_DIR, generate_h264, use_source_dir
+
+use_source_dir(STREAM_DIR)
+from gop_ring import GopRing  # noqa: E402
+from h264 import AccessUnitParser  # noqa: E402
+
+CHUNK_SIZE = 65536
+
+
+def synthetic_h264(frames=300, gop=30, size=4096):
+    """Annex B stream of fake pictures, used when ffmpeg isn't available."""
+    idr = b"\x00\x00\x00\x01\x67\x42" + b"\x11" * 8 + b"\x00\x00\x00\x01\x68\xce\x11" + b"\x00\x00\x00\x01\x65\x88"
+    non_idr = b"\x00\x00\x00\x01\x41\x9a"
+    return b"".join((idr if i % gop == 0 else non_idr) + b"\x11" * size for i in range(frames))
+
+
+def load_source(path):
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    if shutil.which("ffmpeg"):
+        with tempfile.TemporaryDirectory() as workdir:
+            with open(generate_h264(os.path.join(workdir, "source.h264"), seconds=10), "rb") as f:
+                return f.read()
+    return synthetic_h264()
+
+
+def parse_all(chunks):
+    units = []
+    parser = AccessUnitParser(lambda unit, keyframe: units.append((bytes(unit), keyframe)))
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.flush()
+    return units
+
+
+def check_splits(data, trials=200, seed=1):
+    """Trials whose random read boundaries gave other access units than one whole read."""
+    expected = parse_all([data])
+    rng = random.Random(seed)
+    failed = 0
+    for _ in range(trials):
+        # The first read ends within the first few NAL headers, the rest anywhere
+        cuts = [rng.randint(1, 40)]
+        cuts += sorted(rng.sample(range(cuts[0] + 1, len(data)), min(200, len(data) - cuts[0] - 1)))
+        bounds = [0] + cuts + [len(data)]
+        if parse_all(data[a:b] for a, b in zip(bounds, bounds[1:])) != expected:
+            failed += 1
+    return failed
+
+
+def new_ring():
+    # Same sizing as stream.py: 4 s at twice 1 Mbit/s, 30 fps
+    return GopRing(capacity_bytes=1000000, max_units=240)
+
+
+def feed(parser, data, total_bytes):
+    """Feed the source repeatedly in camera sized reads until total_bytes are parsed."""
+    view = memoryview(data)
+    fed = 0
+    while fed < total_bytes:
+        for offset in range(0, len(view), CHUNK_SIZE):
+            parser.feed(view[offset:offset + CHUNK_SIZE])
+        fed += len(view)
+    return fed
+
+
+def measure_throughput(data, total_bytes, consumers=()):
+    ring = new_ring()
+    parser = AccessUnitParser(ring.append)
+    stop = threading.Event()
+    threads = []
+    for name, delay in consumers:
+        cursor = ring.cursor(name)
+        thread = threading.Thread(target=consume, args=(cursor, delay, stop), daemon=True)
+        thread.start()
+        threads.append((cursor, thread))
+
+    start = time.perf_counter()
+    fed = feed(parser, data, total_bytes)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for _, thread in threads:
+        thread.join()
+    return fed / elapsed / 1e6, parser.access_units / elapsed, [(c.name, c.delivered, c.skipped) for c, _ in threads]
+
+
+def consume(cursor, delay, stop):
+    while not stop.is_set():
+        if delay is None:
+            stop.wait(0.1)  # stalled consumer, never reads
+            continue
+        cursor.read(timeout=0.1)
+        if delay:
+            time.sleep(delay)
+
+
+def measure_allocations(data):
+    """Memory allocated while parsing one pass of the source after warm-up."""
+    ring = new_ring()
+    parser = AccessUnitParser(ring.append)
+    feed(parser, data, len(data))  # warm-up
+    frames_before = parser.access_units
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    feed(parser, data, len(data))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    frames = parser.access_units - frames_before
+    blocks = sys.getallocatedblocks() - blocks_before
+    return frames, (peak - baseline) / frames, (current - baseline) / frames, blocks / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source", help="Annex B H.264 file (default: generated test source)")
+    parser.add_argument("--megabytes", type=int, default=200)
+    args = parser.parse_args()
+
+    data = load_source(args.source)
+    total = args.megabytes * 1000000
+    print(f"source: {len(data) / 1e6:.1f} MB")
+
+    failed = check_splits(data[:2000000])
+    print(f"random read boundaries: {failed} of 200 splits parsed differently")
+    if failed:
+        sys.exit(1)
+
+    runs = [
+        ("producer only", ()),
+        ("3 consumers, 1 stalled", (("rtsp", 0), ("recorder", 0.01), ("stalled", None))),
+    ]
+    for label, consumers in runs:
+        mb_per_s, units_per_s, cursors = measure_throughput(data, total, consumers)
+        print(f"{label:<24} {mb_per_s:8.1f} MB/s {units_per_s:10.0f} access units/s")
+        for name, delivered, skipped in cursors:
+            print(f"  {name:<10} delivered {delivered:>8} skipped {skipped:>8}")
+
+    frames, peak_per_frame, retained_per_frame, blocks_per_frame = measure_allocations(data)
+    print(f"allocations over {frames} frames: peak transient {peak_per_frame:.1f} B/frame, "
+          f"retained {retained_per_frame:.2f} B/frame, {blocks_per_frame:.3f} live blocks/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Service startup benchmark for pi-guard's LifecycleManager.
+Registers stand-in services with main.py's dependency graph and start-up
+delays typical of the Pi (camera and Sense HAT initialisation block a
+thread, the broker connection is awaited), then times start_all() until
+/health answers, against starting them one after another:
+
+  healthy   every service starts
+  camera    the camera fails: motion, snapshot and MJPEG are skipped, the
+            rest run and /health reports "degraded"
+  hang      the MQTT start never finishes and times out (--timeout); the
+            services ordered after it still start once it has
+
+Checks that every service started after its dependencies and stopped after
+its dependents. Then cold-starts the real application in a child process
+(stand-in Sense HAT, no camera, broker or supervisor reachable) and
+reports import time, startup time and the first /health.
+
+Usage: python3 lifecycle_startup.py [--timeout 0.5] [--scale 1]
+"""
+import time
+
+STARTED = time.monotonic()  # The cold start child times its imports from here
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import types
+
+from common import PI_GUARD_DIR, use_source_dir
+from metrics_sampling import FakeSenseHat
+
+# The real module only imports on a Pi; the metrics service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+
+# name, depends_on, after (ordered only), seconds to start, how: blocking (worker thread) or async (awaited)
+SERVICES = [
+    ("camera", [], [], 0.30, "blocking"),
+    ("streaming", [], [], 0.02, "async"),
+    ("mqtt", [], [], 0.20, "async"),
+    ("metrics", [], ["mqtt"], 0.15, "blocking"),
+    ("recordings", [], [], 0.02, "async"),
+    ("motion", ["camera"], ["mqtt"], 0.05, "blocking"),
+    ("snapshot", ["camera"], [], 0.01, "async"),
+    ("mjpeg", ["snapshot"], [], 0.01, "async"),
+    ("events", ["metrics"], ["motion"], 0.01, "async"),
+    ("governor", [], ["streaming", "metrics", "motion"], 0.01, "async"),
+]
+
+
+class FakeService:
+    """Service stand-in that takes a while to start and records when it started and stopped."""
+
+    def __init__(self, name, delay, how, log, fail=False, hang=False):
+        self.name = name
+        self.delay = delay
+        self.log = log
+        self.fail = fail
+        self.hang = hang
+        if how == "blocking":
+            self.start = self._start_blocking
+        else:
+            self.start = self._start_async
+
+    def _started(self):
+        if self.fail:
+            raise RuntimeError(f"{self.name} hardware not found")
+        self.log.append(("started", self.name, time.monotonic()))
+
+    def _start_blocking(self):
+        self.log.append(("starting", self.name, time.monotonic()))
+        time.sleep(self.delay)
+        self._started()
+
+    async def _start_async(self):
+        self.log.append(("starting", self.name, time.monotonic()))
+        await asyncio.sleep(3600 if self.hang else self.delay)
+        self._started()
+
+    async def stop(self):
+        await asyncio.sleep(self.delay / 10)
+        self.log.append(("stopped", self.name, time.monotonic()))
+
+    async def get_status(self):
+        return {"status": "running"}
+
+
+def check_order(log, graph):
+    """Dependency violations in the start and stop log, an empty list if none."""
+    when = {(event, name): at for event, name, at in log}
+    problems = []
+    for name, depends_on in graph.items():
+        for dependency in depends_on:
+            if ("starting", name) in when and when[("starting", name)] < when.get(("started", dependency), 0):
+                problems.append(f"{name} started before {dependency}")
+            if ("stopped", dependency) in when and when[("stopped", dependency)] < when.get(("stopped", name), 0):
+                problems.append(f"{dependency} stopped before {name}")
+    return problems
+
+
+async def scenario(LifecycleManager, router, scale, timeout, fail=None, hang=None):
+    import httpx
+    from fastapi import FastAPI
+
+    log = []
+    lifecycle = LifecycleManager()
+    for name, depends_on, after, delay, how in SERVICES:
+        service = FakeService(name, delay * scale, how, log, fail=name == fail, hang=name == hang)
+        lifecycle.register_service(name, service, depends_on, start_timeout=timeout, blocking=how == "blocking",
+                                   after=after)
+    app = FastAPI()
+    app.include_router(router)
+    app.state.lifecycle = lifecycle
+
+    began = time.monotonic()
+    await lifecycle.start_all()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://pi-guard") as http:
+        health = (await http.get("/health")).json()
+    ready = time.monotonic() - began
+    await lifecycle.stop_all()
+    return ready, health, check_order(log, {name: depends_on + after for name, depends_on, after, _, _ in SERVICES})
+
+
+def cold_start(workdir):
+    """Run the real app's startup in a child process; returns its timings."""
+    env = dict(os.environ, STREAM_CONTROL_URL="http://127.0.0.1:1", MQTT_BROKER="127.0.0.1", MQTT_PORT="1",
+               METRICS_SPOOL_PATH=os.path.join(workdir, "metrics.db"), RECORDINGS_DIR=workdir, LOG_LEVEL="WARNING")
+    spawned = time.time()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--cold-start-child"], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.splitlines()[-1])
+    timings["process"] = timings.pop("ready_at") - spawned  # Including the interpreter's own start-up
+    return timings
+
+
+async def cold_start_child():
+    use_source_dir(PI_GUARD_DIR)
+    import main
+    import httpx
+    imported = time.monotonic()
+
+    # Drive the ASGI lifespan as uvicorn would
+    to_app, from_app = asyncio.Queue(), asyncio.Queue()
+    lifespan = asyncio.create_task(main.app({"type": "lifespan", "asgi": {"version": "3.0"}}, to_app.get, from_app.put))
+    await to_app.put({"type": "lifespan.startup"})
+    message = await from_app.get()
+    assert message["type"] == "lifespan.startup.complete", message
+    up = time.monotonic()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://pi-guard") as http:
+        health = (await http.get("/health")).json()
+    ready = time.monotonic()
+    await to_app.put({"type": "lifespan.shutdown"})
+    await from_app.get()
+    await lifespan
+    print(json.dumps({
+        "import": imported - STARTED, "startup": up - imported, "health": ready - up, "ready_at": time.time(),
+        "status": health["status"], "services": health["lifecycle"]["services"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timeout", type=float, default=0.5, help="start timeout per service, seconds")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every start-up delay")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.cold_start_child:
+        asyncio.run(cold_start_child())
+        return 0
+
+    use_source_dir(PI_GUARD_DIR)
+    from api.routes import router
+    from core.lifecycle import LifecycleManager
+
+    sequential = sum(delay for _, _, _, delay, _ in SERVICES) * args.scale
+    print(f"{len(SERVICES)} services, {sequential * 1000:.0f} ms of start-up one after another")
+    ok = True
+    for label, fail, hang in (("healthy", None, None), ("camera", "camera", None), ("hang", None, "mqtt")):
+        ready, health, problems = asyncio.run(scenario(LifecycleManager, router, args.scale, args.timeout, fail, hang))
+        services = health["lifecycle"]["services"]
+        timings = " ".join(f"{name}={entry['start_ms'] if entry['start_ms'] is not None else '-'}"
+                           for name, entry in services.items())
+        print(f"  {label:>8}: /health {health['status']!r} after {ready * 1000:5.0f} ms, "
+              f"degraded {health['lifecycle']['degraded'] or '[]'}; order ok: {not problems}")
+        print(f"            start ms: {timings}")
+        for problem in problems:
+            print(f"            {problem}")
+        ok &= not problems and (label != "healthy" or ready < 1.0)  # Ready well inside a second
+
+    with tempfile.TemporaryDirectory() as workdir:
+        real = cold_start(workdir)
+    states = {}
+    for name, entry in real["services"].items():
+        states.setdefault(entry["state"], []).append(name)
+    print(f"real app cold start: import {real['import'] * 1000:.0f} ms, services {real['startup'] * 1000:.0f} ms, "
+          f"first /health {real['health'] * 1000:.0f} ms; {real['process'] * 1000:.0f} ms from spawning the "
+          f"process to a {real['status']!r} /health")
+    print("  slowest starts: " + ", ".join(
+        f"{name} {entry['start_ms']} ms" for name, entry in
+        sorted(real["services"].items(), key=lambda item: -(item[1]["start_ms"] or 0))[:3]))
+    print("  " + "; ".join(f"{state}: {', '.join(names)}" for state, names in states.items()))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Metrics payload format benchmark.
+Encodes a synthetic hour of Sense HAT readings (drifting environment, noisy
+IMU) as JSON and as the binary format of modules/metrics/codec.py, in both
+message shapes:
+
+  per-sample   metrics.py's flat ten-field message
+  windowed     pi-guard's window summary (last plus min/max/mean/count),
+               stamped with seq, time, captured and sent
+
+and reports payload bytes, MQTT bytes per hour at one message per 2 s,
+and encode/decode time per message. Every binary frame is decoded and
+checked against the JSON it replaces.
+
+metrics.py is deployed on its own with a copy of the codec
+(pie/metrics/codec.py); the run exits 1 if that copy differs from pi-guard's.
+
+Usage: python3 metrics_codec.py [--messages 1800] [--keyframe-interval 30]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+from common import PIE_DIR, PI_GUARD_DIR, use_source_dir
+
+use_source_dir(PI_GUARD_DIR)
+from config import settings  # noqa: E402
+from modules.metrics.codec import MetricsDecoder, MetricsEncoder  # noqa: E402
+from modules.metrics.sampler import CHANNELS, ChannelWindow, parse_rates, summarize  # noqa: E402
+
+INTERVAL = 2.0
+CODEC_COPIES = (
+    os.path.join(PI_GUARD_DIR, "modules", "metrics", "codec.py"),
+    os.path.join(PIE_DIR, "metrics", "codec.py"),
+)
+
+
+def copies_match():
+    """Whether metrics.py's copy of the codec is byte-identical to pi-guard's."""
+    contents = []
+    for path in CODEC_COPIES:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return all(content == contents[0] for content in contents)
+
+
+def reading(t, rng):
+    """One raw read of every channel at time t seconds."""
+    return {
+        "temp_humidity": (24.0 + 0.5 * math.sin(t / 900) + rng.gauss(0, 0.05),),
+        "temp_pressure": (23.6 + 0.5 * math.sin(t / 900) + rng.gauss(0, 0.05),),
+        "humidity": (41.0 + 2 * math.sin(t / 1200) + rng.gauss(0, 0.1),),
+        "pressure": (1013.25 + 0.3 * math.sin(t / 3600) + rng.gauss(0, 0.01),),
+        "orientation": (2 * math.sin(t / 30) + rng.gauss(0, 0.3), 1.5 + rng.gauss(0, 0.3), (90 + t / 60) % 360),
+        "accel": (rng.gauss(0, 0.01), rng.gauss(0, 0.01), 1 + rng.gauss(0, 0.01)),
+    }
+
+
+def per_sample_messages(count, rng):
+    messages = []
+    for n in range(count):
+        values = reading(n * INTERVAL, rng)
+        message = {}
+        for name, channel in CHANNELS.items():
+            for field, value in zip(channel.fields, values[name]):
+                message[field] = round(value, channel.decimals)
+        messages.append(message)
+    return messages
+
+
+def windowed_messages(count, rng, rates):
+    windows = {
+        name: ChannelWindow(len(CHANNELS[name].fields), math.ceil(rate * INTERVAL * 2) + 2)
+        for name, rate in rates.items() if rate > 0
+    }
+    last = {}
+    messages = []
+    for n in range(count):
+        for name, window in windows.items():
+            window.reset()
+            samples = round(rates[name] * INTERVAL)
+            for k in range(samples):
+                window.add(reading(n * INTERVAL + k / rates[name], rng)[name])
+        end = 1_700_000_000 + (n + 1) * INTERVAL
+        stamps = {"seq": n + 1, "time": round(end, 4), "captured": round(end - rng.uniform(0, 0.1), 4),
+                  "sent": round(end + rng.uniform(0, 0.005), 4)}
+        messages.append({**stamps, **summarize(windows, last)})
+    return messages
+
+
+def publish_packet_size(topic, payload_size):
+    """Bytes on the wire for an MQTT 3.1.1 QoS 0 PUBLISH."""
+    remaining = 2 + len(topic) + payload_size
+    length_bytes = 1 if remaining < 128 else 2 if remaining < 16384 else 3
+    return 1 + length_bytes + remaining
+
+
+def timed(func, items):
+    started = time.perf_counter()
+    results = [func(item) for item in items]
+    return results, (time.perf_counter() - started) / len(items) * 1e6
+
+
+def compare(label, messages, keyframe_interval):
+    print(f"{label} ({len(messages)} messages):")
+    print(f"  {'format':<22} {'bytes/msg':>9} {'MB/hour':>8} {'encode us':>10} {'decode us':>10}")
+    per_hour = 3600 / INTERVAL
+
+    payloads, encode_us = timed(json.dumps, messages)
+    _, decode_us = timed(json.loads, payloads)
+    size = sum(len(payload) for payload in payloads) / len(payloads)
+    wire = sum(publish_packet_size(settings.MQTT_METRICS_TOPIC, len(payload)) for payload in payloads) / len(payloads)
+    print(f"  {'JSON':<22} {size:9.1f} {wire * per_hour / 1e6:8.3f} {encode_us:10.1f} {decode_us:10.1f}")
+    json_wire = wire
+
+    for name, delta in (("binary keyframes", False), (f"binary delta (1/{keyframe_interval})", True)):
+        encoder = MetricsEncoder(delta=delta, keyframe_interval=keyframe_interval)
+        frames, encode_us = timed(encoder.encode, messages)
+        decoder = MetricsDecoder()
+        decoded, decode_us = timed(decoder.decode, frames)
+        if decoded != messages:
+            bad = next(i for i, (a, b) in enumerate(zip(decoded, messages)) if a != b)
+            raise SystemExit(f"{name}: frame {bad} decoded to {decoded[bad]}, expected {messages[bad]}")
+        size = sum(len(frame) for frame in frames) / len(frames)
+        wire = sum(publish_packet_size(settings.MQTT_METRICS_BINARY_TOPIC, len(frame)) for frame in frames) / len(frames)
+        print(f"  {name:<22} {size:9.1f} {wire * per_hour / 1e6:8.3f} {encode_us:10.1f} {decode_us:10.1f}"
+              f"   {json_wire / wire:4.1f}x smaller on the wire")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1800, help="one hour at 2 s")
+    parser.add_argument("--keyframe-interval", type=int, default=settings.METRICS_KEYFRAME_INTERVAL)
+    parser.add_argument("--rates", default=settings.METRICS_SAMPLE_RATES)
+    args = parser.parse_args()
+
+    if not copies_match():
+        print(f"Codec copies differ: {' and '.join(CODEC_COPIES)}")
+        return 1
+    print("Codec copies: identical")
+
+    rng = random.Random(1)
+    compare("per-sample (metrics.py)", per_sample_messages(args.messages, rng), args.keyframe_interval)
+    compare("windowed (MetricsService)", windowed_messages(args.messages, rng, parse_rates(args.rates)),
+            args.keyframe_interval)
+    print("All binary frames decoded to the original messages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Report-by-exception savings for pi-guard's MetricsService.
+Runs a day of Sense HAT windows through the service's aggregation and
+DeadbandFilter and compares what gets published with the fixed-interval
+mode (every field, every window): messages, JSON and binary bytes on the
+wire, and how far a subscriber's picture of each field drifts from the
+latest reading (at most the deadband, by construction).
+
+Without --recording the day is synthetic: a diurnal temperature and
+humidity cycle with sensor noise, a door opened at 13:00 and the camera
+knocked (yaw jumps 15 degrees) at 16:00. --recording replays a captured
+day instead: one JSON metrics message per line, as published on
+sensors/metrics by metrics.py or pi-guard (e.g. from mosquitto_sub).
+
+Usage: python3 metrics_deadband.py [--hours 24] [--interval 2] [--recording day.jsonl]
+"""
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+
+from common import PI_GUARD_DIR, use_source_dir
+from metrics_codec import publish_packet_size
+
+use_source_dir(PI_GUARD_DIR)
+from config import settings  # noqa: E402
+from modules.metrics.codec import MetricsEncoder  # noqa: E402
+from modules.metrics.deadband import ANGULAR_CHANNELS, DeadbandFilter  # noqa: E402
+from modules.metrics.sampler import CHANNELS, ChannelWindow, parse_channel_values, parse_rates, summarize  # noqa: E402
+
+DAY = 86400
+
+
+def synthetic_channel(name, times, rng):
+    """Samples of one channel at the given times (seconds since midnight)."""
+    noise = lambda scale: rng.normal(0, scale, len(times))  # noqa: E731
+    diurnal = np.sin(2 * math.pi * (times - 9 * 3600) / DAY)
+    # Door open at 13:00: 2 degrees colder within two minutes, back over twenty
+    since_door = times - 13 * 3600
+    door = np.where(since_door < 0, 0, np.where(since_door < 120, since_door / 120, np.exp(-(since_door - 120) / 600)))
+    knocked = times >= 16 * 3600
+    if name in ("temp_humidity", "temp_pressure"):
+        offset = 0 if name == "temp_humidity" else -0.4
+        return np.stack([21.5 + offset + 2.5 * diurnal - 2 * door + noise(0.05)], axis=1)
+    if name == "humidity":
+        return np.stack([45 - 6 * diurnal + 4 * door + noise(0.2)], axis=1)
+    if name == "pressure":
+        return np.stack([1013 + 1.5 * np.sin(2 * math.pi * times / (1.4 * DAY)) + noise(0.02)], axis=1)
+    if name == "orientation":
+        yaw = (358 + 15 * knocked + noise(0.3)) % 360  # mounted facing north, just left of the wrap
+        return np.stack([2 + noise(0.3), 1.5 + noise(0.3), yaw], axis=1)
+    # accel: gravity plus noise, and a jolt when the camera is knocked
+    jolt = np.where((times >= 16 * 3600) & (times < 16 * 3600 + 0.3), 0.5, 0)
+    return np.stack([noise(0.01) + jolt, noise(0.01), 1 + noise(0.01) - jolt], axis=1)
+
+
+def synthetic_day(hours, interval, rates, seed=1):
+    """Summarized windows, as the service builds them: [(window end, metrics)]."""
+    rng = np.random.default_rng(seed)
+    windows_count = int(hours * 3600 / interval)
+    samples = {}
+    for name, rate in rates.items():
+        times = np.arange(0, windows_count * interval, 1 / rate)
+        samples[name] = (synthetic_channel(name, times, rng), round(rate * interval))
+    windows = {
+        name: ChannelWindow(len(CHANNELS[name].fields), math.ceil(rate * interval * 2) + 2)
+        for name, rate in rates.items()
+    }
+    last = {}
+    day = []
+    for n in range(windows_count):
+        for name, (values, per_window) in samples.items():
+            window = windows[name]
+            window.reset()
+            for row in values[n * per_window:(n + 1) * per_window]:
+                window.add(row)
+        day.append(((n + 1) * interval, summarize(windows, last)))
+    return day
+
+
+def recorded_day(path, interval):
+    """Windows from captured messages; flat per-sample messages become one-sample windows."""
+    day = []
+    with open(path) as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            fields = [field for channel in CHANNELS.values() for field in channel.fields if field in message]
+            metrics = {field: message[field] for field in fields}
+            for block in ("min", "max", "mean"):
+                metrics[block] = message.get(block) or {field: message[field] for field in fields}
+            metrics["count"] = message.get("count") or {field: 1 for field in fields}
+            day.append((message.get("time", n * interval), metrics))
+    return day
+
+
+def channel_of(field):
+    return next(name for name, channel in CHANNELS.items() if field in channel.fields)
+
+
+def publish(day, deadband_filter):
+    """Messages as published (seq and time added), and the worst drift per channel."""
+    messages = []
+    seen = {}  # what a subscriber holding the latest values believes
+    drift = {name: 0.0 for name in CHANNELS}
+    for end, metrics in day:
+        message = deadband_filter.filter(metrics, end) if deadband_filter else metrics
+        if message is not None:
+            messages.append({"seq": len(messages) + 1, "time": round(end, 3), **message})
+            seen.update({field: message[field] for field in message["count"]})
+        for field in metrics["count"]:
+            if field in seen:
+                name = channel_of(field)
+                error = abs(metrics[field] - seen[field])
+                if name in ANGULAR_CHANNELS:
+                    error = abs((metrics[field] - seen[field] + 180) % 360 - 180)
+                drift[name] = max(drift[name], error)
+    return messages, drift
+
+
+def wire_bytes(messages):
+    json_bytes = sum(publish_packet_size(settings.MQTT_METRICS_TOPIC, len(json.dumps(m))) for m in messages)
+    encoder = MetricsEncoder(settings.METRICS_DELTA, settings.METRICS_KEYFRAME_INTERVAL)
+    binary_bytes = sum(publish_packet_size(settings.MQTT_METRICS_BINARY_TOPIC, len(encoder.encode(m))) for m in messages)
+    return json_bytes, binary_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--interval", type=float, default=settings.METRICS_PUBLISH_INTERVAL)
+    parser.add_argument("--rates", default=settings.METRICS_SAMPLE_RATES)
+    parser.add_argument("--recording", help="JSON lines of captured metrics messages")
+    parser.add_argument("--deadband", default=settings.METRICS_DEADBAND)
+    parser.add_argument("--rate-of-change", default=settings.METRICS_RATE_OF_CHANGE)
+    parser.add_argument("--heartbeat", type=float, default=settings.METRICS_HEARTBEAT_INTERVAL)
+    args = parser.parse_args()
+
+    if args.recording:
+        day = recorded_day(args.recording, args.interval)
+        print(f"{len(day)} windows from {args.recording}")
+    else:
+        day = synthetic_day(args.hours, args.interval, parse_rates(args.rates))
+        print(f"{len(day)} synthetic windows ({args.hours:g} h at {args.interval:g} s)")
+    deadbands = parse_channel_values(args.deadband, "deadband")
+    rates_of_change = parse_channel_values(args.rate_of_change, "rate of change")
+
+    modes = [
+        ("fixed interval", None),
+        ("deadband", DeadbandFilter(deadbands, {}, args.heartbeat)),
+        ("deadband + rate of change", DeadbandFilter(deadbands, rates_of_change, args.heartbeat)),
+    ]
+    print(f"  {'mode':<26} {'messages':>8} {'heartbeats':>10} {'JSON MB':>8} {'binary MB':>9}  saved (msgs / JSON bytes)")
+    baseline = None
+    drifts = {}
+    for label, deadband_filter in modes:
+        messages, drifts[label] = publish(day, deadband_filter)
+        json_bytes, binary_bytes = wire_bytes(messages)
+        heartbeats = deadband_filter.heartbeats if deadband_filter else 0
+        if baseline is None:
+            baseline = (len(messages), json_bytes)
+        saved = f"{1 - len(messages) / baseline[0]:6.1%} / {1 - json_bytes / baseline[1]:6.1%}"
+        print(f"  {label:<26} {len(messages):8} {heartbeats:10} {json_bytes / 1e6:8.3f} {binary_bytes / 1e6:9.3f}  {saved}")
+
+    print("Largest drift of a subscriber's latest value from the reading (deadband):")
+    for name in CHANNELS:
+        print(f"  {name:<14} {drifts['deadband + rate of change'][name]:7.2f}  ({deadbands.get(name, 0):g})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
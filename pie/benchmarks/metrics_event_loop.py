@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Event loop responsiveness benchmark for pi-guard's MetricsService.
+Runs the API routes in-process with MetricsService sampling a stand-in Sense
+HAT whose every read blocks for --latency seconds (like a slow I2C bus), and
+has concurrent clients poll /health on a fixed schedule, timing each request
+from when it was due. Reports /health latency for three runs:
+
+  idle       no sampling
+  inline     every channel read once per interval on the event loop (the old behaviour)
+  service    MetricsService, which samples on its sensor thread at METRICS_SAMPLE_RATES
+
+The service run's p99 should match the idle run. Also checks that start()
+returns immediately with the broker unreachable.
+
+Usage: python3 metrics_event_loop.py [--latency 0.02] [--interval 0.5] [--seconds 5]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import types
+
+import httpx
+from fastapi import FastAPI
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+
+
+class FakeSenseHat:
+    """Sense HAT stand-in; every read blocks the calling thread for LATENCY seconds."""
+
+    LATENCY = 0.02
+
+    def __init__(self):
+        time.sleep(self.LATENCY * 10)  # framebuffer and IMU setup
+        self.reads = 0
+
+    def _read(self, value):
+        time.sleep(self.LATENCY)
+        self.reads += 1
+        return value
+
+    def set_imu_config(self, compass, gyro, accel):
+        self._read(None)
+
+    def get_temperature_from_humidity(self):
+        return self._read(24.3)
+
+    def get_temperature_from_pressure(self):
+        return self._read(23.9)
+
+    def get_humidity(self):
+        return self._read(41.2)
+
+    def get_pressure(self):
+        return self._read(1013.25)
+
+    def get_orientation(self):
+        return self._read({"pitch": 1.0, "roll": 2.0, "yaw": 3.0})
+
+    def get_accelerometer_raw(self):
+        return self._read({"x": 0.0, "y": 0.0, "z": 1.0})
+
+
+# The real module only imports on a Pi; the service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+use_source_dir(PI_GUARD_DIR)
+from api.routes import router  # noqa: E402
+from config import settings  # noqa: E402
+from modules.metrics.sampler import CHANNELS, read_channel  # noqa: E402
+from modules.metrics.service import MetricsService  # noqa: E402
+from modules.mqtt.service import MqttService  # noqa: E402
+
+
+async def poll_health(http, deadline, latencies, period=0.02):
+    """Polls on a fixed schedule and times each request from when it was due,
+    so a request that couldn't be sent while the loop was blocked counts."""
+    due = time.perf_counter()
+    while time.monotonic() < deadline:
+        due += period
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await http.get("/health")
+        latencies.append(max(0.0, time.perf_counter() - due))
+        response.raise_for_status()
+
+
+async def inline_sampling(sense, deadline):
+    """What the loop used to do: read the sensor on the event loop thread."""
+    while time.monotonic() < deadline:
+        for name in CHANNELS:
+            read_channel(sense, name)
+        await asyncio.sleep(settings.METRICS_PUBLISH_INTERVAL)
+
+
+async def run(mode, clients, seconds):
+    app = FastAPI()
+    app.include_router(router)
+    service = MetricsService(MqttService())
+    app.state.metrics_service = service
+    extra = []
+    sense = None
+    start_ms = None
+    deadline = time.monotonic() + seconds
+    if mode == "inline":
+        sense = FakeSenseHat()
+        extra.append(inline_sampling(sense, deadline))
+    elif mode == "service":
+        started = time.perf_counter()
+        service.start()
+        start_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://pi-guard") as http:
+        await asyncio.gather(*(poll_health(http, deadline, latencies) for _ in range(clients)), *extra)
+    if service.sampler:
+        sense = service.sampler.sense
+    reads = sense.reads if sense else 0
+    service.stop()
+
+    line = (f"{mode:>8}: {len(latencies) / seconds:6.0f} req/s, /health p50 {percentile(latencies, 50) * 1000:6.2f} ms, "
+            f"p99 {percentile(latencies, 99) * 1000:6.2f} ms, max {max(latencies) * 1000:6.1f} ms, {reads} sensor reads")
+    if start_ms is not None:
+        line += f", start() took {start_ms:.1f} ms"
+    print(line)
+    return percentile(latencies, 99), start_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds each Sense HAT read blocks")
+    parser.add_argument("--interval", type=float, default=0.5, help="METRICS_PUBLISH_INTERVAL")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--clients", type=int, default=10)
+    args = parser.parse_args()
+
+    FakeSenseHat.LATENCY = args.latency
+    settings.METRICS_PUBLISH_INTERVAL = args.interval
+    settings.MQTT_BROKER, settings.MQTT_PORT = "127.0.0.1", 9  # nothing listens: publishing is skipped
+    print(f"Sense HAT reads block {args.latency * 1000:.0f} ms each, window {args.interval}s, "
+          f"{args.clients} clients polling /health")
+
+    idle_p99, _ = asyncio.run(run("idle", args.clients, args.seconds))
+    asyncio.run(run("inline", args.clients, args.seconds))
+    service_p99, start_ms = asyncio.run(run("service", args.clients, args.seconds))
+
+    # Allow scheduler noise, but not a blocked loop (one read is args.latency)
+    ok = service_p99 <= idle_p99 * 1.5 + args.latency / 2 and start_ms < 100
+    print(f"service p99 vs idle p99: {service_p99 * 1000:.2f} vs {idle_p99 * 1000:.2f} ms -> {'ok' if ok else 'REGRESSED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
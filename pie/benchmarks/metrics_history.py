@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+On-device metrics history benchmark for pi-guard.
+Fills MetricsService's history ring with --hours of synthetic windows (the
+day from metrics_deadband.py, repeated) at METRICS_PUBLISH_INTERVAL, then
+times GET /metrics/history through the API routes in-process for several
+ranges, methods and point counts: server time per request (p50/p99, JSON
+included) and response size. Also reports the ring's memory against
+METRICS_HISTORY_MAX_MB, the cost of appending a window, and checks that
+minmax keeps the range's extremes.
+
+Usage: python3 metrics_history.py [--hours 72] [--requests 20]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+import types
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+from metrics_deadband import DAY, synthetic_channel
+from metrics_sampling import FakeSenseHat
+
+# The real module only imports on a Pi; the service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+use_source_dir(PI_GUARD_DIR)
+from api.routes import router  # noqa: E402
+from config import settings  # noqa: E402
+from modules.metrics.history import MetricsHistory, history_capacity  # noqa: E402
+from modules.metrics.sampler import CHANNELS  # noqa: E402
+from modules.metrics.service import MetricsService  # noqa: E402
+from modules.mqtt.service import MqttService  # noqa: E402
+
+
+def synthetic_windows(hours, interval, seed=1):
+    """[(window end, metrics)] as summarize() builds them, one reading per window plus a spread."""
+    rng = np.random.default_rng(seed)
+    count = int(hours * 3600 / interval)
+    ends = time.time() - count * interval + np.arange(1, count + 1) * interval
+    columns = {}
+    for name, channel in CHANNELS.items():
+        readings = synthetic_channel(name, (ends - ends[0]) % DAY, rng)
+        spread = np.abs(rng.normal(0, 0.05, readings.shape))
+        for i, field in enumerate(channel.fields):
+            columns[field] = (readings[:, i] - spread[:, i], readings[:, i] + spread[:, i], readings[:, i])
+    windows = []
+    for n in range(count):
+        metrics = {"min": {}, "max": {}, "mean": {}}
+        for field, (low, high, mean) in columns.items():
+            metrics["min"][field], metrics["max"][field], metrics["mean"][field] = low[n], high[n], mean[n]
+        windows.append((float(ends[n]), metrics))
+    return windows
+
+
+async def time_requests(app, params, requests):
+    timings, size = [], 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://pi-guard") as http:
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = await http.get("/metrics/history", params=params)
+            timings.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+            size = len(response.content)
+    return timings, size, response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=settings.METRICS_HISTORY_HOURS)
+    parser.add_argument("--interval", type=float, default=settings.METRICS_PUBLISH_INTERVAL)
+    parser.add_argument("--requests", type=int, default=20, help="per row")
+    args = parser.parse_args()
+
+    windows = synthetic_windows(args.hours, args.interval)
+    budget = int(settings.METRICS_HISTORY_MAX_MB * 1024 * 1024)
+    tracemalloc.start()
+    history = MetricsHistory(history_capacity(args.hours, args.interval, budget))
+    started = time.perf_counter()
+    for end, metrics in windows:
+        history.append(end, metrics)
+    append_us = (time.perf_counter() - started) / len(windows) * 1e6
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(history)} windows ({len(history) * args.interval / 3600:g} h at {args.interval:g} s): "
+          f"ring {history.nbytes / 2**20:.1f} MB, {allocated / 2**20:.1f} MB allocated, "
+          f"budget {settings.METRICS_HISTORY_MAX_MB:g} MB -> {'ok' if allocated <= budget else 'OVER'}; "
+          f"append {append_us:.1f} us/window")
+
+    service = MetricsService(MqttService())
+    service.history = history
+    app = FastAPI()
+    app.include_router(router)
+    app.state.metrics_service = service
+
+    last = history.times[(history.count - 1) % history.capacity]
+    ranges = [("1 h", 3600), ("24 h", 86400), (f"{args.hours:g} h", args.hours * 3600)]
+    print(f"  {'range':>6} {'method':>7} {'points':>6} {'windows':>7} {'p50 ms':>7} {'p99 ms':>7} {'KB':>6}")
+    extremes_kept = True
+    for label, seconds in ranges:
+        for method in ("minmax", "lttb"):
+            for points in (500, 2000):
+                params = {"start": last - seconds, "end": last, "points": points, "method": method}
+                timings, size, body = asyncio.run(time_requests(app, params, args.requests))
+                print(f"  {label:>6} {method:>7} {points:6} {body['windows']:7} "
+                      f"{percentile(timings, 50):7.2f} {percentile(timings, 99):7.2f} {size / 1024:6.0f}")
+                if method == "minmax":
+                    _, values = history.select(last - seconds, last, [0])
+                    field = body["fields"]["temp_humidity"]
+                    extremes_kept &= (min(field["min"]) == round(float(values[0].min()), 1)
+                                      and max(field["max"]) == round(float(values[1].max()), 1))
+    print(f"minmax keeps each range's min and max: {extremes_kept}")
+    return 0 if extremes_kept and allocated <= budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
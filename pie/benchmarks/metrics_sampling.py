@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Sense HAT sampling and windowed publishing benchmark.
+Runs pi-guard's SensorSampler against a stand-in Sense HAT (slowly drifting
+environment readings, a wobbling IMU, --latency per read) and reports:
+
+  - reads/s achieved per channel at METRICS_SAMPLE_RATES (or --rates), and
+    the sampler's CPU use
+  - the sampler's own ceiling: every channel asking for --max-rate Hz from
+    a Sense HAT that answers instantly
+  - MQTT bytes per hour (PUBLISH packets, QoS 0) of the windowed payload
+    against today's per-sample JSON, both at today's 2 s interval and at the
+    fastest channel's rate that per-sample publishing would need to see the
+    same changes
+
+Usage: python3 metrics_sampling.py [--seconds 10] [--window 2] [--rates "orientation=10,accel=10"]
+"""
+import argparse
+import json
+import sys
+import time
+
+from common import PI_GUARD_DIR, use_source_dir
+
+use_source_dir(PI_GUARD_DIR)
+from config import settings  # noqa: E402
+from modules.metrics.sampler import CHANNELS, SensorSampler, parse_rates, read_channel, summarize  # noqa: E402
+from modules.metrics.sources import SyntheticSenseHat  # noqa: E402
+
+
+class FakeSenseHat(SyntheticSenseHat):
+    """Sense HAT stand-in returning plausible, changing readings; LATENCY per read."""
+
+    LATENCY = 0.001
+
+    def __init__(self):
+        super().__init__(self.LATENCY)
+
+
+def per_sample_payload(sense):
+    """Today's message: every field read once, flat JSON."""
+    metrics = {}
+    for name, channel in CHANNELS.items():
+        for field, value in zip(channel.fields, read_channel(sense, name)):
+            metrics[field] = round(value, channel.decimals)
+    return json.dumps(metrics)
+
+
+def publish_packet_size(topic, payload_size):
+    """Bytes on the wire for an MQTT 3.1.1 QoS 0 PUBLISH."""
+    remaining = 2 + len(topic) + payload_size
+    length_bytes = 1 if remaining < 128 else 2 if remaining < 16384 else 3
+    return 1 + length_bytes + remaining
+
+
+def run_sampler(rates, window, seconds):
+    sampler = SensorSampler(FakeSenseHat, rates, window)
+    cpu_before = time.process_time()
+    sampler.start()
+    payloads = []
+    last = {}
+    reads = {name: 0 for name in sampler.rates}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(min(window, max(0.0, deadline - time.monotonic())))
+        _, _, windows = sampler.swap()
+        for name, channel_window in windows.items():
+            reads[name] += channel_window.count
+        payload = summarize(windows, last)
+        if payload["count"]:
+            payloads.append(json.dumps(payload))
+    sampler.stop()
+    sampler.join()
+    return reads, time.process_time() - cpu_before, payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--window", type=float, default=2.0, help="METRICS_PUBLISH_INTERVAL")
+    parser.add_argument("--rates", default=settings.METRICS_SAMPLE_RATES)
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds each Sense HAT read blocks")
+    parser.add_argument("--max-rate", type=float, default=100000)
+    args = parser.parse_args()
+
+    FakeSenseHat.LATENCY = args.latency
+    rates = parse_rates(args.rates)
+    topic = settings.MQTT_METRICS_TOPIC
+
+    reads, cpu, payloads = run_sampler(rates, args.window, args.seconds)
+    print(f"Sampling {args.seconds:.0f}s, {args.latency * 1000:.1f} ms per read, {args.window}s windows:")
+    for name, count in reads.items():
+        print(f"  {name:<14} {count / args.seconds:7.1f} reads/s (configured {rates[name]:g})")
+    print(f"  sampler CPU {cpu / args.seconds * 100:.1f}% of a core")
+
+    FakeSenseHat.LATENCY = 0
+    ceiling, ceiling_cpu, _ = run_sampler({name: args.max_rate for name in CHANNELS}, args.window, args.seconds / 2)
+    total = sum(ceiling.values())
+    print(f"Ceiling with every channel at {args.max_rate:g} Hz, no read latency: {total / (args.seconds / 2):.0f} reads/s total, "
+          f"CPU {ceiling_cpu / (args.seconds / 2) * 100:.0f}% of a core")
+
+    sense = FakeSenseHat()
+    sample_size = sum(len(per_sample_payload(sense)) for _ in range(100)) / 100
+    window_size = sum(len(payload) for payload in payloads) / len(payloads)
+    fastest = max(rates.values())
+    rows = [
+        ("per-sample JSON every 2 s (today)", 1 / 2.0, sample_size),
+        (f"per-sample JSON at {fastest:g} Hz", fastest, sample_size),
+        (f"windowed JSON every {args.window:g} s", 1 / args.window, window_size),
+    ]
+    print(f"MQTT traffic on {topic}:")
+    for label, per_second, size in rows:
+        per_hour = per_second * 3600 * publish_packet_size(topic, round(size))
+        print(f"  {label:<36} {size:6.0f} B/message, {per_second * 3600:7.0f} messages/h, {per_hour / 1e6:6.2f} MB/h")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Store-and-forward test for pi-guard's MetricsService.
+Runs the service (stand-in Sense HAT, short windows) against the local MQTT
+broker stand-in, then takes the broker down for --outage seconds and
+restarts the service halfway through the outage, so spooled windows have to
+survive on disk. When the broker comes back, checks that every sequence
+number the service produced arrived live or on the replay topic (zero
+loss), and reports duplicates, replay throughput against the rate limit, and the
+largest gap in live windows while the replay ran.
+
+Usage: python3 metrics_spool.py [--interval 0.1] [--outage 6] [--replay-rate 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+
+from common import PI_GUARD_DIR, use_source_dir
+from metrics_sampling import FakeSenseHat
+from mqtt_standin import MqttStandIn
+
+# The real module only imports on a Pi; the service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+use_source_dir(PI_GUARD_DIR)
+from config import settings  # noqa: E402
+from modules.metrics.service import MetricsService  # noqa: E402
+from modules.mqtt.service import MqttService  # noqa: E402
+
+
+def received(broker, topic):
+    return [(at, json.loads(payload)["seq"]) for at, payload in broker.topic_messages(topic)]
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def run(args, broker):
+    mqtt_service = MqttService()
+    mqtt_service.start()
+    service = MetricsService(mqtt_service)
+    service.start()
+    await asyncio.sleep(args.up)
+    print(f"Broker up {args.up}s: {len(broker.topic_messages(settings.MQTT_METRICS_TOPIC))} live windows")
+
+    broker.stop()
+    await asyncio.sleep(args.outage / 2)
+    spooled = service.spool.count
+    service.stop()
+    await asyncio.sleep(0.2)
+    service = MetricsService(mqtt_service)  # a restart mid-outage: the spool has to come back from disk
+    service.start()
+    await asyncio.sleep(args.outage / 2)
+    await wait_until(lambda: service.spool is not None, 5)
+    print(f"Broker down {args.outage}s, service restarted after {args.outage / 2}s "
+          f"({spooled} windows spooled before the restart, {service.spool.count} now)")
+
+    backlog = service.spool.count
+    recovered_at = time.monotonic()
+    broker.start()
+    drained = await wait_until(lambda: service.spool.count <= 1 and service.replayed > 0, 120)
+    drain_time = time.monotonic() - recovered_at
+    await asyncio.sleep(args.interval * 3)
+    produced = service._reserve_seq() - 1
+    service.stop()
+    mqtt_service.stop()
+    return produced, backlog, drained, drain_time, recovered_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=0.1, help="METRICS_PUBLISH_INTERVAL")
+    parser.add_argument("--up", type=float, default=2)
+    parser.add_argument("--outage", type=float, default=6)
+    parser.add_argument("--replay-rate", type=float, default=200, help="METRICS_REPLAY_RATE")
+    args = parser.parse_args()
+
+    FakeSenseHat.LATENCY = 0
+    broker = MqttStandIn().start()
+    workdir = tempfile.mkdtemp()
+    settings.MQTT_BROKER, settings.MQTT_PORT = "127.0.0.1", broker.port
+    settings.METRICS_PUBLISH_INTERVAL = args.interval
+    settings.METRICS_REPLAY_RATE = args.replay_rate
+    settings.METRICS_SPOOL_PATH = os.path.join(workdir, "spool", "metrics.db")
+
+    produced, backlog, drained, drain_time, recovered_at = asyncio.run(run(args, broker))
+    broker.stop()
+
+    live = received(broker, settings.MQTT_METRICS_TOPIC)
+    replay = received(broker, settings.MQTT_METRICS_REPLAY_TOPIC)
+    seqs = [seq for _, seq in live + replay]
+    missing = sorted(set(range(1, produced + 1)) - set(seqs))
+    print(f"Produced {produced} windows: {len(live)} live, {len(replay)} replayed, "
+          f"{len(seqs) - len(set(seqs))} duplicates, {len(missing)} lost {missing[:10] if missing else ''}")
+    # Delivery is at-least-once: a window whose PUBACK was lost with a connection is sent again
+    print(f"Broker saw {broker.connects} connections; consumers drop duplicates by seq")
+
+    replay_times = [at for at, _ in replay]
+    replay_seqs = [seq for _, seq in replay]
+    if len(replay_times) > 1:
+        span = replay_times[-1] - replay_times[0]
+        print(f"Replay: {backlog} backlog windows; first replayed {replay_times[0] - recovered_at:.1f}s after "
+              f"the broker returned (reconnect backoff), all acknowledged after {drain_time:.1f}s")
+        peak = max(sum(1 for t in replay_times if start <= t < start + 1) for start in replay_times)
+        print(f"  {len(replay)} replayed in {span:.2f}s, at most {peak} in any second (limit {args.replay_rate:g}/s), "
+              f"in order: {replay_seqs == sorted(replay_seqs)}")
+        live_during = [at for at, _ in live if replay_times[0] <= at <= replay_times[-1]]
+        gaps = [b - a for a, b in zip(live_during, live_during[1:])]
+        if gaps:
+            print(f"Live windows during replay: {len(live_during)}, largest gap {max(gaps) * 1000:.0f} ms "
+                  f"(interval {args.interval * 1000:.0f} ms)")
+    ok = drained and not missing
+    print("zero loss" if ok else "LOSS")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+MJPEG fan-out benchmark for pi-guard's /stream/mjpeg.
+Starts the API routes under uvicorn in a child process with a stand-in camera
+(1280x720 at --fps), connects 1/10/50 simulated viewers and reports per-viewer
+frames/s, server CPU and server memory. One viewer in ten is slow (it reads a
+frame, then stalls) to show that it skips frames without holding back the
+others or growing the server's memory.
+
+Usage: python3 mjpeg_fanout.py [--viewers 1 10 50] [--seconds 10] [--fps 10]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+
+SLOW_VIEWER_DELAY = 0.5  # seconds a slow viewer stalls after every frame
+
+
+def serve(port, fps, size):
+    """Child process: the API routes with a stand-in camera."""
+    import uvicorn
+    from fastapi import FastAPI
+
+    use_source_dir(PI_GUARD_DIR)
+    from api.routes import router
+    from modules.mjpeg.service import MjpegService
+    from modules.snapshot.service import SnapshotService
+    from snapshot_load import FakeCamera
+
+    camera = FakeCamera(fps)
+    camera.start()
+    app = FastAPI()
+    app.include_router(router)
+    app.state.snapshot_service = SnapshotService(camera)
+    app.state.mjpeg_service = MjpegService(camera, app.state.snapshot_service)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def process_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def viewer(port, size, deadline, slow, frames):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /stream/mjpeg?size={size} HTTP/1.1\r\nHost: pi-guard\r\n\r\n".encode())
+    await writer.drain()
+    status = await reader.readuntil(b"\r\n\r\n")
+    if b" 200 " not in status.split(b"\r\n", 1)[0]:
+        raise RuntimeError(status.decode(errors="ignore"))
+    count = 0
+    try:
+        while time.monotonic() < deadline:
+            # Chunked transfer encoding around multipart parts; scan for part headers
+            await reader.readuntil(b"Content-Length: ")
+            length = int(await reader.readuntil(b"\r\n"))
+            await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(length)
+            count += 1
+            if slow:
+                await asyncio.sleep(SLOW_VIEWER_DELAY)
+    finally:
+        writer.close()
+    frames.append((slow, count))
+
+
+async def run_round(port, pid, viewers, seconds, size):
+    frames = []
+    cpu_before = process_cpu_seconds(pid)
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(
+        viewer(port, size, deadline, i % 10 == 9, frames) for i in range(viewers)
+    ))
+    cpu = process_cpu_seconds(pid) - cpu_before
+    fast = [count / seconds for slow, count in frames if not slow]
+    slow = [count / seconds for slow, count in frames if slow]
+    line = (f"{viewers:>3} viewers: fast viewers {sum(fast) / len(fast):5.1f} fps "
+            f"(min {min(fast):4.1f}, p50 {percentile(fast, 50):4.1f})")
+    if slow:
+        line += f", slow viewers {sum(slow) / len(slow):4.1f} fps"
+    line += f", server CPU {cpu / seconds * 100:5.1f}% of a core, RSS {process_rss_kb(pid) / 1024:6.1f} MB"
+    print(line)
+    await asyncio.sleep(1)  # let the server drop the viewers before the next round
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--size", default="medium")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.fps, args.size)
+        return 0
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port), "--fps", str(args.fps)])
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        print(f"Camera at {args.fps} fps, size {args.size}, server RSS {process_rss_kb(server.pid) / 1024:.1f} MB idle")
+        for viewers in args.viewers:
+            asyncio.run(run_round(port, server.pid, viewers, args.seconds, args.size))
+    finally:
+        server.terminate()
+        server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Motion detection benchmark.
+Runs the pi-guard MotionDetector over a frame sequence and reports analysis
+frames/s and CPU time per frame, then replays the sequence through
+MotionService (with a stand-in camera and MQTT publisher) to check that it
+publishes one start and one stop event per motion episode instead of
+per-frame data. Optionally measures the ffmpeg decoder that feeds the camera
+service, which runs in its own process.
+
+Frames are synthetic (textured background, sensor noise, a square crossing
+the scene for part of the sequence) unless --input names a video file, which
+is decoded to luma with ffmpeg.
+
+Usage: python3 motion_detection.py [--frames 300] [--input clip.mp4] [--decode]
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from common import PI_GUARD_DIR, generate_h264, percentile, use_source_dir
+
+use_source_dir(PI_GUARD_DIR)
+from modules.camera.service import Frame  # noqa: E402
+from modules.motion.detector import MotionDetector  # noqa: E402
+
+WIDTH, HEIGHT = 1280, 720
+FPS = 10
+
+
+def synthetic_frames(count, seed=1):
+    """Luma planes with noise; a 96px square moves across frames [count/3, 2*count/3)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+    background = (96 + 40 * np.sin(x / 37.0) * np.cos(y / 23.0)).astype(np.float32)
+    start, end = count // 3, 2 * count // 3
+    for i in range(count):
+        frame = background + rng.normal(0, 3, (HEIGHT, WIDTH)).astype(np.float32)
+        if start <= i < end:
+            left = int((i - start) / (end - start) * (WIDTH - 96))
+            frame[300:396, left:left + 96] = 220
+        yield np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def video_frames(path, count):
+    """Luma planes decoded from a video file."""
+    process = subprocess.Popen(
+        ["ffmpeg", "-loglevel", "error", "-i", path, "-frames:v", str(count),
+         "-vf", f"scale={WIDTH}:{HEIGHT}", "-pix_fmt", "gray", "-f", "rawvideo", "pipe:1"],
+        stdout=subprocess.PIPE
+    )
+    size = WIDTH * HEIGHT
+    while True:
+        data = process.stdout.read(size)
+        if len(data) < size:
+            break
+        yield np.frombuffer(data, dtype=np.uint8).reshape(HEIGHT, WIDTH)
+    process.wait()
+
+
+def bench_detector(frames, decimation):
+    detector = MotionDetector(WIDTH, HEIGHT, decimation=decimation)
+    wall, cpu = [], []
+    motion_frames = 0
+    for luma in frames:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = detector.process(luma)
+        cpu.append(time.process_time() - cpu_start)
+        wall.append(time.perf_counter() - wall_start)
+        motion_frames += result.motion
+    total = sum(wall)
+    print(f"Detector ({detector.width}x{detector.height} analysis, decimation {decimation}): "
+          f"{len(wall) / total:.0f} frames/s, CPU {sum(cpu) / len(cpu) * 1000:.2f} ms/frame, "
+          f"wall p50 {percentile(wall, 50) * 1000:.2f} ms p99 {percentile(wall, 99) * 1000:.2f} ms, "
+          f"{motion_frames} frames with motion")
+
+
+class FakeCamera:
+    """Hands out a fixed list of frames, one per get_frame call, at FPS timestamps."""
+
+    def __init__(self, lumas):
+        self.width, self.height = WIDTH, HEIGHT
+        self.frames = []
+        start = time.time()
+        for i, luma in enumerate(lumas):
+            data = np.empty((HEIGHT * 3 // 2, WIDTH), dtype=np.uint8)
+            data[:HEIGHT] = luma
+            data[HEIGHT:] = 128
+            self.frames.append(Frame(i, start + i / FPS, WIDTH, HEIGHT, data))
+        self.done = threading.Event()
+
+    def is_running(self):
+        return True
+
+    def get_frame(self, after_seq=-1, timeout=None):
+        if after_seq + 1 >= len(self.frames):
+            self.done.set()
+            time.sleep(timeout or 0)
+            return None
+        return self.frames[after_seq + 1]
+
+
+class FakePublisher:
+    def __init__(self):
+        self.messages = []
+
+    def publish_threadsafe(self, topic, payload, qos=0):
+        self.messages.append((topic, json.loads(payload)))
+        future = concurrent.futures.Future()
+        future.set_result(True)
+        return future
+
+
+def check_service(lumas):
+    from config import settings
+    from modules.motion.service import MotionService
+
+    camera = FakeCamera(lumas)
+    publisher = FakePublisher()
+    service = MotionService(camera, publisher)
+    service.start()
+    camera.done.wait()
+    # Let the stop delay elapse in frame time with an empty scene
+    service.stop()
+    events = [message["event"] for _, message in publisher.messages]
+    print(f"MotionService: {len(camera.frames)} frames -> {len(events)} MQTT messages on "
+          f"{settings.MQTT_MOTION_TOPIC}: {events}")
+    for _, message in publisher.messages:
+        print(f"  {message}")
+
+
+def bench_decoder(seconds):
+    """CPU used by the camera service's ffmpeg decoder per second of 720p30 video."""
+    with tempfile.TemporaryDirectory() as workdir:
+        source = generate_h264(os.path.join(workdir, "source.h264"), seconds=seconds)
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-threads", "1", "-f", "h264", "-i", source,
+             "-vf", f"select=not(mod(n\\,{30 // FPS}))", "-fps_mode", "passthrough",
+             "-pix_fmt", "yuv420p", "-f", "rawvideo", "-y", os.devnull],
+            check=True
+        )
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    print(f"Decoder: {cpu / seconds * 100:.0f}% of one core to decode 720p30 and emit {FPS} fps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--input", help="video file to analyse instead of synthetic frames")
+    parser.add_argument("--decimation", type=int, nargs="+", default=[4, 2])
+    parser.add_argument("--decode", action="store_true", help="also measure the ffmpeg frame decoder")
+    args = parser.parse_args()
+
+    def frames():
+        if args.input:
+            return video_frames(args.input, args.frames)
+        return synthetic_frames(args.frames)
+
+    lumas = list(frames())
+    for decimation in args.decimation:
+        bench_detector(lumas, decimation)
+    check_service(lumas)
+    if args.decode:
+        bench_decoder(10)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
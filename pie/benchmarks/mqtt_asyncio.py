@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+MQTT client benchmark: pi-guard's MqttService against paho's network thread.
+Both clients publish over --transport (MQTT_TRANSPORT, raw TCP by default)
+to the local MQTT broker stand-in from an asyncio loop, the way pi-guard's
+services do:
+
+  thread   paho with loop_start(), how MetricsService used to connect
+  asyncio  MqttService: paho's socket on the event loop, awaitable publish
+
+and reports publish latency (publish() call to the broker receiving it) at
+a steady rate, QoS 0 and QoS 1 throughput with CPU time per message, the
+time from the broker coming back to being connected again over outages of
+several lengths (both back off between attempts), and the threads each runs.
+
+Usage: python3 mqtt_asyncio.py [--messages 20000] [--outages 0.5 1 2 3 5] [--transport websockets]
+"""
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+from mqtt_standin import MqttStandIn
+
+use_source_dir(PI_GUARD_DIR)
+from config import settings  # noqa: E402
+from modules.mqtt.service import MqttService  # noqa: E402
+
+TOPIC = "bench/mqtt"
+
+
+class ThreadClient:
+    """paho driven by its own network thread (loop_start)."""
+
+    name = "thread"
+
+    def __init__(self):
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, transport=settings.MQTT_TRANSPORT)
+        self.client.max_inflight_messages_set(settings.MQTT_MAX_INFLIGHT)
+        self.client.on_publish = self._on_publish
+        self.acked = 0
+        self._waiting = None  # (target, future)
+
+    def start(self):
+        self.client.connect_async(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def connected(self):
+        return self.client.is_connected()
+
+    async def publish(self, payload, qos):
+        """What the old MetricsService did: hand the message to paho's thread."""
+        return self.client.publish(TOPIC, payload, qos=qos).rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        self.acked += 1
+        if self._waiting and self.acked >= self._waiting[0]:
+            loop, future = self._waiting[1], self._waiting[2]
+            self._waiting = None
+            loop.call_soon_threadsafe(future.set_result, None)
+
+    async def publish_all(self, payloads, qos):
+        """Publish everything and wait until paho reports each one sent (QoS 0) or acknowledged."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.acked = 0
+        self._waiting = (len(payloads), loop, future)
+        for payload in payloads:
+            self.client.publish(TOPIC, payload, qos=qos)
+        await future
+
+
+class LoopClient:
+    """pi-guard's MqttService."""
+
+    name = "asyncio"
+
+    def __init__(self):
+        self.service = MqttService()
+
+    def start(self):
+        self.service.start()
+
+    def stop(self):
+        self.service.stop()
+
+    def connected(self):
+        return self.service.is_connected()
+
+    async def publish(self, payload, qos):
+        return await self.service.publish(TOPIC, payload, qos)
+
+    async def publish_all(self, payloads, qos):
+        if qos == 0:
+            for payload in payloads:
+                await self.service.publish(TOPIC, payload, 0)
+            await asyncio.sleep(0)
+            return
+        await asyncio.gather(*(self.service.publish(TOPIC, payload, qos) for payload in payloads))
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.001)
+    return True
+
+
+def arrivals(broker, count):
+    return broker.wait_for(lambda messages: sum(1 for m in messages if m[1] == TOPIC) >= count, 30)
+
+
+async def measure_latency(client, broker, count, interval, qos):
+    broker.messages.clear()
+    sent = []
+    for i in range(count):
+        sent.append(time.monotonic())
+        await client.publish(str(i).encode(), qos)
+        await asyncio.sleep(interval)
+    await asyncio.to_thread(arrivals, broker, count)
+    received = {int(payload): at for at, payload in broker.topic_messages(TOPIC)}
+    return [(received[i] - sent[i]) * 1000 for i in range(count) if i in received]
+
+
+async def measure_throughput(client, broker, count, qos):
+    broker.messages.clear()
+    payloads = [b"x" * 200] * count
+    started, cpu = time.monotonic(), time.process_time()
+    await client.publish_all(payloads, qos)
+    await asyncio.to_thread(arrivals, broker, count)
+    elapsed, cpu = time.monotonic() - started, time.process_time() - cpu
+    return count / elapsed, cpu / count * 1e6
+
+
+async def measure_reconnect(client, broker, outages):
+    """Seconds from the broker coming back to the client being connected, per outage length."""
+    times = []
+    for outage in outages:
+        broker.stop()
+        await wait_until(lambda: not client.connected(), 10)
+        await asyncio.sleep(outage)
+        returned = time.monotonic()
+        broker.start()
+        await wait_until(client.connected, 120)
+        times.append(time.monotonic() - returned)
+    return times
+
+
+async def run(client, broker, args):
+    client.start()
+    if not await wait_until(client.connected, 10):
+        raise SystemExit(f"{client.name}: could not connect to the stand-in")
+    # Leave out the stand-in broker's own threads
+    threads = [thread.name for thread in threading.enumerate() if "_serve" not in thread.name and "_accept" not in thread.name]
+    latency0 = await measure_latency(client, broker, args.latency_messages, 0.01, 0)
+    latency1 = await measure_latency(client, broker, args.latency_messages, 0.01, 1)
+    qos0 = await measure_throughput(client, broker, args.messages, 0)
+    qos1 = await measure_throughput(client, broker, args.messages, 1)
+    reconnect = await measure_reconnect(client, broker, args.outages)
+    client.stop()
+    return threads, latency0, latency1, qos0, qos1, reconnect
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="per throughput run")
+    parser.add_argument("--latency-messages", type=int, default=500, help="at 100 messages/s")
+    parser.add_argument("--outages", type=float, nargs="+", default=[0.5, 1, 2, 3, 5],
+                        help="seconds the broker is down, one reconnect each")
+    parser.add_argument("--transport", choices=["tcp", "websockets"], default=settings.MQTT_TRANSPORT)
+    args = parser.parse_args()
+
+    broker = MqttStandIn().start()
+    settings.MQTT_BROKER, settings.MQTT_PORT, settings.MQTT_TRANSPORT = "127.0.0.1", broker.port, args.transport
+    print(f"{'client':>8} {'threads':>7} {'QoS 0 p50/p99 ms':>17} {'QoS 1 p50/p99 ms':>17} "
+          f"{'QoS 0 msg/s':>11} {'us CPU':>6} {'QoS 1 msg/s':>11} {'us CPU':>6} {'reconnect mean/max s':>20}")
+    names = {}
+    for client in (ThreadClient(), LoopClient()):
+        threads, latency0, latency1, qos0, qos1, reconnect = asyncio.run(run(client, broker, args))
+        names[client.name] = threads
+        print(f"{client.name:>8} {len(threads):7} "
+              f"{percentile(latency0, 50):8.2f}/{percentile(latency0, 99):<8.2f} "
+              f"{percentile(latency1, 50):8.2f}/{percentile(latency1, 99):<8.2f} "
+              f"{qos0[0]:11.0f} {qos0[1]:6.0f} {qos1[0]:11.0f} {qos1[1]:6.0f} "
+              f"{sum(reconnect) / len(reconnect):13.2f}/{max(reconnect):<6.2f}")
+    for name, threads in names.items():
+        print(f"{name} threads: {', '.join(threads)}")
+    broker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
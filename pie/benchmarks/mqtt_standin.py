@@ -0,0 +1,301 @@
+"""
+Local MQTT broker stand-in for benchmarks.
+Speaks enough MQTT 3.1.1 for paho: CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE
+with + and # wildcards, retained messages, PINGREQ and DISCONNECT, over plain
+TCP or WebSocket on the same port, optionally inside TLS. Every PUBLISH it
+receives is recorded with its arrival time. stop() drops all clients and
+stops listening to simulate an outage; start() comes back on the same port.
+
+Run on its own (python3 mqtt_standin.py [--certfile cert.pem --keyfile
+key.pem]) it prints its port and serves until killed, so a benchmark can
+keep the broker's work out of its own process.
+"""
+import argparse
+import base64
+import hashlib
+import socket
+import ssl
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    pattern_parts, topic_parts = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def publish_packet(topic, payload, retain=False):
+    """QoS 0 PUBLISH to a subscriber."""
+    topic_bytes = topic.encode()
+    body = struct.pack(">H", len(topic_bytes)) + topic_bytes + payload
+    return bytes([PUBLISH << 4 | int(retain)]) + encode_length(len(body)) + body
+
+
+class _Connection:
+    """One client socket; reads MQTT bytes from raw TCP or WebSocket frames."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.websocket = False
+        self.subscriptions = []
+        self._buffer = b""
+        self._send_lock = threading.Lock()
+
+    def _recv_raw(self, size):
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("closed")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def handshake(self):
+        """Answer a WebSocket upgrade if the client sent one."""
+        first = self._recv_raw(4)
+        if first != b"GET ":
+            self._buffer = first + self._buffer
+            return
+        request = first
+        while b"\r\n\r\n" not in request:
+            request += self._recv_raw(1)
+        key = b""
+        for line in request.split(b"\r\n"):
+            if line.lower().startswith(b"sec-websocket-key:"):
+                key = line.split(b":", 1)[1].strip()
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        self.sock.sendall(
+            b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Protocol: mqtt\r\nSec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+        self.websocket = True
+        self._ws_buffer = b""
+
+    def _recv_ws(self, size):
+        while len(self._ws_buffer) < size:
+            head = self._recv_raw(2)
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length, = struct.unpack(">H", self._recv_raw(2))
+            elif length == 127:
+                length, = struct.unpack(">Q", self._recv_raw(8))
+            mask = self._recv_raw(4) if head[1] & 0x80 else b"\0\0\0\0"
+            data = self._recv_raw(length)
+            if opcode == 8:
+                raise ConnectionError("websocket closed")
+            if length:
+                repeated = (mask * (length // 4 + 1))[:length]
+                data = (int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+            self._ws_buffer += data
+        data, self._ws_buffer = self._ws_buffer[:size], self._ws_buffer[size:]
+        return data
+
+    def recv(self, size):
+        return self._recv_ws(size) if self.websocket else self._recv_raw(size)
+
+    def read_packet(self):
+        header = self.recv(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self.recv(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self.recv(length)
+
+    def send(self, data):
+        if self.websocket:
+            if len(data) < 126:
+                head = bytes([0x82, len(data)])
+            elif len(data) < 65536:
+                head = bytes([0x82, 126]) + struct.pack(">H", len(data))
+            else:
+                head = bytes([0x82, 127]) + struct.pack(">Q", len(data))
+            data = head + data
+        with self._send_lock:
+            self.sock.sendall(data)
+
+
+class MqttStandIn:
+    """Minimal MQTT broker that records every message published to it."""
+
+    def __init__(self, host="127.0.0.1", port=0, ack_delay=0.0, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.ack_delay = ack_delay  # seconds before each PUBACK, like a slow uplink
+        self.ssl_context = ssl_context  # server-side TLS for every client
+        self.messages = []  # (arrival time, topic, payload, qos)
+        self.retained = {}
+        self.connects = 0
+        self._connections = set()
+        self._lock = threading.Condition()
+        self._sock = None
+
+    def start(self):
+        """Start listening (again, after stop(), on the same port)."""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(16)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, args=(self._sock,), daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop listening and drop every client, like a broker going away."""
+        if self._sock:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)  # wakes the accept() thread
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.sock.close()
+
+    def topic_messages(self, topic):
+        with self._lock:
+            return [(at, payload) for at, name, payload, _ in self.messages if name == topic]
+
+    def wait_for(self, predicate, timeout):
+        """Wait until predicate(messages) is true; returns whether it became true."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while not predicate(self.messages):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+    def _accept_loop(self, sock):
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(_Connection(client),), daemon=True).start()
+
+    def _serve(self, connection):
+        try:
+            if self.ssl_context:
+                connection.sock = self.ssl_context.wrap_socket(connection.sock, server_side=True)
+            connection.handshake()
+            with self._lock:
+                self._connections.add(connection)
+            while True:
+                kind, flags, body = connection.read_packet()
+                if kind == CONNECT:
+                    with self._lock:
+                        self.connects += 1
+                    connection.send(bytes([CONNACK << 4, 2, 0, 0]))
+                elif kind == PUBLISH:
+                    self._on_publish(connection, flags, body)
+                elif kind == SUBSCRIBE:
+                    self._on_subscribe(connection, body)
+                elif kind == PINGREQ:
+                    connection.send(bytes([PINGRESP << 4, 0]))
+                elif kind == DISCONNECT:
+                    break
+        except (ConnectionError, OSError, IndexError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+            connection.sock.close()
+
+    def _on_publish(self, connection, flags, body):
+        qos, retain = (flags >> 1) & 3, flags & 1
+        topic_length, = struct.unpack_from(">H", body)
+        topic = body[2:2 + topic_length].decode()
+        offset = 2 + topic_length
+        packet_id = None
+        if qos:
+            packet_id, = struct.unpack_from(">H", body, offset)
+            offset += 2
+        payload = body[offset:]
+        with self._lock:
+            self.messages.append((time.monotonic(), topic, payload, qos))
+            if retain:
+                self.retained[topic] = payload
+            subscribers = [c for c in self._connections if any(topic_matches(p, topic) for p in c.subscriptions)]
+            self._lock.notify_all()
+        for subscriber in subscribers:
+            try:
+                subscriber.send(publish_packet(topic, payload))
+            except OSError:
+                pass
+        if qos:
+            if self.ack_delay:
+                time.sleep(self.ack_delay)
+            connection.send(bytes([PUBACK << 4, 2]) + struct.pack(">H", packet_id))
+
+    def _on_subscribe(self, connection, body):
+        packet_id, = struct.unpack_from(">H", body)
+        offset, granted = 2, []
+        while offset < len(body):
+            length, = struct.unpack_from(">H", body, offset)
+            pattern = body[offset + 2:offset + 2 + length].decode()
+            granted.append(min(body[offset + 2 + length], 1))
+            offset += 3 + length
+            connection.subscriptions.append(pattern)
+        connection.send(bytes([SUBACK << 4, 2 + len(granted)]) + struct.pack(">H", packet_id) + bytes(granted))
+        with self._lock:
+            retained = [(t, p) for t, p in self.retained.items() if any(topic_matches(s, t) for s in connection.subscriptions)]
+        for topic, payload in retained:
+            connection.send(publish_packet(topic, payload, retain=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--certfile", help="serve TLS with this certificate...")
+    parser.add_argument("--keyfile", help="...and key")
+    args = parser.parse_args()
+
+    context = None
+    if args.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+    broker = MqttStandIn(port=args.port, ssl_context=context).start()
+    print(broker.port, flush=True)
+    try:
+        while True:
+            time.sleep(1)
+            with broker._lock:
+                broker.messages.clear()  # Nobody reads them here
+    except KeyboardInterrupt:
+        pass
+    broker.stop()
+
+
+if __name__ == "__main__":
+    main()
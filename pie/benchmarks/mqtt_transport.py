@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+MQTT transport benchmark: raw TCP against WebSockets, with and without TLS.
+Publishes through pi-guard's MqttService over each transport to a local
+broker and reports, per transport and QoS:
+
+  connect ms   connect() to CONNACK (TCP, TLS and WebSocket handshakes)
+  msgs/s       --messages published back to back, until all are written
+               (QoS 0) or acknowledged (QoS 1)
+  us CPU/msg   CPU time of the publishing thread, which is all of the
+               device's MQTT work (MqttService runs on the event loop)
+  p50/p99 ms   publish to a subscriber receiving it, at --rate messages/s
+
+By default the broker is the MQTT stand-in in child processes (a plain one
+for tcp and websockets, and one with a throwaway self-signed certificate for
+the TLS rows if openssl is installed), so its work doesn't share this
+process. --broker uses a real one on the ports in config.MQTT_DEFAULT_PORTS
+(server/mqtt/mosquitto.conf); its TLS rows need --ca-certs.
+
+Usage: python3 mqtt_transport.py [--messages 20000] [--qos 0 1] [--broker localhost --ca-certs ca.pem]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+
+use_source_dir(PI_GUARD_DIR)
+from config import MQTT_DEFAULT_PORTS, settings  # noqa: E402
+from modules.mqtt.service import MqttService  # noqa: E402
+
+TOPIC = "bench/transport"
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mqtt_standin.py")
+VARIANTS = [("tcp", False), ("websockets", False), ("tcp", True), ("websockets", True)]
+
+
+def self_signed_certificate(directory):
+    """(certificate, key) for 127.0.0.1, or None without openssl."""
+    if not shutil.which("openssl"):
+        return None
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+        "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1",
+        "-addext", "subjectAltName=IP:127.0.0.1",
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+def start_standin(*extra):
+    """A stand-in broker in a child process; returns (process, port)."""
+    process = subprocess.Popen([sys.executable, STANDIN, *extra], stdout=subprocess.PIPE, text=True)
+    return process, int(process.stdout.readline())
+
+
+class Subscriber:
+    """Records when each benchmark message arrives, on paho's own thread."""
+
+    def __init__(self, transport, tls, ca_certs):
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, transport=transport)
+        if tls:
+            self.client.tls_set(ca_certs=ca_certs)
+        self.client.on_connect = lambda client, *_: client.subscribe(TOPIC, 0)
+        self.client.on_subscribe = lambda *_: self.subscribed.set()
+        self.client.on_message = self._on_message
+        self.subscribed = threading.Event()
+        self.arrivals = {}  # seq -> monotonic time
+
+    def start(self, port):
+        self.client.connect(settings.MQTT_BROKER, port, 60)
+        self.client.loop_start()
+        if not self.subscribed.wait(10):
+            raise SystemExit("subscriber could not subscribe")
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_message(self, client, userdata, message):
+        self.arrivals[int(message.payload[:8])] = time.monotonic()
+
+
+def payload(seq, size):
+    return f"{seq:08d}".encode().ljust(size, b"x")
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.001)
+    return True
+
+
+async def measure_latency(service, subscriber, args, qos):
+    subscriber.arrivals.clear()
+    sent = {}
+    for seq in range(args.latency_messages):
+        sent[seq] = time.monotonic()
+        await service.publish(TOPIC, payload(seq, args.size), qos)
+        await asyncio.sleep(1 / args.rate)
+    await wait_until(lambda: len(subscriber.arrivals) >= len(sent), 10)
+    return [(subscriber.arrivals[seq] - at) * 1000 for seq, at in sent.items() if seq in subscriber.arrivals]
+
+
+async def measure_throughput(service, subscriber, args, qos):
+    """(messages/s, CPU microseconds per message, messages the subscriber got)."""
+    subscriber.arrivals.clear()
+    payloads = [payload(seq, args.size) for seq in range(args.messages)]
+    started, cpu = time.monotonic(), time.thread_time()
+    if qos == 0:
+        for data in payloads:
+            await service.publish(TOPIC, data, 0)
+        await wait_until(lambda: not service.client.want_write(), 30)
+    else:
+        await asyncio.gather(*(service.publish(TOPIC, data, qos) for data in payloads))
+    elapsed, cpu = time.monotonic() - started, time.thread_time() - cpu
+    await wait_until(lambda: len(subscriber.arrivals) >= args.messages, 30)
+    return args.messages / elapsed, cpu / args.messages * 1e6, len(subscriber.arrivals)
+
+
+async def run(subscriber, args):
+    service = MqttService()
+    service.start()
+    if not await wait_until(service.is_connected, 10):
+        raise SystemExit(f"could not connect over {settings.MQTT_TRANSPORT} to port {settings.MQTT_PORT}")
+    results = []
+    for qos in args.qos:
+        latency = await measure_latency(service, subscriber, args, qos)
+        results.append((qos, latency, await measure_throughput(service, subscriber, args, qos)))
+    service.stop()
+    return service.connect_seconds * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="per throughput run")
+    parser.add_argument("--size", type=int, default=300, help="payload bytes, about a JSON metrics window")
+    parser.add_argument("--qos", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--latency-messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200, help="messages/s while measuring latency")
+    parser.add_argument("--broker", help="a real broker's host instead of the stand-in")
+    parser.add_argument("--ca-certs", help="CA for --broker's TLS listeners")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="mqtt-transport-")
+    children = []
+    if args.broker:
+        settings.MQTT_BROKER = args.broker
+        ports = {(transport, tls): MQTT_DEFAULT_PORTS[(transport, tls)] for transport, tls in VARIANTS}
+        ca_certs = args.ca_certs
+        if not ca_certs:
+            ports = {variant: port for variant, port in ports.items() if not variant[1]}
+    else:
+        settings.MQTT_BROKER = "127.0.0.1"
+        process, plain = start_standin()
+        children.append(process)
+        ports = {("tcp", False): plain, ("websockets", False): plain}
+        ca_certs = None
+        certificate = self_signed_certificate(directory)
+        if certificate:
+            process, secure = start_standin("--certfile", certificate[0], "--keyfile", certificate[1])
+            children.append(process)
+            ports.update({("tcp", True): secure, ("websockets", True): secure})
+            ca_certs = certificate[0]
+        else:
+            print("openssl not found, skipping TLS")
+
+    print(f"{args.messages} messages of {args.size} bytes per run to {settings.MQTT_BROKER}")
+    print(f"{'transport':>20} {'connect ms':>10} {'QoS':>3} {'msgs/s':>8} {'us CPU/msg':>10} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'delivered':>9}")
+    try:
+        for (transport, tls), port in ports.items():
+            settings.MQTT_TRANSPORT, settings.MQTT_TLS, settings.MQTT_PORT = transport, tls, port
+            settings.MQTT_TLS_CA_CERTS = ca_certs
+            subscriber = Subscriber(transport, tls, ca_certs)
+            subscriber.start(port)
+            connect_ms, results = asyncio.run(run(subscriber, args))
+            subscriber.stop()
+            label = f"{transport}{'+tls' if tls else ''}:{port}"
+            for qos, latency, (rate, cpu, delivered) in results:
+                print(f"{label:>20} {connect_ms:10.1f} {qos:3} {rate:8.0f} {cpu:10.1f} "
+                      f"{percentile(latency, 50):7.2f} {percentile(latency, 99):7.2f} {delivered:9}")
+    finally:
+        for process in children:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Full pipeline benchmark suite, acquisition to encode to publish, on a plain
+Linux box: each stage reads a synthetic or recorded source in place of the
+Sense HAT or the camera.
+
+  sensors   pi-guard's MetricsService in a child process sampling a
+            synthetic Sense HAT or replaying a recorded trace
+            (METRICS_SOURCE), then summarizing, spooling and publishing each
+            window as JSON and binary over its own MQTT connection to a
+            local broker. Reports sensor reads/s, windows/s at the broker,
+            latency from window end to broker arrival (p50/p95/p99/max), how
+            much of it was spent before the publish and in transit (from the
+            windows' "time" and "sent" stamps) and the service's CPU.
+  video     stream.py in a child process replaying a recorded H.264 file
+            (STREAM_VIDEO_SOURCE=replay) through its GOP ring and RTSP push
+            (ffmpeg) to a local RTSP stand-in, while pi-guard's CameraService
+            decodes the supervisor's /video.h264 in another. Reports frames/s
+            at the RTSP endpoint and decoded, the interval between frames at
+            the endpoint (p50/p95/p99/max) and the CPU of each side with its
+            children. Needs ffmpeg; skipped without it.
+
+Every window is published (no deadband) so the figures are the pipeline's,
+not the readings'. --save writes the results as JSON; --compare prints them
+against an earlier --save, e.g. from before a change, in percent.
+
+Usage: python3 pipeline_suite.py [--stages sensors,video] [--seconds 10] [--rate 100]
+       [--sensor-source replay] [--video-speed 1] [--save results.json] [--compare before.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import (PI_GUARD_DIR, STREAM_DIR, generate_h264, percentile, process_cpu_seconds, process_tree,
+                    read_peak_rss_kb, use_source_dir)
+from mqtt_standin import MqttStandIn
+from rtsp_standin import RtspStandIn
+
+# Higher is better for these; everything else (latency, CPU, memory) lower is better
+THROUGHPUT = ("reads_per_s", "windows_per_s", "rtsp_fps", "decoded_fps")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def distribution(prefix, values_ms):
+    return {
+        f"{prefix}_p50_ms": percentile(values_ms, 50), f"{prefix}_p95_ms": percentile(values_ms, 95),
+        f"{prefix}_p99_ms": percentile(values_ms, 99), f"{prefix}_max_ms": max(values_ms, default=float("nan")),
+    }
+
+
+async def sensors_child(seconds):
+    """The service side of the sensors stage; settings come from the environment."""
+    use_source_dir(PI_GUARD_DIR)
+    from modules.metrics.service import MetricsService
+    from modules.mqtt.service import MqttService
+
+    mqtt = MqttService()
+    metrics = MetricsService(mqtt)
+    cpu = time.process_time()  # Running, not importing and starting
+    mqtt.start()
+    metrics.start()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu
+    status = await metrics.get_status()
+    metrics.stop()
+    mqtt.stop()
+    print(json.dumps({
+        "reads": status["sensor_reads"], "read_errors": status["sensor_read_errors"],
+        "windows": status["windows_published"], "cpu_seconds": cpu,
+        "rss_kb": read_peak_rss_kb(os.getpid()),
+    }))
+
+
+def run_sensors(args, workdir):
+    use_source_dir(PI_GUARD_DIR)
+    from modules.metrics.sampler import CHANNELS
+    from modules.metrics.sources import SyntheticSenseHat, record_trace, write_trace
+
+    rates = {name: args.rate for name in CHANNELS}
+    trace = args.sensor_trace
+    if args.sensor_source == "replay" and not trace:
+        trace = os.path.join(workdir, "sensors.bin")
+        write_trace(trace, record_trace(SyntheticSenseHat(0), rates, 5))
+    broker = MqttStandIn().start()
+    env = dict(
+        os.environ, METRICS_SOURCE=args.sensor_source, METRICS_SOURCE_TRACE=trace or "",
+        METRICS_SOURCE_SPEED=str(args.sensor_speed), METRICS_SOURCE_LATENCY=str(args.sensor_latency),
+        METRICS_SAMPLE_RATES=",".join(f"{name}={rate:g}" for name, rate in rates.items()),
+        METRICS_PUBLISH_INTERVAL=str(args.interval), METRICS_HEARTBEAT_INTERVAL="0",
+        METRICS_FORMATS="json,binary", METRICS_SPOOL_PATH=os.path.join(workdir, "metrics.db"),
+        METRICS_HISTORY_HOURS="1", MQTT_BROKER="127.0.0.1", MQTT_PORT=str(broker.port), MQTT_QOS="1",
+        LOG_LEVEL="WARNING",
+    )
+    clock = time.time() - time.monotonic()  # The broker stamps arrivals on the monotonic clock
+    try:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--sensors-child", str(args.seconds)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+    finally:
+        broker.stop()
+    child = json.loads(output.splitlines()[-1])
+    windows = [(at + clock, json.loads(payload)) for at, payload in broker.topic_messages("sensors/metrics")]
+    latencies = [(arrived - window["time"]) * 1000 for arrived, window in windows]
+    return {
+        "reads_per_s": child["reads"] / args.seconds,
+        "read_errors": child["read_errors"],
+        "windows_per_s": len(windows) / args.seconds,
+        "windows_lost": child["windows"] - len(windows),
+        **distribution("latency", latencies),
+        "publish_p50_ms": percentile([(window["sent"] - window["time"]) * 1000 for _, window in windows], 50),
+        "transit_p50_ms": percentile([(arrived - window["sent"]) * 1000 for arrived, window in windows], 50),
+        "cpu_percent": child["cpu_seconds"] / args.seconds * 100,
+        "rss_mb": child["rss_kb"] / 1024,
+    }
+
+
+def camera_child(seconds):
+    """Decode the supervisor's video as pi-guard does; settings come from the environment."""
+    use_source_dir(PI_GUARD_DIR)
+    from modules.camera.service import CameraService
+
+    camera = CameraService()
+    camera.start()
+    time.sleep(1)  # Decoder up and past its first keyframe
+    decoded, started = camera.frames_decoded, time.monotonic()
+    cpu = process_cpu_seconds(os.getpid()) + (process_cpu_seconds(camera._process.pid) if camera._process else 0)
+    time.sleep(seconds)
+    frames = camera.frames_decoded - decoded
+    cpu = process_cpu_seconds(os.getpid()) + (process_cpu_seconds(camera._process.pid) if camera._process else 0) - cpu
+    elapsed = time.monotonic() - started
+    camera.stop()
+    print(json.dumps({"decoded_fps": frames / elapsed, "cpu_percent": cpu / elapsed * 100}))
+
+
+def tree_cpu_seconds(pid):
+    return sum(process_cpu_seconds(member) for member in process_tree(pid))
+
+
+def run_video(args, workdir):
+    trace = args.video_trace or generate_h264(os.path.join(workdir, "camera.h264"), seconds=10)
+    standin = RtspStandIn().start()
+    port = free_port()
+    env = dict(
+        os.environ, STREAM_VIDEO_SOURCE="replay", STREAM_VIDEO_TRACE=trace, STREAM_VIDEO_SPEED=str(args.video_speed),
+        RTSP_URL=standin.url, STREAM_CONTROL_PORT=str(port), STREAM_CLIP_DIR=os.path.join(workdir, "clips"),
+        MQTT_BROKER="127.0.0.1", MQTT_PORT="1",
+    )
+    supervisor = subprocess.Popen([sys.executable, os.path.join(STREAM_DIR, "stream.py")], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not standin.wait_frames(1, timeout=15):
+            raise RuntimeError("no frames reached the RTSP stand-in")
+        camera = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--camera-child", str(args.seconds)],
+            env=dict(os.environ, STREAM_CONTROL_URL=f"http://127.0.0.1:{port}", LOG_LEVEL="WARNING"),
+            stdout=subprocess.PIPE, text=True,
+        )
+        time.sleep(1)  # The camera child's own warm-up
+        standin.reset()
+        cpu_before, started = tree_cpu_seconds(supervisor.pid), time.monotonic()
+        time.sleep(args.seconds)
+        cpu = tree_cpu_seconds(supervisor.pid) - cpu_before
+        elapsed = time.monotonic() - started
+        frame_times = list(standin.frame_times)
+        rss_kb = read_peak_rss_kb(supervisor.pid)
+        decoded = json.loads(camera.communicate(timeout=30)[0].splitlines()[-1])
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        supervisor.wait(timeout=10)
+        standin.stop()
+    intervals = [(b - a) * 1000 for a, b in zip(frame_times, frame_times[1:])]
+    return {
+        "rtsp_fps": len(frame_times) / elapsed,
+        **distribution("interval", intervals),
+        "stream_cpu_percent": cpu / elapsed * 100,
+        "stream_rss_mb": rss_kb / 1024,
+        "decoded_fps": decoded["decoded_fps"],
+        "decode_cpu_percent": decoded["cpu_percent"],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline):
+    for stage, figures in results["stages"].items():
+        print(f"{stage}:")
+        if figures is None:
+            print("  skipped")
+            continue
+        before = (baseline or {}).get("stages", {}).get(stage) or {}
+        for name, value in figures.items():
+            line = f"  {name:<20} {value:10.2f}"
+            if name in before and before[name]:
+                change = (value - before[name]) / abs(before[name]) * 100
+                better = change > 0 if name in THROUGHPUT else change < 0
+                line += f"   was {before[name]:10.2f}  {change:+6.1f}%{'' if abs(change) < 5 else ' better' if better else ' worse'}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default="sensors,video")
+    parser.add_argument("--seconds", type=float, default=10, help="measured per stage")
+    parser.add_argument("--rate", type=float, default=100, help="sensor reads/s per channel")
+    parser.add_argument("--interval", type=float, default=0.1, help="METRICS_PUBLISH_INTERVAL")
+    parser.add_argument("--sensor-source", choices=("synthetic", "replay"), default="replay")
+    parser.add_argument("--sensor-trace", help="trace to replay (default: 5 s recorded from the synthetic source)")
+    parser.add_argument("--sensor-speed", type=float, default=0, help="replay speed, 0 for the next reading per read")
+    parser.add_argument("--sensor-latency", type=float, default=0.001, help="synthetic seconds per read")
+    parser.add_argument("--video-trace", help="H.264 file to replay (default: 10 s of ffmpeg's testsrc2)")
+    parser.add_argument("--video-speed", type=float, default=1, help="replay speed, 0 for as fast as possible")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="results JSON from an earlier --save")
+    parser.add_argument("--sensors-child", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--camera-child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.sensors_child:
+        asyncio.run(sensors_child(args.sensors_child))
+        return 0
+    if args.camera_child:
+        camera_child(args.camera_child)
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"comparing with {args.compare} (revision {baseline.get('revision')}, {baseline.get('time')})")
+    results = {
+        "revision": git_revision(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": f"{platform.machine()} {platform.python_version()} {os.cpu_count()} CPUs",
+        "settings": {name: value for name, value in vars(args).items() if name not in ("save", "compare")
+                     and not name.endswith("_child")},
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for stage in args.stages.split(","):
+            stage = stage.strip()
+            if stage == "sensors":
+                results["stages"]["sensors"] = run_sensors(args, workdir)
+            elif stage == "video":
+                if shutil.which("ffmpeg"):
+                    results["stages"]["video"] = run_video(args, workdir)
+                else:
+                    print("video: ffmpeg not found, skipping")
+                    results["stages"]["video"] = None
+            else:
+                parser.error(f"unknown stage {stage!r}")
+
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"saved to {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
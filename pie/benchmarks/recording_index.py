@@ -0,0 +1,188 @@
+"""
+Benchmark for continuous recording and the segment index.
+
+The index is written by the stream supervisor (pie/stream/segment_index.py)
+and read by pi-guard for GET /recordings (modules/recordings/index.py); the
+lookups here go through pi-guard's reader, the path the API serves.
+
+1. Checks the writer and the reader agree on the format (magic, version,
+   record layouts, segment file names); exits 1 if not.
+2. Feeds synthetic H.264 through a GopRing into a SegmentRecorder, then checks
+   every segment has one fragment per keyframe and that a time range lookup
+   returns bytes that ffmpeg can decode.
+3. Builds synthetic indexes of increasing size (2 weeks of 60s segments is
+   ~20k records) and times opening the index and looking up a range, which
+   should stay flat as the index grows.
+
+Usage: python3 recording_index.py [--records 1000 20000 200000]
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import PI_GUARD_DIR, STREAM_DIR, generate_h264, percentile, split_access_units, use_source_dir
+
+use_source_dir(STREAM_DIR)
+use_source_dir(PI_GUARD_DIR)
+import segment_index  # noqa: E402
+from gop_ring import GopRing  # noqa: E402
+from h264 import nal_type, NAL_AUD  # noqa: E402
+from modules.recordings import index as reader  # noqa: E402
+from modules.recordings.index import find_range  # noqa: E402
+from segment_index import KEYFRAME, RECORD, SegmentIndex, segment_path  # noqa: E402
+from segment_recorder import SegmentRecorder  # noqa: E402
+
+FPS = 30
+
+
+def is_keyframe(access_unit):
+    """True if the access unit carries an IDR slice."""
+    offset = 0
+    while True:
+        offset = access_unit.find(b"\x00\x00\x01", offset)
+        if offset < 0:
+            return False
+        if access_unit[offset + 3] & 0x1F == 5:
+            return True
+        offset += 3
+
+
+def check_format():
+    """Differences between the writer's and the reader's idea of the on-disk format."""
+    problems = []
+    for name in ("INDEX_MAGIC", "INDEX_VERSION"):
+        if getattr(segment_index, name) != getattr(reader, name):
+            problems.append(name)
+    for name in ("HEADER", "RECORD", "KEYFRAME"):
+        if getattr(segment_index, name).format != getattr(reader, name).format:
+            problems.append(name)
+    for start_ms in (0, 1_700_000_000_000, int(time.time() * 1000)):
+        for extension in (".mp4", ".kfi"):
+            written = os.path.relpath(segment_path("root", start_ms, extension), os.path.join("root", "segments"))
+            if written != reader.segment_name(start_ms, extension):
+                problems.append(f"segment name {written} vs {reader.segment_name(start_ms, extension)}")
+    return problems
+
+
+def check_recorder(workdir, seconds, segment_seconds):
+    source = generate_h264(os.path.join(workdir, "source.h264"), seconds=seconds, fps=FPS, gop=FPS)
+    with open(source, "rb") as f:
+        access_units = split_access_units(f.read())
+
+    ring = GopRing(capacity_bytes=64 * 1024 * 1024, max_units=len(access_units) + 1)
+    root = os.path.join(workdir, "recordings")
+    recorder = SegmentRecorder(ring, root, segment_seconds, FPS, max_bytes=10**12, max_age=10**9)
+    recorder.start()
+
+    start = time.time() - seconds
+    for i, access_unit in enumerate(access_units):
+        assert nal_type(access_unit) == NAL_AUD
+        ring.append(access_unit, is_keyframe(access_unit), timestamp=start + i / FPS)
+        time.sleep(0.001)  # let the recorder keep up, the ring isn't the subject here
+    # A gap longer than max_gap closes the open segment
+    time.sleep(2.5)
+    recorder.stop()
+
+    index = recorder.index
+    index.open()
+    print(f"Recorder: {recorder.segments_written} segments, {recorder.segments_failed} failed, "
+          f"{index.total_bytes / 1e6:.2f} MB")
+    index.close()
+
+    # Look up 1.5s in the middle of the recording. Each segment's ranges are
+    # its init section plus the selected fragments, which must decode alone.
+    mid_ms = int((start + seconds / 2) * 1000)
+    ranges = find_range(root, mid_ms, mid_ms + 1500)
+    decoded = 0
+    for i, r in enumerate(ranges):
+        clip = os.path.join(workdir, f"range-{i}.mp4")
+        with open(os.path.join(root, "segments", r["name"]), "rb") as f, open(clip, "wb") as out:
+            out.write(f.read(r["init_size"]))
+            f.seek(r["offset"])
+            out.write(f.read(r["end_offset"] - r["offset"]))
+        result = subprocess.run(
+            ["ffmpeg", "-v", "error", "-i", clip, "-f", "framemd5", "-"],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0 or result.stderr:
+            print(f"Range {i} failed to decode: {result.stderr.strip()[:300]}")
+            continue
+        decoded += sum(1 for line in result.stdout.splitlines() if line and not line.startswith("#"))
+    print(f"Range lookup: 1.5s across {len(ranges)} segment(s), {decoded} frames decoded "
+          f"(keyframe aligned, expect {FPS * 2}-{FPS * 3})")
+
+
+def build_index(root, records, segment_seconds=60, keyframes=60):
+    """Write a synthetic index of back-to-back segments, sidecars only where looked up."""
+    index = SegmentIndex(root, max_bytes=10**15, max_age=10**10)
+    index.open()
+    start_ms = int((time.time() - records * segment_seconds) * 1000)
+    for i in range(records):
+        seg_start = start_ms + i * segment_seconds * 1000
+        index._file.write(
+            RECORD.pack(seg_start, seg_start + segment_seconds * 1000, 7_500_000, 800, keyframes)
+        )
+    index._file.flush()
+    index.close()
+    return start_ms
+
+
+def write_sidecar(root, seg_start, segment_seconds=60, keyframes=60):
+    path = segment_path(root, seg_start, ".kfi")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    step = segment_seconds * 1000 // keyframes
+    with open(path, "wb") as f:
+        f.write(b"".join(KEYFRAME.pack(seg_start + k * step, 800 + k * 125_000) for k in range(keyframes)))
+
+
+def bench_lookup(workdir, records, lookups=200):
+    root = os.path.join(workdir, f"index-{records}")
+    start_ms = build_index(root, records)
+
+    begin = time.perf_counter()
+    index = SegmentIndex(root, max_bytes=10**15, max_age=10**10)
+    index.open()
+    open_ms = (time.perf_counter() - begin) * 1000
+    index.close()
+
+    timings = []
+    for _ in range(lookups):
+        seg = random.randrange(records)
+        seg_start = start_ms + seg * 60_000
+        write_sidecar(root, seg_start)
+        write_sidecar(root, seg_start + 60_000)
+        query = seg_start + random.randrange(60_000)
+        begin = time.perf_counter()
+        ranges = find_range(root, query, query + 10_000)
+        timings.append((time.perf_counter() - begin) * 1000)
+        assert ranges and ranges[0]["start_ms"] == seg_start, (ranges, seg_start)
+    size_kb = os.path.getsize(os.path.join(root, "index", "segments.idx")) / 1024
+    print(f"{records:>8} segments: index {size_kb:8.0f} kB, open {open_ms:7.1f} ms, "
+          f"lookup p50 {percentile(timings, 50):.3f} ms p99 {percentile(timings, 99):.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=10, help="synthetic video length for the recorder check")
+    parser.add_argument("--segment-seconds", type=float, default=2)
+    parser.add_argument("--records", type=int, nargs="+", default=[1000, 20000, 200000])
+    args = parser.parse_args()
+
+    problems = check_format()
+    print(f"Format: writer and reader {'differ on ' + ', '.join(problems) if problems else 'agree'}")
+    if problems:
+        return 1
+
+    with tempfile.TemporaryDirectory() as workdir:
+        check_recorder(workdir, args.seconds, args.segment_seconds)
+        for records in args.records:
+            bench_lookup(workdir, records)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Local RTSP server stand-in for benchmarks.
+Accepts an ffmpeg RTSP publish (ANNOUNCE/SETUP/RECORD over TCP) and records
+the arrival time of every complete video frame (RTP packet with the marker bit).
+"""
+import socket
+import threading
+import time
+
+
+class RtspStandIn:
+    """Minimal RTSP record endpoint that timestamps received frames."""
+
+    def __init__(self, host="127.0.0.1", port=0, on_packet=None):
+        self.host = host
+        self.port = port
+        self.on_packet = on_packet  # optional callback(channel, rtp_packet, arrival_time)
+        self.frame_times = []
+        self.bytes_received = 0
+        self.sdp = None  # session description from the publisher's ANNOUNCE
+        self._sock = None
+        self._thread = None
+        self._frame_event = threading.Condition()
+        self._closed = False
+
+    @property
+    def url(self):
+        return f"rtsp://{self.host}:{self.port}/cam"
+
+    def start(self):
+        """Start listening for a publisher."""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(1)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop listening."""
+        self._closed = True
+        if self._sock:
+            self._sock.close()
+
+    def reset(self):
+        """Forget frames received so far."""
+        with self._frame_event:
+            self.frame_times = []
+            self.bytes_received = 0
+
+    def wait_frames(self, count, timeout):
+        """Wait until at least count frames have arrived, returns the frame count."""
+        deadline = time.monotonic() + timeout
+        with self._frame_event:
+            while len(self.frame_times) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._frame_event.wait(remaining)
+            return len(self.frame_times)
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        reader = conn.makefile("rb")
+        try:
+            while True:
+                first = reader.read(1)
+                if not first:
+                    return
+                if first == b"$":
+                    header = reader.read(3)
+                    channel = header[0]
+                    length = int.from_bytes(header[1:3], "big")
+                    packet = reader.read(length)
+                    self._on_rtp(channel, packet)
+                else:
+                    self._on_request(conn, reader, first)
+        except (OSError, ValueError):
+            return
+        finally:
+            conn.close()
+
+    def _on_rtp(self, channel, packet):
+        now = time.monotonic()
+        if self.on_packet:
+            self.on_packet(channel, packet, now)
+        # Channel 0 carries video RTP, 1 is RTCP; marker bit ends an access unit
+        if channel == 0 and len(packet) > 1 and packet[1] & 0x80:
+            with self._frame_event:
+                self.frame_times.append(now)
+                self.bytes_received += len(packet)
+                self._frame_event.notify_all()
+        elif channel == 0:
+            self.bytes_received += len(packet)
+
+    def _on_request(self, conn, reader, first):
+        lines = [first + reader.readline()]
+        while lines[-1] not in (b"\r\n", b"\n", b""):
+            lines.append(reader.readline())
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        body = reader.read(length) if length else b""
+
+        method = lines[0].split(b" ", 1)[0].decode("latin-1")
+        if method == "ANNOUNCE":
+            self.sdp = body.decode("latin-1")
+        response = ["RTSP/1.0 200 OK", f"CSeq: {headers.get('cseq', '0')}"]
+        if method == "OPTIONS":
+            response.append("Public: OPTIONS, ANNOUNCE, SETUP, RECORD, TEARDOWN")
+        elif method == "SETUP":
+            response.append(f"Transport: {headers.get('transport', '')}")
+            response.append("Session: 1")
+        elif method in ("RECORD", "TEARDOWN"):
+            response.append("Session: 1")
+        conn.sendall(("\r\n".join(response) + "\r\n\r\n").encode("latin-1"))
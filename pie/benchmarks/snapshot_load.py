@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Load test for the pi-guard /snapshot endpoint.
+Runs the API routes in-process with a stand-in camera that publishes a new
+1280x720 frame at the camera frame rate, then has N concurrent clients fetch
+random sizes for a fixed time. Half the clients revalidate with
+If-None-Match like a dashboard polling for changes. Reports requests/s,
+200 vs 304 responses, latency, and the number of JPEG encodes, which must
+stay at or below frames x sizes however many clients there are.
+
+Usage: python3 snapshot_load.py [--clients 50] [--seconds 10] [--fps 10]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+
+from common import PI_GUARD_DIR, percentile, use_source_dir
+
+use_source_dir(PI_GUARD_DIR)
+from api.routes import router  # noqa: E402
+from modules.camera.service import Frame  # noqa: E402
+from modules.snapshot.service import SIZES, SnapshotService  # noqa: E402
+
+WIDTH, HEIGHT = 1280, 720
+
+
+class FakeCamera:
+    """Publishes a new synthetic YUV 4:2:0 frame every 1/fps seconds."""
+
+    def __init__(self, fps):
+        self.width, self.height = WIDTH, HEIGHT
+        self.fps = fps
+        self.frame = None
+        self.frames = 0
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        y, x = np.mgrid[0:HEIGHT, 0:WIDTH]
+        self._base = (96 + 60 * np.sin(x / 41.0) * np.cos(y / 29.0)).astype(np.uint8)
+        self._rng = np.random.default_rng(1)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            data = np.empty((HEIGHT * 3 // 2, WIDTH), dtype=np.uint8)
+            data[:HEIGHT] = self._base + self._rng.integers(0, 8, (HEIGHT, WIDTH), dtype=np.uint8)
+            data[HEIGHT:] = 128
+            with self._cond:
+                self.frame = Frame(self.frames, time.time(), WIDTH, HEIGHT, data)
+                self.frames += 1
+                self._cond.notify_all()
+            self._stop.wait(1 / self.fps)
+
+    def latest_frame(self):
+        return self.frame
+
+    def get_frame(self, after_seq=-1, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self.frame is not None and self.frame.seq > after_seq, timeout)
+            frame = self.frame
+        return frame if frame is not None and frame.seq > after_seq else None
+
+    def is_running(self):
+        return not self._stop.is_set()
+
+
+async def client(http, deadline, revalidate, results):
+    etags = {}
+    while time.monotonic() < deadline:
+        size = random.choice(list(SIZES))
+        headers = {"If-None-Match": etags[size]} if revalidate and size in etags else {}
+        started = time.perf_counter()
+        response = await http.get("/snapshot", params={"size": size}, headers=headers)
+        results.append((response.status_code, time.perf_counter() - started))
+        if response.status_code == 200:
+            etags[size] = response.headers["etag"]
+        elif response.status_code == 304:
+            await asyncio.sleep(0.02)  # a polling client waits a little before asking again
+
+
+async def run(clients, seconds, fps):
+    camera = FakeCamera(fps)
+    camera.start()
+    while camera.latest_frame() is None:
+        await asyncio.sleep(0.01)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.state.snapshot_service = SnapshotService(camera)
+    service = app.state.snapshot_service
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://pi-guard") as http:
+        frames_before = camera.frames
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(client(http, deadline, i % 2 == 0, results) for i in range(clients)))
+        frames = camera.frames - frames_before + 1
+    camera.stop()
+
+    latencies = [latency for _, latency in results]
+    ok = sum(1 for status, _ in results if status == 200)
+    not_modified = sum(1 for status, _ in results if status == 304)
+    bound = frames * len(SIZES)
+    print(f"{clients} clients, {seconds}s, camera at {fps} fps ({frames} frames)")
+    print(f"  {len(results) / seconds:.0f} requests/s: {ok} x 200, {not_modified} x 304, "
+          f"{len(results) - ok - not_modified} other")
+    print(f"  latency p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  {service.encode_count} JPEG encodes for {ok} images served "
+          f"(bound: {frames} frames x {len(SIZES)} sizes = {bound}) -> {'ok' if service.encode_count <= bound else 'EXCEEDED'}")
+    return 0 if service.encode_count <= bound else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--fps", type=float, default=10)
+    args = parser.parse_args()
+    return asyncio.run(run(args.clients, args.seconds, args.fps))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
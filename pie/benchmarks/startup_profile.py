@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Startup profile and cold import budget for pi-guard.
+Imports main.py in fresh interpreters, as `uvicorn main:app` would, and:
+
+  import    times `import main` over --runs cold processes and fails if the
+            best one takes longer than --budget-ms
+  lazy      checks NumPy, simplejpeg, sense_hat and picamera2 are not loaded
+            by the import, only by the services that need them
+  profile   runs one process under `python -X importtime` and reports the
+            cumulative import time of the heaviest packages and of each
+            pi-guard module, then what each service's start loaded and how
+            long every start took (LifecycleManager status)
+  disabled  starts the app with CAMERA_ENABLED, MOTION_ENABLED and
+            METRICS_ENABLED false and checks none of those modules load
+
+The services run against nothing (no camera, broker or supervisor reachable)
+with a stand-in Sense HAT, so start times are for initialisation, not the
+hardware. Exits nonzero if the budget is exceeded or a module loads early.
+
+Usage: python3 startup_profile.py [--runs 5] [--budget-ms 400] [--top 12]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from common import PI_GUARD_DIR, use_source_dir
+
+# Loaded only when the service needing them starts; picamera2 is not used at all (frames come from ffmpeg)
+HEAVY = ("numpy", "simplejpeg", "sense_hat", "picamera2")
+APP_PACKAGES = ("main", "config", "api", "core", "modules")
+IMPORTTIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+class StandInSenseHat(types.ModuleType):
+    """The sense_hat module off a Pi, noting whether anything imported from it."""
+    
+    imported = False
+    
+    def __getattr__(self, name):
+        if name != "SenseHat":
+            raise AttributeError(name)
+        self.imported = True
+        
+        def sense_hat():
+            from metrics_sampling import FakeSenseHat  # Loads NumPy itself, so only once the sampler runs
+            return FakeSenseHat()
+        return sense_hat
+
+
+async def start_app(main):
+    """Drive the ASGI lifespan through startup and shutdown as uvicorn would; returns the lifecycle status."""
+    to_app, from_app = asyncio.Queue(), asyncio.Queue()
+    lifespan = asyncio.create_task(main.app({"type": "lifespan", "asgi": {"version": "3.0"}}, to_app.get, from_app.put))
+    await to_app.put({"type": "lifespan.startup"})
+    message = await from_app.get()
+    assert message["type"] == "lifespan.startup.complete", message
+    await asyncio.sleep(0.5)  # Let the camera and sampler threads get going
+    status = main.app.state.lifecycle.get_status()
+    await to_app.put({"type": "lifespan.shutdown"})
+    await from_app.get()
+    await lifespan
+    return status
+
+
+def child(start):
+    """Import the app, optionally start it, and print what that took and loaded as JSON."""
+    use_source_dir(PI_GUARD_DIR)
+    began = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    result = {
+        "import_ms": (imported - began) * 1000,
+        "loaded_by_import": [name for name in HEAVY if name in sys.modules],
+    }
+    if start:
+        sense_hat = StandInSenseHat("sense_hat")
+        sys.modules["sense_hat"] = sense_hat
+        already = set(sys.modules)
+        result["lifecycle"] = asyncio.run(start_app(main))
+        result["loaded_by_start"] = [name for name in HEAVY if name in sys.modules and name not in already]
+        if sense_hat.imported:
+            result["loaded_by_start"].append("sense_hat")
+    print(json.dumps(result))
+
+
+def run_child(workdir, start=False, importtime=False, **env):
+    environment = dict(os.environ, STREAM_CONTROL_URL="http://127.0.0.1:1", MQTT_BROKER="127.0.0.1", MQTT_PORT="1",
+                       METRICS_SPOOL_PATH=os.path.join(workdir, "metrics.db"), RECORDINGS_DIR=workdir,
+                       LOG_LEVEL="WARNING", **env)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [os.path.abspath(__file__), "--child"]
+    if start:
+        command.append("--start")
+    spawned = time.perf_counter()
+    process = subprocess.run(command, env=environment, capture_output=True, text=True, check=True)
+    result = json.loads(process.stdout.splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - spawned) * 1000
+    return result, process.stderr
+
+
+def parse_importtime(stderr):
+    """(indent, name, cumulative ms) per import, in the order -X importtime printed them."""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            entries.append((len(match.group(3)) // 2, match.group(4), int(match.group(2)) / 1000))
+    return entries
+
+
+def packages(entries):
+    """Cumulative ms per top-level package, wherever it was imported from, other than by itself."""
+    totals = {}
+    outer = []  # package at each depth; -X importtime prints an import after everything it imported
+    for indent, name, ms in reversed(entries):
+        package = name.split(".")[0]
+        del outer[indent:]
+        if not outer or outer[-1] != package:
+            totals[package] = totals.get(package, 0) + ms
+        outer.append(package)
+    return totals
+
+
+def app_modules(entries):
+    """Cumulative ms of each pi-guard module the first time it is imported, at whatever depth."""
+    totals = {}
+    for _, name, ms in entries:
+        if name.split(".")[0] in APP_PACKAGES and name not in totals and not name.endswith("__init__"):
+            totals[name] = ms
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold imports timed")
+    # About 270 ms on a desktop for FastAPI, paho and the app; a Pi 4 takes several times that
+    parser.add_argument("--budget-ms", type=float, default=400, help="cold `import main`, best of --runs")
+    parser.add_argument("--top", type=int, default=12, help="heaviest imports listed")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.start)
+        return 0
+
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [run_child(workdir)[0] for _ in range(args.runs)]
+        profiled, stderr = run_child(workdir, start=True, importtime=True)
+        disabled, _ = run_child(workdir, start=True, CAMERA_ENABLED="false", MOTION_ENABLED="false",
+                                METRICS_ENABLED="false")
+
+    imports = sorted(run["import_ms"] for run in runs)
+    over = imports[0] > args.budget_ms
+    ok &= not over
+    print(f"cold `import main`, {args.runs} runs: best {imports[0]:.0f} ms, median {imports[len(imports) // 2]:.0f} ms, "
+          f"worst {imports[-1]:.0f} ms (budget {args.budget_ms:g} ms){'  OVER BUDGET' if over else ''}")
+    print(f"  interpreter start-up to the import: ~{min(run['process_ms'] - run['import_ms'] for run in runs):.0f} ms "
+          f"per process")
+
+    early = sorted({name for run in runs + [profiled, disabled] for name in run["loaded_by_import"]})
+    ok &= not early
+    print(f"loaded by `import main`: {', '.join(early) if early else 'none of ' + ', '.join(HEAVY)}")
+
+    entries = parse_importtime(stderr)
+    marker = next((i for i, (indent, name, _) in enumerate(entries) if indent == 0 and name == "main"), len(entries))
+    print("\nheaviest imports (cumulative ms, under -X importtime):")
+    for name, ms in sorted(packages(entries[:marker + 1]).items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:7.1f}  {name}")
+    print("pi-guard modules (cumulative ms, first import):")
+    for name, ms in sorted(app_modules(entries[:marker + 1]).items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:7.1f}  {name}")
+
+    later = packages(entries[marker + 1:])
+    print("\nimported while services started: " + (", ".join(
+        f"{name} {ms:.1f} ms" for name, ms in sorted(later.items(), key=lambda item: -item[1])[:args.top]) or "nothing"))
+    services = profiled["lifecycle"]["services"]
+    print(f"service start ({profiled['lifecycle']['startup_ms']} ms in all, concurrently): " + ", ".join(
+        f"{name} {entry['start_ms']} ms" if entry["start_ms"] is not None else f"{name} {entry['state']}"
+        for name, entry in sorted(services.items(), key=lambda item: -(item[1]["start_ms"] or 0))))
+    print(f"  heavy modules loaded by start: {', '.join(profiled['loaded_by_start']) or 'none'}")
+
+    leaked = disabled["loaded_by_start"]
+    ok &= not leaked
+    print(f"\ncamera, motion and metrics disabled: heavy modules loaded by start: {', '.join(leaked) or 'none'}; "
+          f"{disabled['lifecycle']['startup_ms']} ms to start")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Stream pipeline benchmark.
+Feeds a locally generated H.264 source through each stream.py pipeline mode
+into a local RTSP stand-in and reports CPU time, peak memory and per-frame latency.
+
+Usage: python3 stream_pipeline.py [--seconds 20] [--modes passthrough,transcode]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import tempfile
+import time
+
+from common import (STREAM_DIR, generate_h264, percentile, read_peak_rss_kb,
+                    split_access_units, use_source_dir)
+from rtsp_standin import RtspStandIn
+
+use_source_dir(STREAM_DIR)
+import stream  # noqa: E402
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_mode(mode, access_units, fps):
+    """Push the access units through one pipeline mode at the camera framerate."""
+    standin = RtspStandIn().start()
+    cpu_before = children_cpu_seconds()
+    process = subprocess.Popen(
+        stream.build_ffmpeg_cmd(mode, standin.url),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    sent_times = []
+    peak_rss_kb = 0
+    start = time.monotonic()
+    for index, access_unit in enumerate(access_units):
+        delay = start + index / fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        sent_times.append(time.monotonic())
+        process.stdin.write(access_unit)
+        process.stdin.flush()
+        if index % fps == 0:
+            peak_rss_kb = max(peak_rss_kb, read_peak_rss_kb(process.pid))
+
+    # ffmpeg's raw H.264 parser only completes a frame when the next one starts,
+    # so the final frame is held until EOF and left out of the latency figures
+    standin.wait_frames(len(access_units) - 1, timeout=5)
+    peak_rss_kb = max(peak_rss_kb, read_peak_rss_kb(process.pid))
+    process.stdin.close()
+    process.wait(timeout=10)
+    cpu_seconds = children_cpu_seconds() - cpu_before
+    standin.stop()
+
+    received = standin.frame_times
+    latencies_ms = [(r - s) * 1000 for s, r in zip(sent_times[:-1], received)]
+    duration = len(access_units) / fps
+    return {
+        "mode": mode,
+        "frames_sent": len(sent_times),
+        "frames_received": len(received),
+        "cpu_seconds": cpu_seconds,
+        "cpu_percent": cpu_seconds / duration * 100,
+        "peak_rss_mb": peak_rss_kb / 1024,
+        "latency_p50_ms": percentile(latencies_ms, 50),
+        "latency_p95_ms": percentile(latencies_ms, 95),
+        "latency_max_ms": max(latencies_ms) if latencies_ms else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--fps", type=int, default=stream.FRAMERATE)
+    parser.add_argument("--modes", default=",".join(stream.PIPELINE_MODES))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = generate_h264(os.path.join(workdir, "source.h264"), args.seconds, args.fps)
+        with open(source, "rb") as f:
+            access_units = split_access_units(f.read())
+
+    print(f"{'mode':<12} {'frames':>13} {'cpu s':>7} {'cpu %':>6} {'rss MB':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'max ms':>7}")
+    for mode in args.modes.split(","):
+        r = run_mode(mode.strip(), access_units, args.fps)
+        frames = f"{r['frames_received']}/{r['frames_sent']}"
+        print(f"{r['mode']:<12} {frames:>13} {r['cpu_seconds']:>7.2f} {r['cpu_percent']:>6.1f} "
+              f"{r['peak_rss_mb']:>7.1f} {r['latency_p50_ms']:>7.1f} "
+              f"{r['latency_p95_ms']:>7.1f} {r['latency_max_ms']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Stream supervisor recovery benchmark.
+Runs the stream.py supervisor against stub camera and ffmpeg processes, then
+kills or wedges them and measures the time until the first frame of the new pipeline.
+
+Usage: python3 stream_recovery.py [--runs 5] [--stall-timeout 2]
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+from common import STREAM_DIR, percentile, use_source_dir
+
+use_source_dir(STREAM_DIR)
+import stream  # noqa: E402
+
+# Writes fake 4 kB H.264 pictures (an IDR slice every 30) at 30 fps
+CAMERA_STUB = """
+import sys, time
+idr = b"\\x00\\x00\\x00\\x01\\x65\\x88" + b"\\x11" * 4090
+non_idr = b"\\x00\\x00\\x00\\x01\\x41\\x9a" + b"\\x11" * 4090
+count = 0
+while True:
+    sys.stdout.buffer.write(idr if count % 30 == 0 else non_idr)
+    sys.stdout.buffer.flush()
+    count += 1
+    time.sleep(1 / 30)
+"""
+
+# Reads frames and reports them the way "ffmpeg -progress pipe:2" does
+FFMPEG_STUB = """
+import sys
+frames = 0
+while sys.stdin.buffer.read(4096):
+    frames += 1
+    sys.stderr.write(f"frame={frames}\\nprogress=continue\\n")
+    sys.stderr.flush()
+"""
+
+
+def use_stub_processes():
+    stream.CAMERA_CMD = [sys.executable, "-c", CAMERA_STUB]
+    stream.build_ffmpeg_cmd = lambda mode=None, rtsp_url=None: [sys.executable, "-c", FFMPEG_STUB]
+
+
+def wait_for_first_frame(old_pid, timeout=30):
+    """Wait for a new ffmpeg process to report a frame, returns when it did."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = stream.get_stream_stats()
+        if stats["ffmpeg_pid"] not in (None, old_pid) and stats["encoder"]["frame"] > 0:
+            return time.monotonic()
+        time.sleep(0.001)
+    raise TimeoutError("pipeline did not recover")
+
+
+def measure(fault, runs):
+    """Inject a fault repeatedly, returns the recovery times in ms."""
+    recoveries = []
+    for _ in range(runs):
+        # Let the pipeline settle so every fault is a first failure
+        while stream.restart_count or stream.get_stream_stats()["encoder"]["frame"] == 0:
+            time.sleep(0.05)
+        old_pid = stream.ffmpeg_process.pid
+        injected_at = time.monotonic()
+        if fault == "kill-ffmpeg":
+            os.kill(stream.ffmpeg_process.pid, signal.SIGKILL)
+        elif fault == "kill-camera":
+            os.kill(stream.camera_process.pid, signal.SIGKILL)
+        elif fault == "stall-camera":
+            os.kill(stream.camera_process.pid, signal.SIGSTOP)
+        recoveries.append((wait_for_first_frame(old_pid) - injected_at) * 1000)
+    return recoveries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--stall-timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    use_stub_processes()
+    stream.logger.setLevel("WARNING")
+    stream.STALL_TIMEOUT = args.stall_timeout
+    stream.STABLE_RUN_TIME = 0.2
+
+    if not stream.start_streaming():
+        sys.exit("failed to start stub pipeline")
+    supervisor = threading.Thread(target=stream.monitor_processes, daemon=True)
+    supervisor.start()
+
+    print(f"{'fault':<14} {'runs':>5} {'p50 ms':>8} {'max ms':>8}")
+    try:
+        for fault in ("kill-ffmpeg", "kill-camera", "stall-camera"):
+            recoveries = measure(fault, args.runs)
+            print(f"{fault:<14} {len(recoveries):>5} {percentile(recoveries, 50):>8.1f} {max(recoveries):>8.1f}")
+    finally:
+        stream.shutdown_flag = True
+        stream.supervisor_wakeup.set()
+        supervisor.join(timeout=5)
+        stream.cleanup_processes()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Instrumentation overhead benchmark for pi-guard's /metrics (core/telemetry.py).
+Times each kind of metric update in a tight loop and subtracts the cost of
+the empty loop, so the figure is what one event adds to the code it
+instruments:
+
+  counter       Counter child inc(), as the services keep them
+  labels+inc    labels(...) lookup then inc(), the uncached path
+  gauge         Gauge child set()
+  histogram     Histogram observe() into the 14 latency buckets
+  timed         perf_counter() twice plus observe(), as around a sensor read
+
+Then sends --requests requests straight into a minimal FastAPI app through
+ASGI, with and without HttpMetricsMiddleware, for the per-request cost, and
+renders the full registry (every service's metrics imported) for the scrape
+cost. Checks the exposition parses (cumulative buckets, _count = +Inf) and
+exits nonzero if any event costs more than --budget-ns or a request more
+than --request-budget-us.
+
+Usage: python3 telemetry_overhead.py [--events 1000000] [--requests 20000]
+"""
+import argparse
+import asyncio
+import itertools
+import re
+import sys
+import time
+import types
+
+from fastapi import FastAPI
+
+from common import PI_GUARD_DIR, use_source_dir
+from metrics_sampling import FakeSenseHat
+
+# The real module only imports on a Pi; the metrics service imports it when started
+sys.modules["sense_hat"] = types.SimpleNamespace(SenseHat=FakeSenseHat)
+use_source_dir(PI_GUARD_DIR)
+import api.routes  # noqa: E402,F401  every module's metrics, as main.py imports them
+import modules.governor.service  # noqa: E402,F401
+import modules.metrics.service  # noqa: E402,F401
+import modules.mqtt.service  # noqa: E402,F401
+import modules.streaming.service  # noqa: E402,F401
+from core.telemetry import HttpMetricsMiddleware, Registry, registry  # noqa: E402
+from modules.metrics.sampler import CHANNELS  # noqa: E402
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*\})? (NaN|[+-]Inf|-?[0-9.e+-]+)$')
+
+
+def per_event_ns(body, events):
+    """Net nanoseconds per call of body(i) over events calls."""
+    def empty(i):
+        pass
+
+    def loop(function):
+        started = time.perf_counter_ns()
+        for i in range(events):
+            function(i)
+        return time.perf_counter_ns() - started
+
+    loop(body)  # warm up
+    return (min(loop(body) for _ in range(3)) - min(loop(empty) for _ in range(3))) / events
+
+
+def time_updates(events):
+    scratch = Registry()
+    counter = scratch.counter("bench_total", "", ("result",))
+    gauge = scratch.gauge("bench_gauge", "")
+    histogram = scratch.histogram("bench_seconds", "")
+    child = counter.labels("success")
+    gauge_child = gauge.labels()
+    histogram_child = histogram.labels()
+    values = [(i % 997) / 997 * 0.02 for i in range(1000)]  # spread over the low buckets
+    perf_counter = time.perf_counter
+    return {
+        "counter": per_event_ns(lambda i: child.inc(), events),
+        "labels+inc": per_event_ns(lambda i: counter.labels("success").inc(), events),
+        "gauge": per_event_ns(lambda i: gauge_child.set(i), events),
+        "histogram": per_event_ns(lambda i: histogram_child.observe(values[i % 1000]), events),
+        "timed": per_event_ns(lambda i: histogram_child.observe(perf_counter() - perf_counter()), events),
+    }
+
+
+async def time_requests(app, requests):
+    """Mean microseconds per GET /ping sent straight to the ASGI app."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"",
+        "headers": [], "client": ("127.0.0.1", 1), "server": ("pi-guard", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):  # warm up
+        await app(dict(scope), receive, send)
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        best = min(best, (time.perf_counter() - started) / requests * 1e6)
+    return best
+
+
+def build_app(instrumented):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if instrumented:
+        app.add_middleware(HttpMetricsMiddleware)
+    return app
+
+
+def populate(metrics):
+    """Give every labelled metric the series a running Pi has, with observations."""
+    routes = ["/health", "/snapshot", "/stream/mjpeg", "/metrics", "/metrics/history", "/recordings", "unmatched"]
+    values = {
+        "channel": list(CHANNELS), "outcome": ["published", "suppressed", "undelivered"],
+        "result": ["success", "not_connected", "rejected", "aborted", "no_conn", "failure"],
+        "method": ["GET"], "route": routes, "status": ["200", "304", "400", "503"],
+        "type": ["metrics", "motion", "status"],
+        "stage": ["window", "publish"],
+        "direction": ["raise", "lower"],
+    }
+    for metric in metrics._metrics.values():
+        for key in itertools.product(*(values[name] for name in metric.labelnames)):
+            child = metric.labels(*key)
+            if hasattr(child, "observe"):
+                for i in range(100):
+                    child.observe(i / 1000)
+            else:
+                child.inc(len(key))
+
+
+def check_exposition(text):
+    """Problems with the rendered text, an empty list if it is well formed."""
+    problems = []
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        if not SAMPLE.match(line):
+            problems.append(f"unparseable sample: {line}")
+            continue
+        name, value = line.rsplit(" ", 1)
+        if "_bucket{" in name:
+            series = re.sub(r',?le="[^"]*"', "", name).replace("_bucket", "")
+            previous = buckets.get(series, 0)
+            if float(value) < previous:
+                problems.append(f"buckets not cumulative: {line}")
+            buckets[series] = float(value)
+        elif re.search(r"_count(\{|$)", name.split(" ")[0]):
+            series = name.replace("_count", "")
+            if series in buckets and buckets[series] != float(value):
+                problems.append(f"_count differs from the +Inf bucket: {line}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    # Budgets for a Pi 4, several times slower than a desktop: 2 us per update, 25 us per request
+    parser.add_argument("--budget-ns", type=float, default=2000, help="per metric update")
+    parser.add_argument("--request-budget-us", type=float, default=25, help="added per HTTP request")
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'update':>11} {'ns/event':>9}")
+    for name, ns in time_updates(args.events).items():
+        over = ns > args.budget_ns
+        ok &= not over
+        print(f"{name:>11} {ns:9.0f}{'  OVER BUDGET' if over else ''}")
+
+    plain = asyncio.run(time_requests(build_app(False), args.requests))
+    instrumented = asyncio.run(time_requests(build_app(True), args.requests))
+    added = instrumented - plain
+    ok &= added <= args.request_budget_us
+    print(f"HTTP request: {plain:.1f} us plain, {instrumented:.1f} us with HttpMetricsMiddleware, "
+          f"+{added:.1f} us (budget {args.request_budget_us:g} us)")
+
+    populate(registry)
+    started = time.perf_counter()
+    for _ in range(100):
+        text = registry.render()
+    render_ms = (time.perf_counter() - started) / 100 * 1000
+    series = sum(1 for line in text.splitlines() if not line.startswith("#"))
+    print(f"render: {len(registry._metrics)} metrics, {series} samples, {len(text) / 1024:.1f} KB "
+          f"in {render_ms:.2f} ms")
+
+    problems = check_exposition(text)
+    for problem in problems[:10]:
+        print(problem)
+    ok &= not problems
+    print(f"exposition well formed: {not problems}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
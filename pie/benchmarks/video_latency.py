@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency of the video pipeline, measured from the frames themselves.
+stream.py runs with the stamped video source (STREAM_VIDEO_SOURCE=stamped,
+see video_source.py), which puts every frame's sequence number and the wall
+clock time it was captured in a barcode across the top of the picture and
+encodes it with libx264 as rpicam-vid would; stream.py pushes it to a local
+RTSP stand-in as it would to MediaMTX. A reader on the stand-in
+depacketizes the RTP, decodes the pictures with ffmpeg, reads the barcodes
+back and reports per pipeline mode (--modes):
+
+  latency   capture to the last RTP packet of the frame at the server,
+            p50/p95/p99/max, and how long decoding the frame took after that
+  jitter    standard deviation of the latency and the RFC 3550 interarrival
+            jitter of the frames
+  drops     sequence numbers missing between the first and last frame read,
+            and frames whose barcode could not be read
+
+Capture here is the stamped source handing the frame to its encoder, so
+the figures cover encoding, the supervisor's GOP ring and push, the RTSP
+publish and the network to the server, but not the camera sensor, the
+WebRTC leg from MediaMTX or the viewer's decode and display that the
+README's ~220 ms glass-to-glass also includes. Both ends run on this
+machine's clock. Exits nonzero if a mode's p95 exceeds --budget-ms.
+
+Needs ffmpeg with libx264 on the PATH and numpy.
+
+Usage: python3 video_latency.py [--modes passthrough,transcode] [--seconds 10] [--budget-ms 220]
+"""
+import argparse
+import base64
+import json
+import os
+import queue
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from common import STREAM_DIR, percentile, use_source_dir
+from rtsp_standin import RtspStandIn
+
+use_source_dir(STREAM_DIR)
+import stream  # noqa: E402  (after the path set-up)
+from video_source import BITS, BLOCK, TIME_BITS, read_stamp  # noqa: E402
+
+START_CODE = b"\x00\x00\x00\x01"
+AUD = START_CODE + b"\x09\xf0"  # Ends an access unit for ffmpeg's parser, which otherwise waits for the next one
+SPROP = re.compile(r"sprop-parameter-sets=([^;\s]+)")
+
+
+class FrameReader:
+    """Reassembles the H.264 the RTSP stand-in receives (RFC 6184) and decodes the stamps back out of it.
+
+    Every complete access unit with a picture is timed when its last RTP
+    packet arrives and fed to an ffmpeg decoder; ffmpeg hands back one grey
+    picture per access unit, in order, so the nth picture decoded is the
+    nth access unit timed.
+    """
+
+    def __init__(self, standin, width, height):
+        self.standin = standin
+        self.size = width * height
+        self.shape = (height, width)
+        self.arrivals = []  # wall clock seconds each picture's last packet arrived
+        self.frames = []  # (stamp or None, wall clock seconds decoded)
+        self._nals = []
+        self._fragment = None
+        self._keyframe_seen = False
+        self._offset = time.time() - time.monotonic()
+        self._queue = queue.Queue()
+        self._decoder = subprocess.Popen([
+            "ffmpeg", "-loglevel", "fatal", "-probesize", "32", "-analyzeduration", "0",
+            "-flags", "low_delay", "-threads", "1", "-f", "h264", "-i", "-",
+            "-fps_mode", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", "-"
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._writer.start()
+        self._reader.start()
+
+    def on_packet(self, channel, packet, arrival):
+        if channel % 2 or len(packet) < 13:
+            return  # RTCP
+        csrcs = packet[0] & 0x0F
+        start = 12 + 4 * csrcs
+        if packet[0] & 0x10:  # Header extension
+            start += 4 + 4 * int.from_bytes(packet[start + 2:start + 4], "big")
+        end = len(packet) - (packet[-1] if packet[0] & 0x20 else 0)
+        self._depacketize(packet[start:end])
+        if packet[1] & 0x80:  # Marker: the last packet of the access unit
+            self._access_unit(arrival + self._offset)
+
+    def _depacketize(self, payload):
+        if not payload:
+            return
+        nal_type = payload[0] & 0x1F
+        if nal_type == 24:  # STAP-A: several NAL units, each after a 16-bit size
+            i = 1
+            while i + 2 <= len(payload):
+                size = int.from_bytes(payload[i:i + 2], "big")
+                self._nals.append(bytes(payload[i + 2:i + 2 + size]))
+                i += 2 + size
+        elif nal_type == 28:  # FU-A: one NAL unit across packets
+            header = payload[1]
+            if header & 0x80:
+                self._fragment = bytearray([payload[0] & 0xE0 | header & 0x1F])
+            if self._fragment is not None:
+                self._fragment += payload[2:]
+                if header & 0x40:
+                    self._nals.append(bytes(self._fragment))
+                    self._fragment = None
+        else:
+            self._nals.append(bytes(payload))
+
+    def _access_unit(self, arrival):
+        nals, self._nals = self._nals, []
+        types = {nal[0] & 0x1F for nal in nals}
+        if not types & {1, 5}:
+            return  # No picture in it
+        if not self._keyframe_seen:
+            if 5 not in types:
+                return  # The decoder would drop it
+            self._keyframe_seen = True
+            # ffmpeg's RTSP muxer sends the parameter sets in the SDP only when it encodes
+            match = SPROP.search(self.standin.sdp or "")
+            if match and not types & {7, 8}:
+                nals = [base64.b64decode(part) for part in match.group(1).split(",")] + nals
+        self.arrivals.append(arrival)
+        self._queue.put(b"".join(START_CODE + nal for nal in nals if nal[0] & 0x1F != 9) + AUD)
+
+    def _write_loop(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if data is None:
+                    self._decoder.stdin.close()
+                    return
+                self._decoder.stdin.write(data)
+                self._decoder.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                return
+
+    def _read_loop(self):
+        buffer = bytearray(self.size)
+        view = memoryview(buffer)
+        stdout = self._decoder.stdout
+        while True:
+            got = 0
+            while got < self.size:
+                n = stdout.readinto(view[got:])
+                if not n:
+                    return
+                got += n
+            decoded = time.time()
+            luma = np.frombuffer(buffer, dtype=np.uint8).reshape(self.shape)
+            self.frames.append((read_stamp(luma), decoded))
+
+    def close(self, timeout=10):
+        """Let the decoder finish what it has and stop it."""
+        self._queue.put(None)
+        self._reader.join(timeout)
+        self._decoder.kill()
+        self._decoder.wait()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rfc3550_jitter(sent, received):
+    """Interarrival jitter (RFC 3550, 6.4.1) of frames sent and received at these times, in the same unit."""
+    jitter = 0.0
+    for i in range(1, len(sent)):
+        d = (received[i] - received[i - 1]) - (sent[i] - sent[i - 1])
+        jitter += (abs(d) - jitter) / 16
+    return jitter
+
+
+def run_mode(mode, args, workdir):
+    standin = RtspStandIn().start()
+    reader = FrameReader(standin, stream.WIDTH, stream.HEIGHT)
+    standin.on_packet = reader.on_packet
+    env = dict(
+        os.environ, STREAM_PIPELINE_MODE=mode, STREAM_VIDEO_SOURCE="stamped", RTSP_URL=standin.url,
+        STREAM_CONTROL_PORT=str(free_port()), STREAM_CLIP_DIR=os.path.join(workdir, "clips"),
+        MQTT_BROKER="127.0.0.1", MQTT_PORT="1",
+    )
+    supervisor = subprocess.Popen([sys.executable, os.path.join(STREAM_DIR, "stream.py")], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not standin.wait_frames(1, timeout=20):
+            raise RuntimeError(f"{mode}: no frames reached the RTSP stand-in")
+        time.sleep(args.warmup)
+        window = (time.time(), time.time() + args.seconds)
+        time.sleep(args.seconds)
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        supervisor.wait(timeout=10)
+        standin.stop()
+        reader.close()
+
+    # The nth picture decoded came from the nth access unit timed
+    samples = []  # (seq, captured, arrived, decoded), seconds
+    unreadable = 0
+    for arrival, (found, decoded) in zip(reader.arrivals, reader.frames):
+        if not window[0] <= arrival < window[1]:
+            continue
+        if found is None:
+            unreadable += 1
+            continue
+        seq, at_ms = found
+        arrival_ms = int(arrival * 1000)
+        captured_ms = arrival_ms - (arrival_ms - at_ms) % (1 << TIME_BITS)
+        samples.append((seq, captured_ms / 1000, arrival, decoded))
+    if not samples:
+        raise RuntimeError(f"{mode}: no stamped frames read back")
+
+    seqs = sorted({sample[0] for sample in samples})
+    expected = seqs[-1] - seqs[0] + 1
+    latency = [(arrived - captured) * 1000 for _, captured, arrived, _ in samples]
+    decode = [(decoded - arrived) * 1000 for _, _, arrived, decoded in samples]
+    return {
+        "frames": len(samples),
+        "fps": len(samples) / args.seconds,
+        "latency_p50_ms": percentile(latency, 50),
+        "latency_p95_ms": percentile(latency, 95),
+        "latency_p99_ms": percentile(latency, 99),
+        "latency_max_ms": max(latency),
+        "latency_stdev_ms": statistics.pstdev(latency),
+        "jitter_rfc3550_ms": rfc3550_jitter([s[1] for s in samples], [s[2] for s in samples]) * 1000,
+        "decode_p50_ms": percentile(decode, 50),
+        "dropped": expected - len(seqs),
+        "drop_percent": (expected - len(seqs)) / expected * 100,
+        "duplicates": len(samples) - len(seqs),
+        "unreadable": unreadable,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(stream.PIPELINE_MODES))
+    parser.add_argument("--seconds", type=float, default=10, help="measured per mode")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds streamed before measuring")
+    parser.add_argument("--budget-ms", type=float, default=220, help="p95 latency allowed per mode")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    args = parser.parse_args()
+    if stream.WIDTH < BITS * BLOCK or stream.HEIGHT < 2 * BLOCK:
+        parser.error(f"the stamp needs frames at least {BITS * BLOCK}x{2 * BLOCK}")
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg not found")
+        return 1
+
+    print(f"{stream.WIDTH}x{stream.HEIGHT} at {stream.FRAMERATE} fps, {stream.BITRATE / 1e6:g} Mbit/s, "
+          f"libx264 ultrafast; {args.seconds:g} s per mode after {args.warmup:g} s warm-up")
+    results = {}
+    ok = True
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes.split(","):
+            mode = mode.strip()
+            if mode not in stream.PIPELINE_MODES:
+                parser.error(f"unknown mode {mode!r}, expected one of {', '.join(stream.PIPELINE_MODES)}")
+            figures = results[mode] = run_mode(mode, args, workdir)
+            over = figures["latency_p95_ms"] > args.budget_ms
+            ok &= not over
+            print(f"{mode}:")
+            print(f"  latency   p50 {figures['latency_p50_ms']:6.1f} ms  p95 {figures['latency_p95_ms']:6.1f} ms  "
+                  f"p99 {figures['latency_p99_ms']:6.1f} ms  max {figures['latency_max_ms']:6.1f} ms"
+                  f"{'  OVER BUDGET' if over else ''}")
+            print(f"  jitter    stdev {figures['latency_stdev_ms']:5.1f} ms  RFC 3550 "
+                  f"{figures['jitter_rfc3550_ms']:5.1f} ms; decoding then took {figures['decode_p50_ms']:.1f} ms (p50)")
+            print(f"  frames    {figures['frames']} read ({figures['fps']:.2f} fps), {figures['dropped']} dropped "
+                  f"({figures['drop_percent']:.2f}%), {figures['duplicates']} repeated, "
+                  f"{figures['unreadable']} unreadable")
+    print(f"budget: p95 {args.budget_ms:g} ms per mode, {'met' if ok else 'EXCEEDED'}")
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"settings": {name: value for name, value in vars(args).items() if name != "save"},
+                       "modes": results},
+                      file, indent=2)
+        print(f"saved to {args.save}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
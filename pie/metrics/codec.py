@@ -0,0 +1,266 @@
+"""
+Compact binary encoding of Sense HAT metrics messages.
+
+Published next to the JSON messages on "<metrics topic>/bin", with the
+schema() mapping retained on "<metrics topic>/schema", so JSON subscribers
+are unaffected and binary ones opt in by topic.
+
+Frame layout (little-endian):
+    header      version (u8), flags (u8), sequence (u16), fields present (u16 bitmask)
+    stamps      seq (u32), time (f64), captured and sent (i32 each), if FLAG_STAMPS
+    window      fields present in the window blocks (u16 bitmask), if FLAG_WINDOW
+    last        one value per present field: the flat JSON fields
+    min/max/mean  one value per window field each, if FLAG_WINDOW
+    count       samples per window field (u16), if FLAG_WINDOW
+
+Values are float32 in a keyframe. In a delta frame (FLAG_DELTA) they are the
+change since the previous frame in units of the field's last published
+decimal, as int16 (int8 with FLAG_DELTA8). A delta frame follows its
+reference frame's sequence number and field masks exactly; a decoder that
+missed a frame waits for the next keyframe.
+
+The header sequence only chains delta frames and restarts with the encoder.
+The stamps carry MetricsService's "seq" (the spool's, shared with the JSON
+and replay topics), "time" (window end, Unix seconds) and "captured" and
+"sent" as 0.1 ms offsets from "time"; sent is STAMP_ABSENT on a message
+without it. They are never delta coded, so read_stamps() reads them from
+any frame. Version 1 frames are version 2 frames without FLAG_STAMPS.
+
+pie/metrics/codec.py is a byte-identical copy deployed with metrics.py, so
+both publishers send the same layout; benchmarks/metrics_codec.py exits 1
+if the two differ.
+"""
+import struct
+from typing import List, Optional, Tuple
+
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+# (name, decimals, unit); bit i of a field mask is FIELDS[i]. Append only.
+FIELDS = (
+    ("temp_humidity", 1, "°C"),
+    ("temp_pressure", 1, "°C"),
+    ("humidity", 1, "%"),
+    ("pressure", 2, "mbar"),
+    ("pitch", 1, "°"),
+    ("roll", 1, "°"),
+    ("yaw", 1, "°"),
+    ("accel_x", 2, "g"),
+    ("accel_y", 2, "g"),
+    ("accel_z", 2, "g"),
+)
+WINDOW_BLOCKS = ("min", "max", "mean")
+
+FLAG_DELTA = 0x01
+FLAG_DELTA8 = 0x02
+FLAG_WINDOW = 0x04
+FLAG_STAMPS = 0x08
+
+# version, flags, sequence, fields present
+HEADER = struct.Struct("<BBHH")
+# seq, time, captured and sent
+STAMPS = struct.Struct("<Idii")
+STAMP_UNIT = 1e-4  # seconds per step of the captured and sent offsets
+STAMP_ABSENT = -2 ** 31
+# fields present in the window blocks
+WINDOW_HEADER = struct.Struct("<H")
+
+_SCALES = [10 ** decimals for _, decimals, _ in FIELDS]
+
+
+def schema() -> dict:
+    """JSON-serialisable description of the binary format."""
+    return {
+        "version": FORMAT_VERSION,
+        "byte_order": "little",
+        "header": ["version:u8", "flags:u8", "sequence:u16", "fields:u16"],
+        "stamps": ["seq:u32", "time:f64", "captured:i32", "sent:i32"],
+        "stamp_offsets": {"unit_seconds": STAMP_UNIT, "from": "time", "absent": STAMP_ABSENT},
+        "window_header": ["window_fields:u16"],
+        "flags": {"delta": FLAG_DELTA, "delta8": FLAG_DELTA8, "window": FLAG_WINDOW, "stamps": FLAG_STAMPS},
+        "fields": [
+            {"bit": bit, "name": name, "decimals": decimals, "unit": unit}
+            for bit, (name, decimals, unit) in enumerate(FIELDS)
+        ],
+        "blocks": ["last"] + [f"{block}:window" for block in WINDOW_BLOCKS] + ["count:window:u16"],
+        "values": {
+            "keyframe": "f32",
+            "delta": "i16 (i8 with delta8), change since the previous frame in units of 10^-decimals",
+        },
+    }
+
+
+def _mask(present) -> Tuple[int, List[int]]:
+    indexes = [i for i, (name, _, _) in enumerate(FIELDS) if name in present]
+    return sum(1 << i for i in indexes), indexes
+
+
+def _indexes(mask: int) -> List[int]:
+    return [i for i in range(len(FIELDS)) if mask >> i & 1]
+
+
+def _stamp_offset(stamp: Optional[float], time: float) -> int:
+    return STAMP_ABSENT if stamp is None else round((stamp - time) / STAMP_UNIT)
+
+
+def _stamp(time: float, offset: int) -> Optional[float]:
+    return None if offset == STAMP_ABSENT else round(time + offset * STAMP_UNIT, 4)
+
+
+def read_stamps(frame: bytes) -> Optional[dict]:
+    """The seq/time/captured(/sent) of a frame, None if it has no stamps.
+    
+    Needs no reference frame, so gaps and latencies can be counted from
+    frames whose values can't be decoded. Raises ValueError for an
+    unknown version.
+    """
+    version, flags, _, _ = HEADER.unpack_from(frame)
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported metrics format version {version}")
+    if not flags & FLAG_STAMPS:
+        return None
+    seq, time, captured, sent = STAMPS.unpack_from(frame, HEADER.size)
+    stamps = {"seq": seq, "time": time, "captured": _stamp(time, captured)}
+    if sent != STAMP_ABSENT:
+        stamps["sent"] = _stamp(time, sent)
+    return stamps
+
+
+def _as_float32(values: List[float]) -> Tuple[bytes, tuple]:
+    packed = struct.pack(f"<{len(values)}f", *values)
+    return packed, struct.unpack(f"<{len(values)}f", packed)
+
+
+def _quantize(values, scales) -> List[int]:
+    return [round(value * scale) for value, scale in zip(values, scales)]
+
+
+class MetricsEncoder:
+    """Encodes metrics dicts (flat fields, optional min/max/mean/count) to frames.
+    
+    Stamps a frame when the dict has "seq", "time" and "captured" ("sent"
+    optional). Sends a keyframe every keyframe_interval frames, whenever the fields
+    present change and whenever a delta would not fit in int16. Call reset()
+    after a frame was not delivered so the next one is a keyframe.
+    """
+    
+    def __init__(self, delta: bool = True, keyframe_interval: int = 30):
+        self.delta = delta
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self._reference: Optional[Tuple[int, int, int, List[int]]] = None
+        self._since_keyframe = 0
+    
+    def reset(self):
+        self._reference = None
+    
+    def encode(self, metrics: dict) -> bytes:
+        mask, indexes = _mask(metrics)
+        values = [metrics[FIELDS[i][0]] for i in indexes]
+        scales = [_SCALES[i] for i in indexes]
+        flags = 0
+        window_mask = 0
+        counts = []
+        if "count" in metrics:
+            flags |= FLAG_WINDOW
+            window_mask, window_indexes = _mask(metrics["count"])
+            for block in WINDOW_BLOCKS:
+                values += [metrics[block][FIELDS[i][0]] for i in window_indexes]
+            scales += [_SCALES[i] for i in window_indexes] * len(WINDOW_BLOCKS)
+            counts = [min(metrics["count"][FIELDS[i][0]], 0xFFFF) for i in window_indexes]
+        
+        packed, as_sent = _as_float32(values)
+        quanta = _quantize(as_sent, scales)
+        sequence = self.sequence
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        
+        body = packed
+        reference = self._reference
+        if (self.delta and reference is not None and self._since_keyframe + 1 < self.keyframe_interval
+                and reference[:3] == ((sequence - 1) & 0xFFFF, mask, window_mask)):
+            deltas = [q - p for q, p in zip(quanta, reference[3])]
+            low, high = min(deltas, default=0), max(deltas, default=0)
+            if -128 <= low and high <= 127:
+                flags |= FLAG_DELTA | FLAG_DELTA8
+                body = struct.pack(f"<{len(deltas)}b", *deltas)
+            elif -32768 <= low and high <= 32767:
+                flags |= FLAG_DELTA
+                body = struct.pack(f"<{len(deltas)}h", *deltas)
+        if flags & FLAG_DELTA:
+            self._since_keyframe += 1
+        else:
+            self._since_keyframe = 0
+        self._reference = (sequence, mask, window_mask, quanta)
+        
+        stamps = b""
+        if "seq" in metrics and "time" in metrics and "captured" in metrics:
+            flags |= FLAG_STAMPS
+            time = metrics["time"]
+            stamps = STAMPS.pack(metrics["seq"], time, _stamp_offset(metrics["captured"], time),
+                                 _stamp_offset(metrics.get("sent"), time))
+        
+        frame = HEADER.pack(FORMAT_VERSION, flags, sequence, mask) + stamps
+        if flags & FLAG_WINDOW:
+            frame += WINDOW_HEADER.pack(window_mask)
+        frame += body
+        if counts:
+            frame += struct.pack(f"<{len(counts)}H", *counts)
+        return frame
+
+
+class MetricsDecoder:
+    """Decodes frames back to the metrics dict that was encoded.
+    
+    Raises ValueError for an unknown version or a delta frame whose
+    reference frame was not decoded (wait for the next keyframe).
+    """
+    
+    def __init__(self):
+        self._reference: Optional[Tuple[int, int, int, List[int]]] = None
+    
+    def decode(self, frame: bytes) -> dict:
+        version, flags, sequence, mask = HEADER.unpack_from(frame)
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported metrics format version {version}")
+        offset = HEADER.size
+        metrics = {}
+        if flags & FLAG_STAMPS:
+            metrics.update(read_stamps(frame))
+            offset += STAMPS.size
+        window_mask = 0
+        if flags & FLAG_WINDOW:
+            window_mask, = WINDOW_HEADER.unpack_from(frame, offset)
+            offset += WINDOW_HEADER.size
+        indexes = _indexes(mask)
+        window_indexes = _indexes(window_mask)
+        scales = [_SCALES[i] for i in indexes] + [_SCALES[i] for i in window_indexes] * len(WINDOW_BLOCKS)
+        count = len(scales)
+        
+        if flags & FLAG_DELTA:
+            reference = self._reference
+            if reference is None or reference[:3] != ((sequence - 1) & 0xFFFF, mask, window_mask):
+                self._reference = None
+                raise ValueError(f"Delta frame {sequence} without its reference frame")
+            code = "b" if flags & FLAG_DELTA8 else "h"
+            deltas = struct.unpack_from(f"<{count}{code}", frame, offset)
+            offset += count * struct.calcsize(code)
+            quanta = [p + d for p, d in zip(reference[3], deltas)]
+        else:
+            quanta = _quantize(struct.unpack_from(f"<{count}f", frame, offset), scales)
+            offset += count * 4
+        self._reference = (sequence, mask, window_mask, quanta)
+        
+        values = [q / scale for q, scale in zip(quanta, scales)]
+        position = 0
+        for i in indexes:
+            metrics[FIELDS[i][0]] = round(values[position], FIELDS[i][1])
+            position += 1
+        if flags & FLAG_WINDOW:
+            for block in WINDOW_BLOCKS:
+                metrics[block] = {}
+                for i in window_indexes:
+                    metrics[block][FIELDS[i][0]] = round(values[position], FIELDS[i][1])
+                    position += 1
+            counts = struct.unpack_from(f"<{len(window_indexes)}H", frame, offset)
+            metrics["count"] = {FIELDS[i][0]: c for i, c in zip(window_indexes, counts)}
+        return metrics
@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 """
 Sense HAT Metrics Publisher
-Publishes sensor data from Raspberry Pi Sense HAT to MQTT broker via WebSocket.
+Publishes sensor data from Raspberry Pi Sense HAT to MQTT broker (raw TCP by default, or WebSocket).
 """
 import json
+import os
 import time
 import signal
 import sys
 import logging
+import threading
 from sense_hat import SenseHat
 import paho.mqtt.client as mqtt
 
+# Deployed alongside; a copy of pi-guard's modules/metrics/codec.py
+from codec import MetricsEncoder, schema
+
 # Configure logging for systemd
 logging.basicConfig(
     level=logging.INFO,
@@ -20,11 +25,31 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # MQTT Configuration
-MQTT_BROKER = "pi-guardian.kcolville.com"
-MQTT_PORT = 9001  # WebSocket port
+MQTT_BROKER = os.getenv("MQTT_BROKER", "pi-guardian.kcolville.com")
+MQTT_TRANSPORT = os.getenv("MQTT_TRANSPORT", "tcp")  # "tcp" or "websockets"
+MQTT_TLS = os.getenv("MQTT_TLS", "false").lower() == "true"
+MQTT_TLS_CA_CERTS = os.getenv("MQTT_TLS_CA_CERTS")  # None for the system's CA store
+# 1883 TCP, 9001 WebSocket, 8883 TLS, 8083 secure WebSocket; the table of pie/pi-guard/config.py
+MQTT_DEFAULT_PORT = {"tcp": 8883 if MQTT_TLS else 1883, "websockets": 8083 if MQTT_TLS else 9001}
+MQTT_PORT = int(os.getenv("MQTT_PORT", str(MQTT_DEFAULT_PORT.get(MQTT_TRANSPORT, 1883))))
+MQTT_KEEPALIVE = int(os.getenv("MQTT_KEEPALIVE", "60"))
+MQTT_QOS = int(os.getenv("MQTT_QOS", "0"))
+MQTT_CLEAN_SESSION = os.getenv("MQTT_CLEAN_SESSION", "true").lower() == "true"
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "")  # required when MQTT_CLEAN_SESSION is false
 MQTT_TOPIC = "sensors/metrics"
+MQTT_BINARY_TOPIC = f"{MQTT_TOPIC}/bin"
+MQTT_SCHEMA_TOPIC = f"{MQTT_TOPIC}/schema"  # retained layout of the binary frames
 PUBLISH_INTERVAL = 2  # seconds
 
+# Payload formats, each on its own topic: "json", "binary" or "json,binary"
+PAYLOAD_FORMATS = {name.strip() for name in os.getenv("METRICS_FORMATS", "json").split(",") if name.strip()}
+encoder = MetricsEncoder(
+    delta=os.getenv("METRICS_DELTA", "true").lower() == "true",
+    keyframe_interval=int(os.getenv("METRICS_KEYFRAME_INTERVAL", "30")),
+)
+# Set on paho's network thread after a reconnect; the publish loop, which owns the encoder, resets it
+encoder_reset = threading.Event()
+
 # Global variables
 sense = None
 mqtt_client = None
@@ -42,6 +67,9 @@ def on_connect(client, userdata, flags, rc):
     """Callback when MQTT client connects."""
     if rc == 0:
         logger.info(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
+        if "binary" in PAYLOAD_FORMATS:
+            client.publish(MQTT_SCHEMA_TOPIC, json.dumps(schema()), qos=1, retain=True)
+            encoder_reset.set()  # Frames sent before a drop may be lost, start from a keyframe
     else:
         logger.error(f"Failed to connect to MQTT broker, return code: {rc}")
 
@@ -86,12 +114,20 @@ def publish_metrics():
         try:
             metrics = get_sensor_metrics()
             if metrics and mqtt_client and mqtt_client.is_connected():
-                payload = json.dumps(metrics)
-                result = mqtt_client.publish(MQTT_TOPIC, payload)
-                if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                    logger.debug(f"Published metrics: {metrics}")
-                else:
-                    logger.warning(f"Failed to publish metrics, return code: {result.rc}")
+                if "json" in PAYLOAD_FORMATS:
+                    result = mqtt_client.publish(MQTT_TOPIC, json.dumps(metrics), qos=MQTT_QOS)
+                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                        logger.debug(f"Published metrics: {metrics}")
+                    else:
+                        logger.warning(f"Failed to publish metrics, return code: {result.rc}")
+                if "binary" in PAYLOAD_FORMATS:
+                    if encoder_reset.is_set():
+                        encoder_reset.clear()
+                        encoder.reset()
+                    result = mqtt_client.publish(MQTT_BINARY_TOPIC, encoder.encode(metrics), qos=MQTT_QOS)
+                    if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                        logger.warning(f"Failed to publish binary metrics, return code: {result.rc}")
+                        encoder.reset()  # The next frame can't be a delta against this one
             elif not mqtt_client or not mqtt_client.is_connected():
                 logger.warning("MQTT client not connected, skipping publish")
         except Exception as e:
@@ -118,14 +154,16 @@ def main():
         logger.error(f"Failed to initialize Sense HAT: {e}")
         sys.exit(1)
     
-    # Initialize MQTT client with WebSocket transport
+    # Initialize MQTT client
     try:
-        mqtt_client = mqtt.Client(transport="websockets")
+        mqtt_client = mqtt.Client(client_id=MQTT_CLIENT_ID, clean_session=MQTT_CLEAN_SESSION, transport=MQTT_TRANSPORT)
         mqtt_client.on_connect = on_connect
         mqtt_client.on_disconnect = on_disconnect
+        if MQTT_TLS:
+            mqtt_client.tls_set(ca_certs=MQTT_TLS_CA_CERTS)
         
-        logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        logger.info(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT} over {MQTT_TRANSPORT}...")
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
         mqtt_client.loop_start()
         
         # Wait a moment for connection to establish
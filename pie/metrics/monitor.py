@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Metrics Pipeline Monitor
+Subscribes to the JSON metrics topic and its binary /bin and reports, from
+the "seq", "captured", "time" and "sent" stamps pi-guard's MetricsService
+puts on every window (fields in JSON, the stamp block of a binary frame),
+separately for each format received:
+
+  gaps      sequence numbers that never arrived live, less those that came
+            in on the replay topic afterwards, as a share of all expected
+  latency   histograms and percentiles of each leg of a reading's way here:
+              window   the newest reading until its window closed
+              publish  the window closing until it was handed to MQTT
+                       (summary, deadband and spool)
+              transit  serialisation, the MQTT client's queue, the network
+                       and the broker, to this subscriber
+              total    the newest reading to this subscriber
+
+The sensor reads themselves are timed on the Pi (pi_guard_sensor_read_seconds
+on /metrics). Transit and total compare the Pi's clock with this machine's:
+keep both on NTP, or pass --clock-offset-ms (this clock minus the Pi's).
+Messages without the stamps (other publishers) only count towards gaps when
+they carry "seq".
+
+Usage: python3 monitor.py [--broker HOST] [--port 1883] [--seconds 0] [--interval 10]
+"""
+import argparse
+import bisect
+import json
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from codec import read_stamps  # Deployed alongside, as for the publisher
+
+# MQTT Configuration, as for the publisher
+MQTT_BROKER = os.getenv("MQTT_BROKER", "pi-guardian.kcolville.com")
+MQTT_TRANSPORT = os.getenv("MQTT_TRANSPORT", "tcp")  # "tcp" or "websockets"
+MQTT_TLS = os.getenv("MQTT_TLS", "false").lower() == "true"
+MQTT_TLS_CA_CERTS = os.getenv("MQTT_TLS_CA_CERTS")  # None for the system's CA store
+# 1883 TCP, 9001 WebSocket, 8883 TLS, 8083 secure WebSocket; the table of pie/pi-guard/config.py
+MQTT_DEFAULT_PORT = {"tcp": 8883 if MQTT_TLS else 1883, "websockets": 8083 if MQTT_TLS else 9001}
+MQTT_PORT = int(os.getenv("MQTT_PORT", str(MQTT_DEFAULT_PORT.get(MQTT_TRANSPORT, 1883))))
+MQTT_KEEPALIVE = int(os.getenv("MQTT_KEEPALIVE", "60"))
+MQTT_TOPIC = "sensors/metrics"
+
+# (name, from field, to field); None is the time the message arrived here
+STAGES = (
+    ("window", "captured", "time"),
+    ("publish", "time", "sent"),
+    ("transit", "sent", None),
+    ("total", "captured", None),
+)
+# Histogram upper bounds, ms; below the first are negative (clock skew), above the last overflow
+BOUNDS_MS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+MAX_MISSING = 100000  # missing seqs remembered for the replay to fill
+
+
+class StageHistogram:
+    """Fixed-bucket histogram of one stage, plus the samples since the last report for percentiles."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS_MS) + 1)
+        self.total = 0
+        self.recent = []
+
+    def observe(self, ms):
+        self.counts[0 if ms < 0 else bisect.bisect_left(BOUNDS_MS, ms, 1)] += 1
+        self.total += 1
+        self.recent.append(ms)
+
+    def take_recent(self):
+        recent, self.recent = sorted(self.recent), []
+        return recent
+
+
+class PipelineStats:
+    """Gap and latency accounting for the messages of one publisher."""
+
+    def __init__(self, clock_offset=0.0):
+        self.clock_offset = clock_offset  # seconds, this clock minus the publisher's
+        self.stages = {name: StageHistogram() for name, _, _ in STAGES}
+        self.last_seq = None
+        self.received = 0
+        self.duplicates = 0
+        self.restarts = 0
+        self.recovered = 0
+        self.missing = set()
+        self.missed = 0  # missing seqs too many to remember
+        self.lock = threading.Lock()
+
+    def on_live(self, message, arrived):
+        with self.lock:
+            seq = message.get("seq")
+            if isinstance(seq, int):
+                self._count(seq)
+            arrived -= self.clock_offset
+            for name, start, end in STAGES:
+                begin, finish = message.get(start), message.get(end) if end else arrived
+                if isinstance(begin, (int, float)) and isinstance(finish, (int, float)):
+                    self.stages[name].observe((finish - begin) * 1000)
+
+    def on_replay(self, message):
+        with self.lock:
+            if message.get("seq") in self.missing:
+                self.missing.discard(message["seq"])
+                self.recovered += 1
+
+    def _count(self, seq):
+        last = self.last_seq
+        if last is None or seq == last + 1:
+            self.received += 1
+        elif seq > last + 1:
+            self.received += 1
+            gap = seq - last - 1
+            if len(self.missing) + gap <= MAX_MISSING:
+                self.missing.update(range(last + 1, seq))
+            else:
+                self.missed += gap
+        elif seq in self.missing:
+            self.missing.discard(seq)  # Late rather than lost
+            self.received += 1
+            return
+        elif seq == 1:
+            self.restarts += 1  # Publisher restarted without a spool, numbering starts again
+            self.received += 1
+        else:
+            self.duplicates += 1
+            return
+        self.last_seq = seq
+
+    def gaps(self):
+        lost = len(self.missing) + self.missed
+        expected = self.received + lost + self.recovered
+        return lost, expected, lost / expected * 100 if expected else 0.0
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def format_report(stats, elapsed, source="json"):
+    """One summary line of gaps and the per-stage percentiles since the last report."""
+    with stats.lock:
+        lost, expected, rate = stats.gaps()
+        parts = [f"{elapsed:6.0f}s  {source:<6} {stats.received} windows, {lost} missing of {expected} ({rate:.2f}%), "
+                 f"{stats.recovered} replayed, {stats.duplicates} duplicate"
+                 + (f", {stats.restarts} restarts" if stats.restarts else "")]
+        for name, histogram in stats.stages.items():
+            recent = histogram.take_recent()
+            if recent:
+                parts.append(f"{name} p50 {percentile(recent, 50):.1f} p99 {percentile(recent, 99):.1f} ms")
+    return "; ".join(parts)
+
+
+def format_histograms(stats, width=40, source="json"):
+    """Text histograms of every stage since the start."""
+    lines = []
+    labels = ["< 0"] + [f"<= {bound:g}" for bound in BOUNDS_MS[1:]] + [f"> {BOUNDS_MS[-1]:g}"]
+    for name, histogram in stats.stages.items():
+        if not histogram.total:
+            continue
+        lines.append(f"{source} {name} (ms, {histogram.total} windows):")
+        peak = max(histogram.counts)
+        for label, count in zip(labels, histogram.counts):
+            if count:
+                bar = "#" * max(1, round(count / peak * width))
+                lines.append(f"  {label:>9} {count:8d} {count / histogram.total * 100:6.2f}%  {bar}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--topic", default=MQTT_TOPIC, help="JSON metrics topic; binary frames are on its /bin, "
+                        "replays on its /replay")
+    parser.add_argument("--seconds", type=float, default=0, help="stop after this long, 0 for Ctrl-C")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between summary lines")
+    parser.add_argument("--clock-offset-ms", type=float, default=0, help="this clock minus the publisher's")
+    args = parser.parse_args()
+
+    # The same windows can come in both formats, so each is counted on its own
+    stats = {label: PipelineStats(args.clock_offset_ms / 1000) for label in ("json", "binary")}
+    binary_topic = f"{args.topic}/bin"
+    replay_topic = f"{args.topic}/replay"
+
+    def receiving():
+        return [(label, format_stats) for label, format_stats in stats.items() if format_stats.received] \
+            or [("json", stats["json"])]
+
+    def on_connect(client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"Failed to connect to MQTT broker: {reason_code}", file=sys.stderr)
+            return
+        client.subscribe([(args.topic, 1), (binary_topic, 1), (replay_topic, 1)])
+
+    def on_message(client, userdata, message):
+        arrived = time.time()
+        if message.topic == binary_topic:
+            try:
+                stamps = read_stamps(message.payload)
+            except (ValueError, struct.error):
+                return
+            if stamps is not None:  # Other publishers' frames have no stamps
+                stats["binary"].on_live(stamps, arrived)
+            return
+        try:
+            payload = json.loads(message.payload)
+        except ValueError:
+            return
+        if not isinstance(payload, dict):
+            return
+        if message.topic == replay_topic:
+            for format_stats in stats.values():
+                format_stats.on_replay(payload)
+        else:
+            stats["json"].on_live(payload, arrived)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, transport=MQTT_TRANSPORT)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    if MQTT_TLS:
+        client.tls_set(ca_certs=MQTT_TLS_CA_CERTS)
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda sig, frame: stopping.set())
+    signal.signal(signal.SIGTERM, lambda sig, frame: stopping.set())
+
+    client.connect(args.broker, args.port, MQTT_KEEPALIVE)
+    client.loop_start()
+    started = time.monotonic()
+    try:
+        while not stopping.is_set():
+            remaining = args.seconds - (time.monotonic() - started) if args.seconds else args.interval
+            if remaining <= 0:
+                break
+            stopping.wait(min(args.interval, remaining))
+            for label, format_stats in receiving():
+                print(format_report(format_stats, time.monotonic() - started, label), flush=True)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+    print("\n".join(format_histograms(format_stats, source=label) for label, format_stats in receiving()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
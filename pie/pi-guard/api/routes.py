@@ -1,8 +1,14 @@
 """API routes for Pi Guardian service."""
+from typing import Optional
+
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 from config import settings
+from core.telemetry import CONTENT_TYPE, registry
+from modules.events.service import TYPES, find_socket
+from modules.mjpeg.service import BOUNDARY
+from modules.snapshot.service import SIZES
 
 router = APIRouter()
 
@@ -11,8 +17,15 @@ router = APIRouter()
 async def health_check(request: Request):
     """Health check endpoint."""
     camera_service = getattr(request.app.state, 'camera_service', None)
+    mqtt_service = getattr(request.app.state, 'mqtt_service', None)
     metrics_service = getattr(request.app.state, 'metrics_service', None)
     streaming_service = getattr(request.app.state, 'streaming_service', None)
+    motion_service = getattr(request.app.state, 'motion_service', None)
+    snapshot_service = getattr(request.app.state, 'snapshot_service', None)
+    mjpeg_service = getattr(request.app.state, 'mjpeg_service', None)
+    events_service = getattr(request.app.state, 'events_service', None)
+    governor_service = getattr(request.app.state, 'governor_service', None)
+    lifecycle = getattr(request.app.state, 'lifecycle', None)
     
     status = {
         "status": "ok",
@@ -20,14 +33,27 @@ async def health_check(request: Request):
         "version": settings.APP_VERSION,
     }
     
+    # Which services are up, and how long each took to start
+    if lifecycle:
+        status["lifecycle"] = lifecycle.get_status()
+        if status["lifecycle"]["degraded"]:
+            status["status"] = "degraded"
+    
     # Add service statuses
     if camera_service:
         try:
             camera_running = camera_service.is_running()
-            status["camera"] = {"status": "active" if camera_running else "inactive"}
+            status["camera"] = await camera_service.get_status()
+            status["camera"]["status"] = "active" if camera_running else "inactive"
         except Exception as e:
             status["camera"] = {"status": "error", "error": str(e)}
     
+    if mqtt_service:
+        try:
+            status["mqtt"] = await mqtt_service.get_status()
+        except Exception as e:
+            status["mqtt"] = {"status": "error", "error": str(e)}
+    
     if metrics_service:
         try:
             status["metrics"] = await metrics_service.get_status()
@@ -40,9 +66,213 @@ async def health_check(request: Request):
         except Exception as e:
             status["streaming"] = {"status": "error", "error": str(e)}
     
+    if motion_service:
+        try:
+            status["motion"] = await motion_service.get_status()
+        except Exception as e:
+            status["motion"] = {"status": "error", "error": str(e)}
+    
+    if snapshot_service:
+        try:
+            status["snapshot"] = await snapshot_service.get_status()
+        except Exception as e:
+            status["snapshot"] = {"status": "error", "error": str(e)}
+    
+    if mjpeg_service:
+        try:
+            status["mjpeg"] = await mjpeg_service.get_status()
+        except Exception as e:
+            status["mjpeg"] = {"status": "error", "error": str(e)}
+    
+    if events_service:
+        try:
+            status["events"] = await events_service.get_status()
+        except Exception as e:
+            status["events"] = {"status": "error", "error": str(e)}
+    
+    # Load shedding; a raised level leaves the overall status "ok"
+    if governor_service:
+        try:
+            status["governor"] = await governor_service.get_status()
+        except Exception as e:
+            status["governor"] = {"status": "error", "error": str(e)}
+    
     return JSONResponse(content=status)
 
 
+@router.post("/stream/clips")
+async def trigger_clip(request: Request, reason: str = "api"):
+    """Record a clip of the seconds before and after now."""
+    streaming_service = getattr(request.app.state, 'streaming_service', None)
+    if not streaming_service:
+        return JSONResponse(status_code=503, content={"error": "streaming service unavailable"})
+    
+    try:
+        clip = await streaming_service.trigger_clip(reason)
+    except (OSError, RuntimeError) as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    
+    return JSONResponse(status_code=202, content=clip)
+
+
+@router.get("/snapshot")
+async def get_snapshot(request: Request, size: str = "full"):
+    """Latest camera frame as JPEG: size is full, medium or thumbnail."""
+    snapshot_service = getattr(request.app.state, 'snapshot_service', None)
+    if not snapshot_service:
+        return JSONResponse(status_code=503, content={"error": "snapshot service unavailable"})
+    
+    # Cache-Control no-cache: clients may keep the image but must revalidate
+    etag = snapshot_service.check_not_modified(size, request.headers.get("if-none-match"))
+    if etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    try:
+        snapshot = await snapshot_service.get_snapshot(size)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if snapshot is None:
+        return JSONResponse(status_code=503, content={"error": "no camera frame yet"})
+    
+    return Response(
+        content=snapshot.jpeg,
+        media_type="image/jpeg",
+        headers={
+            "ETag": snapshot.etag,
+            "Cache-Control": "no-cache",
+            "X-Frame-Timestamp": f"{snapshot.timestamp:.3f}",
+        },
+    )
+
+
+@router.get("/stream/mjpeg")
+async def mjpeg_stream(request: Request, size: str = "medium"):
+    """Live multipart MJPEG stream for LAN clients without WebRTC."""
+    mjpeg_service = getattr(request.app.state, 'mjpeg_service', None)
+    if not mjpeg_service:
+        return JSONResponse(status_code=503, content={"error": "MJPEG service unavailable"})
+    if size not in SIZES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown size {size!r}, expected one of {', '.join(SIZES)}"})
+    if not mjpeg_service.can_accept():
+        return JSONResponse(status_code=503, content={"error": "too many viewers"})
+    
+    return StreamingResponse(
+        mjpeg_service.stream(size),
+        media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/events")
+async def event_stream(request: Request, types: Optional[str] = None):
+    """Live Server-Sent Events: metrics windows, motion events and status changes.
+    
+    types is a comma-separated subset of metrics, motion and status, default all.
+    """
+    events_service = getattr(request.app.state, 'events_service', None)
+    if not events_service or not events_service.is_running():
+        return JSONResponse(status_code=503, content={"error": "events service unavailable"})
+    
+    kinds = [kind.strip() for kind in types.split(",") if kind.strip()] if types else list(TYPES)
+    unknown = [kind for kind in kinds if kind not in TYPES]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown type {unknown[0]!r}, expected one of {', '.join(TYPES)}"})
+    if not events_service.can_accept():
+        return JSONResponse(status_code=503, content={"error": "too many clients"})
+    
+    connection = find_socket(request.scope.get("client"), request.scope.get("server"))
+    return StreamingResponse(
+        events_service.stream(kinds, connection),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: a reverse proxy must pass each event on as it comes
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/metrics/history")
+async def metrics_history(request: Request, start: Optional[float] = None, end: Optional[float] = None,
+                          points: int = 500, method: str = "minmax", fields: Optional[str] = None):
+    """Sensor history between two Unix timestamps, downsampled to about points per field.
+    
+    method is minmax (per-bucket min/max/mean on a shared time axis) or
+    lttb (a shape-preserving subset of window means per field); fields is a
+    comma-separated list, default all.
+    """
+    metrics_service = getattr(request.app.state, 'metrics_service', None)
+    if not metrics_service:
+        return JSONResponse(status_code=503, content={"error": "metrics service unavailable"})
+    
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+    try:
+        history = await metrics_service.get_history(start, end, points, method, names)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except RuntimeError as e:
+        return JSONResponse(status_code=503, content={"error": str(e)})
+    
+    # Straight to JSON: the response is plain lists, FastAPI's encoder would walk every number
+    return JSONResponse(content=history)
+
+
+@router.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """Counters, gauges and histograms in the Prometheus text format."""
+    streaming_service = getattr(request.app.state, 'streaming_service', None)
+    if streaming_service:
+        try:
+            await streaming_service.update_metrics()  # The supervisor is a separate process, ask it now
+        except Exception:
+            pass  # Its gauges keep their last values
+    
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@router.get("/recordings")
+async def find_recordings(request: Request, start: float, end: float):
+    """Find recorded footage between two Unix timestamps.
+    
+    Each segment lists the HTTP byte ranges to fetch from its URL: the init
+    section, then the fragments from the keyframe at or before start.
+    """
+    recordings_service = getattr(request.app.state, 'recordings_service', None)
+    if not recordings_service:
+        return JSONResponse(status_code=503, content={"error": "recordings service unavailable"})
+    
+    try:
+        segments = await recordings_service.find(int(start * 1000), int(end * 1000))
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    
+    return {
+        "segments": [
+            {
+                "url": f"/recordings/segments/{segment['name']}",
+                "start": segment["start_ms"] / 1000,
+                "end": segment["end_ms"] / 1000,
+                "size": segment["size"],
+                "init_range": f"bytes=0-{segment['init_size'] - 1}",
+                "media_range": f"bytes={segment['offset']}-{segment['end_offset'] - 1}",
+            }
+            for segment in segments
+        ]
+    }
+
+
+@router.get("/recordings/segments/{day}/{name}")
+async def get_recording_segment(request: Request, day: str, name: str):
+    """Serve a recorded segment, honouring Range requests."""
+    recordings_service = getattr(request.app.state, 'recordings_service', None)
+    if not recordings_service:
+        return JSONResponse(status_code=503, content={"error": "recordings service unavailable"})
+    
+    path = recordings_service.segment_path(f"{day}/{name}")
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "segment not found"})
+    
+    # FileResponse answers Range requests with 206 partial content
+    return FileResponse(path, media_type="video/mp4")
+
+
 @router.get("/")
 async def root():
     """Root endpoint."""
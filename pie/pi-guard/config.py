@@ -2,6 +2,16 @@
 import os
 from typing import Optional
 
+# Broker ports by (MQTT_TRANSPORT, MQTT_TLS), the listeners server/mqtt/mosquitto.conf opens. The standalone
+# scripts, deployed without pi-guard's config, repeat this table as MQTT_DEFAULT_PORT: pie/metrics/metrics.py,
+# pie/metrics/monitor.py and pie/stream/stream.py; change them together
+MQTT_DEFAULT_PORTS = {
+    ("tcp", False): 1883,
+    ("websockets", False): 9001,
+    ("tcp", True): 8883,
+    ("websockets", True): 8083,
+}
+
 
 class Settings:
     """Application configuration settings."""
@@ -17,25 +27,120 @@ class Settings:
         self.HOST: str = os.getenv("HOST", "0.0.0.0")
         self.PORT: int = int(os.getenv("PORT", "8000"))
         
+        # Service lifecycle: per-service limits on start and stop before giving up on it
+        self.LIFECYCLE_START_TIMEOUT: float = float(os.getenv("LIFECYCLE_START_TIMEOUT", "10"))
+        self.LIFECYCLE_STOP_TIMEOUT: float = float(os.getenv("LIFECYCLE_STOP_TIMEOUT", "5"))
+        
         # MQTT Configuration
         self.MQTT_BROKER: str = os.getenv("MQTT_BROKER", "pi-guardian.kcolville.com")
-        self.MQTT_PORT: int = int(os.getenv("MQTT_PORT", "9001"))  # WebSocket port (default)
+        self.MQTT_TRANSPORT: str = os.getenv("MQTT_TRANSPORT", "tcp")  # "tcp" or "websockets" (what browsers need)
+        self.MQTT_TLS: bool = os.getenv("MQTT_TLS", "false").lower() == "true"
+        self.MQTT_TLS_CA_CERTS: Optional[str] = os.getenv("MQTT_TLS_CA_CERTS")  # CA bundle, None for the system's
+        self.MQTT_PORT: int = int(os.getenv(
+            "MQTT_PORT", str(MQTT_DEFAULT_PORTS.get((self.MQTT_TRANSPORT, self.MQTT_TLS), 1883))
+        ))
+        self.MQTT_WS_PATH: str = os.getenv("MQTT_WS_PATH", "/mqtt")  # WebSocket request path
+        self.MQTT_KEEPALIVE: int = int(os.getenv("MQTT_KEEPALIVE", "60"))  # seconds between pings on an idle connection
+        # Metrics windows and motion events; at 0 a window leaves the spool once written to the socket
+        self.MQTT_QOS: int = int(os.getenv("MQTT_QOS", "1"))
+        # false keeps the broker session (subscriptions, unacknowledged QoS 1) across reconnects; needs a stable client id
+        self.MQTT_CLEAN_SESSION: bool = os.getenv("MQTT_CLEAN_SESSION", "true").lower() == "true"
         self.MQTT_TOPIC_PREFIX: str = os.getenv("MQTT_TOPIC_PREFIX", "sensors")
         self.MQTT_METRICS_TOPIC: str = f"{self.MQTT_TOPIC_PREFIX}/metrics"
-        self.MQTT_CLIENT_ID: Optional[str] = os.getenv("MQTT_CLIENT_ID")
+        self.MQTT_METRICS_BINARY_TOPIC: str = f"{self.MQTT_METRICS_TOPIC}/bin"
+        self.MQTT_METRICS_REPLAY_TOPIC: str = f"{self.MQTT_METRICS_TOPIC}/replay"  # spooled windows after an outage
+        self.MQTT_METRICS_SCHEMA_TOPIC: str = f"{self.MQTT_METRICS_TOPIC}/schema"  # retained binary layout
+        self.MQTT_MOTION_TOPIC: str = f"{self.MQTT_TOPIC_PREFIX}/camera/motion"
+        self.MQTT_CLIENT_ID: Optional[str] = os.getenv("MQTT_CLIENT_ID")  # default: random, or pi-guard-<hostname>
+        self.MQTT_MAX_INFLIGHT: int = int(os.getenv("MQTT_MAX_INFLIGHT", "20"))  # QoS 1 publishes awaiting PUBACK
+        self.MQTT_CONNECT_TIMEOUT: float = float(os.getenv("MQTT_CONNECT_TIMEOUT", "10"))  # seconds to CONNACK
+        self.MQTT_RECONNECT_MIN: float = float(os.getenv("MQTT_RECONNECT_MIN", "0.5"))  # backoff after a failed connect
+        self.MQTT_RECONNECT_MAX: float = float(os.getenv("MQTT_RECONNECT_MAX", "60"))
         
         # Streaming Configuration
         self.RTSP_URL: str = os.getenv("RTSP_URL", "rtsp://pi-guardian.kcolville.com:8554/cam")
         self.STREAM_RESOLUTION: str = os.getenv("STREAM_RESOLUTION", "1280:720")
         self.STREAM_FRAMERATE: int = int(os.getenv("STREAM_FRAMERATE", "30"))
         self.STREAM_BITRATE: int = int(os.getenv("STREAM_BITRATE", "1000000"))
+        self.STREAM_CONTROL_URL: str = os.getenv("STREAM_CONTROL_URL", "http://127.0.0.1:8555")  # stream.py control API
+        self.STREAM_CONTROL_TIMEOUT: float = float(os.getenv("STREAM_CONTROL_TIMEOUT", "2.0"))
+        self.RECORDINGS_DIR: str = os.getenv("RECORDINGS_DIR", "recordings")  # STREAM_RECORDING_DIR of stream.py
         
         # Metrics Configuration
-        self.METRICS_PUBLISH_INTERVAL: float = float(os.getenv("METRICS_PUBLISH_INTERVAL", "2.0"))
+        self.METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Sense HAT sampling
+        self.METRICS_SOURCE: str = os.getenv("METRICS_SOURCE", "sense_hat")  # "sense_hat", "synthetic" or "replay"
+        self.METRICS_SOURCE_TRACE: str = os.getenv("METRICS_SOURCE_TRACE", "")  # replay: .csv or binary sensor trace
+        self.METRICS_SOURCE_SPEED: float = float(os.getenv("METRICS_SOURCE_SPEED", "1.0"))  # replay: 0 for next reading per read
+        self.METRICS_SOURCE_LATENCY: float = float(os.getenv("METRICS_SOURCE_LATENCY", "0.001"))  # synthetic: seconds per read
+        self.METRICS_PUBLISH_INTERVAL: float = float(os.getenv("METRICS_PUBLISH_INTERVAL", "2.0"))  # seconds per published window
+        # Sense HAT reads per second per channel, "channel=hz,..." (0 disables a channel)
+        self.METRICS_SAMPLE_RATES: str = os.getenv(
+            "METRICS_SAMPLE_RATES",
+            "temp_humidity=1,temp_pressure=1,humidity=1,pressure=1,orientation=10,accel=10"
+        )
+        # Report by exception, "channel=threshold,..." in the channel's units: a channel is published once it
+        # moves this far from the value last sent (channels left out, or an empty setting, every window)
+        self.METRICS_DEADBAND: str = os.getenv(
+            "METRICS_DEADBAND",
+            "temp_humidity=0.3,temp_pressure=0.3,humidity=1,pressure=0.2,orientation=2,accel=0.05"
+        )
+        # ...or once its window mean changes faster than this, in units per second
+        self.METRICS_RATE_OF_CHANGE: str = os.getenv(
+            "METRICS_RATE_OF_CHANGE",
+            "temp_humidity=0.1,temp_pressure=0.1,humidity=0.5,pressure=0.05"
+        )
+        self.METRICS_HEARTBEAT_INTERVAL: float = float(os.getenv("METRICS_HEARTBEAT_INTERVAL", "60"))  # full-state message
+        self.METRICS_FORMATS: str = os.getenv("METRICS_FORMATS", "json")  # "json", "binary" or "json,binary"
+        self.METRICS_DELTA: bool = os.getenv("METRICS_DELTA", "true").lower() == "true"  # delta frames in binary
+        self.METRICS_KEYFRAME_INTERVAL: int = int(os.getenv("METRICS_KEYFRAME_INTERVAL", "30"))  # binary frames
+        self.METRICS_SPOOL_PATH: str = os.getenv("METRICS_SPOOL_PATH", "spool/metrics.db")  # empty disables spooling
+        self.METRICS_SPOOL_MAX_MB: float = float(os.getenv("METRICS_SPOOL_MAX_MB", "64"))
+        self.METRICS_REPLAY_RATE: float = float(os.getenv("METRICS_REPLAY_RATE", "50"))  # messages/s after an outage
+        self.METRICS_REPLAY_INFLIGHT: int = int(os.getenv("METRICS_REPLAY_INFLIGHT", "100"))  # unacknowledged at once
+        self.METRICS_HISTORY_HOURS: float = float(os.getenv("METRICS_HISTORY_HOURS", "72"))  # kept in memory for /metrics/history
+        self.METRICS_HISTORY_MAX_MB: float = float(os.getenv("METRICS_HISTORY_MAX_MB", "32"))  # caps the hours kept
         
         # Camera Configuration (Picamera2)
         self.CAMERA_ENABLED: bool = os.getenv("CAMERA_ENABLED", "true").lower() == "true"
         self.CAMERA_IMU_CONFIG: bool = os.getenv("CAMERA_IMU_CONFIG", "true").lower() == "true"
+        self.CAMERA_FRAME_RATE: int = int(os.getenv("CAMERA_FRAME_RATE", "10"))  # decoded frames/s for analysis
+        self.SNAPSHOT_QUALITY: int = int(os.getenv("SNAPSHOT_QUALITY", "85"))  # JPEG quality for /snapshot
+        self.MJPEG_MAX_VIEWERS: int = int(os.getenv("MJPEG_MAX_VIEWERS", "50"))
+        
+        # Server-Sent Events Configuration (GET /events)
+        self.EVENTS_MAX_CLIENTS: int = int(os.getenv("EVENTS_MAX_CLIENTS", "200"))
+        self.EVENTS_STATUS_INTERVAL: float = float(os.getenv("EVENTS_STATUS_INTERVAL", "1.0"))  # seconds between status checks
+        self.EVENTS_KEEPALIVE: float = float(os.getenv("EVENTS_KEEPALIVE", "15"))  # seconds of silence before a comment
+        self.EVENTS_SEND_AHEAD: int = int(os.getenv("EVENTS_SEND_AHEAD", "1024"))  # bytes queued unsent before a client's events coalesce
+        self.EVENTS_RETRY: float = float(os.getenv("EVENTS_RETRY", "3"))  # client reconnect delay, seconds
+        
+        # Motion Detection Configuration
+        self.MOTION_ENABLED: bool = os.getenv("MOTION_ENABLED", "true").lower() == "true"
+        self.MOTION_DECIMATION: int = int(os.getenv("MOTION_DECIMATION", "4"))  # 1280x720 -> 320x180
+        self.MOTION_THRESHOLD: float = float(os.getenv("MOTION_THRESHOLD", "25"))  # luma difference (0-255)
+        self.MOTION_BACKGROUND_ALPHA: float = float(os.getenv("MOTION_BACKGROUND_ALPHA", "0.05"))
+        self.MOTION_MIN_AREA: float = float(os.getenv("MOTION_MIN_AREA", "0.005"))  # fraction of the frame
+        self.MOTION_REGIONS: str = os.getenv("MOTION_REGIONS", "")  # "x0,y0,x1,y1;..." in 0..1, empty = whole frame
+        self.MOTION_EXCLUDE: str = os.getenv("MOTION_EXCLUDE", "")  # regions to ignore, same format
+        self.MOTION_START_FRAMES: int = int(os.getenv("MOTION_START_FRAMES", "2"))
+        self.MOTION_STOP_DELAY: float = float(os.getenv("MOTION_STOP_DELAY", "3.0"))  # seconds without motion
+        
+        # Resource governor: sheds motion analysis, then sensor sampling, then video quality under load
+        self.GOVERNOR_ENABLED: bool = os.getenv("GOVERNOR_ENABLED", "true").lower() == "true"
+        self.GOVERNOR_SYSFS_ROOT: str = os.getenv("GOVERNOR_SYSFS_ROOT", "/")  # where sys/ and proc/ are read from
+        self.GOVERNOR_INTERVAL: float = float(os.getenv("GOVERNOR_INTERVAL", "5"))  # seconds between checks
+        self.GOVERNOR_TEMP_HIGH: float = float(os.getenv("GOVERNOR_TEMP_HIGH", "75"))  # SoC °C; the firmware throttles at 80
+        self.GOVERNOR_TEMP_LOW: float = float(os.getenv("GOVERNOR_TEMP_LOW", "68"))
+        self.GOVERNOR_CPU_HIGH: float = float(os.getenv("GOVERNOR_CPU_HIGH", "0.9"))  # share of all cores busy
+        self.GOVERNOR_CPU_LOW: float = float(os.getenv("GOVERNOR_CPU_LOW", "0.7"))
+        self.GOVERNOR_SPEED_LOW: float = float(os.getenv("GOVERNOR_SPEED_LOW", "0.95"))  # encoder speed, 1.0 = real time
+        self.GOVERNOR_SPEED_OK: float = float(os.getenv("GOVERNOR_SPEED_OK", "0.98"))
+        self.GOVERNOR_RAISE_AFTER: float = float(os.getenv("GOVERNOR_RAISE_AFTER", "10"))  # seconds of pressure per step
+        self.GOVERNOR_LOWER_AFTER: float = float(os.getenv("GOVERNOR_LOWER_AFTER", "60"))  # seconds recovered per step back
+        self.GOVERNOR_ANALYSIS_FPS: float = float(os.getenv("GOVERNOR_ANALYSIS_FPS", "2"))  # motion frames/s when shed
+        self.GOVERNOR_SAMPLING_SCALE: float = float(os.getenv("GOVERNOR_SAMPLING_SCALE", "0.25"))  # of METRICS_SAMPLE_RATES
+        self.GOVERNOR_VIDEO_FRAMERATE: int = int(os.getenv("GOVERNOR_VIDEO_FRAMERATE", "15"))
+        self.GOVERNOR_VIDEO_BITRATE: int = int(os.getenv("GOVERNOR_VIDEO_BITRATE", "600000"))
         
         # Logging
         self.LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -1,20 +1,89 @@
 """Lifecycle management for services."""
+import asyncio
+import inspect
 import logging
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Iterable, List, Optional
+
+from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+class ManagedService:
+    """A registered service, what it depends on and how its last start and stop went."""
+    
+    def __init__(self, name: str, service: Any, depends_on: Iterable[str], after: Iterable[str],
+                 start_timeout: float, stop_timeout: float, blocking: bool):
+        self.name = name
+        self.service = service
+        self.depends_on = tuple(depends_on)
+        self.after = tuple(after)
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.blocking = blocking
+        self.state = "registered"  # starting, running, failed, skipped, stopping, stopped
+        self.error: Optional[str] = None
+        self.waited: Optional[float] = None  # seconds spent waiting for dependencies
+        self.start_seconds: Optional[float] = None
+        self.stop_seconds: Optional[float] = None
+    
+    def get_status(self) -> Dict[str, Any]:
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+        
+        return {
+            "state": self.state,
+            "depends_on": list(self.depends_on),
+            "after": list(self.after),
+            "waited_ms": ms(self.waited),
+            "start_ms": ms(self.start_seconds),
+            "stop_ms": ms(self.stop_seconds),
+            "error": self.error,
+        }
+
+
 class LifecycleManager:
-    """Manages the lifecycle of all services in the application."""
+    """Manages the lifecycle of all services in the application.
+    
+    Services are registered with the names of the services they need.
+    start_all() starts each one as soon as its dependencies are running, so
+    independent services start concurrently, and stop_all() stops each one
+    once everything depending on it has stopped. A service whose start
+    raises or times out is marked failed and the services needing it are
+    skipped, but the rest of the application carries on (degraded).
+    Services named in after= are only ordered: this one starts once their
+    start has finished, however it went, and stops before them.
+    
+    start() and stop() may be coroutines, awaited with the timeout. Plain
+    methods are called on the event loop and must not block, as most create
+    tasks there; register a service whose plain start() or stop() blocks
+    (hardware initialisation) with blocking=True to run them on a worker
+    thread instead. A timed-out thread is abandoned, not interrupted.
+    """
     
     def __init__(self):
         self.services: Dict[str, Any] = {}
+        self.entries: Dict[str, ManagedService] = {}
+        self.startup_seconds: Optional[float] = None
+        self.shutdown_seconds: Optional[float] = None
         logger.debug("LifecycleManager initialized")
     
-    def register_service(self, name: str, service: Any):
-        """Register a service with the lifecycle manager."""
+    def register_service(self, name: str, service: Any, depends_on: Iterable[str] = (),
+                         start_timeout: Optional[float] = None, stop_timeout: Optional[float] = None,
+                         blocking: bool = False, after: Iterable[str] = ()):
+        """Register a service with the lifecycle manager, after the services it depends on."""
+        depends_on, after = tuple(depends_on), tuple(after)
+        unknown = [dependency for dependency in depends_on + after if dependency not in self.entries]
+        if unknown:
+            raise ValueError(f"Service {name} depends on unregistered service {unknown[0]}")
         self.services[name] = service
+        self.entries[name] = ManagedService(
+            name, service, depends_on, after,
+            settings.LIFECYCLE_START_TIMEOUT if start_timeout is None else start_timeout,
+            settings.LIFECYCLE_STOP_TIMEOUT if stop_timeout is None else stop_timeout,
+            blocking,
+        )
         logger.debug(f"Registered service: {name}")
     
     def get_service(self, name: str) -> Optional[Any]:
@@ -25,7 +94,7 @@ class LifecycleManager:
         """Get all registered services."""
         return self.services.copy()
     
-    def get_service_status(self, name: str) -> Dict[str, Any]:
+    async def get_service_status(self, name: str) -> Dict[str, Any]:
         """Get status of a specific service."""
         service = self.services.get(name)
         if service is None:
@@ -34,11 +103,103 @@ class LifecycleManager:
         # Try to get status from service if it has a get_status method
         if hasattr(service, "get_status"):
             try:
-                return service.get_status()
+                status = service.get_status()
+                return await status if inspect.isawaitable(status) else status
             except Exception as e:
                 logger.error(f"Error getting status for {name}: {e}")
                 return {"status": "error", "error": str(e)}
         
         # Default status
         return {"status": "active"}
-
+    
+    async def _call(self, entry: ManagedService, hook_name: str, timeout: float):
+        hook = getattr(entry.service, hook_name, None)
+        if hook is None:
+            return
+        if entry.blocking and not inspect.iscoroutinefunction(hook):
+            await asyncio.wait_for(asyncio.to_thread(hook), timeout)
+            return
+        result = hook()
+        if inspect.isawaitable(result):
+            await asyncio.wait_for(result, timeout)
+    
+    async def start_all(self):
+        """Start every service, each once its dependencies are running."""
+        began = time.monotonic()
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def start(entry: ManagedService):
+            # Registration order guarantees dependencies have tasks already
+            await asyncio.gather(*(tasks[dependency] for dependency in entry.depends_on + entry.after))
+            entry.waited = time.monotonic() - began
+            entry.error = None
+            missing = [dependency for dependency in entry.depends_on if self.entries[dependency].state != "running"]
+            if missing:
+                entry.state = "skipped"
+                entry.error = f"needs {', '.join(missing)}"
+                logger.warning(f"Not starting {entry.name} service: {entry.error}")
+                return
+            
+            entry.state = "starting"
+            started = time.monotonic()
+            try:
+                await self._call(entry, "start", entry.start_timeout)
+            except asyncio.TimeoutError:
+                entry.state = "failed"
+                entry.error = f"start timed out after {entry.start_timeout:g}s"
+            except Exception as e:
+                entry.state = "failed"
+                entry.error = str(e) or type(e).__name__
+            else:
+                entry.state = "running"
+            entry.start_seconds = time.monotonic() - started
+            if entry.state == "failed":
+                logger.error(f"Failed to start {entry.name} service, continuing without it: {entry.error}")
+        
+        for name, entry in self.entries.items():
+            tasks[name] = asyncio.create_task(start(entry))
+        await asyncio.gather(*tasks.values())
+        self.startup_seconds = time.monotonic() - began
+        logger.info(f"Services started in {self.startup_seconds * 1000:.0f} ms"
+                    + (f" (degraded: {', '.join(self.degraded())})" if self.degraded() else ""))
+    
+    async def stop_all(self):
+        """Stop every service, each once the services depending on it have stopped."""
+        began = time.monotonic()
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def stop(entry: ManagedService, dependents: List[str]):
+            await asyncio.gather(*(tasks[dependent] for dependent in dependents))
+            if entry.state in ("registered", "skipped", "stopped"):
+                return
+            entry.state = "stopping"
+            started = time.monotonic()
+            try:
+                await self._call(entry, "stop", entry.stop_timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Stopping {entry.name} service timed out after {entry.stop_timeout:g}s")
+            except Exception as e:
+                logger.error(f"Error stopping {entry.name} service: {e}")
+            entry.state = "stopped"
+            entry.stop_seconds = time.monotonic() - started
+        
+        # Reverse registration order: dependents have their tasks before what they depend on
+        for name in reversed(list(self.entries)):
+            dependents = [other for other, entry in self.entries.items()
+                          if name in entry.depends_on or name in entry.after]
+            tasks[name] = asyncio.create_task(stop(self.entries[name], dependents))
+        await asyncio.gather(*tasks.values())
+        self.shutdown_seconds = time.monotonic() - began
+        logger.info(f"Services stopped in {self.shutdown_seconds * 1000:.0f} ms")
+    
+    def degraded(self) -> List[str]:
+        """Services that failed to start or were skipped because a dependency did."""
+        return [name for name, entry in self.entries.items() if entry.state in ("failed", "skipped")]
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Startup timings and the state of every service."""
+        return {
+            "startup_ms": round(self.startup_seconds * 1000, 1) if self.startup_seconds is not None else None,
+            "degraded": self.degraded(),
+            "services": {name: entry.get_status() for name, entry in self.entries.items()},
+        }
@@ -0,0 +1,235 @@
+"""Prometheus counters, gauges and histograms with text exposition."""
+import bisect
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a fast in-process call to a slow network round trip
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """A named metric and its children, one per combination of label values.
+    
+    Updating a child is a plain attribute update with no lock: each metric is
+    meant to be updated from one thread (the event loop, or the thread that
+    owns what it measures), and a scrape reading it mid-update at worst sees
+    a histogram's sum ahead of its buckets.
+    """
+    
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}  # by label values, as rendered
+        self._lookup: Dict[tuple, object] = {}  # by labels() arguments, which needn't be strings
+        self._function: Optional[Callable[[], float]] = None
+    
+    def labels(self, *values):
+        """The child for these label values; keep it to skip the lookup on hot paths."""
+        child = self._lookup.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            key = tuple(str(value) for value in values)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            self._lookup[values] = child
+        return child
+    
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from function at scrape time instead (unlabelled metrics only)."""
+        self._function = function
+    
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels {self.labelnames}, use labels()")
+        return self.labels()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def samples(self) -> Iterable[str]:
+        if self._function is not None:
+            try:
+                yield f"{self.name} {_format_value(self._function())}"
+            except Exception:
+                pass  # Whatever it reads from has gone away; leave the sample out
+            return
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{self._label_text(key)} {_format_value(child.value)}"
+
+
+class _Value:
+    __slots__ = ("value",)
+    
+    def __init__(self):
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+    
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """A total that only goes up; the name should end in _total."""
+    
+    kind = "counter"
+    
+    def _new_child(self):
+        return _Value()
+    
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().value += amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+    
+    kind = "gauge"
+    
+    def _new_child(self):
+        return _Value()
+    
+    def set(self, value: float):
+        self._unlabelled().value = value
+    
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().value += amount
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+    
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last one is +Inf
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed buckets (upper bounds, inclusive)."""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = sorted(float(bound) for bound in buckets if bound != float("inf"))
+    
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+    
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+    
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + [float("inf")], list(child.counts)):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{self._label_text(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._label_text(key)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{self._label_text(key)} {cumulative}"
+
+
+class Registry:
+    """The metrics exposed on /metrics."""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        """Every metric in the Prometheus text format (0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# The application's metrics; modules register theirs at import
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "pi_guard_http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "pi_guard_http_request_seconds", "Time from request to response headers", ("method", "route")
+)
+
+
+class HttpMetricsMiddleware:
+    """ASGI middleware counting requests and timing them to their response headers.
+    
+    Streaming responses (MJPEG, recordings) are timed to their first byte,
+    not their length. Routes are labelled by their template, and requests no
+    route matched share one label, so label values stay few.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        started = time.perf_counter()
+        
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")  # Set by the router once a route matched
+                path = route.path if route else "unmatched"
+                HTTP_REQUESTS.labels(scope["method"], path, message["status"]).inc()
+                HTTP_REQUEST_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - started)
+            await send(message)
+        
+        await self.app(scope, receive, send_timed)
@@ -4,7 +4,16 @@ from fastapi import FastAPI
 from modules.camera.service import CameraService
 from modules.streaming.service import StreamingService
 from modules.metrics.service import MetricsService
+from modules.mqtt.service import MqttService
+from modules.recordings.service import RecordingsService
+from modules.motion.service import MotionService
+from modules.snapshot.service import SnapshotService
+from modules.mjpeg.service import MjpegService
+from modules.events.service import EventsService
+from modules.governor.service import GovernorService
 from config import settings
+from core.lifecycle import LifecycleManager
+from core.telemetry import HttpMetricsMiddleware
 from api.routes import router
 
 
@@ -34,42 +43,68 @@ app = FastAPI(
 # Include API routes
 app.include_router(router)
 
+# Request counts and latencies by route, exposed on /metrics
+app.add_middleware(HttpMetricsMiddleware)
+
 # -------------------------------------------------------------------
 # Services (singletons)
 # -------------------------------------------------------------------
 
 camera_service = CameraService()
-streaming_service = StreamingService(camera_service)
-metrics_service = MetricsService()
+streaming_service = StreamingService()
+mqtt_service = MqttService()
+metrics_service = MetricsService(mqtt_service)
+recordings_service = RecordingsService()
+motion_service = MotionService(camera_service, mqtt_service)
+snapshot_service = SnapshotService(camera_service)
+mjpeg_service = MjpegService(camera_service, snapshot_service)
+events_service = EventsService(camera_service, streaming_service, mqtt_service, metrics_service, motion_service)
+governor_service = GovernorService(streaming_service, metrics_service, motion_service)
 
 # -------------------------------------------------------------------
 # Lifecycle
 # -------------------------------------------------------------------
 
+# Each service starts once what it depends on is running, independent ones concurrently;
+# a service that fails leaves the app running without it (and what needs it)
+lifecycle = LifecycleManager()
+# camera and motion join their worker threads in stop(), so that runs off the event loop. Publishers
+# only start and stop around mqtt (after=): without the broker they keep history and feed LAN clients.
+# The governor's levers and the events motion listener make do with a service that didn't start.
+lifecycle.register_service("camera", camera_service, blocking=True)
+lifecycle.register_service("streaming", streaming_service)
+lifecycle.register_service("mqtt", mqtt_service)
+lifecycle.register_service("metrics", metrics_service, after=["mqtt"])
+lifecycle.register_service("recordings", recordings_service)
+lifecycle.register_service("motion", motion_service, depends_on=["camera"], after=["mqtt"], blocking=True)
+lifecycle.register_service("snapshot", snapshot_service, depends_on=["camera"])
+lifecycle.register_service("mjpeg", mjpeg_service, depends_on=["snapshot"])
+lifecycle.register_service("events", events_service, depends_on=["metrics"], after=["motion"])
+lifecycle.register_service("governor", governor_service, after=["streaming", "metrics", "motion"])
+
 @app.on_event("startup")
 async def on_startup():
     logger.info("Starting services...")
-
+    
     # Store services in app.state for route access
+    app.state.lifecycle = lifecycle
     app.state.camera_service = camera_service
     app.state.streaming_service = streaming_service
+    app.state.mqtt_service = mqtt_service
     app.state.metrics_service = metrics_service
-
-    camera_service.start()
-    streaming_service.start()
-    metrics_service.start()
-
-    logger.info("All services started")
+    app.state.recordings_service = recordings_service
+    app.state.motion_service = motion_service
+    app.state.snapshot_service = snapshot_service
+    app.state.mjpeg_service = mjpeg_service
+    app.state.events_service = events_service
+    app.state.governor_service = governor_service
+    
+    await lifecycle.start_all()
 
 @app.on_event("shutdown")
 async def on_shutdown():
     logger.info("Stopping services...")
-
-    metrics_service.stop()
-    streaming_service.stop()
-    camera_service.stop()
-
-    logger.info("All services stopped")
+    await lifecycle.stop_all()
 
 # -------------------------------------------------------------------
 # Main Entry Point
@@ -0,0 +1,187 @@
+"""Camera service providing decoded frames from the stream supervisor's video."""
+import logging
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# data is a planar YUV 4:2:0 image of shape (height * 3 // 2, width):
+# the luma plane is data[:height], followed by the U and V planes
+Frame = namedtuple("Frame", ["seq", "timestamp", "width", "height", "data"])
+
+
+class CameraService:
+    """Service for the latest decoded camera frame.
+    
+    The stream supervisor owns the camera (libcamera allows one owner), so
+    frames come from decoding its H.264 in an ffmpeg child process, decimated
+    to CAMERA_FRAME_RATE. Decoding runs outside this process; a reader thread
+    only copies finished frames in, and consumers always get the newest one.
+    """
+    
+    def __init__(self):
+        width, height = settings.STREAM_RESOLUTION.split(":")
+        self.width = int(width)
+        self.height = int(height)
+        self.frame_rate = settings.CAMERA_FRAME_RATE
+        self.source_url = f"{settings.STREAM_CONTROL_URL.rstrip('/')}/video.h264"
+        self._frame: Optional[Frame] = None
+        self._cond = threading.Condition()
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stopping = threading.Event()  # Cuts the decoder's restart backoff short
+        self._restart_delay = 1  # Initial restart delay in seconds
+        self._max_restart_delay = 30  # Maximum restart delay
+        self.frames_decoded = 0
+        self.decoder_restarts = 0
+    
+    def build_decoder_cmd(self) -> list:
+        """Decode the supervisor's H.264 to raw YUV 4:2:0 at the analysis frame rate."""
+        step = max(1, round(settings.STREAM_FRAMERATE / self.frame_rate))
+        return [
+            "ffmpeg", "-loglevel", "error",
+            "-probesize", "32", "-analyzeduration", "0",
+            "-f", "h264", "-i", self.source_url,
+            "-an",
+            # Keep every step-th picture; exact decimation that doesn't rely on timestamps
+            "-vf", f"select=not(mod(n\\,{step})),scale={self.width}:{self.height}",
+            "-fps_mode", "passthrough",
+            "-pix_fmt", "yuv420p",
+            "-f", "rawvideo", "pipe:1"
+        ]
+    
+    def start(self):
+        """Start the camera service."""
+        if self._running:
+            logger.warning("Camera service is already running")
+            return
+        if not settings.CAMERA_ENABLED:
+            logger.info("Camera disabled (CAMERA_ENABLED=false)")
+            return
+        
+        self._running = True
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._decode_loop, name="camera-decoder", daemon=True)
+        self._thread.start()
+        logger.info(f"Camera service started ({self.width}x{self.height} at {self.frame_rate} fps from {self.source_url})")
+    
+    def stop(self):
+        """Stop the camera service."""
+        if not self._running:
+            return
+        
+        self._running = False
+        self._stopping.set()
+        process = self._process
+        if process and process.poll() is None:
+            process.kill()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+        logger.info("Camera service stopped")
+    
+    def _decode_loop(self):
+        """Run the decoder, restarting it with backoff when the stream drops."""
+        import numpy as np  # Here rather than at import, so the app starts without it when the camera is off
+        
+        frame_size = self.width * self.height * 3 // 2
+        while self._running:
+            started = time.monotonic()
+            try:
+                self._process = subprocess.Popen(
+                    self.build_decoder_cmd(),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    bufsize=0
+                )
+            except OSError as e:
+                logger.error(f"Failed to start frame decoder: {e}")
+                self._running = False
+                return
+            
+            try:
+                while self._running:
+                    # A fresh array per frame, so consumers can keep the one they hold
+                    data = np.empty((self.height * 3 // 2, self.width), dtype=np.uint8)
+                    if not self._read_into(self._process.stdout, memoryview(data).cast("B"), frame_size):
+                        break
+                    with self._cond:
+                        seq = self._frame.seq + 1 if self._frame else 0
+                        self._frame = Frame(seq, time.time(), self.width, self.height, data)
+                        self._cond.notify_all()
+                    self.frames_decoded += 1
+            finally:
+                if self._process.poll() is None:
+                    self._process.kill()
+                self._process.wait()
+            
+            if not self._running:
+                break
+            # Reset the backoff once a decoder ran for a while
+            if time.monotonic() - started > self._max_restart_delay:
+                self._restart_delay = 1
+            self.decoder_restarts += 1
+            logger.warning(f"Frame decoder stopped, restarting in {self._restart_delay}s")
+            if self._stopping.wait(self._restart_delay):
+                break
+            self._restart_delay = min(self._restart_delay * 2, self._max_restart_delay)
+    
+    @staticmethod
+    def _read_into(pipe, view: memoryview, size: int) -> bool:
+        """Fill view with exactly size bytes, False at end of stream."""
+        filled = 0
+        while filled < size:
+            count = pipe.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+    
+    def latest_frame(self) -> Optional[Frame]:
+        """Get the newest frame without waiting (None before the first one)."""
+        return self._frame
+    
+    def get_frame(self, after_seq: int = -1, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Wait for a frame newer than after_seq, None on timeout or stop.
+        
+        While the camera isn't running (stopped, or the decoder failed to
+        start) no frame will come: this waits out the timeout, or until
+        stop(), so a caller polling in a loop doesn't spin.
+        """
+        with self._cond:
+            if not self._running:
+                self._cond.wait(timeout)
+                return None
+            self._cond.wait_for(
+                lambda: not self._running or (self._frame is not None and self._frame.seq > after_seq),
+                timeout
+            )
+            frame = self._frame
+        if frame is None or frame.seq <= after_seq:
+            return None
+        return frame
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the camera service."""
+        frame = self._frame
+        return {
+            "status": "running" if self._running else "stopped",
+            "resolution": f"{self.width}x{self.height}",
+            "frame_rate": self.frame_rate,
+            "frames_decoded": self.frames_decoded,
+            "decoder_restarts": self.decoder_restarts,
+            "frame_age": round(time.time() - frame.timestamp, 3) if frame else None,
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
@@ -0,0 +1,253 @@
+"""Events service pushing live metrics and status changes to Server-Sent Events clients."""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import struct
+from typing import AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+
+from config import settings
+from core.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+# Event types a client can ask for
+TYPES = ("metrics", "motion", "status")
+
+EVENTS = registry.counter("pi_guard_events_total", "Server-sent events broadcast by type", ("type",))
+COALESCED = registry.counter(
+    "pi_guard_events_coalesced_total", "Events a slow client never received because a newer one replaced them"
+)
+CLIENTS = registry.gauge("pi_guard_events_clients", "Connected Server-Sent Events clients")
+
+# Seconds between looks at a client's send queue while it is over EVENTS_SEND_AHEAD
+DRAIN_POLL = 0.1
+# ioctl for the bytes in a TCP socket's send queue not yet sent (linux/sockios.h)
+SIOCOUTQNSD = 0x894B
+
+
+class Subscription:
+    """Latest-per-type mailbox for one client.
+    
+    Holds at most one event of each type: put() replaces one the client
+    hasn't taken yet, so a slow client receives the newest state of each
+    type instead of a backlog, and memory per client is bounded whatever the
+    event rate. Events are shared, already encoded, between clients.
+    """
+    
+    def __init__(self, types: Iterable[str]):
+        self.types = frozenset(types)
+        self._pending: Dict[str, bytes] = {}  # insertion order = delivery order
+        self._event = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+    
+    def put(self, kind: str, frame: bytes):
+        if kind not in self.types:
+            return
+        if self._pending.pop(kind, None) is not None:
+            self.coalesced += 1
+            COALESCED.inc()
+        self._pending[kind] = frame
+        self._event.set()
+    
+    async def get(self, timeout: float) -> Optional[bytes]:
+        """All pending events as one chunk, None if nothing came within timeout."""
+        if not self._pending:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        frames, self._pending = list(self._pending.values()), {}
+        self.delivered += len(frames)
+        return b"".join(frames)
+
+
+def find_socket(client: Optional[Tuple], server: Optional[Tuple]) -> Optional[socket.socket]:
+    """The process's TCP socket from server to client (ASGI scope addresses), None if not found.
+    
+    ASGI doesn't hand the connection to the app, so it is looked up among
+    the open sockets in /proc (Linux only). The socket returned is a
+    duplicate to close when done; the server's own is left alone.
+    """
+    if not client or not server:
+        return None
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    for name in fds:
+        try:
+            if not os.readlink(f"/proc/self/fd/{name}").startswith("socket:"):
+                continue
+            sock = socket.socket(fileno=os.dup(int(name)))
+        except (OSError, ValueError):
+            continue
+        try:
+            if sock.type == socket.SOCK_STREAM and sock.getpeername()[:2] == tuple(client) \
+                    and sock.getsockname()[:2] == tuple(server):
+                return sock
+        except OSError:
+            pass
+        sock.close()
+    return None
+
+
+def unsent(sock: socket.socket) -> int:
+    """Bytes written to sock that the kernel hasn't sent yet, as the peer has no room for them.
+    
+    Bytes sent but not yet acknowledged don't count, so a delayed ACK
+    doesn't hold back a client that keeps up.
+    """
+    try:
+        return struct.unpack("i", fcntl.ioctl(sock.fileno(), SIOCOUTQNSD, b"\0\0\0\0"))[0]
+    except OSError:
+        return 0
+
+
+def encode(event_id: int, kind: str, data: dict) -> bytes:
+    """One Server-Sent Events message."""
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class EventsService:
+    """Broadcasts metrics windows, motion events and status changes as Server-Sent Events.
+    
+    Each event is encoded once and handed to every client's Subscription.
+    A new client first receives the latest event of each type, so it starts
+    from the current state. Status is a compact summary of the other
+    services, checked every EVENTS_STATUS_INTERVAL while anyone is connected
+    and sent only when it changes.
+    """
+    
+    def __init__(self, camera_service, streaming_service, mqtt_service, metrics_service, motion_service):
+        self.camera_service = camera_service
+        self.streaming_service = streaming_service
+        self.mqtt_service = mqtt_service
+        self.metrics_service = metrics_service
+        self.motion_service = motion_service
+        self.clients: Set[Subscription] = set()
+        self._latest: Dict[str, bytes] = {}
+        self._next_id = 1
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._status_task: Optional[asyncio.Task] = None
+        self._running = False
+        CLIENTS.set_function(lambda: len(self.clients))
+    
+    def start(self):
+        """Start the events service and listen to the services it reports on."""
+        if self._running:
+            logger.warning("Events service is already running")
+            return
+        
+        self._loop = asyncio.get_event_loop()
+        self.metrics_service.add_window_listener(lambda window: self.publish("metrics", window))
+        # Motion events come from the analysis thread; none without motion detection
+        if self.motion_service.is_running():
+            self.motion_service.add_event_listener(
+                lambda event: self._loop.call_soon_threadsafe(self.publish, "motion", event)
+            )
+        self._running = True
+        logger.info("Events service started")
+    
+    def stop(self):
+        """Stop the events service (open streams end with their clients)."""
+        if not self._running:
+            return
+        
+        self._running = False
+        if self._status_task:
+            self._status_task.cancel()
+            self._status_task = None
+        logger.info("Events service stopped")
+    
+    def publish(self, kind: str, data: dict):
+        """Broadcast an event to every client that wants its type (call on the event loop)."""
+        if not self._running:
+            return
+        frame = encode(self._next_id, kind, data)
+        self._next_id += 1
+        self._latest[kind] = frame
+        for client in self.clients:
+            client.put(kind, frame)
+        EVENTS.labels(kind).inc()
+    
+    def can_accept(self) -> bool:
+        """False once EVENTS_MAX_CLIENTS are connected."""
+        return len(self.clients) < settings.EVENTS_MAX_CLIENTS
+    
+    async def stream(self, types: Iterable[str], connection: Optional[socket.socket] = None) -> AsyncIterator[bytes]:
+        """Event stream body for one client; ends when the client disconnects.
+        
+        With the client's connection (see find_socket), the next chunk waits
+        while more than EVENTS_SEND_AHEAD bytes are queued unsent, so a slow
+        client's events are coalesced here rather than queued in socket
+        buffers, and what it receives is the latest. The connection is closed
+        at the end.
+        """
+        client = Subscription(types)
+        for kind, frame in self._latest.items():
+            client.put(kind, frame)
+        self.clients.add(client)
+        if "status" in client.types and (self._status_task is None or self._status_task.done()):
+            self._status_task = asyncio.create_task(self._watch_status())
+        try:
+            # Tells EventSource how long to wait before reconnecting
+            yield f"retry: {int(settings.EVENTS_RETRY * 1000)}\n\n".encode("ascii")
+            while self._running:
+                while connection is not None and self._running and unsent(connection) > settings.EVENTS_SEND_AHEAD:
+                    await asyncio.sleep(DRAIN_POLL)
+                chunk = await client.get(settings.EVENTS_KEEPALIVE)
+                # A comment line keeps proxies from timing out an idle stream
+                yield chunk if chunk is not None else b": keepalive\n\n"
+        finally:
+            self.clients.discard(client)
+            if connection is not None:
+                connection.close()
+    
+    async def _watch_status(self):
+        """Publish the status summary when it changes, while a client wants status events."""
+        last = None
+        while self._running and any("status" in client.types for client in self.clients):
+            try:
+                status = await self._status()
+                if status != last:
+                    self.publish("status", status)
+                    last = status
+            except Exception as e:
+                logger.error(f"Error checking status for events: {e}")
+            await asyncio.sleep(settings.EVENTS_STATUS_INTERVAL)
+        self._latest.pop("status", None)  # Stale once nobody watches; recomputed for the next client
+    
+    async def _status(self) -> dict:
+        sampler = self.metrics_service.sampler
+        if not sampler:
+            sensors = "stopped"
+        elif sampler.error:
+            sensors = "error"
+        else:
+            sensors = "ok" if sampler.sense is not None else "starting"
+        return {
+            "camera": "active" if self.camera_service.is_running() else "inactive",
+            "stream": (await self.streaming_service.get_status())["status"],
+            "mqtt": self.mqtt_service.state,
+            "sensors": sensors,
+            "motion": self.motion_service.active,
+        }
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the events service."""
+        return {
+            "status": "running" if self._running else "stopped",
+            "clients": len(self.clients),
+            "max_clients": settings.EVENTS_MAX_CLIENTS,
+            "events": self._next_id - 1,
+            "coalesced": sum(client.coalesced for client in self.clients),
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
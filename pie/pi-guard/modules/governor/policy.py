@@ -0,0 +1,89 @@
+"""Degradation levels with hysteresis for the resource governor."""
+from collections import deque
+from typing import List, Optional, Sequence
+
+from modules.governor.signals import THROTTLING, Signals, throttle_reasons
+
+# Shed in this order, restored in reverse: each level keeps the ones below it
+LEVELS = ("normal", "analysis", "sampling", "video")
+
+
+class DegradationPolicy:
+    """Steps through LEVELS one at a time as the Pi runs hot, and back as it cools.
+    
+    The Pi is under pressure while any signal is past its high threshold
+    (SoC temperature, a current throttle flag, CPU load or the encoder falling
+    behind real time), and has recovered only once every signal is back past
+    its low threshold. In between it holds its level, and each step needs
+    pressure or recovery to last raise_after or lower_after seconds, so a
+    brief spike or a temperature hovering at a threshold doesn't flap. After
+    a step the dwell starts again, so the governor sees the effect of one
+    level before taking the next.
+    """
+    
+    def __init__(self, temp_high: float = 75, temp_low: float = 68, cpu_high: float = 0.9, cpu_low: float = 0.7,
+                 speed_low: float = 0.95, speed_ok: float = 0.98, raise_after: float = 10, lower_after: float = 60,
+                 levels: Sequence[str] = LEVELS):
+        if temp_low >= temp_high or cpu_low >= cpu_high or speed_low >= speed_ok:
+            raise ValueError("Each low threshold must be below its high one")
+        self.temp_high = temp_high
+        self.temp_low = temp_low
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.speed_low = speed_low
+        self.speed_ok = speed_ok
+        self.raise_after = raise_after
+        self.lower_after = lower_after
+        self.levels = tuple(levels)
+        self.level = 0
+        self.state = "ok"  # "pressure", "ok" (between the thresholds) or "recovered"
+        self.reasons: List[str] = []
+        self._since: Optional[float] = None  # when the current pressure or recovery began
+        self.changes = 0
+        self.transitions = deque(maxlen=20)  # (time, from level, to level, reasons)
+    
+    def pressure(self, signals: Signals) -> List[str]:
+        """Why the Pi is under pressure, empty if it isn't."""
+        reasons = []
+        if signals.temperature is not None and signals.temperature >= self.temp_high:
+            reasons.append(f"SoC {signals.temperature:.1f}°C")
+        if signals.throttled is not None and signals.throttled & THROTTLING:
+            reasons.append(", ".join(throttle_reasons(signals.throttled & THROTTLING)))
+        if signals.cpu is not None and signals.cpu >= self.cpu_high:
+            reasons.append(f"CPU {signals.cpu:.0%}")
+        if signals.encoder_speed is not None and signals.encoder_speed < self.speed_low:
+            reasons.append(f"encoder at {signals.encoder_speed:.2f}x real time")
+        return reasons
+    
+    def recovered(self, signals: Signals) -> bool:
+        """Whether every signal is back below its low threshold (unknown signals don't hold it back)."""
+        return ((signals.temperature is None or signals.temperature <= self.temp_low)
+                and (signals.throttled is None or not signals.throttled & THROTTLING)
+                and (signals.cpu is None or signals.cpu <= self.cpu_low)
+                and (signals.encoder_speed is None or signals.encoder_speed >= self.speed_ok))
+    
+    def update(self, signals: Signals, now: float) -> Optional[int]:
+        """Take in a reading at time now (seconds); returns the new level if it changed, else None."""
+        reasons = self.pressure(signals)
+        state = "pressure" if reasons else "recovered" if self.recovered(signals) else "ok"
+        if state != self.state:
+            self._since = now
+        self.state = state
+        self.reasons = reasons
+        
+        step = 0
+        if state == "pressure" and self.level < len(self.levels) - 1 and now - self._since >= self.raise_after:
+            step = 1
+        elif state == "recovered" and self.level > 0 and now - self._since >= self.lower_after:
+            step = -1
+        if not step:
+            return None
+        self.transitions.append((now, self.level, self.level + step, reasons or ["recovered"]))
+        self.level += step
+        self.changes += 1
+        self._since = now
+        return self.level
+    
+    @property
+    def level_name(self) -> str:
+        return self.levels[self.level]
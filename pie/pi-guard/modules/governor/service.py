@@ -0,0 +1,169 @@
+"""Resource governor shedding load in steps when the Pi runs hot or falls behind."""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from config import settings
+from core.telemetry import registry
+from modules.governor.policy import LEVELS, DegradationPolicy
+from modules.governor.signals import Signals, SysfsProbe, throttle_reasons
+
+logger = logging.getLogger(__name__)
+
+LEVEL = registry.gauge("pi_guard_governor_level", "Degradation level, 0 normal to 3 video quality lowered")
+LEVEL_CHANGES = registry.counter("pi_guard_governor_level_changes_total", "Degradation level steps", ("direction",))
+SOC_TEMPERATURE = registry.gauge("pi_guard_soc_temperature_celsius", "SoC temperature from the thermal zone")
+CPU_BUSY = registry.gauge("pi_guard_cpu_busy_ratio", "Share of CPU time busy between governor checks")
+
+
+class GovernorService:
+    """Watches the Pi's temperature, throttling, CPU load and encoder speed and sheds load by level.
+    
+    Every GOVERNOR_INTERVAL the signals go to a DegradationPolicy, and each
+    level keeps the load shed below it and sheds one more thing, cheapest to
+    lose first:
+      
+      analysis  motion analysis at GOVERNOR_ANALYSIS_FPS
+      sampling  Sense HAT sampling at GOVERNOR_SAMPLING_SCALE of its rates
+      video     the stream at GOVERNOR_VIDEO_FRAMERATE and GOVERNOR_VIDEO_BITRATE
+    
+    The levers are checked against the level every tick rather than only on a
+    step, so one that failed (the supervisor not answering, say) or was
+    undone (the supervisor restarted at full quality) is applied again.
+    """
+    
+    def __init__(self, streaming_service, metrics_service, motion_service):
+        self.streaming_service = streaming_service
+        self.metrics_service = metrics_service
+        self.motion_service = motion_service
+        self.probe = SysfsProbe(settings.GOVERNOR_SYSFS_ROOT)
+        self.policy = DegradationPolicy(
+            temp_high=settings.GOVERNOR_TEMP_HIGH,
+            temp_low=settings.GOVERNOR_TEMP_LOW,
+            cpu_high=settings.GOVERNOR_CPU_HIGH,
+            cpu_low=settings.GOVERNOR_CPU_LOW,
+            speed_low=settings.GOVERNOR_SPEED_LOW,
+            speed_ok=settings.GOVERNOR_SPEED_OK,
+            raise_after=settings.GOVERNOR_RAISE_AFTER,
+            lower_after=settings.GOVERNOR_LOWER_AFTER,
+        )
+        self.signals = Signals(None, None, None, None)
+        self.lever_errors = 0
+        self._now = 0.0  # clock of the last tick
+        # What the supervisor last accepted, None for its configured rate; unknown (None) until the first
+        # call, as a supervisor that outlived a pi-guard restart may still be at a lowered quality
+        self._video_quality: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        LEVEL.set_function(lambda: self.policy.level)
+    
+    def start(self):
+        """Start the governor loop."""
+        if self._running:
+            logger.warning("Governor service is already running")
+            return
+        if not settings.GOVERNOR_ENABLED:
+            logger.info("Resource governor disabled (GOVERNOR_ENABLED=false)")
+            return
+        
+        self._running = True
+        self.probe.cpu()  # Primes the CPU load for the first tick
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        logger.info(f"Governor service started (every {settings.GOVERNOR_INTERVAL:g}s)")
+    
+    def stop(self):
+        """Stop the governor loop; the levers stay where they are until the services restart."""
+        if not self._running:
+            return
+        
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        logger.info("Governor service stopped")
+    
+    async def _run(self):
+        while self._running:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Error in resource governor: {e}")
+            await asyncio.sleep(settings.GOVERNOR_INTERVAL)
+    
+    async def tick(self, now: Optional[float] = None):
+        """Read the signals, step the level if the policy says so and bring the levers in line with it."""
+        stream = await self.streaming_service.get_status()
+        speed = (stream.get("encoder") or {}).get("speed")
+        self.signals = self.probe.read(speed if speed and speed > 0 else None)
+        if self.signals.temperature is not None:
+            SOC_TEMPERATURE.set(self.signals.temperature)
+        if self.signals.cpu is not None:
+            CPU_BUSY.set(self.signals.cpu)
+        
+        previous = self.policy.level
+        self._now = time.monotonic() if now is None else now
+        level = self.policy.update(self.signals, self._now)
+        if level is not None:
+            raised = level > previous
+            LEVEL_CHANGES.labels("raise" if raised else "lower").inc()
+            if raised:
+                logger.warning(f"Shedding load, level {LEVELS[level]}: {'; '.join(self.policy.reasons)}")
+            else:
+                logger.info(f"Load recovered, level {LEVELS[level]}")
+        await self._apply(stream)
+    
+    async def _apply(self, stream: dict):
+        level = self.policy.level
+        try:
+            rate = settings.GOVERNOR_ANALYSIS_FPS if level >= 1 else None
+            if self.motion_service.max_rate != rate:
+                self.motion_service.set_analysis_rate(rate)
+            
+            scale = settings.GOVERNOR_SAMPLING_SCALE if level >= 2 else 1.0
+            sampler = self.metrics_service.sampler
+            if sampler and sampler.rate_scale != scale:
+                self.metrics_service.set_sampling_scale(scale)
+            
+            quality = (None, None)
+            if level >= 3:
+                # The supervisor refuses more than it is configured for
+                quality = (min(settings.GOVERNOR_VIDEO_FRAMERATE, settings.STREAM_FRAMERATE),
+                           min(settings.GOVERNOR_VIDEO_BITRATE, settings.STREAM_BITRATE))
+            if stream.get("status") in ("running", "restarting"):
+                reported = stream.get("quality") or {}
+                undone = level >= 3 and (reported.get("framerate"), reported.get("bitrate")) != quality
+                if quality != self._video_quality or undone:
+                    await self.streaming_service.set_quality(*quality)
+                    self._video_quality = quality
+        except Exception as e:
+            self.lever_errors += 1
+            logger.error(f"Resource governor couldn't apply level {LEVELS[level]}: {e}")
+    
+    async def get_status(self) -> dict:
+        """Get the current level, why it is there and the signals behind it."""
+        signals = self.signals
+        return {
+            "status": "running" if self._running else "stopped",
+            "level": self.policy.level,
+            "level_name": self.policy.level_name,
+            "state": self.policy.state,
+            "reasons": self.policy.reasons,
+            "signals": {
+                "temperature": signals.temperature,
+                "throttled": hex(signals.throttled) if signals.throttled is not None else None,
+                "throttle_flags": throttle_reasons(signals.throttled or 0),
+                "cpu": round(signals.cpu, 3) if signals.cpu is not None else None,
+                "encoder_speed": signals.encoder_speed,
+            },
+            "level_changes": self.policy.changes,
+            "lever_errors": self.lever_errors,
+            "transitions": [
+                {"seconds_ago": round(self._now - at, 1), "from": LEVELS[before], "to": LEVELS[after], "reasons": reasons}
+                for at, before, after, reasons in self.policy.transitions
+            ],
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
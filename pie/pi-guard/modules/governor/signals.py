@@ -0,0 +1,88 @@
+"""SoC temperature, throttling and CPU load read from sysfs and procfs.
+
+Every path is under a root directory ("/" on the Pi), so a fake tree of the
+same files stands in for the hardware anywhere.
+"""
+import logging
+import os
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# One look at the load: SoC °C, firmware throttle flags, CPU busy 0..1, encoder speed
+# (1.0 keeps up with real time); None where a signal isn't available
+Signals = namedtuple("Signals", ["temperature", "throttled", "cpu", "encoder_speed"])
+
+THERMAL_ZONE = "sys/class/thermal/thermal_zone0/temp"  # millidegrees Celsius
+GET_THROTTLED = "sys/devices/platform/soc/soc:firmware/get_throttled"  # hex, as `vcgencmd get_throttled`
+PROC_STAT = "proc/stat"
+
+# Current-state bits of get_throttled; the same bits shifted by 16 mean "since boot"
+THROTTLE_FLAGS = (
+    (0x1, "under-voltage"),
+    (0x2, "frequency capped"),
+    (0x4, "throttled"),
+    (0x8, "soft temperature limit"),
+)
+# The bits that mean the CPU is being slowed down right now
+THROTTLING = 0x2 | 0x4 | 0x8
+
+
+def throttle_reasons(flags: int) -> List[str]:
+    """Names of the current-state bits set in get_throttled flags."""
+    return [name for bit, name in THROTTLE_FLAGS if flags & bit]
+
+
+class SysfsProbe:
+    """Reads the SoC's thermal and throttle state and the CPU load under root.
+    
+    CPU load is the busy share of all CPUs' time since the previous read, so
+    the first read only primes it. A file that can't be read gives None for
+    its signal; each missing one is logged once.
+    """
+    
+    def __init__(self, root: str = "/"):
+        self.root = root
+        self._cpu_times: Optional[Tuple[int, int]] = None  # (busy, total) jiffies at the last read
+        self._missing = set()
+    
+    def _read(self, path: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, path)) as file:
+                return file.read()
+        except OSError as e:
+            if path not in self._missing:
+                self._missing.add(path)
+                logger.info(f"Resource governor can't read {path}, going without it: {e}")
+            return None
+    
+    def temperature(self) -> Optional[float]:
+        text = self._read(THERMAL_ZONE)
+        try:
+            return int(text) / 1000 if text else None
+        except ValueError:
+            return None
+    
+    def throttled(self) -> Optional[int]:
+        text = self._read(GET_THROTTLED)
+        try:
+            return int(text.strip(), 16) if text else None
+        except ValueError:
+            return None
+    
+    def cpu(self) -> Optional[float]:
+        text = self._read(PROC_STAT)
+        if not text or not text.startswith("cpu "):
+            return None
+        # user nice system idle iowait irq softirq steal ...; idle and iowait are the idle time
+        times = [int(value) for value in text.split("\n", 1)[0].split()[1:]]
+        total = sum(times[:8])
+        busy = total - sum(times[3:5])
+        previous, self._cpu_times = self._cpu_times, (busy, total)
+        if previous is None or total <= previous[1]:
+            return None
+        return max(0.0, min(1.0, (busy - previous[0]) / (total - previous[1])))
+    
+    def read(self, encoder_speed: Optional[float] = None) -> Signals:
+        return Signals(self.temperature(), self.throttled(), self.cpu(), encoder_speed)
@@ -0,0 +1,100 @@
+"""Report-by-exception filtering of metrics windows."""
+from typing import Dict, List, Optional, Tuple
+
+from modules.metrics.sampler import CHANNELS
+
+# Channels whose fields are angles in degrees, wrapping at 360
+ANGULAR_CHANNELS = {"orientation"}
+
+WINDOW_BLOCKS = ("min", "max", "mean", "count")
+
+# Values are rounded to their published decimals; keep 21.6 - 21.3 from falling short of 0.3
+TOLERANCE = 1e-9
+
+
+def _difference(a: float, b: float, angular: bool) -> float:
+    difference = a - b
+    if angular:
+        difference = (difference + 180) % 360 - 180
+    return abs(difference)
+
+
+class DeadbandFilter:
+    """Drops channels from a window's metrics until they change enough to matter.
+    
+    A channel is sent when the last, min or max of any of its fields is at
+    least its deadband away from the value last sent, or when its window mean
+    moved faster than its rate-of-change threshold (units per second) since
+    the previous window. Channels without a deadband are sent every window.
+    Every heartbeat_interval seconds, and after force_heartbeat(), the full
+    state goes out flagged "heartbeat" so late subscribers can sync.
+    """
+    
+    def __init__(self, deadbands: Dict[str, float], rates_of_change: Dict[str, float], heartbeat_interval: float):
+        self.deadbands = deadbands
+        self.rates_of_change = rates_of_change
+        self.heartbeat_interval = heartbeat_interval
+        self.suppressed = 0  # windows with nothing worth sending
+        self.heartbeats = 0
+        self._sent: Dict[str, float] = {}  # field -> value last sent
+        self._previous: Dict[str, Tuple[float, List[float]]] = {}  # channel -> (window end, means)
+        self._next_heartbeat = 0.0
+    
+    def force_heartbeat(self):
+        """Send the full state with the next window (e.g. after a reconnect)."""
+        self._next_heartbeat = 0.0
+    
+    def filter(self, metrics: dict, now: float) -> Optional[dict]:
+        """The part of a summarized window worth publishing, None for nothing.
+        
+        now is the end of the window in seconds.
+        """
+        heartbeat = now >= self._next_heartbeat
+        changed = []
+        for name, channel in CHANNELS.items():
+            if channel.fields[0] not in metrics["count"]:
+                continue  # Not sampled in this window
+            means = [metrics["mean"][field] for field in channel.fields]
+            if heartbeat or self._exceeds(name, metrics, means, now):
+                changed.append(name)
+            self._previous[name] = (now, means)
+        
+        if heartbeat:
+            self._next_heartbeat = now + self.heartbeat_interval
+            self.heartbeats += 1
+            for channel in CHANNELS.values():
+                for field in channel.fields:
+                    if field in metrics:
+                        self._sent[field] = metrics[field]
+            return {**metrics, "heartbeat": True}
+        if not changed:
+            self.suppressed += 1
+            return None
+        
+        fields = [field for name in changed for field in CHANNELS[name].fields]
+        message = {field: metrics[field] for field in fields}
+        for block in WINDOW_BLOCKS:
+            message[block] = {field: metrics[block][field] for field in fields}
+        for field in fields:
+            self._sent[field] = metrics[field]
+        return message
+    
+    def _exceeds(self, name: str, metrics: dict, means: List[float], now: float) -> bool:
+        deadband = self.deadbands.get(name, 0)
+        if deadband <= 0:
+            return True
+        angular = name in ANGULAR_CHANNELS
+        for field in CHANNELS[name].fields:
+            sent = self._sent.get(field)
+            if sent is None:
+                return True
+            for value in (metrics[field], metrics["min"][field], metrics["max"][field]):
+                if _difference(value, sent, angular) >= deadband - TOLERANCE:
+                    return True
+        
+        rate = self.rates_of_change.get(name, 0)
+        previous = self._previous.get(name)
+        if rate > 0 and previous and now > previous[0]:
+            elapsed = now - previous[0]
+            return any(_difference(mean, before, angular) / elapsed >= rate for mean, before in zip(means, previous[1]))
+        return False
@@ -0,0 +1,237 @@
+"""In-memory history of metrics windows with downsampled range queries."""
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from modules.metrics.sampler import CHANNELS
+
+logger = logging.getLogger(__name__)
+
+FIELDS = tuple(field for channel in CHANNELS.values() for field in channel.fields)
+DECIMALS = {field: channel.decimals for channel in CHANNELS.values() for field in channel.fields}
+STATS = ("min", "max", "mean")
+METHODS = ("minmax", "lttb")
+MAX_POINTS = 10000
+
+# Per window: its end time (float64) and min/max/mean of every field (float32)
+WINDOW_BYTES = 8 + len(STATS) * len(FIELDS) * 4
+
+# A query's arguments and its copy of the range: window ends (n,) and values (stats, fields, n)
+Selection = namedtuple("Selection", ["method", "points", "names", "times", "values"])
+
+
+def history_capacity(hours: float, window_seconds: float, max_bytes: int) -> int:
+    """Windows to keep for hours of history, capped by the memory budget."""
+    wanted = max(1, int(hours * 3600 / window_seconds))
+    allowed = max(1, max_bytes // WINDOW_BYTES)
+    if wanted > allowed:
+        logger.warning(f"{hours:g} h of metrics history needs {wanted * WINDOW_BYTES / 2**20:.1f} MB, "
+                       f"keeping {allowed * window_seconds / 3600:.1f} h")
+    return min(wanted, allowed)
+
+
+def _json_values(values: np.ndarray, decimals: int) -> list:
+    """Rounded floats with None for missing (JSON has no NaN)."""
+    return np.where(np.isnan(values), None, np.round(values.astype(np.float64), decimals)).tolist()
+
+
+class MetricsHistory:
+    """Fixed-size ring of every published window's per-field min, max and mean.
+    
+    Two preallocated arrays hold the whole history, so memory is fixed at
+    capacity * WINDOW_BYTES and appending allocates nothing per window.
+    Fields a window did not sample are NaN. Window end times must increase;
+    if the clock steps back the history is cleared rather than mis-ordered.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        # Field-major, so one field's series is contiguous for range queries
+        self.values = np.full((len(STATS), len(FIELDS), capacity), np.nan, dtype=np.float32)
+        self.count = 0  # windows ever appended
+        self._row = np.empty((len(STATS), len(FIELDS)), dtype=np.float32)
+    
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+    
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+    
+    def append(self, end: float, metrics: dict):
+        """Add a summarized window (before any deadband filtering) ending at end."""
+        if self.count and end <= self.times[(self.count - 1) % self.capacity]:
+            logger.warning("Clock stepped back, clearing the metrics history")
+            self.count = 0
+        row = self._row
+        row.fill(np.nan)
+        for s, stat in enumerate(STATS):
+            block = metrics[stat]
+            for f, field in enumerate(FIELDS):
+                if field in block:
+                    row[s, f] = block[field]
+        i = self.count % self.capacity
+        self.times[i] = end
+        self.values[:, :, i] = row
+        self.count += 1
+    
+    def _segments(self) -> List[slice]:
+        """The ring's slices in time order."""
+        if self.count <= self.capacity:
+            return [slice(0, self.count)]
+        head = self.count % self.capacity
+        return [slice(head, self.capacity), slice(0, head)]
+    
+    def select(self, start: float, end: float, fields: Union[Sequence[int], slice]) -> Tuple[np.ndarray, np.ndarray]:
+        """Window ends (n,) and values (stats, fields, n) in [start, end], oldest first.
+        
+        Views into the ring when the range doesn't wrap and fields is a slice.
+        """
+        times, values = [], []
+        for segment in self._segments():
+            ends = self.times[segment]
+            first = np.searchsorted(ends, start, side="left")
+            last = np.searchsorted(ends, end, side="right")
+            if last > first:
+                rows = slice(segment.start + first, segment.start + last)
+                times.append(self.times[rows])
+                values.append(self.values[:, fields, rows])
+        if not times:
+            return np.empty(0), self.values[:, fields, :0]
+        if len(times) == 1:
+            return times[0], values[0]
+        return np.concatenate(times), np.concatenate(values, axis=2)
+    
+    def query(self, start: Optional[float] = None, end: Optional[float] = None, points: int = 500,
+              method: str = "minmax", fields: Optional[Sequence[str]] = None) -> dict:
+        """Downsample [start, end] (default: everything) to at most points per field.
+        
+        minmax splits the windows into equal-count buckets and returns each
+        bucket's time, min, max and mean, so spikes survive any zoom level.
+        lttb (largest triangle three buckets) keeps, per field, the window
+        mean that best preserves the line's shape; it returns each field's own
+        times.
+        """
+        return downsample(self.snapshot(start, end, points, method, fields))
+    
+    def snapshot(self, start: Optional[float] = None, end: Optional[float] = None, points: int = 500,
+                 method: str = "minmax", fields: Optional[Sequence[str]] = None) -> Selection:
+        """Check query() arguments and copy the range out of the ring (raises ValueError).
+        
+        The copy is safe to downsample() on another thread while windows are
+        appended; lttb copies only the means.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(METHODS)}")
+        if not 3 <= points <= MAX_POINTS:
+            raise ValueError(f"points must be between 3 and {MAX_POINTS}")
+        names = list(fields) if fields else list(FIELDS)
+        unknown = [name for name in names if name not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field {unknown[0]!r}, expected one of {', '.join(FIELDS)}")
+        columns = [FIELDS.index(name) for name in names]
+        if columns == list(range(len(FIELDS))):
+            columns = slice(None)  # Every field: no copy before the one below
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        if end < start:
+            raise ValueError("end must not be before start")
+        
+        times, values = self.select(start, end, columns)
+        if method == "lttb":
+            values = values[STATS.index("mean"):STATS.index("mean") + 1]
+        return Selection(method, points, names, np.array(times), np.array(values))
+
+
+def downsample(selection: Selection) -> dict:
+    """The query() result for a snapshot(); pure NumPy, fine off the event loop."""
+    times, values, names = selection.times, selection.values, selection.names
+    result = {"method": selection.method, "windows": len(times)}
+    if selection.method == "minmax":
+        result.update(_minmax(times, values, selection.points, names))
+    else:
+        # values holds only the means
+        result["fields"] = {
+            name: _lttb(times, values[0, i], selection.points, DECIMALS[name])
+            for i, name in enumerate(names)
+        }
+    return result
+
+
+def _bucket_edges(count: int, buckets: int) -> np.ndarray:
+    """Start index of each of up to buckets equal-count, non-empty buckets."""
+    return np.unique(np.linspace(0, count, min(buckets, count) + 1).astype(np.int64)[:-1])
+
+
+def _minmax(times: np.ndarray, values: np.ndarray, points: int, names: List[str]) -> dict:
+    if not len(times):
+        return {"time": [], "fields": {name: {stat: [] for stat in STATS} for name in names}}
+    edges = _bucket_edges(len(times), points)
+    sizes = np.diff(np.append(edges, len(times)))
+    low = np.fmin.reduceat(values[0], edges, axis=1)  # fmin/fmax skip NaN
+    high = np.fmax.reduceat(values[1], edges, axis=1)
+    means = values[2]
+    present = ~np.isnan(means)
+    if present.all():
+        mean = np.add.reduceat(means, edges, axis=1, dtype=np.float64) / sizes
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (np.add.reduceat(np.where(present, means, 0), edges, axis=1, dtype=np.float64)
+                    / np.add.reduceat(present, edges, axis=1))
+    bucket_time = np.add.reduceat(times, edges) / sizes
+    return {
+        "time": np.round(bucket_time, 3).tolist(),
+        "fields": {
+            name: {
+                "min": _json_values(low[i], DECIMALS[name]),
+                "max": _json_values(high[i], DECIMALS[name]),
+                "mean": _json_values(mean[i], DECIMALS[name]),
+            }
+            for i, name in enumerate(names)
+        },
+    }
+
+
+def _lttb(times: np.ndarray, values: np.ndarray, points: int, decimals: int) -> Dict[str, list]:
+    """Largest triangle three buckets over one field, vectorised across buckets.
+    
+    The first and last windows are always kept; the rest are split into
+    points - 2 buckets and each keeps the window forming the largest
+    triangle with the neighbouring buckets. The original algorithm anchors
+    each triangle on the point picked in the previous bucket, which makes
+    the buckets a sequential loop; here both neighbours are represented by
+    their averages, so every bucket is chosen at once.
+    """
+    keep = ~np.isnan(values)
+    if not keep.all():
+        times, values = times[keep], values[keep]
+    if len(times) <= points:
+        return {"time": np.round(times, 3).tolist(), "value": _json_values(values, decimals)}
+    
+    x = times[1:-1] - times[0]  # Relative, so the products below keep their precision
+    y = values[1:-1].astype(np.float64)
+    edges = _bucket_edges(len(x), points - 2)
+    sizes = np.diff(np.append(edges, len(x)))
+    average_x = np.add.reduceat(x, edges) / sizes
+    average_y = np.add.reduceat(y, edges) / sizes
+    # Neighbours of each bucket: the averages of the buckets either side, the end points at the ends
+    previous_x = np.concatenate(([0.0], average_x[:-1]))
+    previous_y = np.concatenate(([values[0]], average_y[:-1]))
+    next_x = np.concatenate((average_x[1:], [times[-1] - times[0]]))
+    next_y = np.concatenate((average_y[1:], [values[-1]]))
+    
+    # Twice the triangle's area, (px - nx)(y - py) - (px - x)(ny - py), as a*y + b*x + c per bucket
+    a = previous_x - next_x
+    b = next_y - previous_y
+    c = -a * previous_y - previous_x * b
+    area = np.abs(np.repeat(a, sizes) * y + np.repeat(b, sizes) * x + np.repeat(c, sizes))
+    largest = np.maximum.reduceat(area, edges)
+    # First window of each bucket reaching its bucket's largest area (candidates come in bucket order)
+    candidates = np.flatnonzero(area == np.repeat(largest, sizes))
+    bucket = np.searchsorted(edges, candidates, side="right")
+    first = candidates[np.flatnonzero(np.diff(bucket, prepend=0))]
+    chosen = np.concatenate(([0], first + 1, [len(times) - 1]))
+    return {"time": np.round(times[chosen], 3).tolist(), "value": _json_values(values[chosen], decimals)}
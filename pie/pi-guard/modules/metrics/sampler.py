@@ -0,0 +1,213 @@
+"""Sense HAT sampling at per-channel rates into preallocated windows."""
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from core.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+# One Sense HAT read: the method to call, the payload fields it fills, the keys
+# of the dict it returns (None for a single number) and the decimals to publish
+Channel = namedtuple("Channel", ["method", "fields", "keys", "decimals"])
+
+CHANNELS = {
+    "temp_humidity": Channel("get_temperature_from_humidity", ("temp_humidity",), None, 1),
+    "temp_pressure": Channel("get_temperature_from_pressure", ("temp_pressure",), None, 1),
+    "humidity": Channel("get_humidity", ("humidity",), None, 1),
+    "pressure": Channel("get_pressure", ("pressure",), None, 2),
+    "orientation": Channel("get_orientation", ("pitch", "roll", "yaw"), ("pitch", "roll", "yaw"), 1),
+    "accel": Channel("get_accelerometer_raw", ("accel_x", "accel_y", "accel_z"), ("x", "y", "z"), 2),
+}
+
+SENSOR_READ_SECONDS = registry.histogram(
+    "pi_guard_sensor_read_seconds", "Sense HAT read duration by channel", ("channel",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+SENSOR_READ_ERRORS = registry.counter(
+    "pi_guard_sensor_read_errors_total", "Failed Sense HAT reads by channel", ("channel",)
+)
+
+
+def parse_channel_values(spec: str, what: str) -> Dict[str, float]:
+    """Parse "channel=value,..." into a non-negative number per channel."""
+    values = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in CHANNELS:
+            raise ValueError(f"Unknown Sense HAT channel {name!r}, expected one of {', '.join(CHANNELS)}")
+        values[name] = float(value)
+        if values[name] < 0:
+            raise ValueError(f"Negative {what} for {name}")
+    return values
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """Parse "channel=hz,..." into a rate per channel; 0 disables a channel."""
+    return parse_channel_values(spec, "sample rate")
+
+
+def read_channel(sense, name: str) -> Tuple[float, ...]:
+    """Read one channel from the Sense HAT (blocking I2C)."""
+    channel = CHANNELS[name]
+    reading = getattr(sense, channel.method)()
+    if channel.keys is None:
+        return (reading,)
+    return tuple(reading[key] for key in channel.keys)
+
+
+class ChannelWindow:
+    """Preallocated samples of one channel for one publish window.
+    
+    Sized for twice the expected samples; if a publish is late enough to fill
+    it, the oldest samples are overwritten.
+    """
+    
+    def __init__(self, fields: int, capacity: int):
+        self.values = np.empty((capacity, fields), dtype=np.float64)
+        self.count = 0
+        self.newest = 0.0  # Unix time of the latest sample
+    
+    def add(self, reading: Tuple[float, ...], at: float = 0.0):
+        self.values[self.count % len(self.values)] = reading
+        self.newest = at
+        self.count += 1
+    
+    def reset(self):
+        self.count = 0
+        self.newest = 0.0
+    
+    def stats(self) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Per-field (min, max, mean, last), None without samples."""
+        if not self.count:
+            return None
+        values = self.values[:min(self.count, len(self.values))]
+        last = self.values[(self.count - 1) % len(self.values)]
+        return values.min(axis=0), values.max(axis=0), values.mean(axis=0), last
+
+
+def newest_reading(windows: Dict[str, ChannelWindow]) -> Optional[float]:
+    """Unix time of the latest sample in a finished window, None without samples."""
+    return max((window.newest for window in windows.values() if window.count), default=None)
+
+
+def summarize(windows: Dict[str, ChannelWindow], last: Dict[str, float]) -> dict:
+    """Build one metrics payload from a finished window.
+    
+    The top-level fields keep the flat schema of the per-sample messages and
+    carry each field's latest value (held over from earlier windows for slow
+    channels); "min", "max", "mean" and "count" describe this window.
+    """
+    stats = {"min": {}, "max": {}, "mean": {}, "count": {}}
+    for name, window in windows.items():
+        channel = CHANNELS[name]
+        result = window.stats()
+        if result is None:
+            continue
+        low, high, mean, latest = result
+        for i, field in enumerate(channel.fields):
+            last[field] = round(float(latest[i]), channel.decimals)
+            stats["min"][field] = round(float(low[i]), channel.decimals)
+            stats["max"][field] = round(float(high[i]), channel.decimals)
+            stats["mean"][field] = round(float(mean[i]), channel.decimals)
+            stats["count"][field] = window.count
+    payload = {
+        field: last[field]
+        for channel in CHANNELS.values()
+        for field in channel.fields
+        if field in last
+    }
+    payload.update(stats)
+    return payload
+
+
+class SensorSampler(threading.Thread):
+    """Thread owning the Sense HAT, reading each channel at its own rate.
+    
+    Samples go into one of two sets of preallocated windows; swap() hands the
+    filled set to the caller for aggregation and continues into the other, so
+    sampling never waits on publishing.
+    """
+    
+    def __init__(self, sense_factory: Callable, rates: Dict[str, float], window_seconds: float):
+        super().__init__(name="sense-hat", daemon=True)
+        self.sense_factory = sense_factory
+        self.rates = {name: rate for name, rate in rates.items() if rate > 0}
+        self._windows = [
+            {
+                name: ChannelWindow(len(CHANNELS[name].fields), math.ceil(rate * window_seconds * 2) + 2)
+                for name, rate in self.rates.items()
+            }
+            for _ in range(2)
+        ]
+        self._active = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.sense = None
+        self.error: Optional[str] = None
+        self.read_count = 0
+        self.read_errors = 0
+        self.window_start = time.time()
+        self.rate_scale = 1.0  # Multiplies every channel's rate, lowered to shed load
+    
+    def run(self):
+        try:
+            self.sense = self.sense_factory()
+            self.sense.set_imu_config(True, True, True)  # Enable gyroscope, accelerometer, magnetometer
+            logger.info("Sense HAT initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize Sense HAT: {e}")
+            self.sense = None
+            self.error = str(e)
+            return
+        
+        names = list(self.rates)
+        periods = [1 / self.rates[name] for name in names]
+        read_seconds = [SENSOR_READ_SECONDS.labels(name) for name in names]
+        read_errors = [SENSOR_READ_ERRORS.labels(name) for name in names]
+        due = [time.monotonic()] * len(names)
+        failing = False
+        while names and not self._stop_event.is_set():
+            i = min(range(len(names)), key=due.__getitem__)
+            delay = due[i] - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            started = time.perf_counter()
+            try:
+                reading = read_channel(self.sense, names[i])
+            except Exception as e:
+                self.read_errors += 1
+                read_errors[i].inc()
+                if not failing:
+                    logger.error(f"Error reading Sense HAT {names[i]}: {e}")
+                failing = True
+            else:
+                read_seconds[i].observe(time.perf_counter() - started)
+                with self._lock:
+                    self._windows[self._active][names[i]].add(reading, time.time())
+                self.read_count += 1
+                failing = False
+            # A read that overran its slot delays the channel instead of bursting to catch up
+            due[i] = max(due[i] + periods[i] / self.rate_scale, time.monotonic())
+    
+    def swap(self) -> Tuple[float, float, Dict[str, ChannelWindow]]:
+        """Finish the current window: returns (start, end, windows by channel)."""
+        with self._lock:
+            finished = self._windows[self._active]
+            self._active ^= 1
+            for window in self._windows[self._active].values():
+                window.reset()
+            start = self.window_start
+            self.window_start = time.time()
+        return start, self.window_start, finished
+    
+    def stop(self):
+        self._stop_event.set()
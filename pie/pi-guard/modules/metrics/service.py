@@ -3,66 +3,120 @@ import json
 import logging
 import asyncio
 import signal
-from typing import Optional
-from sense_hat import SenseHat
-import paho.mqtt.client as mqtt
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Set
 
 from config import settings
+from core.telemetry import registry
+from modules.metrics.codec import MetricsEncoder, schema
+from modules.metrics.spool import MetricsSpool
+
+if TYPE_CHECKING:
+    # Imported by start(): sense_hat only exists on a Pi, and the rest load NumPy
+    from modules.metrics.deadband import DeadbandFilter
+    from modules.metrics.history import MetricsHistory
+    from modules.metrics.sampler import SensorSampler
 
 logger = logging.getLogger(__name__)
 
+WINDOWS = registry.counter(
+    "pi_guard_metrics_windows_total", "Metrics windows by outcome: published, suppressed or undelivered",
+    ("outcome",)
+)
+DELIVERY_SECONDS = registry.histogram(
+    "pi_guard_metrics_delivery_seconds", "Time from publishing a window to its last acknowledgement"
+)
+STAGE_SECONDS = registry.histogram(
+    "pi_guard_metrics_stage_seconds",
+    "Time a window spends on the Pi: window (newest reading to the window closing) or publish (closing to MQTT)",
+    ("stage",)
+)
+SPOOLED = registry.gauge("pi_guard_metrics_spooled", "Windows in the spool awaiting acknowledgement")
+SPOOL_DROPPED = registry.gauge("pi_guard_metrics_spool_dropped", "Windows dropped from the full spool since it opened")
+REPLAYED = registry.counter("pi_guard_metrics_replayed_total", "Spooled windows published again")
+
 
 class MetricsService:
     """Service for collecting and publishing Sense HAT metrics to MQTT."""
     
-    def __init__(self):
-        self.sense: Optional[SenseHat] = None
-        self.mqtt_client: Optional[mqtt.Client] = None
+    def __init__(self, mqtt_service):
+        self.mqtt = mqtt_service
+        self.mqtt.add_connect_listener(self._on_mqtt_connect)
+        self.sampler: Optional["SensorSampler"] = None
         self._running = False
         self._publish_task: Optional[asyncio.Task] = None
         self._shutdown_event = asyncio.Event()
-        self._reconnect_delay = 1  # Initial reconnect delay in seconds
-        self._max_reconnect_delay = 60  # Maximum reconnect delay
-        self._reconnecting = False
+        self._last_values: Dict[str, float] = {}  # held over for channels slower than a window
+        self.deadband: Optional["DeadbandFilter"] = None
+        self.windows_published = 0
+        self._window_listeners: List[Callable[[dict], None]] = []
+        # Every window, including those the deadband holds back, for charts on the LAN (allocated on start)
+        self.history: Optional["MetricsHistory"] = None
+        # Payload formats, each on its own topic: JSON on MQTT_METRICS_TOPIC, binary on its /bin suffix
+        self.formats = {name.strip() for name in settings.METRICS_FORMATS.split(",") if name.strip()}
+        self.encoder = MetricsEncoder(settings.METRICS_DELTA, settings.METRICS_KEYFRAME_INTERVAL)
+        # Store-and-forward: windows are spooled before publishing and deleted once acknowledged
+        self.spool: Optional[MetricsSpool] = None
+        self._next_seq = 1  # used without a spool
+        self._pending: Set[int] = set()  # seqs with a publish awaiting PUBACK
+        self._acked: Set[int] = set()  # seqs acknowledged but not yet deleted from the spool
+        self._deliveries: Set[asyncio.Task] = set()
+        self._replay_task: Optional[asyncio.Task] = None
+        self._replay_after = 0  # highest seq handed to the replay
+        self.replayed = 0
+        SPOOLED.set_function(lambda: self.spool.count if self.spool else 0)
+        SPOOL_DROPPED.set_function(lambda: self.spool.dropped if self.spool else 0)
     
     def start(self):
-        """Start the metrics service."""
+        """Start the metrics service.
+        
+        Returns without waiting on hardware or the network: the Sense HAT is
+        initialised and sampled on its own thread, and windows go out on the
+        shared MQTT connection whenever it is up. The Sense HAT library and
+        NumPy are imported here rather than with the module, so a Pi running
+        with METRICS_ENABLED=false never loads them. METRICS_SOURCE picks the
+        Sense HAT, a synthetic one or a recorded trace (modules/metrics/sources.py).
+        """
         if self._running:
             logger.warning("Metrics service is already running")
             return
+        if not settings.METRICS_ENABLED:
+            logger.info("Metrics disabled (METRICS_ENABLED=false)")
+            return
         
         logger.info("Starting metrics service...")
         
-        # Initialize Sense HAT
-        try:
-            self.sense = SenseHat()
-            self.sense.set_imu_config(True, True, True)  # Enable gyroscope, accelerometer, magnetometer
-            logger.info("Sense HAT initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Sense HAT: {e}")
-            raise
-        
-        # Initialize MQTT client with WebSocket transport
         try:
-            self.mqtt_client = mqtt.Client(transport="websockets")
-            self.mqtt_client.on_connect = self._on_connect
-            self.mqtt_client.on_disconnect = self._on_disconnect
+            from modules.metrics.deadband import DeadbandFilter
+            from modules.metrics.history import MetricsHistory, history_capacity
+            from modules.metrics.sampler import SensorSampler, parse_channel_values, parse_rates
+            from modules.metrics.sources import sensor_source
             
-            logger.info(f"Connecting to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT}...")
-            self.mqtt_client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            
-            # Wait a moment for connection to establish
-            import time
-            time.sleep(1)
-            
-            if not self.mqtt_client.is_connected():
-                logger.error("Failed to establish MQTT connection")
-                raise ConnectionError("Failed to establish MQTT connection")
+            # The Sense HAT itself, or a synthetic or recorded one for running off the Pi
+            sense_factory = sensor_source(
+                settings.METRICS_SOURCE, settings.METRICS_SOURCE_TRACE,
+                settings.METRICS_SOURCE_SPEED, settings.METRICS_SOURCE_LATENCY
+            )
             
             self._running = True
+            if self.history is None:
+                self.history = MetricsHistory(history_capacity(
+                    settings.METRICS_HISTORY_HOURS, settings.METRICS_PUBLISH_INTERVAL,
+                    int(settings.METRICS_HISTORY_MAX_MB * 1024 * 1024)
+                ))
             self._shutdown_event.clear()
             
+            # Sampling rates are independent of the publish interval, which only sets the window length
+            self.sampler = SensorSampler(
+                sense_factory, parse_rates(settings.METRICS_SAMPLE_RATES), settings.METRICS_PUBLISH_INTERVAL
+            )
+            self.sampler.start()
+            self.deadband = DeadbandFilter(
+                parse_channel_values(settings.METRICS_DEADBAND, "deadband"),
+                parse_channel_values(settings.METRICS_RATE_OF_CHANGE, "rate of change"),
+                settings.METRICS_HEARTBEAT_INTERVAL,
+            )
+            
             # Start async publishing task
             loop = asyncio.get_event_loop()
             self._publish_task = loop.create_task(self._publish_metrics_loop())
@@ -82,147 +136,257 @@ class MetricsService:
         self._running = False
         self._shutdown_event.set()
         
-        # Cancel publish task
+        # Cancel publish, replay and delivery tasks
         if self._publish_task and not self._publish_task.done():
             self._publish_task.cancel()
+        if self._replay_task and not self._replay_task.done():
+            self._replay_task.cancel()
+        for task in self._deliveries:
+            task.cancel()
         
-        # Disconnect MQTT
-        if self.mqtt_client:
-            try:
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
-            except Exception as e:
-                logger.error(f"Error disconnecting MQTT client: {e}")
-            finally:
-                self.mqtt_client = None
+        # A read in progress finishes on its own, nothing waits for it
+        if self.sampler:
+            self.sampler.stop()
+        
+        # Whatever is still unacknowledged stays spooled for the next start
+        if self.spool:
+            self.spool.close()
+            self.spool = None
+        self._pending.clear()
+        self._acked.clear()
         
         logger.info("Metrics service stopped")
     
-    def _on_connect(self, client, userdata, flags, rc):
-        """Callback when MQTT client connects."""
-        if rc == 0:
-            logger.info(f"Connected to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT}")
-            self._reconnect_delay = 1  # Reset reconnect delay on successful connection
-            self._reconnecting = False
-        else:
-            logger.error(f"Failed to connect to MQTT broker, return code: {rc}")
-    
-    def _on_disconnect(self, client, userdata, rc):
-        """Callback when MQTT client disconnects."""
-        if rc != 0:
-            logger.warning(f"Unexpected MQTT disconnection, return code: {rc}")
-            # Trigger reconnection if service is still running
-            if self._running and not self._shutdown_event.is_set():
-                self._reconnecting = True
-                # Start reconnection task
-                loop = asyncio.get_event_loop()
-                loop.create_task(self._reconnect_mqtt())
-    
-    async def _reconnect_mqtt(self):
-        """Reconnect to MQTT broker with exponential backoff."""
-        if not self._running or self._shutdown_event.is_set():
+    def set_sampling_scale(self, scale: float):
+        """Sample every channel at scale times its METRICS_SAMPLE_RATES rate (1 for the configured rates)."""
+        if not 0 < scale <= 1:
+            raise ValueError("Sampling scale must be in (0, 1]")
+        if self.sampler:
+            self.sampler.rate_scale = scale
+            logger.info(f"Sensor sampling at {scale:g}x the configured rates")
+    
+    def add_window_listener(self, callback: Callable[[dict], None]):
+        """Call callback on the event loop with every window (with its "time"), before the deadband."""
+        self._window_listeners.append(callback)
+    
+    def _on_mqtt_connect(self):
+        """Called by the MQTT service after every (re)connect."""
+        if not self._running:
             return
+        if self.deadband:
+            self.deadband.force_heartbeat()  # Subscribers may have missed changes while we were away
+        if "binary" in self.formats:
+            # Retained, so binary subscribers can always look up the layout
+            self._deliver(None, [self.mqtt.publish(settings.MQTT_METRICS_SCHEMA_TOPIC, json.dumps(schema()), 1, True)])
+            self.encoder.reset()  # Frames sent before the drop may be lost, start from a keyframe
+    
+    async def _publish_metrics_loop(self):
+        """Async loop for publishing metrics.
         
+        Every METRICS_PUBLISH_INTERVAL the sampler's window is swapped out and
+        published as one message of per-field min/max/mean/last, leaving out
+        channels that stayed inside their deadband (a window where nothing
+        moved is not published). Windows are scheduled on a fixed period.
+        """
+        from modules.metrics.sampler import newest_reading, summarize
+        
+        window_seconds = STAGE_SECONDS.labels("window")
+        publish_seconds = STAGE_SECONDS.labels("publish")
+        
+        if settings.METRICS_SPOOL_PATH:
+            spool = MetricsSpool(settings.METRICS_SPOOL_PATH, int(settings.METRICS_SPOOL_MAX_MB * 1024 * 1024))
+            try:
+                await asyncio.to_thread(spool.open)
+                self.spool = spool
+                self._replay_task = asyncio.create_task(self._replay_loop())
+            except Exception as e:
+                logger.error(f"Failed to open metrics spool {settings.METRICS_SPOOL_PATH}, not spooling: {e}")
+        
+        loop = asyncio.get_running_loop()
+        next_window = loop.time()
         while self._running and not self._shutdown_event.is_set():
+            # Wait for the end of the window or shutdown event
+            next_window += settings.METRICS_PUBLISH_INTERVAL
+            delay = next_window - loop.time()
+            if delay < 0:
+                next_window = loop.time()
+                delay = 0
             try:
-                if self.mqtt_client and self.mqtt_client.is_connected():
-                    self._reconnecting = False
-                    return
-                
-                logger.info(f"Attempting to reconnect to MQTT broker (delay: {self._reconnect_delay}s)...")
-                await asyncio.sleep(self._reconnect_delay)
-                
-                if self.mqtt_client:
-                    try:
-                        self.mqtt_client.reconnect()
-                        # Wait a moment for connection to establish
-                        await asyncio.sleep(1)
-                        if self.mqtt_client.is_connected():
-                            logger.info("Successfully reconnected to MQTT broker")
-                            self._reconnect_delay = 1  # Reset delay on success
-                            self._reconnecting = False
-                            return
-                    except Exception as e:
-                        logger.warning(f"Reconnection attempt failed: {e}")
-                
-                # Exponential backoff
-                self._reconnect_delay = min(self._reconnect_delay * 2, self._max_reconnect_delay)
-                
+                await asyncio.wait_for(
+                    self._shutdown_event.wait(),
+                    timeout=delay
+                )
+                break  # Shutdown event was set
+            except asyncio.TimeoutError:
+                pass  # Timeout is expected, the window is complete
+            
+            try:
+                _, end, windows = self.sampler.swap()
+                metrics = summarize(windows, self._last_values)
+                if not metrics["count"]:
+                    continue  # Sense HAT not sampling (yet)
+                self.history.append(end, metrics)
+                if self._window_listeners:
+                    window = {"time": round(end, 3), **metrics}
+                    for listener in self._window_listeners:
+                        try:
+                            listener(window)
+                        except Exception as e:
+                            logger.error(f"Error in metrics window listener: {e}")
+                metrics = self.deadband.filter(metrics, end)
+                if metrics is None:
+                    WINDOWS.labels("suppressed").inc()
+                    continue  # Nothing moved past its deadband
+                # Sequence numbers let consumers de-duplicate live and replayed messages and
+                # count gaps; "captured" (the newest reading) and "sent" time the way to them
+                seq = self._reserve_seq()
+                captured = newest_reading(windows)
+                metrics = {"seq": seq, "time": round(end, 4), "captured": round(captured, 4), **metrics}
+                window_seconds.observe(end - captured)
+                if self.spool:
+                    self._pending.add(seq)  # Keep the replay loop off it until it's published
+                    await asyncio.to_thread(self.spool.append, seq, json.dumps(metrics))
+                if self.mqtt.is_connected():
+                    # Only live messages carry "sent": a replayed one goes out later than that
+                    sent = time.time()
+                    metrics["sent"] = round(sent, 4)
+                    publish_seconds.observe(sent - end)
+                    self._publish_window(seq, metrics, json.dumps(metrics))
+                else:
+                    self._pending.discard(seq)
+                    WINDOWS.labels("undelivered").inc()
+                    logger.debug("MQTT client not connected, spooled metrics" if self.spool else
+                                 "MQTT client not connected, skipping publish")
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logger.error(f"Error during MQTT reconnection: {e}")
-                await asyncio.sleep(self._reconnect_delay)
+                logger.error(f"Error publishing metrics: {e}")
     
-    def _get_sensor_metrics(self) -> Optional[dict]:
-        """Read all sensor metrics from Sense HAT."""
-        try:
-            metrics = {
-                "temp_humidity": round(self.sense.get_temperature_from_humidity(), 1),
-                "temp_pressure": round(self.sense.get_temperature_from_pressure(), 1),
-                "humidity": round(self.sense.get_humidity(), 1),
-                "pressure": round(self.sense.get_pressure(), 2),
-            }
-            
-            # Get orientation (pitch, roll, yaw)
-            orientation = self.sense.get_orientation()
-            metrics["pitch"] = round(orientation["pitch"], 1)
-            metrics["roll"] = round(orientation["roll"], 1)
-            metrics["yaw"] = round(orientation["yaw"], 1)
-            
-            # Get acceleration
-            acceleration = self.sense.get_accelerometer_raw()
-            metrics["accel_x"] = round(acceleration["x"], 2)
-            metrics["accel_y"] = round(acceleration["y"], 2)
-            metrics["accel_z"] = round(acceleration["z"], 2)
-            
-            logger.debug(f"Collected metrics: {metrics}")
-            return metrics
-        except Exception as e:
-            logger.error(f"Error reading sensor metrics: {e}")
-            return None
+    def _reserve_seq(self) -> int:
+        if self.spool:
+            return self.spool.reserve()
+        seq, self._next_seq = self._next_seq, self._next_seq + 1
+        return seq
     
-    async def _publish_metrics_loop(self):
-        """Async loop for publishing metrics."""
+    def _publish_window(self, seq: int, metrics: dict, payload: str):
+        """Publish one window in each configured format.
+        
+        At MQTT_QOS, 1 by default, so a spooled window is deleted once the broker acknowledges it.
+        """
+        qos = settings.MQTT_QOS
+        publishes = []
+        if "json" in self.formats:
+            publishes.append(self.mqtt.publish(settings.MQTT_METRICS_TOPIC, payload, qos))
+        if "binary" in self.formats:
+            # Encoded now, in window order, even though the publish is awaited later
+            publishes.append(self._publish_binary(self.encoder.encode(metrics), qos))
+        self._deliver(seq, publishes)
+    
+    async def _publish_binary(self, frame: bytes, qos: int) -> bool:
+        published = await self.mqtt.publish(settings.MQTT_METRICS_BINARY_TOPIC, frame, qos)
+        if not published:
+            self.encoder.reset()  # The next frame can't be a delta against this one
+        return published
+    
+    def _deliver(self, seq: Optional[int], publishes: list):
+        """Await a window's publishes in the background and note whether all went through."""
+        task = asyncio.create_task(self._await_delivery(seq, publishes))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+    
+    async def _await_delivery(self, seq: Optional[int], publishes: list):
+        started = time.perf_counter()
+        delivered = all(await asyncio.gather(*publishes))
+        if seq is None:
+            return
+        self._pending.discard(seq)
+        WINDOWS.labels("published" if delivered else "undelivered").inc()
+        if delivered:
+            DELIVERY_SECONDS.observe(time.perf_counter() - started)
+            self.windows_published += 1
+            if self.spool:
+                self._acked.add(seq)
+        elif self.spool:
+            self._replay_after = min(self._replay_after, seq - 1)  # Not delivered, replay it
+    
+    async def _replay_loop(self):
+        """Replay spooled windows after an outage and forget acknowledged ones.
+        
+        Replayed windows go out in sequence order as JSON on
+        MQTT_METRICS_REPLAY_TOPIC, so live subscribers never mistake them for
+        current readings. They are paced to METRICS_REPLAY_RATE with a bounded
+        number in flight, leaving the connection to the live windows.
+        """
+        tick = 0.1
+        budget = 0.0
         while self._running and not self._shutdown_event.is_set():
+            await asyncio.sleep(tick)
             try:
-                # Check connection and attempt reconnection if needed
-                if self.mqtt_client and not self.mqtt_client.is_connected() and not self._reconnecting:
-                    logger.warning("MQTT client disconnected, attempting reconnection...")
-                    self._reconnecting = True
-                    asyncio.create_task(self._reconnect_mqtt())
+                if self._acked:
+                    acked, self._acked = self._acked, set()
+                    await asyncio.to_thread(self.spool.delete, acked)
+                if not self.mqtt.is_connected():
+                    continue
                 
-                metrics = self._get_sensor_metrics()
-                if metrics and self.mqtt_client and self.mqtt_client.is_connected():
-                    payload = json.dumps(metrics)
-                    result = self.mqtt_client.publish(settings.MQTT_METRICS_TOPIC, payload)
-                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                        logger.debug(f"Published metrics: {metrics}")
-                    else:
-                        logger.warning(f"Failed to publish metrics, return code: {result.rc}")
-                elif not self.mqtt_client or not self.mqtt_client.is_connected():
-                    logger.debug("MQTT client not connected, skipping publish")
+                # Token bucket holding at most one tick's worth, so bursts never exceed the rate
+                refill = settings.METRICS_REPLAY_RATE * tick
+                budget = min(budget + refill, max(refill, 1))
+                room = min(int(budget), settings.METRICS_REPLAY_INFLIGHT - len(self._pending))
+                busy = len(self._pending) + len(self._acked)
+                if room <= 0 or self.spool.count <= busy:
+                    continue
+                rows = await asyncio.to_thread(self.spool.read, self._replay_after, room + busy)
+                for seq, payload in rows:
+                    if room <= 0:
+                        break
+                    self._replay_after = seq
+                    if seq in self._pending or seq in self._acked:
+                        continue  # Live publish in flight
+                    self._pending.add(seq)
+                    self._deliver(seq, [self.mqtt.publish(settings.MQTT_METRICS_REPLAY_TOPIC, payload, settings.MQTT_QOS)])
+                    self.replayed += 1
+                    REPLAYED.inc()
+                    budget -= 1
+                    room -= 1
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logger.error(f"Error publishing metrics: {e}")
-            
-            # Wait for interval or shutdown event
-            try:
-                await asyncio.wait_for(
-                    self._shutdown_event.wait(),
-                    timeout=settings.METRICS_PUBLISH_INTERVAL
-                )
-                break  # Shutdown event was set
-            except asyncio.TimeoutError:
-                continue  # Timeout is expected, continue loop
+                logger.error(f"Error replaying spooled metrics: {e}")
+    
+    async def get_history(self, start: Optional[float], end: Optional[float], points: int, method: str,
+                          fields: Optional[Sequence[str]]) -> dict:
+        """Downsampled history of [start, end] (Unix seconds); raises ValueError for bad arguments.
+        
+        Raises RuntimeError if the service never started, so there is no history.
+        """
+        if self.history is None:
+            raise RuntimeError("metrics history unavailable, the metrics service is not running")
+        from modules.metrics.history import downsample  # Loaded with the history in start()
+        
+        # Copied here, as appends overwrite the ring; downsampling 72 h takes too long for the loop
+        selection = self.history.snapshot(start, end, points, method, fields)
+        return await asyncio.to_thread(downsample, selection)
     
     async def get_status(self) -> dict:
         """Get the current status of the metrics service."""
         return {
             "status": "running" if self._running else "stopped",
-            "mqtt_connected": self.mqtt_client.is_connected() if self.mqtt_client else False,
-            "sense_hat_initialized": self.sense is not None,
+            "mqtt_connected": self.mqtt.is_connected(),
+            "sense_hat_initialized": bool(self.sampler and self.sampler.sense is not None),
+            "sensor_error": self.sampler.error if self.sampler else None,
+            "sensor_reads": self.sampler.read_count if self.sampler else 0,
+            "sensor_read_errors": self.sampler.read_errors if self.sampler else 0,
+            "sample_rates": self.sampler.rates if self.sampler else {},
+            "sample_rate_scale": self.sampler.rate_scale if self.sampler else 1.0,
+            "windows_published": self.windows_published,
+            "formats": sorted(self.formats),
+            "windows_suppressed": self.deadband.suppressed if self.deadband else 0,
+            "heartbeats": self.deadband.heartbeats if self.deadband else 0,
+            "spooled": self.spool.count if self.spool else None,
+            "spool_dropped": self.spool.dropped if self.spool else None,
+            "replayed": self.replayed,
+            "history_windows": len(self.history) if self.history is not None else 0,
+            "history_mb": round(self.history.nbytes / 2**20, 1) if self.history is not None else 0.0,
         }
     
     def is_running(self) -> bool:
@@ -0,0 +1,204 @@
+"""Sensor sources for the metrics service: the Sense HAT, a synthetic one or a recorded trace.
+
+Each source is a Sense HAT look-alike, so SensorSampler reads them all the
+same way. The synthetic and replay sources let the metrics pipeline run and
+be profiled on a machine without the hardware.
+"""
+import bisect
+import csv
+import math
+import struct
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from modules.metrics.sampler import CHANNELS, read_channel
+
+SOURCES = ("sense_hat", "synthetic", "replay")
+
+# Every field of every channel, in the order traces store them
+FIELDS = tuple(field for channel in CHANNELS.values() for field in channel.fields)
+
+# Binary traces: magic, then one little-endian float64 time and value per field per
+# row; fields a row didn't read are NaN
+TRACE_MAGIC = b"PGTRACE1"
+_ROW = struct.Struct(f"<{1 + len(FIELDS)}d")
+
+# One reading of all fields at a time (seconds), NaN for fields not read then
+TraceRow = Tuple[float, Tuple[float, ...]]
+
+
+class SyntheticSenseHat:
+    """Sense HAT stand-in returning plausible readings that drift and wobble.
+    
+    Each read takes latency seconds, like an I2C transfer on the Pi.
+    """
+    
+    def __init__(self, latency: float = 0.001):
+        self.latency = latency
+        self.started = time.monotonic()
+    
+    def _wait(self) -> float:
+        if self.latency:
+            time.sleep(self.latency)
+        return time.monotonic() - self.started
+    
+    def set_imu_config(self, compass: bool, gyro: bool, accel: bool):
+        pass
+    
+    def get_temperature_from_humidity(self) -> float:
+        return 24.0 + 0.5 * math.sin(self._wait() / 60)
+    
+    def get_temperature_from_pressure(self) -> float:
+        return 23.6 + 0.5 * math.sin(self._wait() / 60)
+    
+    def get_humidity(self) -> float:
+        return 41.0 + 2 * math.sin(self._wait() / 90)
+    
+    def get_pressure(self) -> float:
+        return 1013.25 + 0.3 * math.sin(self._wait() / 300)
+    
+    def get_orientation(self) -> Dict[str, float]:
+        t = self._wait()
+        return {"pitch": 2 * math.sin(t * 3), "roll": 1.5 * math.cos(t * 2.3), "yaw": (t * 7) % 360}
+    
+    def get_accelerometer_raw(self) -> Dict[str, float]:
+        t = self._wait()
+        return {"x": 0.05 * math.sin(t * 11), "y": 0.04 * math.cos(t * 13), "z": 1 + 0.02 * math.sin(t * 17)}
+
+
+class ReplaySenseHat:
+    """Sense HAT stand-in answering from a recorded trace, looped.
+    
+    At speed > 0 a read returns the channel's latest recorded reading at the
+    trace time elapsed since the first read, times speed. At speed 0 every
+    read returns the channel's next recorded reading, however fast they come.
+    """
+    
+    def __init__(self, rows: Sequence[TraceRow], speed: float = 1.0):
+        if speed < 0:
+            raise ValueError("Replay speed can't be negative")
+        self.speed = speed
+        self.readings: Dict[str, Tuple[List[float], List[Tuple[float, ...]]]] = {}
+        for name, channel in CHANNELS.items():
+            indexes = [FIELDS.index(field) for field in channel.fields]
+            times, values = [], []
+            for at, row in rows:
+                reading = tuple(row[i] for i in indexes)
+                if not any(math.isnan(value) for value in reading):
+                    times.append(at)
+                    values.append(reading)
+            self.readings[name] = (times, values)
+        if not any(times for times, _ in self.readings.values()):
+            raise ValueError("Sensor trace has no readings")
+        self.first = min(times[0] for times, _ in self.readings.values() if times)
+        self.duration = max(times[-1] for times, _ in self.readings.values() if times) - self.first
+        self.started = None
+        self._next = {name: 0 for name in CHANNELS}
+        for name, channel in CHANNELS.items():
+            setattr(self, channel.method, self._reader(name))
+    
+    def set_imu_config(self, compass: bool, gyro: bool, accel: bool):
+        pass
+    
+    def _reader(self, name: str) -> Callable:
+        keys = CHANNELS[name].keys
+        
+        def read():
+            values = self._read(name)
+            return values[0] if keys is None else dict(zip(keys, values))
+        return read
+    
+    def _read(self, name: str) -> Tuple[float, ...]:
+        times, values = self.readings[name]
+        if not times:
+            raise OSError(f"No {name} readings in the trace")
+        if self.speed == 0:
+            index = self._next[name] % len(values)
+            self._next[name] = index + 1
+            return values[index]
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        at = self.first + (now - self.started) * self.speed % (self.duration or 1)
+        return values[max(bisect.bisect_right(times, at) - 1, 0)]
+
+
+def write_trace(path: str, rows: Sequence[TraceRow]):
+    """Write a sensor trace: CSV with a header if path ends in .csv, binary otherwise."""
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("time",) + FIELDS)
+            for at, row in rows:
+                writer.writerow([repr(at)] + ["" if math.isnan(value) else repr(value) for value in row])
+        return
+    with open(path, "wb") as file:
+        file.write(TRACE_MAGIC)
+        for at, row in rows:
+            file.write(_ROW.pack(at, *row))
+
+
+def read_trace(path: str) -> List[TraceRow]:
+    """Read a sensor trace written by write_trace(); raises ValueError if it isn't one."""
+    with open(path, "rb") as file:
+        data = file.read()
+    if data.startswith(TRACE_MAGIC):
+        body = memoryview(data)[len(TRACE_MAGIC):]
+        if len(body) % _ROW.size:
+            raise ValueError(f"Truncated sensor trace {path}")
+        return [(row[0], row[1:]) for row in _ROW.iter_unpack(body)]
+    
+    lines = data.decode().splitlines()
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header or header[0] != "time":
+        raise ValueError(f"{path} is not a sensor trace (expected a 'time' column or a binary trace)")
+    columns = [FIELDS.index(field) if field in FIELDS else None for field in header[1:]]
+    rows = []
+    for record in reader:
+        row = [math.nan] * len(FIELDS)
+        for column, value in zip(columns, record[1:]):
+            if column is not None and value:
+                row[column] = float(value)
+        rows.append((float(record[0]), tuple(row)))
+    return rows
+
+
+def record_trace(sense, rates: Dict[str, float], seconds: float) -> List[TraceRow]:
+    """Read each channel of a Sense HAT (or stand-in) at its rate for seconds, one row per read."""
+    rows = []
+    names = [name for name, rate in rates.items() if rate > 0]
+    due = {name: 0.0 for name in names}
+    started = time.monotonic()
+    while names:
+        name = min(names, key=due.__getitem__)
+        now = time.monotonic() - started
+        if due[name] >= seconds:
+            break
+        if due[name] > now:
+            time.sleep(due[name] - now)
+        row = [math.nan] * len(FIELDS)
+        for field, value in zip(CHANNELS[name].fields, read_channel(sense, name)):
+            row[FIELDS.index(field)] = value
+        rows.append((time.time(), tuple(row)))
+        due[name] += 1 / rates[name]
+    return rows
+
+
+def sensor_source(source: str, trace: str = "", speed: float = 1.0, latency: float = 0.001) -> Callable:
+    """Factory for the sampler's Sense HAT: the real one, a synthetic one or a trace replayed.
+    
+    The trace is read here, so a missing or unreadable one fails the caller
+    rather than the sampler thread. Raises ValueError for an unknown source.
+    """
+    if source == "sense_hat":
+        from sense_hat import SenseHat  # Only importable on a Pi
+        return SenseHat
+    if source == "synthetic":
+        return lambda: SyntheticSenseHat(latency)
+    if source == "replay":
+        if not trace:
+            raise ValueError("Replaying sensors needs a trace file (METRICS_SOURCE_TRACE)")
+        rows = read_trace(trace)
+        return lambda: ReplaySenseHat(rows, speed)
+    raise ValueError(f"Unknown sensor source {source!r}, expected one of {', '.join(SOURCES)}")
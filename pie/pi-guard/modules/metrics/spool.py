@@ -0,0 +1,117 @@
+"""Disk-backed store-and-forward spool for metrics messages."""
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSpool:
+    """Append-only SQLite (WAL) queue of messages not yet acknowledged by the broker.
+    
+    Every message is written here before it is published and deleted once
+    the broker acknowledges it, so whatever was not delivered survives
+    outages and restarts. Sequence numbers come from AUTOINCREMENT and never
+    repeat, even after the spool empties. When the spool grows past
+    max_bytes the oldest messages are dropped.
+    
+    Methods block on disk I/O; call them off the event loop.
+    """
+    
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.count = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._next_seq = 1
+        self._db = None
+    
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL: appends don't rewrite pages, and NORMAL sync only fsyncs at checkpoints
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+        )
+        self.count, self.bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM spool"
+        ).fetchone()
+        row = self._db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'spool'").fetchone()
+        self._next_seq = (row[0] if row else 0) + 1
+        if self.count:
+            logger.info(f"Metrics spool has {self.count} unsent messages ({self.bytes} bytes)")
+    
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+    
+    def reserve(self) -> int:
+        """Next sequence number, to embed in the message before appending it."""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            return seq
+    
+    def append(self, seq: int, payload: str):
+        with self._lock:
+            self._db.execute("INSERT INTO spool (seq, payload) VALUES (?, ?)", (seq, payload))
+            self.count += 1
+            self.bytes += len(payload)
+            if self.bytes > self.max_bytes:
+                self._drop_oldest()
+    
+    def _drop_oldest(self):
+        # Drop a tenth of the budget at once so a full spool doesn't delete on every append
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT seq, LENGTH(payload) FROM spool ORDER BY seq").fetchall()
+        drop = []
+        for seq, size in rows:
+            if self.bytes <= target:
+                break
+            drop.append(seq)
+            self.bytes -= size
+        self._db.execute("DELETE FROM spool WHERE seq <= ?", (drop[-1],))
+        self.count -= len(drop)
+        self.dropped += len(drop)
+        logger.warning(f"Metrics spool over {self.max_bytes} bytes, dropped {len(drop)} oldest messages")
+    
+    def read(self, after_seq: int, limit: int) -> List[Tuple[int, str]]:
+        """Oldest messages with a sequence number above after_seq."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT seq, payload FROM spool WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+            ).fetchall()
+    
+    def delete(self, seqs: Iterable[int]):
+        """Forget delivered messages."""
+        seqs = list(seqs)
+        if not seqs:
+            return
+        with self._lock:
+            # SELECT then DELETE rather than DELETE ... RETURNING, which needs SQLite 3.35
+            # (Raspberry Pi OS Bullseye has 3.34)
+            count = size = 0
+            self._db.execute("BEGIN")
+            try:
+                for seq in seqs:
+                    row = self._db.execute("SELECT LENGTH(payload) FROM spool WHERE seq = ?", (seq,)).fetchone()
+                    if row:
+                        self._db.execute("DELETE FROM spool WHERE seq = ?", (seq,))
+                        count += 1
+                        size += row[0]
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self.count -= count
+            self.bytes -= size
@@ -0,0 +1,161 @@
+"""MJPEG service fanning the camera out to multipart HTTP viewers."""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = "frame"
+
+
+class Mailbox:
+    """One-slot "latest frame" mailbox for a viewer.
+    
+    put() overwrites whatever the viewer hasn't taken yet, so a slow viewer
+    skips frames instead of queueing them, and holds at most one reference to
+    a shared frame.
+    """
+    
+    def __init__(self):
+        self._item: Optional[tuple] = None
+        self._event = asyncio.Event()
+        self.delivered = 0
+        self.skipped = 0
+    
+    def put(self, item: tuple):
+        if self._item is not None:
+            self.skipped += 1
+        self._item = item
+        self._event.set()
+    
+    async def get(self) -> tuple:
+        await self._event.wait()
+        self._event.clear()
+        item, self._item = self._item, None
+        self.delivered += 1
+        return item
+
+
+class MjpegHub:
+    """Broadcasts encoded frames of one size to any number of viewers.
+    
+    A producer task runs only while someone is watching. It encodes each new
+    frame once through the snapshot service (sharing its cache with
+    /snapshot) and puts the same bytes in every viewer's mailbox.
+    """
+    
+    def __init__(self, camera_service, snapshot_service, size: str):
+        self.camera_service = camera_service
+        self.snapshot_service = snapshot_service
+        self.size = size
+        self.viewers: Set[Mailbox] = set()
+        self._producer: Optional[asyncio.Task] = None
+        self.frames_broadcast = 0
+    
+    def subscribe(self) -> Mailbox:
+        mailbox = Mailbox()
+        self.viewers.add(mailbox)
+        if self._producer is None or self._producer.done():
+            self._producer = asyncio.create_task(self._produce())
+            self._producer.add_done_callback(self._producer_done)
+        return mailbox
+    
+    def _producer_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"MJPEG producer for {self.size} failed: {task.exception()}")
+    
+    def unsubscribe(self, mailbox: Mailbox):
+        self.viewers.discard(mailbox)
+        if not self.viewers and self._producer:
+            self._producer.cancel()
+            self._producer = None
+    
+    async def _produce(self):
+        seq = -1
+        while self.viewers:
+            if not self.camera_service.is_running():
+                # No frames will come; check again later without holding an executor thread
+                await asyncio.sleep(1)
+                continue
+            # Wait for the next frame off the loop, the camera signals a threading.Condition
+            frame = await asyncio.to_thread(self.camera_service.get_frame, seq, 1.0)
+            if frame is None:
+                continue
+            seq = frame.seq
+            try:
+                snapshot = await self.snapshot_service.get_snapshot(self.size)
+            except Exception as e:
+                logger.error(f"MJPEG encode failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if snapshot is None:
+                continue
+            # Part header built once per frame, viewers share both byte strings
+            header = (
+                f"--{BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(snapshot.jpeg)}\r\n"
+                f"X-Frame-Timestamp: {snapshot.timestamp:.3f}\r\n\r\n"
+            ).encode("ascii")
+            item = (header, snapshot.jpeg)
+            for mailbox in self.viewers:
+                mailbox.put(item)
+            self.frames_broadcast += 1
+    
+    def stop(self):
+        if self._producer:
+            self._producer.cancel()
+            self._producer = None
+
+
+class MjpegService:
+    """Service for multipart MJPEG streams, one hub per size."""
+    
+    def __init__(self, camera_service, snapshot_service):
+        self.camera_service = camera_service
+        self.snapshot_service = snapshot_service
+        self.hubs: Dict[str, MjpegHub] = {}
+    
+    def viewer_count(self) -> int:
+        return sum(len(hub.viewers) for hub in self.hubs.values())
+    
+    async def stream(self, size: str) -> AsyncIterator[bytes]:
+        """Multipart body for one viewer; ends when the client disconnects."""
+        hub = self.hubs.get(size)
+        if hub is None:
+            hub = self.hubs[size] = MjpegHub(self.camera_service, self.snapshot_service, size)
+        mailbox = hub.subscribe()
+        try:
+            while True:
+                header, jpeg = await mailbox.get()
+                yield header
+                yield jpeg
+                yield b"\r\n"
+        finally:
+            hub.unsubscribe(mailbox)
+    
+    def can_accept(self) -> bool:
+        """False once MJPEG_MAX_VIEWERS are connected."""
+        return self.viewer_count() < settings.MJPEG_MAX_VIEWERS
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the MJPEG service."""
+        return {
+            "viewers": self.viewer_count(),
+            "max_viewers": settings.MJPEG_MAX_VIEWERS,
+            "hubs": {
+                size: {
+                    "viewers": len(hub.viewers),
+                    "frames_broadcast": hub.frames_broadcast,
+                    "skipped": sum(mailbox.skipped for mailbox in hub.viewers),
+                }
+                for size, hub in self.hubs.items()
+            },
+        }
+    
+    def stop(self):
+        """Stop the MJPEG service (open viewer streams end with their clients)."""
+        for hub in self.hubs.values():
+            hub.stop()
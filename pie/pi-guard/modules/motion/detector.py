@@ -0,0 +1,153 @@
+"""Vectorised motion detection on decimated grayscale frames."""
+from collections import namedtuple
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# area: fraction of the analysed frame covered by qualifying blobs
+# bbox: (x0, y0, x1, y1) of the largest blob in 0..1 frame coordinates
+MotionResult = namedtuple("MotionResult", ["motion", "area", "blobs", "bbox"])
+
+Rect = Tuple[float, float, float, float]
+
+
+def parse_regions(value: str) -> List[Rect]:
+    """Parse "x0,y0,x1,y1;..." rectangles in 0..1 frame coordinates."""
+    regions = []
+    for part in value.split(";"):
+        if not part.strip():
+            continue
+        x0, y0, x1, y1 = (float(v) for v in part.split(","))
+        if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+            raise ValueError(f"Invalid region {part!r}, expected x0,y0,x1,y1 within 0..1")
+        regions.append((x0, y0, x1, y1))
+    return regions
+
+
+class MotionDetector:
+    """Frame differencing against a running-average background.
+    
+    The luma plane is decimated by striding (no copy of the full frame), pixels
+    that differ from the background by more than threshold are counted per
+    cell, and cells with enough changed pixels are grouped into blobs. Only
+    blobs of at least min_area (fraction of the frame) count as motion, which
+    rejects sensor noise and small flicker. All per-pixel work is a handful of
+    NumPy operations on preallocated buffers; only the small cell grid is
+    walked in Python, and only when something changed.
+    """
+    
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        decimation: int = 4,
+        threshold: float = 25,
+        alpha: float = 0.05,
+        min_area: float = 0.005,
+        cell: int = 8,
+        cell_fill: float = 0.25,
+        max_area: float = 0.8,
+        regions: Optional[Sequence[Rect]] = None,
+        exclude: Optional[Sequence[Rect]] = None,
+    ):
+        self.decimation = decimation
+        self.threshold = threshold
+        self.alpha = alpha
+        self.cell = cell
+        # Crop the analysed image to whole cells
+        self.rows = height // decimation // cell
+        self.cols = width // decimation // cell
+        self.height = self.rows * cell
+        self.width = self.cols * cell
+        self.min_pixels = min_area * self.width * self.height
+        self.cell_pixels = cell_fill * cell * cell
+        self.max_area = max_area
+        
+        self.mask = self._build_mask(regions, exclude)
+        self.mask_pixels = int(self.mask.sum())
+        self._background: Optional[np.ndarray] = None
+        self._small = np.empty((self.height, self.width), dtype=np.float32)
+        self._delta = np.empty_like(self._small)
+        self._absdiff = np.empty_like(self._small)
+        self._changed = np.empty((self.height, self.width), dtype=bool)
+        self.frames = 0
+    
+    def _build_mask(self, regions, exclude) -> np.ndarray:
+        """Boolean mask of analysed pixels: inside any region and outside every exclusion."""
+        def pixels(rect):
+            x0, y0, x1, y1 = rect
+            return (slice(int(y0 * self.height), int(round(y1 * self.height))),
+                    slice(int(x0 * self.width), int(round(x1 * self.width))))
+        
+        if regions:
+            mask = np.zeros((self.height, self.width), dtype=bool)
+            for rect in regions:
+                mask[pixels(rect)] = True
+        else:
+            mask = np.ones((self.height, self.width), dtype=bool)
+        for rect in exclude or ():
+            mask[pixels(rect)] = False
+        return mask
+    
+    def reset(self):
+        """Forget the background, e.g. after the stream restarted."""
+        self._background = None
+    
+    def process(self, luma: np.ndarray) -> MotionResult:
+        """Analyse one full-resolution luma plane."""
+        step = self.decimation
+        small, delta, changed = self._small, self._delta, self._changed
+        np.copyto(small, luma[:self.height * step:step, :self.width * step:step], casting="unsafe")
+        self.frames += 1
+        
+        if self._background is None:
+            self._background = small.copy()
+            return MotionResult(False, 0.0, 0, None)
+        background = self._background
+        
+        np.subtract(small, background, out=delta)
+        np.greater(np.abs(delta, out=self._absdiff), self.threshold, out=changed)
+        # Running average: background += alpha * (frame - background)
+        np.multiply(delta, self.alpha, out=delta)
+        np.add(background, delta, out=background)
+        np.logical_and(changed, self.mask, out=changed)
+        
+        counts = changed.reshape(self.rows, self.cell, self.cols, self.cell).sum(axis=(1, 3))
+        if self.mask_pixels and counts.sum() > self.max_area * self.mask_pixels:
+            # Lighting change or camera shake, not an object: start over from this frame
+            np.copyto(background, small)
+            return MotionResult(False, 0.0, 0, None)
+        
+        active = counts >= self.cell_pixels
+        if not active.any():
+            return MotionResult(False, 0.0, 0, None)
+        return self._blobs(active, counts)
+    
+    def _blobs(self, active: np.ndarray, counts: np.ndarray) -> MotionResult:
+        """Group active cells into 8-connected blobs and keep those over min_area."""
+        remaining = {(int(r), int(c)) for r, c in np.argwhere(active)}
+        area = 0
+        blobs = 0
+        largest = (0, None)
+        while remaining:
+            stack = [remaining.pop()]
+            pixels = 0
+            r0, c0, r1, c1 = stack[0][0], stack[0][1], stack[0][0], stack[0][1]
+            while stack:
+                r, c = stack.pop()
+                pixels += int(counts[r, c])
+                r0, c0, r1, c1 = min(r0, r), min(c0, c), max(r1, r), max(c1, c)
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        neighbour = (r + dr, c + dc)
+                        if neighbour in remaining:
+                            remaining.remove(neighbour)
+                            stack.append(neighbour)
+            if pixels >= self.min_pixels:
+                blobs += 1
+                area += pixels
+                if pixels > largest[0]:
+                    largest = (pixels, (c0 / self.cols, r0 / self.rows, (c1 + 1) / self.cols, (r1 + 1) / self.rows))
+        
+        total = self.width * self.height
+        return MotionResult(blobs > 0, area / total, blobs, largest[1])
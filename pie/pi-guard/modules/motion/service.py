@@ -0,0 +1,202 @@
+"""Motion service publishing motion start/stop events from camera frames."""
+import json
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from config import settings
+
+if TYPE_CHECKING:
+    from modules.motion.detector import MotionDetector  # Imported by start(), it loads NumPy
+
+logger = logging.getLogger(__name__)
+
+# Seconds without frames after which the background model is rebuilt
+RESET_GAP = 5.0
+
+
+class MotionService:
+    """Service running motion detection on the camera service's frames.
+    
+    Analysis runs on its own thread and always takes the newest frame, so a
+    slow frame is skipped rather than queued. Only state changes are
+    published: "start" after MOTION_START_FRAMES frames with motion and
+    "stop" once none has been seen for MOTION_STOP_DELAY seconds.
+    """
+    
+    def __init__(self, camera_service, mqtt_service):
+        self.camera_service = camera_service
+        self.mqtt_service = mqtt_service
+        self.detector: Optional["MotionDetector"] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.active = False
+        self._motion_frames = 0
+        self._started_at: Optional[float] = None
+        self._last_motion_at: Optional[float] = None
+        self._peak_area = 0.0
+        self.frames_analysed = 0
+        self.frames_skipped = 0
+        self.events_published = 0
+        self._event_listeners: List[Callable[[dict], None]] = []
+        self._analysis_time = 0.0
+        self.max_rate: Optional[float] = None  # frames analysed per second at most, None for every frame
+        self.frames_shed = 0
+    
+    def start(self):
+        """Start the motion service."""
+        if self._running:
+            logger.warning("Motion service is already running")
+            return
+        if not settings.MOTION_ENABLED:
+            logger.info("Motion detection disabled (MOTION_ENABLED=false)")
+            return
+        if not self.camera_service.is_running():
+            logger.warning("Camera service not running, motion detection disabled")
+            return
+        
+        from modules.motion.detector import MotionDetector, parse_regions
+        
+        self.detector = MotionDetector(
+            self.camera_service.width,
+            self.camera_service.height,
+            decimation=settings.MOTION_DECIMATION,
+            threshold=settings.MOTION_THRESHOLD,
+            alpha=settings.MOTION_BACKGROUND_ALPHA,
+            min_area=settings.MOTION_MIN_AREA,
+            regions=parse_regions(settings.MOTION_REGIONS),
+            exclude=parse_regions(settings.MOTION_EXCLUDE),
+        )
+        self._running = True
+        self._thread = threading.Thread(target=self._analysis_loop, name="motion", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Motion service started ({self.detector.width}x{self.detector.height} analysis, "
+            f"min area {settings.MOTION_MIN_AREA:.1%})"
+        )
+    
+    def stop(self):
+        """Stop the motion service."""
+        if not self._running:
+            return
+        
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.active:
+            self._finish(time.time())
+        logger.info("Motion service stopped")
+    
+    def _analysis_loop(self):
+        """Analyse the newest frame whenever one arrives."""
+        seq = -1
+        last_timestamp = 0.0
+        while self._running:
+            # Waits the whole second while the camera is down, so this doesn't spin
+            frame = self.camera_service.get_frame(seq, timeout=1)
+            if frame is None:
+                continue
+            if seq >= 0 and frame.seq > seq + 1:
+                self.frames_skipped += frame.seq - seq - 1
+            max_rate = self.max_rate
+            if max_rate and frame.timestamp - last_timestamp < 1 / max_rate:
+                # Shedding load: leave this frame, the next one due is analysed instead
+                seq = frame.seq
+                self.frames_shed += 1
+                continue
+            if frame.timestamp - last_timestamp > RESET_GAP:
+                self.detector.reset()  # first frame or the stream restarted
+            seq = frame.seq
+            last_timestamp = frame.timestamp
+            
+            started = time.thread_time()
+            try:
+                result = self.detector.process(frame.data[:frame.height])
+            except Exception as e:
+                logger.error(f"Motion analysis failed: {e}")
+                continue
+            self._analysis_time += time.thread_time() - started  # This thread's CPU only
+            self.frames_analysed += 1
+            self._update(result, frame.timestamp)
+    
+    def _update(self, result, timestamp: float):
+        """Advance the start/stop state machine with one analysis result."""
+        if result.motion:
+            self._motion_frames += 1
+            self._last_motion_at = timestamp
+            self._peak_area = max(self._peak_area, result.area)
+            if not self.active and self._motion_frames >= settings.MOTION_START_FRAMES:
+                self.active = True
+                self._started_at = timestamp
+                self._publish({
+                    "event": "start",
+                    "timestamp": timestamp,
+                    "area": round(result.area, 4),
+                    "blobs": result.blobs,
+                    "bbox": [round(v, 3) for v in result.bbox],
+                })
+        else:
+            self._motion_frames = 0
+            if self.active and timestamp - self._last_motion_at >= settings.MOTION_STOP_DELAY:
+                self._finish(timestamp)
+            elif not self.active:
+                self._peak_area = 0.0
+    
+    def _finish(self, timestamp: float):
+        self.active = False
+        self._publish({
+            "event": "stop",
+            "timestamp": timestamp,
+            "duration": round(self._last_motion_at - self._started_at, 2),
+            "peak_area": round(self._peak_area, 4),
+        })
+        self._peak_area = 0.0
+    
+    def set_analysis_rate(self, rate: Optional[float]):
+        """Analyse at most rate frames per second, or every frame the camera decodes with None."""
+        if rate is not None and rate <= 0:
+            raise ValueError("Analysis rate must be positive")
+        self.max_rate = rate
+        logger.info(f"Motion analysis at {rate:g} fps at most" if rate else "Motion analysis on every frame")
+    
+    def add_event_listener(self, callback: Callable[[dict], None]):
+        """Call callback with every start/stop event, on the analysis thread."""
+        self._event_listeners.append(callback)
+    
+    def _publish(self, event: dict):
+        logger.info(f"Motion {event['event']}")
+        for listener in self._event_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Error in motion event listener: {e}")
+        # Runs on the analysis thread; the publish itself happens on the event loop
+        future = self.mqtt_service.publish_threadsafe(settings.MQTT_MOTION_TOPIC, json.dumps(event), qos=settings.MQTT_QOS)
+        if future is None:
+            logger.warning("MQTT service not running, dropping motion event")
+            return
+        future.add_done_callback(self._on_published)
+    
+    def _on_published(self, future):
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.events_published += 1
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the motion service."""
+        analysed = self.frames_analysed
+        return {
+            "status": "running" if self._running else "stopped",
+            "motion": self.active,
+            "frames_analysed": analysed,
+            "frames_skipped": self.frames_skipped,
+            "frames_shed": self.frames_shed,
+            "max_rate": self.max_rate,
+            "cpu_ms_per_frame": round(self._analysis_time / analysed * 1000, 2) if analysed else None,
+            "events_published": self.events_published,
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
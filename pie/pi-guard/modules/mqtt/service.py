@@ -0,0 +1,321 @@
+"""MQTT service sharing one broker connection, driven by the asyncio event loop."""
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import paho.mqtt.client as mqtt
+
+from config import settings
+from core.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+PUBLISHES = registry.counter(
+    "pi_guard_mqtt_publish_total",
+    "MQTT publishes by result: success, not_connected, rejected, aborted, or paho's error (no_conn, queue_size...)",
+    ("result",)
+)
+ACK_SECONDS = registry.histogram("pi_guard_mqtt_ack_seconds", "Time from a QoS 1 publish to its PUBACK")
+CONNECTS = registry.counter("pi_guard_mqtt_connects_total", "MQTT connect attempts by result", ("result",))
+CONNECT_SECONDS = registry.histogram(
+    "pi_guard_mqtt_connect_seconds", "Time from a successful connect attempt to CONNACK"
+)
+CONNECTED = registry.gauge("pi_guard_mqtt_connected", "1 while connected to the broker")
+INFLIGHT = registry.gauge("pi_guard_mqtt_inflight", "QoS 1 publishes awaiting PUBACK")
+
+_SUCCESS = PUBLISHES.labels("success")
+_NOT_CONNECTED = PUBLISHES.labels("not_connected")
+
+
+class MqttService:
+    """One MQTT connection for every service, with its network I/O on the event loop.
+    
+    paho still speaks the protocol, over MQTT_TRANSPORT (raw TCP by default,
+    or WebSockets) with optional TLS, but its socket is watched with the
+    loop's add_reader/add_writer instead of paho's network thread, so every
+    paho callback runs on the loop. A single task owns the connection:
+    connect, wait for it to drop, back off, connect again. Only the blocking
+    DNS lookup and TCP, TLS and WebSocket handshakes run on a worker thread.
+    
+    QoS 1 publishes are limited to MQTT_MAX_INFLIGHT awaiting PUBACK. One
+    that is in flight when the connection drops is resent by paho after the
+    reconnect, and its publish() keeps waiting for the acknowledgement.
+    """
+    
+    def __init__(self):
+        self.client: Optional[mqtt.Client] = None
+        self.state = "stopped"  # connecting, connected, backoff
+        self._running = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fd: Optional[int] = None  # socket watched for reading
+        self._writer: Optional[int] = None  # socket watched for writing, while its buffer is full
+        self._connack: Optional[asyncio.Future] = None
+        self._disconnected: Optional[asyncio.Future] = None
+        self._acks: Dict[int, asyncio.Future] = {}  # mid -> QoS 1 publish awaiting PUBACK
+        self._window: Optional[asyncio.Semaphore] = None
+        self._connect_listeners: List[Callable[[], None]] = []
+        self.connections = 0
+        self.connect_seconds: Optional[float] = None  # last connect, from the attempt to CONNACK
+        self.published = 0
+        self.publish_failures = 0
+        CONNECTED.set_function(lambda: int(self.is_connected()))
+        INFLIGHT.set_function(lambda: len(self._acks))
+    
+    def start(self):
+        """Start the MQTT service; connecting happens in the background."""
+        if self._running:
+            logger.warning("MQTT service is already running")
+            return
+        
+        logger.info("Starting MQTT service...")
+        self._loop = asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        client_id = settings.MQTT_CLIENT_ID or ""
+        if not client_id and not settings.MQTT_CLEAN_SESSION:
+            client_id = f"pi-guard-{socket.gethostname()}"  # A kept session is found again by its client id
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2, client_id=client_id,
+            clean_session=settings.MQTT_CLEAN_SESSION, transport=settings.MQTT_TRANSPORT
+        )
+        if settings.MQTT_TRANSPORT == "websockets":
+            self.client.ws_set_options(path=settings.MQTT_WS_PATH)
+        if settings.MQTT_TLS:
+            self.client.tls_set(ca_certs=settings.MQTT_TLS_CA_CERTS)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self.client.max_inflight_messages_set(settings.MQTT_MAX_INFLIGHT)
+        # Only stores the address; _connect() does the connecting
+        self.client.connect_async(settings.MQTT_BROKER, settings.MQTT_PORT, settings.MQTT_KEEPALIVE)
+        self._window = asyncio.Semaphore(settings.MQTT_MAX_INFLIGHT)
+        self._running = True
+        self._task = self._loop.create_task(self._run())
+        logger.info("MQTT service started")
+    
+    def stop(self):
+        """Stop the MQTT service, sending DISCONNECT if connected."""
+        if not self._running:
+            return
+        
+        logger.info("Stopping MQTT service...")
+        self._running = False
+        if self._task and not self._task.done():
+            self._task.cancel()
+        if self.client:
+            try:
+                if self.client.is_connected():
+                    self.client.disconnect()
+                    self.client.loop_write()  # Flush the DISCONNECT now, the loop may not run again
+            except Exception as e:
+                logger.error(f"Error disconnecting MQTT client: {e}")
+            self._unwatch()
+        for future in self._acks.values():
+            if not future.done():
+                PUBLISHES.labels("aborted").inc()
+                future.set_result(False)
+        self._acks.clear()
+        self.state = "stopped"
+        logger.info("MQTT service stopped")
+    
+    def add_connect_listener(self, callback: Callable[[], None]):
+        """Call callback on the event loop after every successful (re)connect."""
+        self._connect_listeners.append(callback)
+    
+    def is_connected(self) -> bool:
+        return bool(self.client and self.client.is_connected())
+    
+    async def publish(self, topic: str, payload: Union[str, bytes], qos: int = 0, retain: bool = False) -> bool:
+        """Publish a message on the shared connection (call on the event loop).
+        
+        QoS 0 returns once the message is queued for the socket. QoS 1 first
+        waits for room in the in-flight window, then returns when the broker
+        acknowledges it. False if not connected or the service stops first.
+        """
+        if not self.is_connected():
+            _NOT_CONNECTED.inc()
+            return False
+        if qos == 0:
+            result = self._checked(self.client.publish(topic, payload, qos=0, retain=retain), topic)
+            self._flush()  # Straight to the socket rather than on the next loop iteration
+            if result is None:
+                return False
+            _SUCCESS.inc()
+            return True
+        async with self._window:
+            if not self.is_connected():
+                _NOT_CONNECTED.inc()
+                return False  # Dropped while waiting for room
+            result = self._checked(self.client.publish(topic, payload, qos=qos, retain=retain), topic)
+            if result is None:
+                return False
+            self._flush()
+            started = time.perf_counter()
+            future = self._loop.create_future()
+            self._acks[result.mid] = future
+            acknowledged = await future
+            if acknowledged:
+                ACK_SECONDS.observe(time.perf_counter() - started)
+                _SUCCESS.inc()
+            return acknowledged
+    
+    def publish_threadsafe(self, topic: str, payload: Union[str, bytes], qos: int = 0,
+                           retain: bool = False) -> Optional[concurrent.futures.Future]:
+        """publish() from another thread; returns a future of its result, None if not running."""
+        if not self._running:
+            return None
+        return asyncio.run_coroutine_threadsafe(self.publish(topic, payload, qos, retain), self._loop)
+    
+    def _checked(self, result: mqtt.MQTTMessageInfo, topic: str) -> Optional[mqtt.MQTTMessageInfo]:
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.publish_failures += 1
+            PUBLISHES.labels(mqtt.MQTTErrorCode(result.rc).name.lower().replace("mqtt_err_", "")).inc()
+            logger.warning(f"Failed to publish to {topic}, return code: {result.rc}")
+            return None
+        return result
+    
+    async def _run(self):
+        """The connection state machine: connecting -> connected -> backoff -> connecting."""
+        delay = 0.0
+        while self._running:
+            if delay:
+                self.state = "backoff"
+                logger.info(f"Reconnecting to MQTT broker in {delay:g}s...")
+                await asyncio.sleep(delay)
+            self.state = "connecting"
+            started = time.monotonic()
+            try:
+                await self._connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                CONNECTS.labels("failure").inc()
+                logger.warning(f"Failed to connect to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT}: {e}")
+                self._unwatch()
+                delay = min(max(delay * 2, settings.MQTT_RECONNECT_MIN), settings.MQTT_RECONNECT_MAX)
+                continue
+            
+            self.connect_seconds = time.monotonic() - started
+            CONNECTS.labels("success").inc()
+            CONNECT_SECONDS.observe(self.connect_seconds)
+            self.state = "connected"
+            delay = 0.0  # A connection that was up retries at once when it drops
+            logger.info(f"Connected to MQTT broker at {settings.MQTT_BROKER}:{settings.MQTT_PORT} "
+                        f"in {self.connect_seconds * 1000:.0f} ms")
+            for listener in self._connect_listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    logger.error(f"Error in MQTT connect listener: {e}")
+            
+            # Keepalive pings and their timeouts are driven by loop_misc()
+            while not self._disconnected.done():
+                await asyncio.wait([self._disconnected], timeout=1.0)
+                self.client.loop_misc()
+    
+    async def _connect(self):
+        self._connack = self._loop.create_future()
+        self._disconnected = self._loop.create_future()
+        # DNS, TCP, TLS and WebSocket handshakes block; the CONNECT packet is queued for the writer
+        await asyncio.to_thread(self.client.reconnect)
+        sock = self.client.socket()
+        self._fd = sock.fileno()
+        self._loop.add_reader(self._fd, self._read)
+        reason = await asyncio.wait_for(self._connack, settings.MQTT_CONNECT_TIMEOUT)
+        if reason.is_failure:
+            raise ConnectionError(f"broker refused the connection: {reason}")
+    
+    def _read(self):
+        self.client.loop_read()
+        # TLS (and the WebSocket wrapper around it) can hold bytes already taken off the
+        # socket, which will not make it readable again
+        sock = self.client.socket()
+        while sock is not None and hasattr(sock, "pending") and sock.pending() > 0:
+            self.client.loop_read()
+            sock = self.client.socket()
+    
+    def _unwatch(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._writer is not None:
+            self._loop.remove_writer(self._writer)
+            self._writer = None
+    
+    def _on_socket_register_write(self, client, userdata, sock):
+        # paho queued a packet; also called from the connect worker thread for the CONNECT
+        if threading.get_ident() == self._loop_thread:
+            self._loop.call_soon(self._flush)
+        else:
+            self._loop.call_soon_threadsafe(self._flush)
+    
+    def _flush(self):
+        """Write what paho has queued; wait for the socket only when its buffer is full."""
+        sock = self.client.socket() if self._running else None
+        if sock is None:
+            return
+        self.client.loop_write()
+        if self.client.want_write() and not self._writer:
+            self._writer = sock.fileno()
+            self._loop.add_writer(self._writer, self._flush)
+    
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        if self._writer is not None:
+            self._loop.remove_writer(self._writer)
+            self._writer = None
+    
+    def _on_socket_close(self, client, userdata, sock):
+        # Also called from the connect worker thread, for a socket left from a failed attempt
+        if threading.get_ident() == self._loop_thread:
+            self._unwatch()
+        else:
+            self._loop.call_soon_threadsafe(self._unwatch)
+    
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if not reason_code.is_failure:
+            self.connections += 1
+        if self._connack and not self._connack.done():
+            self._connack.set_result(reason_code)
+    
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if self._running:
+            logger.warning(f"MQTT connection lost: {reason_code}")
+        if self._connack and not self._connack.done():
+            self._connack.set_exception(ConnectionError(f"connection closed: {reason_code}"))
+        if self._disconnected and not self._disconnected.done():
+            self._disconnected.set_result(reason_code)
+    
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        self.published += 1
+        future = self._acks.pop(mid, None)
+        if future and not future.done():
+            if reason_code.is_failure:
+                PUBLISHES.labels("rejected").inc()
+            future.set_result(not reason_code.is_failure)
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the MQTT service."""
+        return {
+            "status": "running" if self._running else "stopped",
+            "state": self.state,
+            "connected": self.is_connected(),
+            "broker": f"{settings.MQTT_BROKER}:{settings.MQTT_PORT}",
+            "transport": f"{settings.MQTT_TRANSPORT}{'+tls' if settings.MQTT_TLS else ''}",
+            "connections": self.connections,
+            "connect_ms": round(self.connect_seconds * 1000, 1) if self.connect_seconds is not None else None,
+            "inflight": len(self._acks),
+            "published": self.published,
+            "publish_failures": self.publish_failures,
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
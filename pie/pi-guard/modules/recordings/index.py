@@ -0,0 +1,101 @@
+"""Read-only access to the segment index written by the stream supervisor.
+
+The format is defined by its writer, pie/stream/segment_index.py, a separate
+deployment; benchmarks/recording_index.py fails if the two disagree on it.
+Lookups binary search the memory-mapped index and one keyframe sidecar per
+segment, so they never open or decode a segment file.
+"""
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import List, Tuple
+
+INDEX_MAGIC = b"PGSI"
+INDEX_VERSION = 1
+# magic, version, record size, first live record
+HEADER = struct.Struct("<4sHHQ")
+# start_ms, end_ms, file size, init section size, keyframe count
+RECORD = struct.Struct("<qqQII")
+# time_ms, byte offset of the keyframe's fragment
+KEYFRAME = struct.Struct("<qQ")
+
+
+def segment_name(start_ms: int, extension: str = ".mp4") -> str:
+    """Segment path relative to the segments directory."""
+    day = datetime.fromtimestamp(start_ms / 1000).strftime("%Y%m%d")
+    return f"{day}/{start_ms}{extension}"
+
+
+def _keyframe_bounds(sidecar: bytes, count: int, start_ms: int, end_ms: int) -> Tuple[int, int]:
+    """Indexes of the last of count keyframes at or before start_ms and the first after end_ms."""
+
+    def search(time_ms: int) -> int:
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEYFRAME.unpack_from(sidecar, mid * KEYFRAME.size)[0] <= time_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    return search(start_ms) - 1, search(end_ms)
+
+
+def find_range(root: str, start_ms: int, end_ms: int) -> List[dict]:
+    """Find the segments and byte ranges covering [start_ms, end_ms].
+
+    Each result holds the segment's init section size and the [offset, end_offset)
+    byte range of the fragments to play after it, starting on a keyframe.
+    Raises FileNotFoundError if nothing has been recorded yet.
+    """
+    segments_dir = os.path.join(root, "segments")
+    path = os.path.join(root, "index", "segments.idx")
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise FileNotFoundError(f"Segment index {path} has no header yet")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            magic, version, record_size, first_live = HEADER.unpack_from(index, 0)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or record_size != RECORD.size:
+                raise ValueError("Unsupported segment index")
+            count = (len(index) - HEADER.size) // RECORD.size
+
+            # First live segment ending at or after start_ms
+            lo, hi = first_live, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if RECORD.unpack_from(index, HEADER.size + mid * RECORD.size)[1] < start_ms:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            records = []
+            for i in range(lo, count):
+                record = RECORD.unpack_from(index, HEADER.size + i * RECORD.size)
+                if record[0] > end_ms:
+                    break
+                records.append(record)
+
+    results = []
+    for seg_start, seg_end, size, init_size, keyframes in records:
+        name = segment_name(seg_start)
+        try:
+            with open(os.path.join(segments_dir, segment_name(seg_start, ".kfi")), "rb") as f:
+                sidecar = f.read()
+        except FileNotFoundError:
+            continue  # removed by retention since the index was read
+        keyframes = min(keyframes, len(sidecar) // KEYFRAME.size)
+        first, last = _keyframe_bounds(sidecar, keyframes, start_ms, end_ms)
+        offset = KEYFRAME.unpack_from(sidecar, first * KEYFRAME.size)[1] if first >= 0 else init_size
+        end_offset = KEYFRAME.unpack_from(sidecar, last * KEYFRAME.size)[1] if last < keyframes else size
+        results.append({
+            "name": name,
+            "start_ms": seg_start,
+            "end_ms": seg_end,
+            "size": size,
+            "init_size": init_size,
+            "offset": offset,
+            "end_offset": end_offset,
+        })
+    return results
@@ -0,0 +1,64 @@
+"""Recordings service for the continuous segments written by the stream supervisor."""
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from config import settings
+from modules.recordings.index import find_range
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingsService:
+    """Service for finding and serving recorded fMP4 segments.
+    
+    The stream supervisor writes segments and their index to RECORDINGS_DIR;
+    this service only reads them, so playback works while it records.
+    """
+    
+    def __init__(self):
+        self.root = os.path.abspath(settings.RECORDINGS_DIR)
+        self.segments_dir = os.path.join(self.root, "segments")
+        self._running = False
+    
+    def start(self):
+        """Start the recordings service."""
+        if self._running:
+            logger.warning("Recordings service is already running")
+            return
+        
+        self._running = True
+        logger.info(f"Recordings service started ({self.root})")
+    
+    def stop(self):
+        """Stop the recordings service."""
+        self._running = False
+    
+    async def find(self, start_ms: int, end_ms: int) -> List[dict]:
+        """Find the segment byte ranges covering a time range (ms since epoch)."""
+        if end_ms < start_ms:
+            raise ValueError("end must not be before start")
+        try:
+            return await asyncio.to_thread(find_range, self.root, start_ms, end_ms)
+        except FileNotFoundError:
+            return []
+    
+    def segment_path(self, name: str) -> Optional[str]:
+        """Resolve a segment name from find() to a file, None if it doesn't exist."""
+        path = os.path.abspath(os.path.join(self.segments_dir, name))
+        if not path.startswith(self.segments_dir + os.sep) or not path.endswith(".mp4"):
+            return None
+        return path if os.path.isfile(path) else None
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the recordings service."""
+        return {
+            "status": "running" if self._running else "stopped",
+            "directory": self.root,
+            "indexed": os.path.exists(os.path.join(self.root, "index", "segments.idx")),
+        }
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
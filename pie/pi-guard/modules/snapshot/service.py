@@ -0,0 +1,141 @@
+"""Snapshot service serving JPEG stills of the latest camera frame."""
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pyramid level per size name: each level halves the previous one
+SIZES = {"full": 0, "medium": 1, "thumbnail": 2}
+
+Snapshot = namedtuple("Snapshot", ["jpeg", "etag", "timestamp", "width", "height"])
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def halve(plane: "np.ndarray") -> "np.ndarray":
+    """Downscale a plane by 2 in each direction with a 2x2 box filter."""
+    h, w = plane.shape[0] // 2 * 2, plane.shape[1] // 2 * 2
+    total = plane[0:h:2, 0:w:2].astype("uint16")
+    total += plane[1:h:2, 0:w:2]
+    total += plane[0:h:2, 1:w:2]
+    total += plane[1:h:2, 1:w:2]
+    total += 2  # round to nearest
+    total >>= 2
+    return total.astype("uint8")
+
+
+class SnapshotService:
+    """Service keeping one JPEG of the latest frame per size.
+    
+    Each size is encoded lazily on the first request after a new frame and
+    reused until the next one, so the encode rate is bounded by the frame
+    rate whatever the request rate. Concurrent requests for the same frame and
+    size share one in-flight encode. Smaller sizes are built from the YUV
+    planes of the level above, and encoding goes straight from YUV 4:2:0
+    without a colour conversion.
+    """
+    
+    def __init__(self, camera_service):
+        self.camera_service = camera_service
+        # ETags must not repeat across restarts, frame numbers start at 0 again
+        self._boot_id = f"{int(time.time() * 1000):x}"
+        self._encodes: Dict[str, Tuple[int, asyncio.Task]] = {}
+        self._pyramid_lock = threading.Lock()
+        self._pyramid: Tuple[int, list] = (-1, [])
+        self.encode_count = 0
+        self.request_count = 0
+        self.not_modified_count = 0
+    
+    def etag(self, seq: int, size: str) -> str:
+        """Entity tag for a frame at a size (known before encoding)."""
+        return f'"{self._boot_id}-{seq}-{size}"'
+    
+    def start(self):
+        """Load the JPEG encoder if there are frames to encode, ahead of the first request."""
+        if self.camera_service.is_running():
+            import simplejpeg  # noqa: F401
+    
+    def check_not_modified(self, size: str, if_none_match: Optional[str]) -> Optional[str]:
+        """ETag to answer 304 with if If-None-Match names the latest frame at this size."""
+        frame = self.camera_service.latest_frame()
+        if frame is None or not if_none_match:
+            return None
+        etag = self.etag(frame.seq, size)
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in tags or f"W/{etag}" in tags or "*" in tags:
+            self.not_modified_count += 1
+            return etag
+        return None
+    
+    async def get_snapshot(self, size: str = "full") -> Optional[Snapshot]:
+        """Get the latest frame as JPEG, None until the camera has a frame."""
+        if size not in SIZES:
+            raise ValueError(f"Unknown size {size!r}, expected one of {', '.join(SIZES)}")
+        frame = self.camera_service.latest_frame()
+        if frame is None:
+            return None
+        self.request_count += 1
+        
+        # No await between the lookup and the insert, so only the first request
+        # per frame and size starts an encode; the rest await the same task.
+        # shield() keeps a disconnecting client from cancelling it for the others.
+        cached = self._encodes.get(size)
+        if cached is None or cached[0] != frame.seq:
+            task = asyncio.create_task(self._encode_snapshot(frame, size))
+            self._encodes[size] = (frame.seq, task)
+        else:
+            task = cached[1]
+        return await asyncio.shield(task)
+    
+    async def _encode_snapshot(self, frame, size: str) -> Snapshot:
+        try:
+            jpeg, width, height = await asyncio.to_thread(self._encode, frame, SIZES[size])
+        except Exception as e:
+            logger.error(f"Snapshot encode failed: {e}")
+            # Let the next request retry instead of replaying the failure
+            if self._encodes.get(size, (None,))[0] == frame.seq:
+                del self._encodes[size]
+            raise
+        self.encode_count += 1
+        return Snapshot(jpeg, self.etag(frame.seq, size), frame.timestamp, width, height)
+    
+    def _planes(self, frame, level: int) -> list:
+        """Y, U, V planes of a frame at a pyramid level, building levels as needed."""
+        with self._pyramid_lock:
+            seq, levels = self._pyramid
+            if seq != frame.seq:
+                height, width = frame.height, frame.width
+                chroma = frame.data[height:].reshape(-1)
+                quarter = (height // 2) * (width // 2)
+                levels = [[
+                    frame.data[:height],
+                    chroma[:quarter].reshape(height // 2, width // 2),
+                    chroma[quarter:2 * quarter].reshape(height // 2, width // 2),
+                ]]
+                self._pyramid = (frame.seq, levels)
+            while len(levels) <= level:
+                levels.append([halve(plane) for plane in levels[-1]])
+            return levels[level]
+    
+    def _encode(self, frame, level: int) -> Tuple[bytes, int, int]:
+        import simplejpeg  # Loaded by start(), or here if the camera came up later
+        
+        y, u, v = self._planes(frame, level)
+        jpeg = simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=settings.SNAPSHOT_QUALITY)
+        return jpeg, y.shape[1], y.shape[0]
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the snapshot service."""
+        return {
+            "status": "running" if self.camera_service.is_running() else "stopped",
+            "requests": self.request_count,
+            "not_modified": self.not_modified_count,
+            "encodes": self.encode_count,
+        }
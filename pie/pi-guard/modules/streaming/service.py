@@ -0,0 +1,150 @@
+"""Streaming service bridging the API to the stream supervisor (pie/stream/stream.py)."""
+import asyncio
+import json
+import logging
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from config import settings
+from core.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+SUPERVISOR_UP = registry.gauge("pi_guard_stream_supervisor_up", "1 if the stream supervisor answered the last scrape")
+PIPELINE_UP = registry.gauge("pi_guard_stream_pipeline_up", "1 while the camera and encoder processes are running")
+RESTARTS = registry.gauge(
+    "pi_guard_stream_restarts", "Pipeline restarts since the supervisor started (a counter that resets with it)"
+)
+SUPERVISOR_UPTIME = registry.gauge("pi_guard_stream_supervisor_uptime_seconds", "Time since the supervisor started")
+PIPELINE_UPTIME = registry.gauge("pi_guard_stream_pipeline_uptime_seconds", "Time since the pipeline last (re)started")
+CAMERA_FPS = registry.gauge("pi_guard_stream_camera_fps", "Frame rate reported by the camera")
+ENCODER_FPS = registry.gauge("pi_guard_stream_encoder_fps", "Frame rate reported by ffmpeg")
+ENCODER_BITRATE = registry.gauge("pi_guard_stream_encoder_bitrate_kbps", "Output bitrate reported by ffmpeg")
+ENCODER_SPEED = registry.gauge("pi_guard_stream_encoder_speed", "ffmpeg speed relative to real time")
+ENCODER_DUP = registry.gauge("pi_guard_stream_encoder_dup_frames", "Frames ffmpeg duplicated since the pipeline started")
+ENCODER_DROP = registry.gauge("pi_guard_stream_encoder_drop_frames", "Frames ffmpeg dropped since the pipeline started")
+PUSH_SKIPPED = registry.gauge(
+    "pi_guard_stream_push_skipped", "Frames the RTSP push skipped to catch up since the pipeline started"
+)
+
+# Supervisor status fields behind each gauge
+_STATS_GAUGES = (
+    (RESTARTS, ("restarts_total",)),
+    (SUPERVISOR_UPTIME, ("uptime",)),
+    (PIPELINE_UPTIME, ("pipeline_uptime",)),
+    (CAMERA_FPS, ("camera", "fps")),
+    (ENCODER_FPS, ("encoder", "fps")),
+    (ENCODER_BITRATE, ("encoder", "bitrate_kbps")),
+    (ENCODER_SPEED, ("encoder", "speed")),
+    (ENCODER_DUP, ("encoder", "dup")),
+    (ENCODER_DROP, ("encoder", "drop")),
+    (PUSH_SKIPPED, ("rtsp_push", "skipped")),
+)
+
+
+class StreamingService:
+    """Service for the camera stream, which runs in its own supervisor process.
+    
+    The supervisor owns the camera, the RTSP push and the in-memory GOP ring;
+    this service talks to its local control API for status and clip triggers.
+    """
+    
+    def __init__(self):
+        self.control_url = settings.STREAM_CONTROL_URL.rstrip("/")
+        self._running = False
+    
+    def start(self):
+        """Start the streaming service."""
+        if self._running:
+            logger.warning("Streaming service is already running")
+            return
+        
+        self._running = True
+        logger.info(f"Streaming service started (supervisor at {self.control_url})")
+    
+    def stop(self):
+        """Stop the streaming service."""
+        if not self._running:
+            return
+        
+        self._running = False
+        logger.info("Streaming service stopped")
+    
+    def _request(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        """Blocking JSON request to the supervisor control API."""
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            f"{self.control_url}{path}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=settings.STREAM_CONTROL_TIMEOUT) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            # The supervisor answers errors with a JSON body too
+            try:
+                detail = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                detail = str(e)
+            raise RuntimeError(detail) from e
+    
+    async def _call(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        """Run a control API request without blocking the event loop."""
+        return await asyncio.to_thread(self._request, method, path, body)
+    
+    async def trigger_clip(self, reason: str = "api") -> dict:
+        """Ask the supervisor to record a pre-event clip."""
+        if not self._running:
+            raise RuntimeError("Streaming service is not running")
+        return await self._call("POST", "/clips", {"reason": reason})
+    
+    async def set_quality(self, framerate: Optional[int] = None, bitrate: Optional[int] = None) -> dict:
+        """Ask the supervisor to stream at a lower frame rate and/or bitrate, None for the configured one.
+        
+        The supervisor restarts the pipeline to apply a change.
+        """
+        if not self._running:
+            raise RuntimeError("Streaming service is not running")
+        return await self._call("POST", "/quality", {"framerate": framerate, "bitrate": bitrate})
+    
+    async def get_status(self) -> dict:
+        """Get the current status of the streaming pipeline."""
+        if not self._running:
+            return {"status": "stopped"}
+        try:
+            stats = await self._call("GET", "/status")
+        except (OSError, RuntimeError) as e:
+            return {"status": "unreachable", "error": str(e)}
+        return {
+            "status": "running" if stats.get("ffmpeg_pid") else "restarting",
+            "restart_count": stats.get("restart_count"),
+            "restarts_total": stats.get("restarts_total"),
+            "uptime": stats.get("uptime"),
+            "quality": stats.get("quality"),
+            "encoder": stats.get("encoder"),
+            "clips": stats.get("clips"),
+        }
+    
+    async def update_metrics(self):
+        """Refresh the stream gauges from the supervisor, called before each /metrics scrape."""
+        stats = None
+        if self._running:
+            try:
+                stats = await self._call("GET", "/status")
+            except (OSError, RuntimeError) as e:
+                logger.debug(f"Stream supervisor unreachable for metrics: {e}")
+        SUPERVISOR_UP.set(1 if stats else 0)
+        PIPELINE_UP.set(1 if stats and stats.get("ffmpeg_pid") else 0)
+        for gauge, keys in _STATS_GAUGES:
+            value = stats
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            # NaN when unknown (supervisor down, pipeline restarting) rather than a misleading zero
+            gauge.set(value if isinstance(value, (int, float)) else float("nan"))
+    
+    def is_running(self) -> bool:
+        """Check if the service is running."""
+        return self._running
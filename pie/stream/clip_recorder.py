@@ -0,0 +1,133 @@
+"""
+Pre-event clip recording for the stream service.
+On a trigger, writes the buffered seconds before the event plus a post-roll
+from the GOP ring to an MP4 clip by remuxing with ffmpeg, without re-encoding.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from h264 import AUD_NAL, strip_aud
+
+logger = logging.getLogger(__name__)
+
+
+class ClipRecorder:
+    """Writes pre-roll + post-roll clips from a GopRing off the capture path.
+
+    Memory use is bounded by the ring itself: the clip writer streams access
+    units from its own cursor into ffmpeg instead of collecting them. A trigger
+    that arrives while a clip is being written extends its post-roll.
+    """
+
+    def __init__(self, ring, output_dir, preroll, postroll, framerate):
+        self.ring = ring
+        self.output_dir = output_dir
+        self.preroll = preroll
+        self.postroll = postroll
+        self.framerate = framerate
+        self._lock = threading.Lock()
+        self._active = None
+        self.clips_written = 0
+        self.clips_failed = 0
+
+    def build_ffmpeg_cmd(self, path):
+        """Remux raw H.264 into MP4 with constant framerate timestamps."""
+        return [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "h264",
+            "-framerate", str(self.framerate),
+            "-i", "-",
+            "-c:v", "copy",
+            "-bsf:v", f"setts=ts=N/({self.framerate}*TB)",
+            "-movflags", "+faststart",
+            "-f", "mp4",
+            path
+        ]
+
+    def trigger(self, reason="api"):
+        """Start a clip for an event happening now, returns the clip path or None."""
+        now = time.time()
+        with self._lock:
+            if self._active is not None:
+                self._active["until"] = now + self.postroll
+                logger.info(f"Clip already recording, post-roll extended ({reason})")
+                return self._active["path"]
+
+            start_seq = self.ring.keyframe_at_or_before(now - self.preroll)
+            if start_seq is None:
+                logger.warning("No keyframe buffered yet, can't record a clip")
+                return None
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = f"clip-{datetime.fromtimestamp(now):%Y%m%d-%H%M%S}.mp4"
+            clip = {
+                "path": os.path.join(self.output_dir, name),
+                "reason": reason,
+                "triggered_at": now,
+                "until": now + self.postroll,
+            }
+            self._active = clip
+
+        logger.info(f"Recording clip {clip['path']} ({reason})")
+        threading.Thread(target=self._write_clip, args=(clip, start_seq), name="clip-writer", daemon=True).start()
+        return clip["path"]
+
+    def _write_clip(self, clip, start_seq):
+        cursor = self.ring.cursor("clip", start_seq)
+        partial = clip["path"] + ".part"
+        process = None
+        try:
+            process = subprocess.Popen(
+                self.build_ffmpeg_cmd(partial),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            frames = 0
+            while True:
+                access_unit = cursor.read(timeout=1)
+                with self._lock:
+                    until = clip["until"]
+                if access_unit is None:
+                    if time.time() > until:
+                        break  # camera went quiet, finish with what we have
+                    continue
+                if access_unit.timestamp > until:
+                    break
+                process.stdin.write(strip_aud(access_unit.data))
+                process.stdin.write(AUD_NAL)
+                frames += 1
+
+            _, stderr = process.communicate(timeout=30)
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode("utf-8", errors="ignore")[:500])
+            os.replace(partial, clip["path"])
+            self.clips_written += 1
+            gap = f", {cursor.skipped} frames lost to overrun" if cursor.skipped else ""
+            logger.info(f"Clip written: {clip['path']} ({frames} frames{gap})")
+        except Exception as e:
+            self.clips_failed += 1
+            logger.error(f"Failed to write clip {clip['path']}: {e}")
+            if process and process.poll() is None:
+                process.kill()
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            with self._lock:
+                self._active = None
+
+    def get_status(self):
+        """Get recorder state and counters."""
+        with self._lock:
+            active = dict(self._active) if self._active else None
+        return {
+            "preroll": self.preroll,
+            "postroll": self.postroll,
+            "recording": active["path"] if active else None,
+            "clips_written": self.clips_written,
+            "clips_failed": self.clips_failed,
+        }
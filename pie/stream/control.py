@@ -0,0 +1,155 @@
+"""
+Local control interfaces for the stream service.
+A small JSON HTTP API on localhost (used by pi-guard) and an MQTT subscription
+for remote triggers. Both run on their own threads, away from the capture path.
+"""
+import json
+import logging
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class ControlServer:
+    """JSON HTTP API dispatching (method, path) to handler functions.
+
+    Handlers take the decoded JSON body (or {}) and return (status, payload).
+    A payload that is an iterator of bytes is streamed until it ends or the
+    client disconnects.
+    """
+
+    def __init__(self, host, port, routes):
+        self.host = host
+        self.port = port
+        self.routes = routes
+        self._server = None
+
+    def start(self):
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method):
+                path = urlsplit(self.path).path.rstrip("/") or "/"
+                handler = routes.get((method, path))
+                if handler is None:
+                    return self._reply(404, {"error": "not found"})
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length)) if length else {}
+                    status, payload = handler(body)
+                except ValueError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    logger.error(f"Control request {method} {path} failed: {e}")
+                    status, payload = 500, {"error": str(e)}
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                if isinstance(payload, Iterator):
+                    return self._stream(status, payload)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status, chunks):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        self.wfile.write(chunk)
+                except OSError:
+                    pass  # client went away
+                finally:
+                    chunks.close()
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def log_message(self, format, *args):
+                logger.debug(f"Control API: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="control-api", daemon=True).start()
+        logger.info(f"Control API listening on http://{self.host}:{self._server.server_address[1]}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class MqttTrigger:
+    """Calls a function for every message on an MQTT topic."""
+
+    def __init__(self, broker, port, topic, on_message, transport="tcp", tls=False, ca_certs=None, keepalive=60):
+        self.broker = broker
+        self.port = port
+        self.topic = topic
+        self.on_message = on_message
+        self.transport = transport
+        self.tls = tls
+        self.ca_certs = ca_certs
+        self.keepalive = keepalive
+        self.client = None
+
+    def start(self):
+        """Connect in the background, returns False if paho-mqtt isn't installed."""
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            logger.warning("paho-mqtt not installed, MQTT triggers disabled")
+            return False
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, transport=self.transport)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        if self.tls:
+            self.client.tls_set(ca_certs=self.ca_certs)
+        # connect_async + loop_start retries in the background if the broker is down
+        self.client.connect_async(self.broker, self.port, self.keepalive)
+        self.client.loop_start()
+        return True
+
+    def stop(self):
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.client = None
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if not reason_code.is_failure:
+            # Subscribe on every connect so the subscription survives reconnects
+            client.subscribe(self.topic, qos=1)
+            logger.info(f"Subscribed to MQTT trigger topic {self.topic}")
+        else:
+            logger.error(f"Failed to connect to MQTT broker: {reason_code}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.warning(f"MQTT trigger connection lost, reconnecting: {reason_code}")
+
+    def _on_message(self, client, userdata, message):
+        try:
+            payload = json.loads(message.payload) if message.payload else {}
+        except ValueError:
+            payload = {}
+        if not isinstance(payload, dict):
+            payload = {}
+        try:
+            self.on_message(payload)
+        except Exception as e:
+            logger.error(f"MQTT trigger handler failed: {e}")
@@ -0,0 +1,209 @@
+"""
+In-memory ring of recent H.264 access units for the stream service.
+One producer (the camera reader) appends access units into preallocated storage;
+any number of consumers read through their own cursors without ever blocking it.
+"""
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+AccessUnit = namedtuple("AccessUnit", ["seq", "timestamp", "keyframe", "data"])
+
+
+class GopRing:
+    """Bounded ring of access units that always starts on a keyframe.
+
+    Storage is one preallocated byte buffer plus fixed-size metadata arrays, so
+    appending copies the access unit in without allocating. When space runs out
+    the oldest whole GOPs are evicted.
+    """
+
+    def __init__(self, capacity_bytes, max_units):
+        self.capacity_bytes = capacity_bytes
+        self.max_units = max_units
+        self._data = bytearray(capacity_bytes)
+        self._view = memoryview(self._data)
+        self._offsets = array("q", bytes(8 * max_units))
+        self._lengths = array("q", bytes(8 * max_units))
+        self._timestamps = array("d", bytes(8 * max_units))
+        self._keyframes = bytearray(max_units)
+        self._cond = threading.Condition()
+        self._write_pos = 0
+        self.head_seq = 0  # sequence number of the next access unit
+        self.tail_seq = 0  # oldest access unit still readable
+        self.bytes_used = 0
+        self.oversized = 0  # access units larger than the whole ring, dropped
+
+    def append(self, data, keyframe, timestamp=None):
+        """Store an access unit, evicting the oldest GOPs if needed. Never blocks on readers."""
+        length = len(data)
+        if length > self.capacity_bytes:
+            self.oversized += 1
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._cond:
+            # Access units are stored contiguously, wrap to the start if this one doesn't fit
+            pos = self._write_pos
+            wrap_from = None
+            if pos + length > self.capacity_bytes:
+                wrap_from, pos = pos, 0
+            self._evict(pos, length, wrap_from)
+
+            self._view[pos:pos + length] = data
+            slot = self.head_seq % self.max_units
+            self._offsets[slot] = pos
+            self._lengths[slot] = length
+            self._timestamps[slot] = timestamp
+            self._keyframes[slot] = 1 if keyframe else 0
+            self._write_pos = pos + length
+            self.bytes_used += length
+            self.head_seq += 1
+            # A ring that doesn't start on a keyframe has nothing decodable yet
+            if self.tail_seq == self.head_seq - 1 and not keyframe:
+                self._drop_oldest()
+            self._cond.notify_all()
+
+    def _evict(self, pos, length, wrap_from=None):
+        """Drop access units that overlap the write range, then the rest of their GOP.
+
+        After a wrap, units past wrap_from are the oldest ones and get dropped too.
+        """
+        end = pos + length
+        evicted = False
+        while self.tail_seq < self.head_seq:
+            slot = self.tail_seq % self.max_units
+            offset = self._offsets[slot]
+            full = self.head_seq - self.tail_seq >= self.max_units
+            skipped = wrap_from is not None and offset >= wrap_from
+            overlaps = offset < end and pos < offset + self._lengths[slot]
+            if not (full or skipped or overlaps):
+                break
+            self._drop_oldest()
+            evicted = True
+        if evicted:
+            # A GOP without its keyframe can't be decoded, drop the remainder too
+            while self.tail_seq < self.head_seq and not self._keyframes[self.tail_seq % self.max_units]:
+                self._drop_oldest()
+
+    def _drop_oldest(self):
+        slot = self.tail_seq % self.max_units
+        self.bytes_used -= self._lengths[slot]
+        self.tail_seq += 1
+
+    def _unit(self, seq):
+        """Copy out an access unit, caller holds the lock."""
+        slot = seq % self.max_units
+        offset = self._offsets[slot]
+        return AccessUnit(
+            seq,
+            self._timestamps[slot],
+            bool(self._keyframes[slot]),
+            bytes(self._view[offset:offset + self._lengths[slot]]),
+        )
+
+    def _latest_keyframe_seq(self):
+        """Sequence number of the newest keyframe, caller holds the lock."""
+        seq = self.head_seq - 1
+        while seq >= self.tail_seq:
+            if self._keyframes[seq % self.max_units]:
+                return seq
+            seq -= 1
+        return None
+
+    def keyframe_at_or_before(self, timestamp):
+        """Sequence number of the newest keyframe captured at or before timestamp.
+
+        Falls back to the oldest keyframe if the ring doesn't reach back that far.
+        """
+        with self._cond:
+            found = None
+            seq = self.head_seq - 1
+            while seq >= self.tail_seq:
+                slot = seq % self.max_units
+                if self._keyframes[slot]:
+                    found = seq
+                    if self._timestamps[slot] <= timestamp:
+                        break
+                seq -= 1
+            return found
+
+    def latest_gop(self):
+        """Copy out the newest keyframe and everything after it."""
+        with self._cond:
+            start = self._latest_keyframe_seq()
+            if start is None:
+                return []
+            return [self._unit(seq) for seq in range(start, self.head_seq)]
+
+    def cursor(self, name, start_seq=None):
+        """Create a consumer cursor.
+
+        By default the cursor waits for the next keyframe, so a new consumer
+        starts on a decodable picture without replaying old frames.
+        """
+        return RingCursor(self, name, start_seq)
+
+    def stats(self):
+        """Get ring occupancy figures."""
+        with self._cond:
+            units = self.head_seq - self.tail_seq
+            span = 0.0
+            if units:
+                span = (self._timestamps[(self.head_seq - 1) % self.max_units]
+                        - self._timestamps[self.tail_seq % self.max_units])
+            return {
+                "units": units,
+                "bytes_used": self.bytes_used,
+                "capacity_bytes": self.capacity_bytes,
+                "seconds": span,
+                "head_seq": self.head_seq,
+                "tail_seq": self.tail_seq,
+                "oversized": self.oversized,
+            }
+
+
+class RingCursor:
+    """A consumer's read position in a GopRing.
+
+    A consumer that falls behind far enough for its next access unit to be
+    evicted skips ahead to the newest keyframe rather than slowing anyone else.
+    """
+
+    def __init__(self, ring, name, start_seq=None):
+        self.ring = ring
+        self.name = name
+        self.seq = ring.head_seq if start_seq is None else start_seq
+        self.need_keyframe = start_seq is None
+        self.delivered = 0
+        self.skipped = 0
+
+    def read(self, timeout=None):
+        """Get the next access unit, or None if none arrives within timeout."""
+        ring = self.ring
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with ring._cond:
+            while True:
+                if self.seq < ring.tail_seq:
+                    # Overrun: resume at the newest keyframe
+                    latest = ring._latest_keyframe_seq()
+                    resume = ring.tail_seq if latest is None else latest
+                    self.skipped += resume - self.seq
+                    self.seq = resume
+                while self.seq < ring.head_seq:
+                    seq = self.seq
+                    self.seq += 1
+                    if self.need_keyframe and not ring._keyframes[seq % ring.max_units]:
+                        self.skipped += 1
+                        continue
+                    self.need_keyframe = False
+                    self.delivered += 1
+                    return ring._unit(seq)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                ring._cond.wait(remaining)
+
+    def lag(self):
+        """Number of access units waiting for this consumer."""
+        return max(0, self.ring.head_seq - max(self.seq, self.ring.tail_seq))
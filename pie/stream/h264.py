@@ -0,0 +1,131 @@
+"""
+H.264 Annex B stream parsing for the stream service.
+Splits the byte stream from rpicam-vid --inline into NAL units and groups them
+into access units (one encoded picture each) without decoding anything.
+"""
+
+START_CODE = b"\x00\x00\x01"
+
+# NAL unit types (ITU-T H.264 table 7-1)
+NAL_SLICE = 1
+NAL_IDR_SLICE = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+VCL_TYPES = (NAL_SLICE, NAL_IDR_SLICE)
+
+# NAL types that can only appear before the first slice of a picture (7.4.1.2.3)
+AU_START_TYPES = (NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD, 14, 15, 16, 17, 18)
+
+# Access unit delimiter (primary_pic_type 7: any slice type)
+AUD_NAL = b"\x00\x00\x00\x01\x09\xf0"
+
+
+def nal_type(access_unit, offset=0):
+    """Get the type of the NAL unit whose start code begins at offset."""
+    header = access_unit.find(START_CODE, offset) + 3
+    return access_unit[header] & 0x1F
+
+
+def strip_aud(access_unit):
+    """Drop a leading access unit delimiter, returns a view of the rest."""
+    view = memoryview(access_unit)
+    if nal_type(access_unit) != NAL_AUD:
+        return view
+    next_nal = access_unit.find(START_CODE, access_unit.find(START_CODE) + 3)
+    if next_nal < 0:
+        return view[len(view):]
+    if next_nal > 0 and access_unit[next_nal - 1] == 0:
+        next_nal -= 1  # four byte start code
+    return view[next_nal:]
+
+
+class AccessUnitParser:
+    """Incremental Annex B parser that emits complete access units.
+
+    An access unit is emitted once the first NAL of the next one arrives, so
+    the newest picture is held until the camera sends the following frame.
+    """
+
+    def __init__(self, on_access_unit):
+        # on_access_unit(view, keyframe): view is only valid during the call
+        self.on_access_unit = on_access_unit
+        self._buffer = bytearray()
+        self._scan_pos = 0
+        self._au_start = -1  # -1 until the first start code has been seen
+        self._au_has_vcl = False
+        self._au_keyframe = False
+        self.access_units = 0
+        self.bytes_parsed = 0
+
+    def reset(self):
+        """Forget any partial data, e.g. when the camera process restarts."""
+        self._buffer.clear()
+        self._scan_pos = 0
+        self._au_start = -1
+        self._au_has_vcl = False
+        self._au_keyframe = False
+
+    def feed(self, data):
+        """Parse a chunk of the byte stream."""
+        buffer = self._buffer
+        buffer += data
+        self.bytes_parsed += len(data)
+        end = len(buffer)
+
+        while True:
+            index = buffer.find(START_CODE, self._scan_pos)
+            # Need the NAL header and the first slice header byte to classify it
+            if index < 0 or index + 4 >= end:
+                break
+            start = index - 1 if index > 0 and buffer[index - 1] == 0 else index
+            nal = buffer[index + 3] & 0x1F
+
+            if self._au_start < 0:
+                self._au_start = start
+            elif self._au_has_vcl and (
+                nal in AU_START_TYPES
+                # first_mb_in_slice == 0 (ue(v) "1") starts a new picture
+                or (nal in VCL_TYPES and buffer[index + 4] & 0x80)
+            ):
+                self._emit(start)
+
+            if nal in VCL_TYPES:
+                self._au_has_vcl = True
+                if nal == NAL_IDR_SLICE:
+                    self._au_keyframe = True
+            self._scan_pos = index + 3
+
+        if self._au_start < 0:
+            if index >= 0:
+                # A start code whose NAL header hasn't arrived yet, keep it for the next chunk
+                keep_from = index - 1 if index > 0 and buffer[index - 1] == 0 else index
+            else:
+                # No start code yet, keep the last bytes in case one straddles chunks
+                keep_from = max(0, end - 3)
+            del buffer[:keep_from]
+            self._scan_pos = 0
+        elif self._au_start > 0:
+            # Drop emitted data; deleting from the front of a bytearray is O(1)
+            del buffer[:self._au_start]
+            self._scan_pos = max(0, self._scan_pos - self._au_start)
+            self._au_start = 0
+        if index < 0:
+            # Resume the next scan where a start code could still straddle chunks
+            self._scan_pos = max(self._scan_pos, len(buffer) - 3)
+
+    def flush(self):
+        """Emit the buffered access unit, e.g. at end of stream."""
+        if self._au_start >= 0 and self._au_has_vcl:
+            self._emit(len(self._buffer))
+        self.reset()
+
+    def _emit(self, end):
+        with memoryview(self._buffer) as view:
+            self.on_access_unit(view[self._au_start:end], self._au_keyframe)
+        self.access_units += 1
+        self._au_start = end
+        self._au_has_vcl = False
+        self._au_keyframe = False
@@ -0,0 +1,173 @@
+"""
+On-disk index of recorded segments for the stream service.
+
+Layout under the recording directory:
+    index/segments.idx           header + one fixed-size record per segment, in time order
+    segments/YYYYMMDD/<ms>.mp4   fragmented MP4 segment named by its start time (ms since epoch)
+    segments/YYYYMMDD/<ms>.kfi   keyframe sidecar: (time_ms, byte offset) per fragment
+
+Every MP4 fragment starts on a keyframe, so a time range maps to the init
+section (ftyp + moov) of a segment plus a byte range from a keyframe's
+fragment onwards. Records are fixed-size, so lookups are a binary search over
+the memory-mapped index without reading any segment. Retention drops segments
+from the front by advancing first_live in the header.
+
+This module is the writer. The one reader, pie/pi-guard/modules/recordings/index.py,
+serves GET /recordings; benchmarks/recording_index.py checks that both agree
+on the format.
+"""
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"PGSI"
+INDEX_VERSION = 1
+# magic, version, record size, first live record
+HEADER = struct.Struct("<4sHHQ")
+# start_ms, end_ms, file size, init section size, keyframe count
+RECORD = struct.Struct("<qqQII")
+# time_ms, byte offset of the keyframe's fragment
+KEYFRAME = struct.Struct("<qQ")
+
+# Compact the index file once this many dead records precede the live ones
+COMPACT_THRESHOLD = 1024
+
+
+def segment_path(root, start_ms, extension=".mp4"):
+    """Path of a segment file (or its sidecar) from its start time."""
+    day = datetime.fromtimestamp(start_ms / 1000).strftime("%Y%m%d")
+    return os.path.join(root, "segments", day, f"{start_ms}{extension}")
+
+
+def scan_fragments(path):
+    """Find (init section size, [moof offsets]) by walking the top-level MP4 boxes."""
+    offsets = []
+    init_size = 0
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            header = f.read(16)
+            box_size, box_type = struct.unpack_from(">I4s", header)
+            if box_size == 1:
+                box_size = struct.unpack_from(">Q", header, 8)[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < 8:
+                break  # corrupt box, stop rather than loop
+            if box_type == b"moof":
+                if not offsets:
+                    init_size = offset
+                offsets.append(offset)
+            offset += box_size
+    return init_size, offsets
+
+
+class SegmentIndex:
+    """Append-only segment index with size and age based retention (writer side)."""
+
+    def __init__(self, root, max_bytes, max_age):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.path = os.path.join(root, "index", "segments.idx")
+        self.first_live = 0
+        self.count = 0
+        self.total_bytes = 0
+        self._file = None
+
+    def open(self):
+        """Open or create the index; reads only the index file, never the segments."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Created whole (atomic replace) so a reader never sees a short header; a short file from
+        # a crash before that holds no records yet
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            temp = self.path + ".tmp"
+            with open(temp, "wb") as f:
+                f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, RECORD.size, 0))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        self._file = open(self.path, "r+b")
+        magic, version, record_size, self.first_live = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION or record_size != RECORD.size:
+            raise ValueError(f"Unsupported segment index {self.path}")
+
+        # Drop a torn record left by a crash mid-append
+        size = os.fstat(self._file.fileno()).st_size
+        self.count = (size - HEADER.size) // RECORD.size
+        self._file.truncate(HEADER.size + self.count * RECORD.size)
+
+        self._file.seek(HEADER.size + self.first_live * RECORD.size)
+        live = self._file.read((self.count - self.first_live) * RECORD.size)
+        self.total_bytes = sum(record[2] for record in RECORD.iter_unpack(live))
+        logger.info(f"Segment index: {self.count - self.first_live} segments, {self.total_bytes / 1e9:.2f} GB")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _read(self, index):
+        self._file.seek(HEADER.size + index * RECORD.size)
+        return RECORD.unpack(self._file.read(RECORD.size))
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, RECORD.size, self.first_live))
+
+    def add(self, start_ms, end_ms, size, init_size, keyframes):
+        """Record a finished segment and its keyframes [(time_ms, offset)], then apply retention."""
+        with open(segment_path(self.root, start_ms, ".kfi"), "wb") as f:
+            f.write(b"".join(KEYFRAME.pack(t, o) for t, o in keyframes))
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(RECORD.pack(start_ms, end_ms, size, init_size, len(keyframes)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.count += 1
+        self.total_bytes += size
+        self.enforce_retention()
+
+    def enforce_retention(self, now=None):
+        """Delete the oldest segments while over the disk budget or the maximum age."""
+        oldest_allowed_ms = ((now or time.time()) - self.max_age) * 1000
+        removed = 0
+        while self.first_live < self.count:
+            start_ms, end_ms, size, _, _ = self._read(self.first_live)
+            if self.total_bytes <= self.max_bytes and end_ms >= oldest_allowed_ms:
+                break
+            for extension in (".mp4", ".kfi"):
+                try:
+                    os.remove(segment_path(self.root, start_ms, extension))
+                except FileNotFoundError:
+                    pass
+            self.first_live += 1
+            self.total_bytes -= size
+            removed += 1
+        if removed:
+            self._write_header()
+            self._file.flush()
+            logger.info(f"Retention removed {removed} segments")
+            if self.first_live >= COMPACT_THRESHOLD:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the index without dead records (atomic replace)."""
+        self._file.seek(HEADER.size + self.first_live * RECORD.size)
+        live = self._file.read()
+        temp = self.path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, RECORD.size, 0))
+            f.write(live)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        self._file.close()
+        self._file = open(self.path, "r+b")
+        self.count -= self.first_live
+        self.first_live = 0
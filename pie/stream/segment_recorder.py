@@ -0,0 +1,193 @@
+"""
+Continuous segmented recording for the stream service.
+Remuxes access units from the GOP ring into fixed-length fragmented MP4
+segments with ffmpeg (no re-encoding) and records each finished segment in
+the on-disk SegmentIndex.
+"""
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from h264 import AUD_NAL, strip_aud
+from segment_index import SegmentIndex, scan_fragments, segment_path
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentRecorder(threading.Thread):
+    """Ring consumer that writes back-to-back fMP4 segments.
+
+    Segments are cut on the first keyframe after segment_seconds and on any
+    capture gap longer than max_gap (e.g. a camera restart), so timestamps
+    inside a segment stay continuous. Fragments start on every keyframe, which
+    makes each keyframe a byte offset a player can start from.
+    """
+
+    def __init__(self, ring, root, segment_seconds, framerate, max_bytes, max_age, max_gap=1.0):
+        super().__init__(name="segment-recorder", daemon=True)
+        self.ring = ring
+        self.root = root
+        self.segment_seconds = segment_seconds
+        self.framerate = framerate
+        self.max_gap = max_gap
+        self.index = SegmentIndex(root, max_bytes, max_age)
+        self.current_path = os.path.join(root, "index", "current")
+        self._stop_event = threading.Event()
+        self._segment = None
+        self.cursor = None
+        self.segments_written = 0
+        self.segments_failed = 0
+
+    def build_ffmpeg_cmd(self, path):
+        """Remux raw H.264 into fragmented MP4, one fragment per keyframe."""
+        return [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "h264",
+            "-framerate", str(self.framerate),
+            "-i", "-",
+            "-c:v", "copy",
+            "-bsf:v", f"setts=ts=N/({self.framerate}*TB)",
+            "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+            "-f", "mp4",
+            path
+        ]
+
+    def start(self):
+        self.index.open()
+        self._remove_unfinished()
+        self.cursor = self.ring.cursor("recording")
+        super().start()
+
+    def stop(self, timeout=10):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        self.index.close()
+
+    def _remove_unfinished(self):
+        """Delete the segment a crash left half-written, named in index/current."""
+        try:
+            with open(self.current_path) as f:
+                partial = f.read().strip()
+        except FileNotFoundError:
+            return
+        if partial and os.path.exists(partial):
+            logger.warning(f"Removing unfinished segment {partial}")
+            os.remove(partial)
+        os.remove(self.current_path)
+
+    def run(self):
+        last_timestamp = None
+        while not self._stop_event.is_set():
+            access_unit = self.cursor.read(timeout=1)
+            if access_unit is None:
+                if self._segment and time.time() - last_timestamp > self.max_gap:
+                    self._close_segment()
+                continue
+
+            if self._segment and (
+                access_unit.timestamp - last_timestamp > self.max_gap
+                or (access_unit.keyframe and access_unit.timestamp - self._segment["start"] >= self.segment_seconds)
+            ):
+                self._close_segment()
+            if self._segment is None:
+                if not access_unit.keyframe:
+                    continue
+                self._open_segment(access_unit.timestamp)
+                if self._segment is None:
+                    continue
+
+            segment = self._segment
+            try:
+                # Delimiter first: latency doesn't matter here and a trailing one
+                # would end the segment with an empty sample
+                segment["process"].stdin.write(AUD_NAL)
+                segment["process"].stdin.write(strip_aud(access_unit.data))
+            except OSError as e:
+                logger.error(f"Segment writer failed: {e}")
+                self._close_segment()
+                continue
+            if access_unit.keyframe:
+                segment["keyframes"].append(int(access_unit.timestamp * 1000))
+            segment["end"] = access_unit.timestamp + 1 / self.framerate
+            last_timestamp = access_unit.timestamp
+
+        if self._segment:
+            self._close_segment()
+
+    def _open_segment(self, timestamp):
+        start_ms = int(timestamp * 1000)
+        path = segment_path(self.root, start_ms)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(self.current_path, "w") as f:
+            f.write(path + ".part")
+        try:
+            process = subprocess.Popen(
+                self.build_ffmpeg_cmd(path + ".part"),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            self.segments_failed += 1
+            logger.error(f"Failed to start segment writer: {e}")
+            return
+        self._segment = {
+            "start_ms": start_ms,
+            "start": timestamp,
+            "end": timestamp,
+            "path": path,
+            "process": process,
+            "keyframes": [],
+        }
+
+    def _close_segment(self):
+        segment, self._segment = self._segment, None
+        process = segment["process"]
+        partial = segment["path"] + ".part"
+        try:
+            _, stderr = process.communicate(timeout=30)
+            if process.returncode != 0:
+                raise RuntimeError(stderr.decode("utf-8", errors="ignore")[:500])
+            os.replace(partial, segment["path"])
+
+            init_size, offsets = scan_fragments(segment["path"])
+            if len(offsets) != len(segment["keyframes"]):
+                logger.warning(
+                    f"Segment {segment['path']} has {len(offsets)} fragments "
+                    f"for {len(segment['keyframes'])} keyframes"
+                )
+            self.index.add(
+                segment["start_ms"],
+                int(segment["end"] * 1000),
+                os.path.getsize(segment["path"]),
+                init_size,
+                list(zip(segment["keyframes"], offsets)),
+            )
+            self.segments_written += 1
+        except Exception as e:
+            self.segments_failed += 1
+            logger.error(f"Failed to write segment {segment['path']}: {e}")
+            if process.poll() is None:
+                process.kill()
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            if os.path.exists(self.current_path):
+                os.remove(self.current_path)
+
+    def get_status(self):
+        """Get recorder state and counters."""
+        segment = self._segment
+        return {
+            "recording": segment["path"] if segment else None,
+            "segments": self.index.count - self.index.first_live,
+            "bytes": self.index.total_bytes,
+            "max_bytes": self.index.max_bytes,
+            "max_age": self.index.max_age,
+            "segments_written": self.segments_written,
+            "segments_failed": self.segments_failed,
+            "skipped": self.cursor.skipped if self.cursor else 0,
+        }
@@ -0,0 +1,178 @@
+"""
+Stderr draining for the stream service child processes.
+Keeps rpicam-vid and ffmpeg stderr pipes empty from background threads, parses
+their progress output into live statistics and keeps the last lines for crash reports.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Lines kept per process for crash reports
+STDERR_TAIL_LINES = 50
+
+# ffmpeg "-progress pipe:2" output: one key=value per line, each block ends with "progress=..."
+FFMPEG_PROGRESS_KEYS = {
+    "frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+    "dup_frames", "drop_frames", "speed", "progress",
+}
+
+# rpicam-vid per-frame line: "#123 (30.01 fps) exp 33251.00 ag 8.00 dg 1.00"
+CAMERA_FRAME_PATTERN = re.compile(r"^#(\d+) \(([\d.]+) fps\)")
+
+
+def _to_float(value):
+    """Parse a number with an optional unit suffix, None if it isn't one ("N/A")."""
+    match = re.match(r"[-+]?\d*\.?\d+", value)
+    return float(match.group()) if match else None
+
+
+class EncoderStats:
+    """Live ffmpeg encoder statistics parsed from its progress output."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._block = {}
+        self.reset()
+
+    def reset(self):
+        """Clear statistics for a new ffmpeg process."""
+        with self._lock:
+            self._block = {}
+            self.frame = 0
+            self.fps = 0.0
+            self.bitrate_kbps = 0.0
+            self.speed = 0.0
+            self.dup = 0
+            self.drop = 0
+            self.total_size = 0
+            self.out_time_us = 0
+            self.updated_at = None
+            self.last_progress_at = None
+
+    def parse(self, line):
+        """Update from an ffmpeg stderr line, returns True if it was a progress line."""
+        key, sep, value = line.partition("=")
+        if not sep or (key not in FFMPEG_PROGRESS_KEYS and not key.startswith("stream_")):
+            return False
+        if key != "progress":
+            self._block[key] = value
+            return True
+
+        # End of a progress block, publish it as one update
+        block, self._block = self._block, {}
+        now = time.monotonic()
+        with self._lock:
+            frame = int(_to_float(block.get("frame", "")) or 0)
+            total_size = int(_to_float(block.get("total_size", "")) or 0)
+            out_time_us = int(_to_float(block.get("out_time_us", "")) or 0)
+            # Stream copy to RTSP reports neither frames nor size on newer ffmpeg,
+            # so any of the counters moving counts as progress
+            if frame > self.frame or total_size > self.total_size or out_time_us > self.out_time_us:
+                self.last_progress_at = now
+            self.frame = frame
+            self.total_size = total_size
+            self.out_time_us = out_time_us
+            self.fps = _to_float(block.get("fps", "")) or 0.0
+            self.bitrate_kbps = _to_float(block.get("bitrate", "")) or 0.0
+            self.speed = _to_float(block.get("speed", "")) or 0.0
+            self.dup = int(_to_float(block.get("dup_frames", "")) or 0)
+            self.drop = int(_to_float(block.get("drop_frames", "")) or 0)
+            self.updated_at = now
+        return True
+
+    def snapshot(self):
+        """Get a consistent copy of the statistics."""
+        with self._lock:
+            return {
+                "frame": self.frame,
+                "fps": self.fps,
+                "bitrate_kbps": self.bitrate_kbps,
+                "speed": self.speed,
+                "dup": self.dup,
+                "drop": self.drop,
+                "total_size": self.total_size,
+                "out_time_us": self.out_time_us,
+                "updated_at": self.updated_at,
+                "last_progress_at": self.last_progress_at,
+            }
+
+
+class CameraStats:
+    """Live rpicam-vid statistics parsed from its per-frame lines."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear statistics for a new camera process."""
+        with self._lock:
+            self.frame = 0
+            self.fps = 0.0
+            self.updated_at = None
+
+    def parse(self, line):
+        """Update from an rpicam-vid stderr line, returns True if it was a frame line."""
+        match = CAMERA_FRAME_PATTERN.match(line)
+        if not match:
+            return False
+        with self._lock:
+            self.frame = int(match.group(1))
+            self.fps = float(match.group(2))
+            self.updated_at = time.monotonic()
+        return True
+
+    def snapshot(self):
+        """Get a consistent copy of the statistics."""
+        with self._lock:
+            return {"frame": self.frame, "fps": self.fps, "updated_at": self.updated_at}
+
+
+class StderrDrain(threading.Thread):
+    """Background reader that keeps a child's stderr pipe from filling up."""
+
+    def __init__(self, name, pipe, stats=None, max_lines=STDERR_TAIL_LINES):
+        super().__init__(name=f"{name}-stderr", daemon=True)
+        self.process_name = name
+        self.pipe = pipe
+        self.stats = stats
+        self._tail = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+
+    def run(self):
+        pending = b""
+        try:
+            while True:
+                chunk = self.pipe.read(4096)
+                if not chunk:
+                    break
+                # Progress meters end lines with \r, everything else with \n
+                lines = (pending + chunk).replace(b"\r", b"\n").split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    self._handle_line(line)
+            if pending:
+                self._handle_line(pending)
+        except (OSError, ValueError) as e:
+            # Pipe closed underneath us during cleanup
+            logger.debug(f"{self.process_name} stderr reader stopped: {e}")
+
+    def _handle_line(self, raw):
+        line = raw.decode("utf-8", errors="ignore").strip()
+        if not line:
+            return
+        # Progress lines only go to the stats, the tail keeps diagnostics
+        if self.stats and self.stats.parse(line):
+            return
+        with self._lock:
+            self._tail.append(line)
+        logger.debug(f"{self.process_name}: {line}")
+
+    def tail(self):
+        """Get the last stderr lines, oldest first."""
+        with self._lock:
+            return list(self._tail)
@@ -2,15 +2,27 @@
 """
 RTSP Camera Stream Service
 Streams video from Raspberry Pi camera to RTSP server using rpicam-vid and ffmpeg.
+The camera's H.264 is read in-process into a ring of recent GOPs that feeds the
+RTSP push and any other local consumers.
 Designed to run as a systemd service with auto-restart capabilities.
 """
+import os
 import subprocess
+import threading
 import time
 import signal
 import sys
 import logging
 from datetime import datetime
 
+from clip_recorder import ClipRecorder
+from control import ControlServer, MqttTrigger
+from gop_ring import GopRing
+from h264 import AUD_NAL, AccessUnitParser, strip_aud
+from segment_recorder import SegmentRecorder
+from stderr_drain import CameraStats, EncoderStats, StderrDrain
+from video_source import build_source_cmd
+
 # Configure logging for systemd
 logging.basicConfig(
     level=logging.INFO,
@@ -20,116 +32,375 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # RTSP server endpoint
-RTSP_URL = "rtsp://pi-guardian.kcolville.com:8554/cam"
+RTSP_URL = os.getenv("RTSP_URL", "rtsp://pi-guardian.kcolville.com:8554/cam")
+
+# Pipeline mode: "passthrough" remuxes the camera's H.264 as-is,
+# "transcode" decodes and re-encodes it with libx264
+PIPELINE_MODES = ("passthrough", "transcode")
+PIPELINE_MODE = os.getenv("STREAM_PIPELINE_MODE", "passthrough").lower()
+WIDTH, HEIGHT = 1280, 720
+FRAMERATE = 30
+BITRATE = 1000000
 
 # Camera command
 CAMERA_CMD = [
     "rpicam-vid",
-    "--mode", "1280:720:10",
-    "--framerate", "30",
-    "--bitrate", "1000000",
+    "--mode", f"{WIDTH}:{HEIGHT}:10",
+    "--framerate", str(FRAMERATE),
+    "--bitrate", str(BITRATE),
+    "--intra", str(FRAMERATE),  # keyframe every second (the GOP ffmpeg used to set)
     "--inline",
     "--nopreview",
     "--timeout", "0",
     "-o", "-"
 ]
 
-# FFmpeg command
-FFMPEG_CMD = [
+# Video source: "camera" (rpicam-vid), "synthetic" (an ffmpeg test pattern at the
+# camera's settings), "stamped" (the same with each frame's capture time in the picture)
+# or "replay" (a recorded H.264 file), see video_source.py
+VIDEO_SOURCE = os.getenv("STREAM_VIDEO_SOURCE", "camera").lower()
+VIDEO_TRACE = os.getenv("STREAM_VIDEO_TRACE", "")  # replay: Annex B H.264 file
+VIDEO_SPEED = float(os.getenv("STREAM_VIDEO_SPEED", "1"))  # replay: multiple of real time, 0 for unpaced
+
+# Frame rate and bitrate the pipeline runs at: FRAMERATE and BITRATE unless
+# pi-guard's resource governor lowered them (POST /quality) to shed load
+quality = {"framerate": FRAMERATE, "bitrate": BITRATE}
+quality_changed = False
+
+def set_options(command, values):
+    """A copy of command with the value after each option in values replaced."""
+    command = list(command)
+    for i, option in enumerate(command[:-1]):
+        if option in values:
+            command[i + 1] = str(values[option])
+    return command
+
+def build_camera_cmd(source=VIDEO_SOURCE):
+    """Build the command for the video source."""
+    framerate, bitrate = quality["framerate"], quality["bitrate"]
+    camera_cmd = set_options(CAMERA_CMD, {"--framerate": framerate, "--bitrate": bitrate, "--intra": framerate})
+    return build_source_cmd(source, camera_cmd, WIDTH, HEIGHT, framerate, bitrate, VIDEO_TRACE, VIDEO_SPEED)
+
+# FFmpeg input: raw H.264 on stdin carries no timestamps, so stamp packets on
+# arrival (copy mode can't regenerate them), minimal probing so the first
+# frames aren't held back
+FFMPEG_INPUT = [
     "ffmpeg",
     "-f", "h264",
+    "-framerate", str(FRAMERATE),
+    "-use_wallclock_as_timestamps", "1",
+    "-probesize", "32",
+    "-analyzeduration", "0",
     "-i", "-",
-    "-vf", "scale=1280:720",
-    "-c:v", "libx264",
-    "-preset", "ultrafast",
-    "-tune", "zerolatency",
-    "-g", "30",
-    "-rtsp_transport", "tcp",
-    "-f", "rtsp",
-    RTSP_URL
 ]
 
+# FFmpeg video options per pipeline mode
+FFMPEG_VIDEO_OPTS = {
+    "passthrough": [
+        "-c:v", "copy",
+    ],
+    "transcode": [
+        "-vf", f"scale={WIDTH}:{HEIGHT}",
+        "-c:v", "libx264",
+        "-preset", "ultrafast",
+        "-tune", "zerolatency",
+        "-g", str(FRAMERATE),
+    ],
+}
+
+def build_ffmpeg_cmd(mode=PIPELINE_MODE, rtsp_url=RTSP_URL):
+    """Build the ffmpeg command for a pipeline mode."""
+    if mode not in FFMPEG_VIDEO_OPTS:
+        raise ValueError(f"Unknown pipeline mode: {mode} (expected one of {PIPELINE_MODES})")
+    video_opts = FFMPEG_VIDEO_OPTS[mode]
+    if mode == "transcode":
+        # A keyframe a second at the frame rate in use, and libx264 held to a lowered bitrate
+        video_opts = set_options(video_opts, {"-g": quality["framerate"]})
+        if quality["bitrate"] < BITRATE:
+            video_opts += ["-b:v", str(quality["bitrate"])]
+    return FFMPEG_INPUT + video_opts + [
+        "-progress", "pipe:2",  # machine readable stats for the stderr reader
+        "-nostats",
+        "-rtsp_transport", "tcp",
+        "-f", "rtsp",
+        rtsp_url
+    ]
+
+# Pre-event clips: seconds kept before a trigger and recorded after it
+CLIP_PREROLL = float(os.getenv("STREAM_CLIP_PREROLL", "10"))
+CLIP_POSTROLL = float(os.getenv("STREAM_CLIP_POSTROLL", "10"))
+CLIP_DIR = os.getenv("STREAM_CLIP_DIR", "clips")
+
+# In-memory ring of recent GOPs read from the camera, shared by every consumer
+# (RTSP push, snapshots, clips). It must cover the clip pre-roll plus one GOP
+# to start on a keyframe. Its memory is a hard cap of RING_SECONDS at twice the
+# target bitrate (room for keyframes), allocated once and kept across restarts.
+RING_SECONDS = max(float(os.getenv("STREAM_RING_SECONDS", "4")), CLIP_PREROLL + 1)
+RING_HEADROOM = 2
+gop_ring = GopRing(
+    capacity_bytes=int(BITRATE / 8 * RING_SECONDS * RING_HEADROOM),
+    max_units=int(FRAMERATE * RING_SECONDS * RING_HEADROOM)
+)
+clip_recorder = ClipRecorder(gop_ring, CLIP_DIR, CLIP_PREROLL, CLIP_POSTROLL, FRAMERATE)
+CAMERA_READ_SIZE = 65536
+push_cursor = None
+
+# Continuous recording into fixed-length fMP4 segments, oldest deleted first
+# once the disk budget or maximum age is exceeded
+RECORDING_ENABLED = os.getenv("STREAM_RECORDING", "false").lower() == "true"
+RECORDING_DIR = os.getenv("STREAM_RECORDING_DIR", "recordings")
+SEGMENT_SECONDS = float(os.getenv("STREAM_SEGMENT_SECONDS", "60"))
+RECORDING_MAX_BYTES = int(float(os.getenv("STREAM_RECORDING_MAX_GB", "8")) * 1e9)
+RECORDING_MAX_AGE = float(os.getenv("STREAM_RECORDING_MAX_DAYS", "14")) * 86400
+segment_recorder = None
+
+# Local control API (pi-guard talks to it) and MQTT triggers
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = int(os.getenv("STREAM_CONTROL_PORT", "8555"))
+MQTT_BROKER = os.getenv("MQTT_BROKER", "pi-guardian.kcolville.com")
+MQTT_TRANSPORT = os.getenv("MQTT_TRANSPORT", "tcp")  # "tcp" or "websockets"
+MQTT_TLS = os.getenv("MQTT_TLS", "false").lower() == "true"
+MQTT_TLS_CA_CERTS = os.getenv("MQTT_TLS_CA_CERTS")  # None for the system's CA store
+# 1883 TCP, 9001 WebSocket, 8883 TLS, 8083 secure WebSocket; the table of pie/pi-guard/config.py
+MQTT_DEFAULT_PORT = {"tcp": 8883 if MQTT_TLS else 1883, "websockets": 8083 if MQTT_TLS else 9001}
+MQTT_PORT = int(os.getenv("MQTT_PORT", str(MQTT_DEFAULT_PORT.get(MQTT_TRANSPORT, 1883))))
+MQTT_KEEPALIVE = int(os.getenv("MQTT_KEEPALIVE", "60"))
+MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "sensors")
+CLIP_TRIGGER_TOPIC = f"{MQTT_TOPIC_PREFIX}/camera/clip"
+
 # Global process references
 camera_process = None
 ffmpeg_process = None
 shutdown_flag = False
 
+# Stderr readers and the live statistics they feed
+camera_stderr = None
+ffmpeg_stderr = None
+camera_stats = CameraStats()
+encoder_stats = EncoderStats()
+STATS_LOG_INTERVAL = 60  # seconds between encoder health log lines
+
 # Restart configuration
-RESTART_DELAY = 2  # seconds to wait before restarting
-MAX_RESTART_ATTEMPTS = 5  # max consecutive failures before longer delay
+RESTART_DELAY = 2  # base backoff delay once restarts start failing
+MAX_RESTART_DELAY = 30  # cap for the exponential backoff
+STABLE_RUN_TIME = 30  # seconds of progress before the failure count resets
+TERMINATE_TIMEOUT = 2  # seconds to wait for children to exit before killing them
 restart_count = 0
+restarts_total = 0  # never reset, for monitoring
+supervisor_started_at = time.monotonic()
+
+# Watchdog configuration
+STALL_TIMEOUT = float(os.getenv("STREAM_STALL_TIMEOUT", "5"))  # seconds without frame progress
+STARTUP_GRACE = 10  # extra time for the first frame after a (re)start
+WATCHDOG_INTERVAL = 0.5  # how often progress is checked when nothing else wakes the supervisor
+pipeline_started_at = None
+
+# Set by child exit watchers and the signal handler to wake the supervisor
+supervisor_wakeup = threading.Event()
 
 def signal_handler(sig, frame):
     """Handle shutdown signals gracefully."""
     global shutdown_flag
     logger.info("Received shutdown signal, terminating processes...")
     shutdown_flag = True
-    cleanup_processes()
+    # main() cleans up once the supervisor wakes and returns
+    supervisor_wakeup.set()
+
+def watch_process(process):
+    """Wake the supervisor as soon as a child process exits."""
+    def wait_for_exit():
+        process.wait()
+        supervisor_wakeup.set()
+    threading.Thread(target=wait_for_exit, name=f"watch-{process.pid}", daemon=True).start()
 
-def cleanup_processes():
-    """Clean up camera and ffmpeg processes."""
+def cleanup_processes(force=False):
+    """Clean up camera and ffmpeg processes, force kills wedged ones straight away."""
     global camera_process, ffmpeg_process
     
-    # Terminate ffmpeg first (consumer)
-    if ffmpeg_process:
+    # Terminate ffmpeg first (consumer), then camera (producer), and wait for both together
+    processes = [(name, process) for name, process in (("ffmpeg", ffmpeg_process), ("camera", camera_process)) if process]
+    for name, process in processes:
         try:
-            logger.info("Terminating ffmpeg process...")
-            ffmpeg_process.terminate()
-            try:
-                ffmpeg_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                logger.warning("FFmpeg didn't terminate, killing...")
-                ffmpeg_process.kill()
-                ffmpeg_process.wait()
+            # Closing ffmpeg's input lets it finish the RTSP session on its own
+            if process.stdin:
+                process.stdin.close()
+            if process.poll() is None and force:
+                logger.info(f"Killing {name} process...")
+                process.kill()
+            elif process.poll() is None:
+                logger.info(f"Terminating {name} process...")
+                process.terminate()
         except Exception as e:
-            logger.error(f"Error terminating ffmpeg: {e}")
-        finally:
-            ffmpeg_process = None
+            logger.error(f"Error terminating {name}: {e}")
     
-    # Terminate camera (producer)
-    if camera_process:
+    deadline = time.monotonic() + TERMINATE_TIMEOUT
+    for name, process in processes:
         try:
-            logger.info("Terminating camera process...")
-            camera_process.terminate()
-            try:
-                camera_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                logger.warning("Camera didn't terminate, killing...")
-                camera_process.kill()
-                camera_process.wait()
+            process.wait(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{name} didn't terminate, killing...")
+            process.kill()
+            process.wait()
         except Exception as e:
-            logger.error(f"Error terminating camera: {e}")
-        finally:
-            camera_process = None
+            logger.error(f"Error terminating {name}: {e}")
+    
+    ffmpeg_process = None
+    camera_process = None
 
-def start_streaming():
-    """Start both camera and ffmpeg processes with pipe."""
-    global camera_process, ffmpeg_process
+def read_camera(process):
+    """Split the camera's H.264 into access units and append them to the ring."""
+    parser = AccessUnitParser(gop_ring.append)
+    buffer = bytearray(CAMERA_READ_SIZE)
+    view = memoryview(buffer)
+    try:
+        while True:
+            count = process.stdout.readinto(buffer)
+            if not count:
+                break
+            parser.feed(view[:count])
+    except (OSError, ValueError) as e:
+        # Pipe closed during cleanup
+        logger.debug(f"Camera reader stopped: {e}")
+    logger.debug(f"Camera reader finished after {parser.access_units} access units")
+
+def write_all(pipe, data):
+    """Write all of data to an unbuffered pipe."""
+    view = memoryview(data)
+    while view:
+        written = pipe.write(view)
+        view = view[written:]
+
+def push_to_ffmpeg(process, cursor):
+    """Feed access units from the ring to ffmpeg for the RTSP push."""
+    try:
+        while process.poll() is None:
+            access_unit = cursor.read(timeout=0.5)
+            if access_unit is None:
+                continue
+            # Lead with our own delimiter so ffmpeg's parser closes each picture
+            # on arrival instead of holding it until the next one starts
+            write_all(process.stdin, strip_aud(access_unit.data))
+            write_all(process.stdin, AUD_NAL)
+    except (OSError, ValueError) as e:
+        # ffmpeg exited or was stopped, the supervisor handles the restart
+        logger.debug(f"RTSP push stopped: {e}")
+
+def capture_snapshot(path, timeout=5):
+    """Decode the newest keyframe in the ring to an image file (format from the extension)."""
+    gop = gop_ring.latest_gop()
+    if not gop:
+        logger.warning("No keyframe buffered yet, can't take a snapshot")
+        return False
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "h264", "-i", "-", "-frames:v", "1", path],
+            input=bytes(strip_aud(gop[0].data)) + AUD_NAL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            check=True
+        )
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Snapshot failed: {e.stderr.decode('utf-8', errors='ignore')[:500]}")
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Snapshot failed: {e}")
+    return False
+
+def trigger_clip(request):
+    """Record a pre-event clip, request may carry a "reason"."""
+    path = clip_recorder.trigger(str(request.get("reason", "api")))
+    if path is None:
+        return 503, {"error": "no video buffered yet"}
+    return 202, {"path": path, "preroll": CLIP_PREROLL, "postroll": CLIP_POSTROLL}
+
+def stream_video(request):
+    """Stream raw H.264 from the next keyframe on (pi-guard decodes it for analysis)."""
+    cursor = gop_ring.cursor("video")
+    
+    def access_units():
+        while not shutdown_flag:
+            access_unit = cursor.read(timeout=1)
+            if access_unit is None:
+                continue
+            yield strip_aud(access_unit.data)
+            yield AUD_NAL
+    
+    return 200, access_units()
+
+def set_quality(request):
+    """Run at a lower "framerate" and/or "bitrate" (omitted or null: the configured one), restarting the pipeline."""
+    global quality_changed
+    try:
+        framerate = int(request.get("framerate") or FRAMERATE)
+        bitrate = int(request.get("bitrate") or BITRATE)
+    except (TypeError, ValueError):
+        return 400, {"error": "framerate and bitrate must be numbers"}
+    if not 1 <= framerate <= FRAMERATE or not 100000 <= bitrate <= BITRATE:
+        return 400, {"error": f"framerate must be 1-{FRAMERATE} and bitrate 100000-{BITRATE}"}
+    if (framerate, bitrate) == (quality["framerate"], quality["bitrate"]):
+        return 200, dict(quality)
+    logger.info(f"Quality change requested: {framerate} fps, {bitrate // 1000} kbit/s")
+    quality.update(framerate=framerate, bitrate=bitrate)
+    quality_changed = True
+    supervisor_wakeup.set()
+    return 202, dict(quality)
+
+CONTROL_ROUTES = {
+    ("GET", "/status"): lambda request: (200, get_stream_stats()),
+    ("GET", "/video.h264"): stream_video,
+    ("POST", "/clips"): trigger_clip,
+    ("POST", "/quality"): set_quality,
+}
+
+def start_streaming(mode=PIPELINE_MODE):
+    """Start the camera and ffmpeg processes with the GOP ring between them."""
+    global camera_process, ffmpeg_process, camera_stderr, ffmpeg_stderr, pipeline_started_at, push_cursor
     
     try:
-        logger.info("Starting camera process...")
+        camera_cmd = build_camera_cmd()
+        ffmpeg_cmd = build_ffmpeg_cmd(mode)
+        camera_stats.reset()
+        encoder_stats.reset()
+        
+        logger.info(f"Starting camera process ({VIDEO_SOURCE} source)...")
         camera_process = subprocess.Popen(
-            CAMERA_CMD,
+            camera_cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             bufsize=0
         )
         
-        logger.info("Starting ffmpeg process...")
+        logger.info(f"Starting ffmpeg process ({mode} mode)...")
         ffmpeg_process = subprocess.Popen(
-            FFMPEG_CMD,
-            stdin=camera_process.stdout,
-            stdout=subprocess.PIPE,
+            ffmpeg_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
             bufsize=0
         )
         
-        # Close camera's stdout in parent process (ffmpeg has it)
-        camera_process.stdout.close()
+        # The camera feeds the ring, the RTSP push reads it from the next keyframe on
+        push_cursor = gop_ring.cursor("rtsp")
+        threading.Thread(target=read_camera, args=(camera_process,), name="camera-reader", daemon=True).start()
+        threading.Thread(target=push_to_ffmpeg, args=(ffmpeg_process, push_cursor), name="rtsp-push", daemon=True).start()
+        
+        # Keep both stderr pipes drained so a chatty process can't stall the pipeline
+        camera_stderr = StderrDrain("camera", camera_process.stderr, camera_stats)
+        ffmpeg_stderr = StderrDrain("ffmpeg", ffmpeg_process.stderr, encoder_stats)
+        camera_stderr.start()
+        ffmpeg_stderr.start()
+        
+        watch_process(camera_process)
+        watch_process(ffmpeg_process)
+        pipeline_started_at = time.monotonic()
         
         logger.info(f"Streaming started. Camera PID: {camera_process.pid}, FFmpeg PID: {ffmpeg_process.pid}")
         return True
         
+    except ValueError as e:
+        logger.error(str(e))
+        return False
     except FileNotFoundError as e:
         logger.error(f"Command not found: {e}. Please ensure rpicam-vid and ffmpeg are installed.")
         return False
@@ -138,69 +409,156 @@ def start_streaming():
         cleanup_processes()
         return False
 
+def log_stderr_tail(drain):
+    """Log the last stderr lines of a dead process."""
+    if drain is None:
+        return
+    # Give the reader a moment to collect the final output
+    drain.join(timeout=1)
+    tail = drain.tail()
+    if tail:
+        logger.error(f"{drain.process_name} stderr (last {len(tail)} lines):\n" + "\n".join(tail))
+
+def get_stream_stats():
+    """Get live statistics for the streaming pipeline."""
+    return {
+        "camera_pid": camera_process.pid if camera_process else None,
+        "ffmpeg_pid": ffmpeg_process.pid if ffmpeg_process else None,
+        "restart_count": restart_count,
+        "restarts_total": restarts_total,
+        "uptime": round(time.monotonic() - supervisor_started_at, 1),
+        "pipeline_uptime": (round(time.monotonic() - pipeline_started_at, 1)
+                            if ffmpeg_process and pipeline_started_at is not None else None),
+        "quality": dict(quality),
+        "camera": camera_stats.snapshot(),
+        "encoder": encoder_stats.snapshot(),
+        "ring": gop_ring.stats(),
+        "clips": clip_recorder.get_status(),
+        "recording": segment_recorder.get_status() if segment_recorder else None,
+        "rtsp_push": {
+            "delivered": push_cursor.delivered if push_cursor else 0,
+            "skipped": push_cursor.skipped if push_cursor else 0,
+            "lag": push_cursor.lag() if push_cursor else 0,
+        },
+    }
+
+def log_stream_stats():
+    """Log a one line summary of the encoder health."""
+    encoder = encoder_stats.snapshot()
+    camera = camera_stats.snapshot()
+    logger.info(
+        f"Stream stats: camera {camera['fps']:.1f} fps, encoder frame {encoder['frame']} "
+        f"{encoder['fps']:.1f} fps {encoder['bitrate_kbps']:.0f} kbit/s speed {encoder['speed']:.2f}x "
+        f"dup {encoder['dup']} drop {encoder['drop']}"
+    )
+
+def check_stalled():
+    """Check whether the pipeline has stopped making frame progress."""
+    if pipeline_started_at is None:
+        return False
+    last_progress = encoder_stats.snapshot()["last_progress_at"]
+    if last_progress is None:
+        # Nothing through yet, allow for camera start-up and the RTSP handshake
+        return time.monotonic() - pipeline_started_at > STALL_TIMEOUT + STARTUP_GRACE
+    return time.monotonic() - last_progress > STALL_TIMEOUT
+
+def get_restart_delay(failures):
+    """Restart immediately after a single failure, back off exponentially after repeats."""
+    if failures <= 1:
+        return 0
+    return min(RESTART_DELAY * 2 ** (failures - 2), MAX_RESTART_DELAY)
+
+def wait_for_shutdown(delay):
+    """Sleep for delay seconds unless a shutdown is requested first."""
+    deadline = time.monotonic() + delay
+    while not shutdown_flag:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        supervisor_wakeup.wait(remaining)
+        supervisor_wakeup.clear()
+
 def monitor_processes():
-    """Monitor camera and ffmpeg processes, restart if needed."""
-    global camera_process, ffmpeg_process, restart_count, shutdown_flag
+    """Monitor camera and ffmpeg processes, restart if they exit or stall."""
+    global camera_process, ffmpeg_process, restart_count, restarts_total, shutdown_flag, quality_changed
     
+    last_stats_log = time.monotonic()
     while not shutdown_flag:
+        # Sleep until a child exits or it's time for a progress check
+        supervisor_wakeup.wait(WATCHDOG_INTERVAL)
+        supervisor_wakeup.clear()
+        if shutdown_flag:
+            break
+        
+        # A new frame rate or bitrate needs a new camera and encoder; not a failure
+        if quality_changed:
+            quality_changed = False
+            logger.info(f"Restarting pipeline at {quality['framerate']} fps, {quality['bitrate'] // 1000} kbit/s")
+            cleanup_processes()
+            # Clips and segments started from now on are timed at the new frame rate
+            clip_recorder.framerate = quality["framerate"]
+            if segment_recorder:
+                segment_recorder.framerate = quality["framerate"]
+            if not start_streaming():
+                logger.error("Failed to restart streaming processes")
+            continue
+        
         # Check if processes are still running
         camera_running = camera_process and camera_process.poll() is None
         ffmpeg_running = ffmpeg_process and ffmpeg_process.poll() is None
+        stalled = camera_running and ffmpeg_running and check_stalled()
         
-        if not camera_running or not ffmpeg_running:
+        if not camera_running or not ffmpeg_running or stalled:
+            if stalled:
+                logger.warning(f"No frame progress for over {STALL_TIMEOUT}s, restarting pipeline")
+                log_stream_stats()
+            
             # One or both processes have died
             if not camera_running:
                 exit_code = camera_process.poll() if camera_process else None
                 logger.warning(f"Camera process died with exit code: {exit_code}")
-                # Read stderr for error details
-                if camera_process:
-                    try:
-                        stderr = camera_process.stderr.read().decode('utf-8', errors='ignore')
-                        if stderr:
-                            logger.error(f"Camera stderr: {stderr[:500]}")
-                    except:
-                        pass
+                log_stderr_tail(camera_stderr)
             
             if not ffmpeg_running:
                 exit_code = ffmpeg_process.poll() if ffmpeg_process else None
                 logger.warning(f"FFmpeg process died with exit code: {exit_code}")
-                # Read stderr for error details
-                if ffmpeg_process:
-                    try:
-                        stderr = ffmpeg_process.stderr.read().decode('utf-8', errors='ignore')
-                        if stderr:
-                            logger.error(f"FFmpeg stderr: {stderr[:500]}")
-                    except:
-                        pass
+                log_stderr_tail(ffmpeg_stderr)
             
-            # Clean up dead processes
-            cleanup_processes()
+            # Clean up dead or wedged processes
+            cleanup_processes(force=stalled)
             
             if shutdown_flag:
                 break
             
             # Restart with backoff on repeated failures
             restart_count += 1
-            if restart_count >= MAX_RESTART_ATTEMPTS:
-                delay = RESTART_DELAY * restart_count
-                logger.warning(f"Multiple restart failures detected. Waiting {delay}s before retry...")
+            restarts_total += 1
+            delay = get_restart_delay(restart_count)
+            if delay:
+                logger.warning(f"Repeated failures detected. Restarting streaming processes in {delay}s... (attempt {restart_count})")
+                wait_for_shutdown(delay)
+                if shutdown_flag:
+                    break
             else:
-                delay = RESTART_DELAY
-            
-            logger.info(f"Restarting streaming processes in {delay}s... (attempt {restart_count})")
-            time.sleep(delay)
+                logger.info(f"Restarting streaming processes... (attempt {restart_count})")
             
-            if start_streaming():
-                restart_count = 0  # Reset on successful start
-            else:
+            if not start_streaming():
                 logger.error("Failed to restart streaming processes")
+            continue
+        
+        # Reset the failure count once the pipeline has been healthy for a while
+        last_progress = encoder_stats.snapshot()["last_progress_at"]
+        if restart_count and last_progress and last_progress - pipeline_started_at >= STABLE_RUN_TIME:
+            logger.info("Streaming pipeline stable, resetting restart count")
+            restart_count = 0
         
-        # Small sleep to avoid busy waiting
-        time.sleep(1)
+        if time.monotonic() - last_stats_log >= STATS_LOG_INTERVAL:
+            log_stream_stats()
+            last_stats_log = time.monotonic()
 
 def main():
     """Main entry point."""
-    global shutdown_flag
+    global shutdown_flag, segment_recorder
     
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
@@ -208,11 +566,38 @@ def main():
     
     logger.info("Starting RTSP camera stream service...")
     logger.info(f"RTSP URL: {RTSP_URL}")
+    logger.info(f"Pipeline mode: {PIPELINE_MODE}")
+    logger.info(f"Video source: {VIDEO_SOURCE}")
     
     if not start_streaming():
         logger.error("Failed to start streaming. Exiting.")
         sys.exit(1)
     
+    # The recorder keeps its ring cursor across pipeline restarts
+    if RECORDING_ENABLED:
+        segment_recorder = SegmentRecorder(
+            gop_ring, RECORDING_DIR, SEGMENT_SECONDS, FRAMERATE,
+            RECORDING_MAX_BYTES, RECORDING_MAX_AGE
+        )
+        try:
+            segment_recorder.start()
+            logger.info(f"Recording {SEGMENT_SECONDS:.0f}s segments to {RECORDING_DIR}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Continuous recording unavailable: {e}")
+            segment_recorder = None
+    
+    control_server = ControlServer(CONTROL_HOST, CONTROL_PORT, CONTROL_ROUTES)
+    try:
+        control_server.start()
+    except OSError as e:
+        logger.error(f"Control API unavailable: {e}")
+    clip_trigger = MqttTrigger(
+        MQTT_BROKER, MQTT_PORT, CLIP_TRIGGER_TOPIC,
+        lambda message: trigger_clip({"reason": "mqtt", **message}),
+        transport=MQTT_TRANSPORT, tls=MQTT_TLS, ca_certs=MQTT_TLS_CA_CERTS, keepalive=MQTT_KEEPALIVE
+    )
+    clip_trigger.start()
+    
     try:
         monitor_processes()
     except KeyboardInterrupt:
@@ -220,6 +605,10 @@ def main():
     except Exception as e:
         logger.error(f"Unexpected error in main loop: {e}", exc_info=True)
     finally:
+        clip_trigger.stop()
+        control_server.stop()
+        if segment_recorder:
+            segment_recorder.stop()
         cleanup_processes()
         logger.info("Service stopped.")
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Video sources for the stream service.
+The supervisor reads Annex B H.264 from the source process's stdout, so every
+source is a command:
+
+  camera      rpicam-vid on the Pi camera
+  synthetic   ffmpeg's testsrc2 pattern encoded with libx264 at the camera's
+              size, frame rate, bitrate and keyframe interval, in real time
+  stamped     like synthetic, but every frame carries its sequence number and
+              the wall clock time it was captured as a barcode across the top
+              (read_stamp reads it back), so latency and drops can be
+              measured from the frames downstream; needs numpy
+  replay      a recorded H.264 file, looped, written by this module at its
+              frame rate times a speed, or as fast as the reader takes it
+              with speed 0
+
+The synthetic, stamped and replay sources let the pipeline run on a machine
+without a camera. Run as a script this module is the replay source, or the
+stamped one with --stamped; like rpicam-vid it reports each frame on stderr
+("#123 (30.00 fps)").
+
+Usage: python3 video_source.py FILE [--fps 30] [--speed 1] [--loops 0]
+       python3 video_source.py --stamped [--size 1280x720] [--fps 30] [--bitrate 1000000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from h264 import AccessUnitParser
+
+SOURCES = ("camera", "synthetic", "stamped", "replay")
+
+# Stamp barcode: 64 blocks across the top of the picture, the stamp's bits and
+# below them the bits inverted, so a smeared or half-decoded barcode is rejected
+BLOCK = 16
+BITS = 64
+SEQ_BITS = 24  # then the wall clock milliseconds' low 40 bits (34 years), to unwrap against the arrival
+TIME_BITS = BITS - SEQ_BITS
+BLACK, WHITE = 16, 235  # video range luma
+
+
+def build_source_cmd(source, camera_cmd, width, height, framerate, bitrate, trace="", speed=1.0):
+    """Build the command whose stdout is the H.264 to stream."""
+    if source == "camera":
+        return camera_cmd
+    if source == "synthetic":
+        return [
+            "ffmpeg", "-loglevel", "error", "-re",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={framerate}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-pix_fmt", "yuv420p", "-g", str(framerate), "-b:v", str(bitrate),
+            "-bsf:v", "h264_metadata=aud=insert",
+            "-f", "h264", "-"
+        ]
+    if source == "stamped":
+        if width < BITS * BLOCK or height < 2 * BLOCK:
+            raise ValueError(f"The stamp needs frames at least {BITS * BLOCK}x{2 * BLOCK}")
+        return [
+            sys.executable, os.path.abspath(__file__), "--stamped",
+            "--size", f"{width}x{height}", "--fps", str(framerate), "--bitrate", str(bitrate)
+        ]
+    if source == "replay":
+        if not trace:
+            raise ValueError("Replaying video needs an H.264 file (STREAM_VIDEO_TRACE)")
+        if not os.path.isfile(trace):
+            raise ValueError(f"Video trace not found: {trace}")
+        return [
+            sys.executable, os.path.abspath(__file__), trace,
+            "--fps", str(framerate), "--speed", str(speed)
+        ]
+    raise ValueError(f"Unknown video source: {source} (expected one of {SOURCES})")
+
+
+def stamp(luma, seq, at_ms):
+    """Write seq and a millisecond time into the top rows of a luma plane (height x width uint8)."""
+    import numpy as np
+    value = (seq % (1 << SEQ_BITS)) << TIME_BITS | at_ms % (1 << TIME_BITS)
+    bits = (value >> np.arange(BITS - 1, -1, -1, dtype=np.uint64)) & 1
+    row = np.where(bits == 1, WHITE, BLACK).astype(np.uint8).repeat(BLOCK)
+    luma[:BLOCK, :BITS * BLOCK] = row
+    luma[BLOCK:2 * BLOCK, :BITS * BLOCK] = BLACK + WHITE - row
+
+
+def read_stamp(luma):
+    """(seq, low bits of the milliseconds) from a stamped luma plane, or None if the barcode doesn't check out."""
+    inner = slice(BLOCK // 4, BLOCK - BLOCK // 4)  # Block centres, clear of the codec's edges
+    rows = luma[:2 * BLOCK, :BITS * BLOCK].reshape(2, BLOCK, BITS, BLOCK)[:, inner, :, inner]
+    bits = rows.mean(axis=(1, 3)) > (BLACK + WHITE) / 2
+    if not (bits[0] != bits[1]).all():
+        return None
+    value = 0
+    for bit in bits[0]:
+        value = value << 1 | int(bit)
+    return value >> TIME_BITS, value & ((1 << TIME_BITS) - 1)
+
+
+def run_stamped(width, height, fps, bitrate, report=None):
+    """Stamp frames at fps and encode them as the synthetic source does, H.264 on this process's stdout."""
+    import numpy as np
+    encoder = subprocess.Popen([
+        "ffmpeg", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "yuv420p", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+        "-g", str(fps), "-b:v", str(bitrate),
+        "-bsf:v", "h264_metadata=aud=insert",
+        "-f", "h264", "-"
+    ], stdin=subprocess.PIPE)  # The encoder writes to our stdout, so the reader takes it directly
+
+    # Something moving under the barcode, so the encoder has work to do
+    ramp = np.add.outer(np.arange(height), np.arange(width * 2)).astype(np.uint8)
+    frame = np.empty(width * height * 3 // 2, dtype=np.uint8)
+    luma = frame[:width * height].reshape(height, width)
+    frame[width * height:] = 128  # Grey chroma
+
+    started = time.monotonic()
+    seq = 0
+    try:
+        while True:
+            delay = started + seq / fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            offset = seq * 4 % width
+            luma[:] = ramp[:, offset:offset + width]
+            stamp(luma, seq, int(time.time() * 1000))
+            encoder.stdin.write(frame.data)
+            encoder.stdin.flush()
+            seq += 1
+            if report:
+                report(seq, seq / max(time.monotonic() - started, 1e-6))
+    finally:
+        encoder.kill()
+
+
+def read_access_units(path):
+    """Split an Annex B H.264 file into access units (bytes each)."""
+    access_units = []
+    parser = AccessUnitParser(lambda view, keyframe: access_units.append(bytes(view)))
+    with open(path, "rb") as file:
+        parser.feed(file.read())
+    parser.flush()
+    return access_units
+
+
+def replay(access_units, output, fps, speed=1.0, loops=0, report=None):
+    """Write access units to output at fps times speed (0: unpaced), looping loops times (0: forever)."""
+    interval = 1 / (fps * speed) if speed > 0 else 0
+    started = time.monotonic()
+    sent = 0
+    loop = 0
+    while not loops or loop < loops:
+        for access_unit in access_units:
+            if interval:
+                delay = started + sent * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            output.write(access_unit)
+            output.flush()  # Each picture goes out whole and on time
+            sent += 1
+            if report:
+                report(sent, sent / max(time.monotonic() - started, 1e-6))
+        loop += 1
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="Annex B H.264 recording")
+    parser.add_argument("--fps", type=float, default=30, help="frame rate of the recording, or to stamp at")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of real time, 0 for as fast as possible")
+    parser.add_argument("--loops", type=int, default=0, help="times through the file, 0 for forever")
+    parser.add_argument("--stamped", action="store_true", help="be the stamped source instead of replaying a file")
+    parser.add_argument("--size", default="1280x720", help="stamped: frame size")
+    parser.add_argument("--bitrate", type=int, default=1000000, help="stamped: encoder bitrate")
+    args = parser.parse_args()
+
+    def report(frame, fps):
+        sys.stderr.write(f"#{frame} ({fps:.2f} fps)\n")
+        sys.stderr.flush()
+
+    if args.stamped:
+        width, height = (int(value) for value in args.size.split("x"))
+        fps = int(args.fps) if args.fps == int(args.fps) else args.fps
+        try:
+            run_stamped(width, height, fps, args.bitrate, report)
+        except (BrokenPipeError, KeyboardInterrupt):
+            pass
+        return 0
+    if not args.file:
+        parser.error("an H.264 file to replay is needed, or --stamped")
+
+    access_units = read_access_units(args.file)
+    if not access_units:
+        print(f"No H.264 pictures in {args.file}", file=sys.stderr)
+        return 1
+
+    try:
+        replay(access_units, sys.stdout.buffer, args.fps, args.speed, args.loops, report)
+        sys.stdout.buffer.flush()
+    except (BrokenPipeError, KeyboardInterrupt):
+        # The supervisor stopped reading; don't fail again flushing stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())